@@ -0,0 +1,378 @@
+"""End-to-end benchmarks for the capture, parse and fan-out paths.
+
+Everything runs against ``fake_iperf3.py``, so no network peer or iperf3
+binary is needed:
+
+    parser   IperfOutputParser records/s, and the full capture path
+             (LineSplitter -> Run.feed_lines -> log publish + series) per
+             output format, for -P 1 and -P 16
+    e2e      a complete execute_run of the fake through a PTY/pipe
+    sse      publish -> browser latency on /stream with N raw-socket clients,
+             for the asyncio and the threaded server
+    tk       IperfApp.process_queue drain time for a burst of queued events
+             (skipped when no display is available)
+
+Timings are the median of ``--repeat`` runs. Each run appends one JSON line
+to ``results.jsonl`` (next to this file, not tracked by git) and compares
+against the previous entry recorded on the same host. Metrics ending in
+``_per_s`` are better when higher, ``_ms`` when lower; ``--check`` exits with
+status 1 if any of them regressed by more than ``--tolerance``. Run-to-run
+noise on a shared machine is easily +-30%, hence the wide default; record a
+few baselines before trusting a tighter one.
+
+Usage: python NetTest_bench/bench.py [--quick] [--only parser,sse] [--clients 100]
+"""
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+from NetTest_core.iperf_stream import IperfOutputParser
+from NetTest_core.reader import LineSplitter
+from NetTest_core.runs import Run, execute_run
+
+FAKE = os.path.join(BENCH_DIR, 'fake_iperf3.py')
+RESULTS_FILE = os.path.join(BENCH_DIR, 'results.jsonl')
+FORMATS = {'text': [], 'json-stream': ['--json-stream'], 'json': ['-J']}
+
+
+def fake_cmd(*args):
+    return [sys.executable, FAKE, '-c', '127.0.0.1', '--fake-speed', '0', '--fake-seed', '1',
+            *args]
+
+
+def fake_output(args):
+    return subprocess.run(fake_cmd(*args), stdout=subprocess.PIPE, check=True).stdout
+
+
+def load_module(name, path):
+    """Import one of the app scripts (both are called main.py) under its own name."""
+    sys.path.insert(0, os.path.dirname(path))
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def median_of(repeat, fn):
+    return statistics.median(fn() for _ in range(max(1, repeat)))
+
+
+# ---------------------------------------------------------------------------
+# Parser / capture path
+# ---------------------------------------------------------------------------
+
+def bench_parser(opts):
+    out = {}
+    seconds = '20' if opts.quick else '60'
+    for fmt, flags in FORMATS.items():
+        for parallel in (1, 16):
+            raw = fake_output(['-i', '0.1', '-t', seconds, '-P', str(parallel)] + flags)
+            lines = raw.decode('utf-8').splitlines(True)
+
+            # One json-stream line carries a whole interval, so compare records
+            parser = IperfOutputParser(parallel=parallel)
+            events = [e for line in lines for e in parser.feed(line)] + parser.finish()
+            records = sum(len(p) for kind, p in events if kind in ('interval', 'summary'))
+
+            def parse_only():
+                parser = IperfOutputParser(parallel=parallel)
+                t0 = time.perf_counter()
+                for line in lines:
+                    parser.feed(line)
+                parser.finish()
+                return time.perf_counter() - t0
+
+            def capture():
+                run = Run(['iperf3', '-c', 'bench', '-P', str(parallel)])
+                splitter = LineSplitter()
+                t0 = time.perf_counter()
+                for i in range(0, len(raw), 65536):
+                    run.feed_lines(splitter.feed(raw[i:i + 65536]))
+                run.feed_lines(splitter.flush())
+                elapsed = time.perf_counter() - t0
+                run.series.close()
+                return elapsed
+
+            key = f"{fmt.replace('-', '_')}_p{parallel}"
+            out[f'parse_{key}_records_per_s'] = records / median_of(opts.repeat, parse_only)
+            out[f'capture_{key}_records_per_s'] = records / median_of(opts.repeat, capture)
+    return out
+
+
+def bench_e2e(opts):
+    out = {}
+    seconds = '10' if opts.quick else '30'
+    for fmt in ('text', 'json-stream'):
+        def once():
+            run = Run(fake_cmd('-i', '0.1', '-t', seconds, '-P', '16', *FORMATS[fmt]),
+                      run_id='bench')
+            t0 = time.perf_counter()
+            execute_run(run)
+            elapsed = time.perf_counter() - t0
+            if run.series.agg_count == 0:
+                raise RuntimeError(f"e2e {fmt}: no intervals captured ({run.error})")
+            count = run.series.agg_count
+            run.series.close()
+            return elapsed / count
+        out[f"e2e_{fmt.replace('-', '_')}_p16_intervals_per_s"] = 1.0 / median_of(opts.repeat, once)
+    return out
+
+
+# ---------------------------------------------------------------------------
+# SSE fan-out
+# ---------------------------------------------------------------------------
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+async def _sse_client(port, expected, latencies, ready, tag):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port, limit=1 << 20)
+    writer.write(b"GET /stream HTTP/1.1\r\nHost: bench\r\n\r\n")
+    await writer.drain()
+    ready()
+    seen = 0
+    marker = f"data: {tag} ".encode()
+    try:
+        while seen < expected:
+            line = await reader.readline()
+            if not line:
+                break
+            if line.startswith(marker):
+                sent = float(line.split()[-1])
+                latencies.append(time.perf_counter() - sent)
+                seen += 1
+    finally:
+        writer.close()
+
+
+def _run_clients(port, clients, messages, tag, latencies, all_ready, timeout):
+    async def main():
+        remaining = [clients]
+
+        def ready():
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                all_ready.set()
+        tasks = [asyncio.ensure_future(_sse_client(port, messages, latencies, ready, tag))
+                 for _ in range(clients)]
+        await asyncio.wait(tasks, timeout=timeout)
+        for t in tasks:
+            t.cancel()
+    asyncio.run(main())
+
+
+def _start_server(web, mode, port):
+    if mode == 'asyncio':
+        import aio_server
+
+        def serve():
+            try:
+                asyncio.run(aio_server.serve('127.0.0.1', port, web))
+            except Exception:
+                pass
+        threading.Thread(target=serve, daemon=True).start()
+    else:
+        httpd = web.make_threaded_server('127.0.0.1', port)
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    deadline = time.time() + 5
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"{mode} server did not start")
+
+
+def bench_sse(opts):
+    web = load_module('nettest_web_main', os.path.join(ROOT_DIR, 'NetTest_web', 'main.py'))
+    out = {}
+    messages = 200 if opts.quick else 1000
+    for mode in ('asyncio', 'threaded'):
+        port = free_port()
+        _start_server(web, mode, port)
+        tag = f"bench-{mode}"
+        latencies = []
+        all_ready = threading.Event()
+        timeout = 30 + messages * opts.rate_ms / 1000
+        clients = threading.Thread(target=_run_clients, daemon=True,
+                                   args=(port, opts.clients, messages, tag, latencies,
+                                         all_ready, timeout))
+        clients.start()
+        all_ready.wait(10)
+        time.sleep(0.5)     # let the server attach every subscriber
+        for i in range(messages):
+            web.broadcaster.publish(f"{tag} {i} {time.perf_counter():.9f}")
+            time.sleep(opts.rate_ms / 1000)
+        clients.join(timeout)
+        if not latencies:
+            raise RuntimeError(f"sse {mode}: no messages delivered")
+        latencies.sort()
+        ms = [v * 1000 for v in latencies]
+        out[f'sse_{mode}_p50_ms'] = statistics.median(ms)
+        out[f'sse_{mode}_p99_ms'] = ms[min(len(ms) - 1, int(len(ms) * 0.99))]
+        out[f'sse_{mode}_delivered'] = len(ms) / (messages * opts.clients)
+    return out
+
+
+# ---------------------------------------------------------------------------
+# Tk queue drain
+# ---------------------------------------------------------------------------
+
+def bench_tk(opts):
+    try:
+        import tkinter as tk
+        root = tk.Tk()
+    except Exception as e:
+        print(f"  tk: skipped ({e})")
+        return {}
+    root.withdraw()
+    ui = load_module('nettest_ui_main', os.path.join(ROOT_DIR, 'NetTest_ui', 'main.py'))
+    app = ui.IperfApp(root)
+    raw = fake_output(['-i', '0.1', '-t', '10' if opts.quick else '30', '-P', '16', '--json-stream'])
+    run = Run(['iperf3', '-c', 'bench', '-P', '16'], listener=app._on_run_event)
+    app.start_time = time.time()
+    t0 = time.perf_counter()
+    splitter = LineSplitter()
+    run.feed_lines(splitter.feed(raw))
+    produce = time.perf_counter() - t0
+    events = app.queue.qsize()
+
+    ticks = []
+    t0 = time.perf_counter()
+    while not app.queue.empty():
+        t = time.perf_counter()
+        app.process_queue()
+        root.update_idletasks()
+        ticks.append(time.perf_counter() - t)
+    drain = time.perf_counter() - t0
+    app.run_manager.stop_all()
+    root.destroy()
+    return {
+        'tk_events': events,
+        'tk_reader_events_per_s': events / produce,
+        'tk_drain_ms': drain * 1000,
+        'tk_max_tick_ms': max(ticks) * 1000 if ticks else 0.0,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Recording / comparison
+# ---------------------------------------------------------------------------
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR,
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                              text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def previous_entry(path, host, quick):
+    last = None
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get('host') == host and entry.get('quick') == quick:
+                    last = entry
+    return last
+
+
+def compare(results, previous, tolerance):
+    """Print each metric next to the previous run; return the regressed names."""
+    regressed = []
+    old = (previous or {}).get('results', {})
+    for name in sorted(results):
+        value = results[name]
+        line = f"  {name:<44} {value:>14.2f}"
+        before = old.get(name)
+        if before:
+            change = (value - before) / before
+            line += f"  {change:+7.1%}"
+            worse = (name.endswith('_per_s') and change < -tolerance) or \
+                    (name.endswith('_ms') and change > tolerance)
+            if worse:
+                line += "  REGRESSION"
+                regressed.append(name)
+        print(line)
+    return regressed
+
+
+BENCHES = {'parser': bench_parser, 'e2e': bench_e2e, 'sse': bench_sse, 'tk': bench_tk}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="NetTest capture/parse/fan-out benchmarks")
+    ap.add_argument('--only', default=','.join(BENCHES),
+                    help="comma-separated subset of: " + ', '.join(BENCHES))
+    ap.add_argument('--quick', action='store_true', help="smaller inputs (CI smoke run)")
+    ap.add_argument('--repeat', type=int, default=5, help="repetitions per timing (median)")
+    ap.add_argument('--clients', type=int, default=50, help="SSE clients")
+    ap.add_argument('--rate-ms', type=float, default=2.0, help="gap between SSE publishes")
+    ap.add_argument('--results', default=RESULTS_FILE)
+    ap.add_argument('--no-record', action='store_true', help="don't append to the results file")
+    ap.add_argument('--check', action='store_true', help="exit 1 on a regression")
+    ap.add_argument('--tolerance', type=float, default=0.5,
+                    help="relative change counted as a regression")
+    opts = ap.parse_args(argv)
+
+    # keep the apps' results history out of the user's real database
+    os.environ.setdefault('NETTEST_HISTORY_DB',
+                          os.path.join(tempfile.mkdtemp(prefix='nettest-bench-'), 'history.sqlite3'))
+
+    results = {}
+    for name in opts.only.split(','):
+        name = name.strip()
+        if name not in BENCHES:
+            ap.error(f"unknown benchmark {name!r}")
+        print(f"[{name}]")
+        t0 = time.perf_counter()
+        results.update(BENCHES[name](opts))
+        print(f"  done in {time.perf_counter() - t0:.1f}s")
+
+    host = platform.node()
+    previous = previous_entry(opts.results, host, opts.quick)
+    against = f"{previous.get('commit')} @ {previous['time']}" if previous else "no previous run"
+    print(f"\nResults (vs {against}):")
+    regressed = compare(results, previous, opts.tolerance)
+
+    if not opts.no_record:
+        entry = {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'host': host,
+                 'commit': git_revision(), 'python': platform.python_version(),
+                 'platform': platform.platform(), 'quick': opts.quick,
+                 'options': {'clients': opts.clients, 'rate_ms': opts.rate_ms},
+                 'results': results}
+        with open(opts.results, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry) + "\n")
+        print(f"Recorded in {opts.results}")
+
+    if regressed and opts.check:
+        print(f"{len(regressed)} metric(s) regressed by more than {opts.tolerance:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,376 @@
+"""Stand-in for the iperf3 client that needs neither a network peer nor a binary.
+
+Understands the client options the tools use (-c -p -u -b -R -P -i -t -O -w
+-l -Z -J --json-stream --forceflush -v) and prints output shaped like iperf3
+3.16: the classic text tables, one JSON object per line for --json-stream, or
+a single document for -J. Other iperf3 options are accepted and ignored.
+
+Without -b or --fake-rate, TCP throughput follows a crude host model: each
+stream is limited by window / RTT (0.8 ms) and by a per-core copy rate that
+grows with -l and -Z, the streams share the link capacity, and every extra
+stream costs 1%. That is enough for parameter sweeps to have a real optimum.
+
+Extra options that only the fake knows:
+
+    --fake-rate BPS     mean bitrate of the whole test (default: -b, or 940M TCP / 1M UDP)
+    --fake-speed X      time acceleration; 0 prints everything without sleeping
+    --fake-loss PCT     mean UDP loss percentage (default 0.1)
+    --fake-capacity BPS link capacity. UDP load above it is lost and jitter
+                        rises as the link fills (default: unlimited); TCP
+                        shares it between streams (default 940M)
+    --fake-noise F      relative bitrate noise (default 0.05)
+    --fake-seed N       RNG seed, for reproducible output
+    --fake-drop T:D[:F] scale the bitrate by F (default 0.5) for D seconds from
+                        test time T, to exercise anomaly detection (repeatable)
+    --fake-version V    version string printed by -v (default 3.16)
+
+Usage: python fake_iperf3.py -c 127.0.0.1 -P 4 -i 0.1 -t 5 --json-stream --fake-speed 0
+"""
+import argparse
+import json
+import random
+import sys
+import time
+
+UNITS = {'': 1, 'K': 1e3, 'M': 1e6, 'G': 1e9, 'T': 1e12,
+         'k': 1e3, 'm': 1e6, 'g': 1e9, 't': 1e12}
+UDP_DATAGRAM = 1448
+FIRST_SOCKET = 5
+
+
+def parse_rate(text):
+    text = str(text).strip()
+    if text and text[-1] in UNITS:
+        return float(text[:-1]) * UNITS[text[-1]]
+    return float(text)
+
+
+def parse_size(text):
+    """iperf3 sizes (-w, -l) are binary: 128K = 131072 bytes"""
+    text = str(text).strip()
+    if text and text[-1].upper() in 'KMG':
+        return float(text[:-1]) * 1024 ** ('KMG'.index(text[-1].upper()) + 1)
+    return float(text)
+
+
+TCP_RTT = 0.0008
+CORE_COPY_BPS = 6e9         # per-stream copy rate at the default 128K buffer
+
+
+def tcp_model_rate(args, parallel):
+    capacity = parse_rate(args.fake_capacity) if args.fake_capacity else 940e6
+    window = parse_size(args.window) if args.window else 4 << 20
+    length = parse_size(args.length) if args.length else 128 << 10
+    per_stream = min(window * 8 / TCP_RTT,
+                     CORE_COPY_BPS * (length / (128 << 10)) ** 0.3 * (1.3 if args.zerocopy else 1.0))
+    return min(capacity, per_stream * parallel) * (1 - 0.01 * (parallel - 1))
+
+
+def build_parser():
+    ap = argparse.ArgumentParser(prog='iperf3', add_help=False)
+    ap.add_argument('-c', '--client')
+    ap.add_argument('-s', '--server', action='store_true')
+    ap.add_argument('-p', '--port', type=int, default=5201)
+    ap.add_argument('-u', '--udp', action='store_true')
+    ap.add_argument('-b', '--bitrate')
+    ap.add_argument('-R', '--reverse', action='store_true')
+    ap.add_argument('-P', '--parallel', type=int, default=1)
+    ap.add_argument('-i', '--interval', type=float, default=1.0)
+    ap.add_argument('-t', '--time', type=float, default=10.0)
+    ap.add_argument('-O', '--omit', type=float, default=0.0)
+    ap.add_argument('-w', '--window')
+    ap.add_argument('-l', '--length')
+    ap.add_argument('-Z', '--zerocopy', action='store_true')
+    ap.add_argument('-J', '--json', action='store_true')
+    ap.add_argument('--json-stream', action='store_true')
+    ap.add_argument('--forceflush', action='store_true')
+    ap.add_argument('-v', '--version', action='store_true')
+    ap.add_argument('--fake-rate')
+    ap.add_argument('--fake-speed', type=float, default=1.0)
+    ap.add_argument('--fake-loss', type=float, default=0.1)
+    ap.add_argument('--fake-capacity')
+    ap.add_argument('--fake-noise', type=float, default=0.05)
+    ap.add_argument('--fake-seed', type=int)
+    ap.add_argument('--fake-drop', action='append', default=[])
+    ap.add_argument('--fake-version', default='3.16')
+    return ap
+
+
+# ---------------------------------------------------------------------------
+# Text formatting, as iperf3 prints it
+# ---------------------------------------------------------------------------
+
+def unit(value, suffix, base):
+    for prefix in ('', 'K', 'M', 'G', 'T'):
+        if value < base or prefix == 'T':
+            break
+        value /= base
+    if value >= 100 or prefix == '':
+        return f"{value:.0f} {prefix}{suffix}"
+    if value >= 10:
+        return f"{value:.1f} {prefix}{suffix}"
+    return f"{value:.2f} {prefix}{suffix}"
+
+
+def text_line(sid, d, udp, final=None, omitted=False):
+    label = 'SUM' if sid is None else f"{sid:>3}"
+    line = (f"[{label}] {d['start']:6.2f}-{d['end']:<6.2f} sec  "
+            f"{unit(d['bytes'], 'Bytes', 1024.0):>10}  {unit(d['bits_per_second'], 'bits/sec', 1000.0):>14}")
+    if udp and (final is not None or 'jitter_ms' in d):
+        line += f"  {d['jitter_ms']:.3f} ms  {d['lost_packets']}/{d['packets']} ({d['lost_percent']:.2g}%)"
+    elif udp:
+        line += f"  {d['packets']}"
+    elif 'retransmits' in d:
+        line += f"  {d['retransmits']:>4}"
+        if 'snd_cwnd' in d:
+            line += f"   {unit(d['snd_cwnd'], 'Bytes', 1024.0):>10}"
+    if omitted:
+        line += "  (omitted)"
+    if final is not None:
+        line += "  sender" if final else "  receiver"
+    return line
+
+
+# ---------------------------------------------------------------------------
+# Test simulation
+# ---------------------------------------------------------------------------
+
+class FakeTest:
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.fake_seed)
+        self.udp = args.udp
+        self.parallel = max(1, args.parallel)
+        if args.fake_rate:
+            self.rate = parse_rate(args.fake_rate)
+        elif args.bitrate:
+            self.rate = parse_rate(args.bitrate) * self.parallel
+        else:
+            self.rate = 1e6 if self.udp else tcp_model_rate(args, self.parallel)
+        self.sockets = [FIRST_SOCKET + i for i in range(self.parallel)]
+        self.totals = {s: {'bytes': 0, 'packets': 0, 'lost': 0, 'retr': 0, 'jitter': 0.0}
+                       for s in self.sockets}
+        self.cwnd = {s: 1 << 20 for s in self.sockets}
+        self.capacity = parse_rate(args.fake_capacity) if args.fake_capacity else None
+        self.drops = []
+        for spec in args.fake_drop:
+            parts = [float(v) for v in spec.split(':')]
+            self.drops.append((parts[0], parts[0] + parts[1], parts[2] if len(parts) > 2 else 0.5))
+
+    def drop_factor(self, t):
+        for start, end, factor in self.drops:
+            if start <= t < end:
+                return factor
+        return 1.0
+
+    def stream_interval(self, sock, start, end, omitted):
+        seconds = end - start
+        share = self.rate / self.parallel * self.drop_factor(start)
+        bps = max(0.0, self.rng.gauss(share, share * self.args.fake_noise))
+        nbytes = int(bps * seconds / 8)
+        d = {'socket': sock, 'start': start, 'end': end, 'seconds': seconds,
+             'bytes': nbytes, 'bits_per_second': nbytes * 8 / seconds if seconds else 0.0,
+             'omitted': omitted, 'sender': not self.args.reverse}
+        tot = self.totals[sock]
+        if self.udp:
+            packets = max(1, nbytes // UDP_DATAGRAM)
+            loss = max(0.0, self.rng.gauss(self.args.fake_loss, self.args.fake_loss / 2))
+            jitter = abs(self.rng.gauss(0.05, 0.02))
+            if self.capacity:
+                # queueing near the capacity, tail drop above it
+                util = bps * self.parallel / self.capacity
+                jitter *= 1 + 40 * max(0.0, util - 0.8)
+                if util > 1:
+                    loss += (1 - 1 / util) * 100
+            lost = min(packets, int(packets * loss / 100 + self.rng.random()))
+            d['packets'] = packets
+            if self.args.reverse:
+                # the client is the receiver: intervals carry jitter and loss
+                d.update(jitter_ms=jitter, lost_packets=lost,
+                         lost_percent=lost * 100.0 / packets)
+            if not omitted:
+                tot['packets'] += packets
+                tot['lost'] += lost
+                tot['jitter'] = jitter
+        else:
+            retr = self.rng.choice((0, 0, 0, 0, 0, 0, 1, 2, 5))
+            self.cwnd[sock] = max(64 << 10, int(self.cwnd[sock] * (0.7 if retr else 1.05)))
+            rtt = int(abs(self.rng.gauss(800, 150)))
+            d.update(retransmits=retr, snd_cwnd=self.cwnd[sock], rtt=rtt,
+                     rttvar=int(rtt * 0.2), pmtu=1500)
+            if not omitted:
+                tot['retr'] += retr
+        if not omitted:
+            tot['bytes'] += nbytes
+        return d
+
+    def interval(self, start, end, omitted):
+        streams = [self.stream_interval(s, start, end, omitted) for s in self.sockets]
+        total = sum(d['bytes'] for d in streams)
+        seconds = end - start
+        summ = {'start': start, 'end': end, 'seconds': seconds, 'bytes': total,
+                'bits_per_second': total * 8 / seconds if seconds else 0.0,
+                'omitted': omitted, 'sender': not self.args.reverse}
+        if self.udp:
+            summ['packets'] = sum(d['packets'] for d in streams)
+            if self.args.reverse:
+                lost = sum(d['lost_packets'] for d in streams)
+                summ.update(jitter_ms=sum(d['jitter_ms'] for d in streams) / len(streams),
+                            lost_packets=lost, lost_percent=lost * 100.0 / summ['packets'])
+        else:
+            summ['retransmits'] = sum(d['retransmits'] for d in streams)
+        return {'streams': streams, 'sum': summ}
+
+    def start_block(self):
+        a = self.args
+        return {
+            'connected': [{'socket': s, 'local_host': '127.0.0.1', 'local_port': 40000 + s,
+                           'remote_host': a.client, 'remote_port': a.port} for s in self.sockets],
+            'version': f"iperf {a.fake_version}",
+            'timestamp': {'timesecs': int(time.time())},
+            'connecting_to': {'host': a.client, 'port': a.port},
+            'test_start': {'protocol': 'UDP' if self.udp else 'TCP', 'num_streams': self.parallel,
+                           'omit': a.omit, 'duration': a.time, 'reverse': int(a.reverse)},
+        }
+
+    def end_block(self, duration):
+        streams, sent = [], 0
+        lost = packets = retr = 0
+        jitter = 0.0
+        for s in self.sockets:
+            t = self.totals[s]
+            sent += t['bytes']
+            base = {'socket': s, 'start': 0, 'end': duration, 'seconds': duration,
+                    'bytes': t['bytes'], 'bits_per_second': t['bytes'] * 8 / duration}
+            if self.udp:
+                loss_pct = t['lost'] * 100.0 / t['packets'] if t['packets'] else 0.0
+                streams.append({'udp': dict(base, jitter_ms=t['jitter'], lost_packets=t['lost'],
+                                            packets=t['packets'], lost_percent=loss_pct,
+                                            sender=True)})
+                lost += t['lost']
+                packets += t['packets']
+                jitter += t['jitter']
+            else:
+                streams.append({'sender': dict(base, retransmits=t['retr'], sender=True),
+                                'receiver': dict(base, sender=False)})
+                retr += t['retr']
+        total = {'start': 0, 'end': duration, 'seconds': duration, 'bytes': sent,
+                 'bits_per_second': sent * 8 / duration}
+        end = {'streams': streams}
+        if self.udp:
+            end['sum'] = dict(total, jitter_ms=jitter / self.parallel, lost_packets=lost,
+                              packets=packets, lost_percent=lost * 100.0 / packets if packets else 0.0,
+                              sender=True)
+        else:
+            end['sum_sent'] = dict(total, retransmits=retr, sender=True)
+            end['sum_received'] = dict(total, sender=False)
+        return end
+
+
+class Output:
+    def __init__(self, flush):
+        self.flush = flush
+        self.write = sys.stdout.write
+
+    def line(self, text):
+        self.write(text + "\n")
+        if self.flush:
+            sys.stdout.flush()
+
+
+def run_client(args):
+    test = FakeTest(args)
+    out = Output(args.forceflush or args.json_stream)
+    speed = args.fake_speed
+    mode = 'json-stream' if args.json_stream else 'json' if args.json else 'text'
+    doc = {'start': test.start_block(), 'intervals': []}
+
+    if mode == 'json-stream':
+        out.line(json.dumps({'event': 'start', 'data': doc['start']}))
+    elif mode == 'text':
+        out.line(f"Connecting to host {args.client}, port {args.port}")
+        if args.reverse:
+            out.line(f"Reverse mode, remote host {args.client} is sending")
+        for s in test.sockets:
+            out.line(f"[{s:>3}] local 127.0.0.1 port {40000 + s} connected to {args.client} port {args.port}")
+        if test.udp and args.reverse:
+            out.line("[ ID] Interval           Transfer     Bitrate         Jitter    Lost/Total Datagrams")
+        elif test.udp:
+            out.line("[ ID] Interval           Transfer     Bitrate         Total Datagrams")
+        else:
+            out.line("[ ID] Interval           Transfer     Bitrate         Retr  Cwnd")
+
+    step = max(0.01, args.interval)
+    began = time.monotonic()
+    t = 0.0 - args.omit
+    end_time = args.time
+    while t < end_time - 1e-9:
+        t_next = min(t + step, end_time)
+        omitted = t < 0
+        shown_start, shown_end = (t + args.omit, t_next + args.omit) if omitted else (t, t_next)
+        if speed > 0:
+            delay = began + (t_next + args.omit) / speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        iv = test.interval(round(shown_start, 6), round(shown_end, 6), omitted)
+        if mode == 'json-stream':
+            out.line(json.dumps({'event': 'interval', 'data': iv}))
+        elif mode == 'json':
+            doc['intervals'].append(iv)
+        else:
+            for d in iv['streams']:
+                out.line(text_line(d['socket'], d, test.udp, omitted=omitted))
+            if test.parallel > 1:
+                out.line(text_line(None, iv['sum'], test.udp, omitted=omitted))
+                out.line("- - - - - - - - - - - - - - - - - - - - - - - - -")
+        t = t_next
+
+    end = test.end_block(args.time)
+    if mode == 'json-stream':
+        out.line(json.dumps({'event': 'end', 'data': end}))
+    elif mode == 'json':
+        doc['end'] = end
+        out.line(json.dumps(doc, indent=1))
+    else:
+        out.line("- - - - - - - - - - - - - - - - - - - - - - - - -")
+        if test.udp:
+            out.line("[ ID] Interval           Transfer     Bitrate         Jitter    Lost/Total Datagrams")
+            for st in end['streams']:
+                d = st['udp']
+                out.line(text_line(d['socket'], d, True, final=True))
+            if test.parallel > 1:
+                out.line(text_line(None, end['sum'], True, final=True))
+        else:
+            out.line("[ ID] Interval           Transfer     Bitrate         Retr")
+            for st in end['streams']:
+                out.line(text_line(st['sender']['socket'], st['sender'], False, final=True))
+                out.line(text_line(st['receiver']['socket'], st['receiver'], False, final=False))
+            if test.parallel > 1:
+                out.line(text_line(None, end['sum_sent'], False, final=True))
+                out.line(text_line(None, end['sum_received'], False, final=False))
+        out.line("")
+        out.line("iperf Done.")
+    sys.stdout.flush()
+    return 0
+
+
+def main(argv=None):
+    args, _unknown = build_parser().parse_known_args(argv)
+    if args.version:
+        print(f"iperf {args.fake_version} (fake) Linux\nOptional features available: none")
+        return 0
+    if not args.client:
+        msg = "parameter error - must either be a client (-c) or server (-s)"
+        if args.json_stream:
+            print(json.dumps({'event': 'error', 'data': msg}))
+        else:
+            print(f"iperf3: {msg}")
+        return 1
+    try:
+        return run_client(args)
+    except (BrokenPipeError, KeyboardInterrupt):
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,675 @@
+"""Headless NetTest: run iperf3 tests from cron, systemd or CI.
+
+    python NetTest_cli/main.py run 10.0.0.2 -t 10 -P 4 --min-mbps 900
+    python NetTest_cli/main.py run 10.0.0.2 10.0.0.3 -u -b 500M --max-loss 0.5 --format csv
+    python NetTest_cli/main.py ratesearch 10.0.0.2 --loss-target 0.1
+    python NetTest_cli/main.py sweep 10.0.0.2 --grid parallel=1,4,8 --grid window=512K,4M
+    python NetTest_cli/main.py mesh a=10.0.0.1 b=10.0.0.2 c=10.0.0.3 -t 5
+    python NetTest_cli/main.py server -p 5201
+    python NetTest_cli/main.py daemon --host 0.0.0.0 --port 8000
+    python NetTest_cli/main.py export 1a2b3c4d --format csv --gzip -o run.csv.gz
+
+Tests go through the same ``RunManager`` and parser as the GUIs. Results go
+to stdout (or ``--output``) as one JSON document, NDJSON (live intervals,
+then one result per run) or CSV (one row per run). Progress and iperf3's own
+log go to stderr with ``-v``.
+
+Exit codes: 0 all runs passed, 1 a threshold failed, 2 bad usage,
+3 a run failed to execute, 4 an anomaly was detected (``--fail-on-anomaly``),
+130 interrupted.
+
+Startup is kept short. Only ``NetTest_core.runs`` is imported eagerly;
+sqlite3, csv, asyncio, http.server and tkinter load only when a command
+needs them.
+"""
+import argparse
+import json
+import os
+import signal
+import sys
+import threading
+import time
+
+# 共享核心库 NetTest_core 位于本目录的上一级
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+from NetTest_core.runs import RunManager, normalize_spec
+
+EXIT_OK = 0
+EXIT_THRESHOLD = 1
+EXIT_USAGE = 2
+EXIT_RUN_FAILED = 3
+EXIT_ANOMALY = 4
+EXIT_INTERRUPTED = 130
+
+CSV_FIELDS = ('id', 'label', 'target', 'protocol', 'direction', 'state', 'exit_code',
+              'started', 'finished', 'mbps', 'sender_mbps', 'receiver_mbps',
+              'p5_mbps', 'p50_mbps', 'p95_mbps', 'retransmits', 'retransmit_storms', 'jain_index',
+              'jitter_ms', 'loss_percent',
+              'passed', 'failures', 'anomalies', 'error')
+
+
+def iperf_executable():
+    """``$NETTEST_IPERF3``, the bundled iperf3.exe on Windows, else iperf3 on PATH."""
+    exe = os.environ.get('NETTEST_IPERF3')
+    if exe:
+        return exe
+    bundled = os.path.join(ROOT_DIR, 'iperf3.exe')
+    if sys.platform == 'win32' and os.path.exists(bundled):
+        return bundled
+    return 'iperf3'
+
+
+def log(args, message):
+    if args.verbose:
+        print(message, file=sys.stderr, flush=True)
+
+
+# ---------------------------------------------------------------------------
+# Results
+# ---------------------------------------------------------------------------
+
+def end_totals(run):
+    """(sender, receiver, udp_total) end-of-test records of the whole test."""
+    records = [r for r in run.summary_records if r.stream is None] or run.summary_records
+    sender = receiver = udp = None
+    for rec in records:
+        if rec.lost_percent is not None:
+            udp = rec
+        if rec.sender is True:
+            sender = rec
+        elif rec.sender is False:
+            receiver = rec
+    return sender, receiver, udp
+
+
+def run_result(run, thresholds):
+    """JSON-friendly result of a finished run, with its threshold verdict."""
+    spec = run.spec
+    ser = run.series
+    sender, receiver, udp = end_totals(run)
+    bw = run.stats.throughput.summary(scale=1e6)
+    avg = ser.agg_sum_bps / ser.agg_count / 1e6 if ser.agg_count else None
+    tcp = run.tcp.summary() if run.tcp.intervals else None
+    result = {
+        'id': run.id,
+        'label': spec.get('label', ''),
+        'target': f"{run.target[0]}:{run.target[1]}" if run.target else None,
+        'protocol': spec.get('protocol'),
+        'direction': spec.get('direction'),
+        'command': run.cmd,
+        'state': run.state,
+        'exit_code': run.exit_code,
+        'error': run.error,
+        'started': run.started,
+        'finished': run.finished,
+        'intervals': ser.agg_count,
+        # receiver total when iperf3 reported one, else the interval mean
+        'mbps': receiver.mbps if receiver is not None else avg,
+        'sender_mbps': sender.mbps if sender is not None else None,
+        'receiver_mbps': receiver.mbps if receiver is not None else None,
+        'p5_mbps': bw['p5'],
+        'p50_mbps': bw['p50'],
+        'p95_mbps': bw['p95'],
+        'retransmits': run.retransmits if spec.get('protocol') != 'udp' else None,
+        'retransmit_storms': len(tcp['storms']) if tcp and tcp['retransmits'] is not None else None,
+        'jain_index': tcp['jain'] if tcp else None,
+        'jitter_ms': udp.jitter_ms if udp is not None else (run.last.jitter_ms if run.last else None),
+        'loss_percent': udp.lost_percent if udp is not None else None,
+        'anomalies': [{k: ev.get(k) for k in ANOMALY_FIELDS} for ev in run.anomalies],
+        # per-stream retransmits / cwnd / RTT and fairness (TCP, or several streams)
+        'tcp': tcp,
+    }
+    result['failures'] = check_thresholds(result, thresholds)
+    result['passed'] = run.state == 'finished' and not result['failures']
+    return result
+
+
+ANOMALY_FIELDS = ('id', 'kind', 'start', 'end', 'value', 'baseline', 'level', 'reason', 'capture')
+
+
+def check_thresholds(result, t):
+    failures = []
+    if result['state'] != 'finished':
+        return failures     # a run that did not complete is an execution failure instead
+    if t.min_mbps is not None and (result['mbps'] or 0.0) < t.min_mbps:
+        failures.append(f"throughput {result['mbps'] or 0.0:.2f} < {t.min_mbps:g} Mbps")
+    if t.max_loss is not None and result['loss_percent'] is not None \
+            and result['loss_percent'] > t.max_loss:
+        failures.append(f"loss {result['loss_percent']:.3f} > {t.max_loss:g} %")
+    if t.max_jitter is not None and result['jitter_ms'] is not None \
+            and result['jitter_ms'] > t.max_jitter:
+        failures.append(f"jitter {result['jitter_ms']:.3f} > {t.max_jitter:g} ms")
+    if t.max_retransmits is not None and result['retransmits'] is not None \
+            and result['retransmits'] > t.max_retransmits:
+        failures.append(f"retransmits {result['retransmits']} > {t.max_retransmits}")
+    return failures
+
+
+def exit_code_of(results, fail_on_anomaly=False):
+    if any(r['state'] != 'finished' for r in results):
+        return EXIT_RUN_FAILED
+    if any(not r['passed'] for r in results):
+        return EXIT_THRESHOLD
+    if fail_on_anomaly and any(r['anomalies'] for r in results):
+        return EXIT_ANOMALY
+    return EXIT_OK
+
+
+class Writer:
+    """Serializes output records from the reader threads to one stream."""
+
+    def __init__(self, fmt, path=None):
+        self.fmt = fmt
+        self.out = open(path, 'w', newline='', encoding='utf-8') if path else sys.stdout
+        self.lock = threading.Lock()
+        self._csv = None
+
+    def line(self, obj):
+        with self.lock:
+            self.out.write(json.dumps(obj) + "\n")
+            self.out.flush()
+
+    def interval(self, run, records):
+        if self.fmt == 'ndjson':
+            for rec in records:
+                self.line(dict(rec.to_dict(), type='interval', run=run.id))
+
+    def anomaly(self, run, ev):
+        if self.fmt == 'ndjson' and ev['phase'] != 'captured':
+            self.line(dict({k: ev.get(k) for k in ANOMALY_FIELDS}, type='anomaly',
+                           phase=ev['phase'], run=run.id))
+
+    def results(self, results, extra=None):
+        if self.fmt == 'ndjson':
+            for r in results:
+                self.line(dict(r, type='result'))
+        elif self.fmt == 'csv':
+            self.csv_rows(results)
+        else:
+            doc = {'results': results, 'passed': all(r['passed'] for r in results)}
+            doc.update(extra or {})
+            with self.lock:
+                json.dump(doc, self.out, indent=2)
+                self.out.write("\n")
+
+    def csv_rows(self, rows, fields=CSV_FIELDS):
+        import csv
+        with self.lock:
+            if self._csv is None:
+                self._csv = csv.DictWriter(self.out, fieldnames=fields, extrasaction='ignore')
+                self._csv.writeheader()
+            for row in rows:
+                row = dict(row)
+                if isinstance(row.get('failures'), list):
+                    row['failures'] = '; '.join(row['failures'])
+                if isinstance(row.get('anomalies'), list):
+                    row['anomalies'] = len(row['anomalies'])
+                self._csv.writerow(row)
+            self.out.flush()
+
+    def close(self):
+        if self.out is not sys.stdout:
+            self.out.close()
+
+
+# ---------------------------------------------------------------------------
+# Commands
+# ---------------------------------------------------------------------------
+
+def spec_from_args(args, server):
+    return normalize_spec({
+        'server': server,
+        'port': args.port,
+        'protocol': 'udp' if args.udp else 'tcp',
+        'direction': 'download' if args.reverse else 'upload',
+        'bandwidth': args.bitrate,
+        'duration': args.time,
+        'interval': args.interval,
+        'parallel': args.parallel,
+        'window': args.window,
+        'length': args.length,
+        'zerocopy': args.zerocopy,
+        'omit': args.omit,
+        'label': args.label,
+        'extra_args': args.extra,
+    })
+
+
+def make_manager(args):
+    manager = RunManager(max_concurrent=args.max_runs)
+    if getattr(args, 'no_capture', False):
+        manager.anomaly = {'capture': False}
+    elif getattr(args, 'capture_dir', None):
+        manager.anomaly = {'capture_dir': args.capture_dir}
+    if args.history_db or args.save:
+        from NetTest_core.history import HistoryDB
+        history = HistoryDB(args.history_db)
+        manager.add_finish_hook(history.record_run)
+        manager.history = history
+    else:
+        manager.history = None
+    return manager
+
+
+def finish(manager):
+    if manager.history is not None:
+        manager.history.flush()
+
+
+def cmd_run(args, writer):
+    manager = make_manager(args)
+    specs = [spec_from_args(args, server) for server in args.servers]
+    pending = threading.Semaphore(0)
+
+    def listener_for(run_box):
+        def listener(kind, payload):
+            run = run_box[0]
+            if kind == 'text':
+                log(args, f"[{run.id}] {payload}")
+            elif kind == 'interval':
+                writer.interval(run, payload)
+            elif kind == 'anomaly':
+                writer.anomaly(run, payload)
+            elif kind == 'finish':
+                pending.release()
+        return listener
+
+    journal = None
+    if args.journal:
+        from NetTest_core.journal import Journal
+        journal = Journal(args.journal)
+        log(args, f"Log journal: {journal.directory}")
+    runs = []
+    for spec in specs:
+        box = [None]
+        box[0] = run = manager.submit_spec(spec, args.iperf, listener=listener_for(box),
+                                           channels=(journal,) if journal is not None else ())
+        runs.append(run)
+    try:
+        for _ in runs:
+            while not pending.acquire(timeout=0.5):
+                pass    # short waits keep Ctrl+C responsive on Windows
+    except KeyboardInterrupt:
+        manager.stop_all()
+        return EXIT_INTERRUPTED
+    finally:
+        if journal is not None:
+            journal.close()
+    finish(manager)
+    results = [run_result(r, args) for r in runs]
+    writer.results(results)
+    for r in results:
+        log(args, f"[{r['id']}] {r['target']} {r['state']}: "
+                  f"{r['mbps'] or 0.0:.2f} Mbps {'PASS' if r['passed'] else 'FAIL'}"
+                  + (f" ({'; '.join(r['failures'])})" if r['failures'] else "")
+                  + (f", {len(r['anomalies'])} anomalies" if r['anomalies'] else ""))
+    return exit_code_of(results, args.fail_on_anomaly)
+
+
+def _wait_for(job, manager):
+    job.start()
+    try:
+        while job.finished is None:
+            time.sleep(0.2)
+    except KeyboardInterrupt:
+        job.cancel()
+        manager.stop_all()
+        return False
+    return True
+
+
+def cmd_ratesearch(args, writer):
+    from NetTest_core.ratesearch import RateSearch, format_probe
+    manager = make_manager(args)
+    args.udp = True
+    spec = spec_from_args(args, args.servers[0])
+    search = RateSearch(manager, spec, start=args.start, min_rate=args.min_rate,
+                        max_rate=args.max_rate, loss_target=args.loss_target,
+                        jitter_ceiling=args.jitter_ceiling, probe_duration=args.time,
+                        resolution=args.resolution, max_probes=args.max_probes, exe=args.iperf,
+                        listener=lambda kind, p: log(args, format_probe(p)) if kind == 'probe' else None)
+    if not _wait_for(search, manager):
+        return EXIT_INTERRUPTED
+    finish(manager)
+    result = search.result()
+    if writer.fmt == 'csv':
+        writer.csv_rows(result['probes'], ('index', 'rate_mbps', 'achieved_mbps', 'loss_percent',
+                                           'jitter_ms', 'seconds', 'early_stop', 'passed', 'reason'))
+    elif writer.fmt == 'ndjson':
+        for p in result['probes']:
+            writer.line(dict(p, type='probe'))
+        writer.line(dict(result, type='result', probes=len(result['probes'])))
+    else:
+        writer.line(result)
+    if result['state'] == 'failed':
+        return EXIT_RUN_FAILED
+    best = result['max_rate_mbps']
+    if best is None or (args.min_mbps is not None and best < args.min_mbps):
+        return EXIT_THRESHOLD
+    return EXIT_OK
+
+
+def cmd_sweep(args, writer):
+    from NetTest_core.sweep import Sweep, format_cell, format_heatmap, format_table
+    manager = make_manager(args)
+    grid = {}
+    for item in args.grid:
+        key, _, values = item.partition('=')
+        grid[key.strip()] = values
+    specs = [spec_from_args(args, server) for server in args.servers]
+    sweep = Sweep(manager, specs, grid, duration=args.time, prune_ratio=args.prune_ratio,
+                  heatmap=args.heatmap.split(','), exe=args.iperf,
+                  listener=lambda kind, p: log(args, format_cell(p, sweep.total_cells))
+                  if kind == 'cell' else None)
+    if not _wait_for(sweep, manager):
+        return EXIT_INTERRUPTED
+    finish(manager)
+    result = sweep.result()
+    if args.verbose:
+        for line in format_table(result):
+            log(args, line)
+        for target, heatmap in result['heatmaps'].items():
+            log(args, f"heatmap {target} (Mbps)")
+            for line in format_heatmap(heatmap):
+                log(args, line)
+    if writer.fmt == 'csv':
+        rows = [dict(c, **c['params']) for c in result['cells']]
+        writer.csv_rows(rows, ('index', 'target', 'parallel', 'window', 'length', 'zerocopy',
+                               'omit', 'state', 'mean_mbps', 'receiver_mbps', 'p5_mbps',
+                               'p95_mbps', 'retransmits', 'reason'))
+    elif writer.fmt == 'ndjson':
+        for c in result['cells']:
+            writer.line(dict(c, type='cell'))
+        writer.line({'type': 'result', 'id': result['id'], 'state': result['state'],
+                     'best': result['best'], 'heatmaps': result['heatmaps']})
+    else:
+        writer.line(result)
+    if result['state'] == 'failed' or not result['best']:
+        return EXIT_RUN_FAILED
+    if args.min_mbps is not None and any(
+            (c['receiver_mbps'] or c['mean_mbps'] or 0.0) < args.min_mbps
+            for c in result['best'].values()):
+        return EXIT_THRESHOLD
+    return EXIT_OK
+
+
+def cmd_mesh(args, writer):
+    from NetTest_core.mesh import Mesh, format_matrix, format_pair
+    manager = make_manager(args)
+    hosts = list(args.servers)
+    if args.hosts_file:
+        with open(args.hosts_file, encoding='utf-8') as f:
+            if args.hosts_file.endswith('.json'):
+                hosts += json.load(f)       # [{"name", "address", "port", "bind", "exec"}, ...]
+            else:
+                hosts += [line.split('#')[0].strip() for line in f if line.split('#')[0].strip()]
+    spec = spec_from_args(args, 'mesh')
+    mesh = Mesh(manager, hosts, spec, duration=args.time, duplex=args.duplex, exe=args.iperf,
+                listener=lambda kind, p: log(args, format_pair(p, len(mesh.rounds)))
+                if kind == 'pair' else None)
+    log(args, f"{len(mesh.hosts)} hosts, {mesh.total_pairs} pairs in {len(mesh.rounds)} rounds")
+    if not _wait_for(mesh, manager):
+        return EXIT_INTERRUPTED
+    finish(manager)
+    result = mesh.result()
+    if args.verbose:
+        for line in format_matrix(result):
+            log(args, line)
+    if writer.fmt == 'csv':
+        writer.csv_rows(result['pairs'], ('round', 'sender', 'receiver', 'state', 'mbps',
+                                          'loss_percent', 'jitter_ms', 'retransmits', 'reason'))
+    elif writer.fmt == 'ndjson':
+        for pair in result['pairs']:
+            writer.line(dict(pair, type='pair'))
+        writer.line({'type': 'result', 'id': result['id'], 'state': result['state'],
+                     'hosts': result['hosts'], 'matrix': result['matrix']})
+    else:
+        writer.line(result)
+    if result['state'] == 'failed' or any(p['state'] != 'done' for p in result['pairs']):
+        return EXIT_RUN_FAILED
+    if args.min_mbps is not None and any((p['mbps'] or 0.0) < args.min_mbps for p in result['pairs']):
+        return EXIT_THRESHOLD
+    return EXIT_OK
+
+
+def cmd_export(args, _writer):
+    """Stream a run's intervals out of a running dashboard/daemon into a file."""
+    from urllib.error import URLError
+    from urllib.parse import quote, urlencode
+    from urllib.request import urlopen
+    params = {'format': args.export_format, 'key': args.key, 'stream': args.stream}
+    if args.gzip:
+        params['gzip'] = '1'
+    for name in ('from', 'to'):
+        if getattr(args, name + '_') is not None:
+            params[name] = getattr(args, name + '_')
+    url = f"{args.url.rstrip('/')}/api/runs/{quote(args.run_id)}/export?{urlencode(params)}"
+    try:
+        resp = urlopen(url, timeout=30)
+    except (URLError, OSError) as e:
+        print(f"nettest: {url}: {e}", file=sys.stderr)
+        return EXIT_RUN_FAILED
+    with resp:
+        if resp.headers.get_content_type() == 'application/json':
+            # an {"status": "error"} answer instead of the file
+            raise ValueError(json.loads(resp.read().decode('utf-8')).get('msg', 'export failed'))
+        out = open(args.output, 'wb') if args.output else sys.stdout.buffer
+        try:
+            size = 0
+            while True:
+                block = resp.read(64 * 1024)
+                if not block:
+                    break
+                out.write(block)
+                size += len(block)
+        finally:
+            if args.output:
+                out.close()
+    if args.output:
+        print(f"{args.output}: {size} bytes", file=sys.stderr)
+    return EXIT_OK
+
+
+def cmd_server(args, writer):
+    # built-in iperf3 server: no iperf3 binary (or cygwin1.dll) needed
+    from NetTest_core.iperf_server import IperfServer
+
+    def listener(kind, payload):
+        if writer.fmt == 'text':
+            if kind in ('text', 'error'):
+                with writer.lock:
+                    writer.out.write(payload + "\n")
+                    writer.out.flush()
+        elif kind in ('interval', 'summary'):
+            for rec in payload:
+                writer.line(dict(rec.to_dict(), type=kind))
+        elif kind == 'session':
+            writer.line(dict(payload, type='session'))
+
+    server = IperfServer(args.bind, args.port, interval=args.interval, one_off=args.one_off,
+                         listener=listener)
+    try:
+        server.start()
+    except OSError as e:
+        print(f"nettest: unable to start server: {e}", file=sys.stderr)
+        return EXIT_RUN_FAILED
+    try:
+        while server.state != 'stopped':
+            server.wait(0.5)
+    except KeyboardInterrupt:
+        server.stop()
+        return EXIT_INTERRUPTED
+    if args.one_off and (not server.sessions or server.sessions[-1]['state'] != 'finished'):
+        return EXIT_RUN_FAILED
+    return EXIT_OK
+
+
+def cmd_daemon(args, _writer):
+    # the web backend (http.server, asyncio) is only imported here
+    import importlib.util
+    web_dir = os.path.join(ROOT_DIR, 'NetTest_web')
+    sys.path.insert(0, web_dir)
+    spec = importlib.util.spec_from_file_location('nettest_web_main', os.path.join(web_dir, 'main.py'))
+    web = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = web    # main() hands sys.modules[__name__] to the aio server
+    spec.loader.exec_module(web)
+    argv = ['--host', args.host, '--port', str(args.http_port), '--no-browser',
+            '--max-runs', str(args.max_runs)]
+    if args.history_db:
+        argv += ['--history-db', args.history_db]
+    if args.no_history:
+        argv.append('--no-history')
+    if args.pool:
+        argv += ['--pool', str(args.pool), '--pool-base-port', str(args.pool_base_port),
+                 '--pool-backend', args.pool_backend]
+    if args.journal_dir:
+        argv += ['--journal-dir', args.journal_dir]
+    if args.no_journal:
+        argv.append('--no-journal')
+    web.main(argv)
+    return EXIT_OK
+
+
+# ---------------------------------------------------------------------------
+# Arguments
+# ---------------------------------------------------------------------------
+
+def add_test_options(p, duration=10, servers='+'):
+    p.add_argument('servers', nargs=servers, metavar='SERVER', help="iperf3 server(s) to test")
+    p.add_argument('-p', '--port', type=int, default=5201)
+    p.add_argument('-u', '--udp', action='store_true')
+    p.add_argument('-b', '--bitrate', help="UDP target bitrate (iperf3 -b, per stream)")
+    p.add_argument('-R', '--reverse', action='store_true', help="download (server sends)")
+    p.add_argument('-t', '--time', type=int, default=duration, help="seconds per test")
+    p.add_argument('-i', '--interval', type=float, default=1.0)
+    p.add_argument('-P', '--parallel', type=int, default=1)
+    p.add_argument('-w', '--window')
+    p.add_argument('-l', '--length')
+    p.add_argument('-Z', '--zerocopy', action='store_true')
+    p.add_argument('-O', '--omit', type=int, default=0)
+    p.add_argument('--label', default='')
+    p.add_argument('--extra', action='append', default=[], metavar='ARG',
+                   help="extra iperf3 argument (repeatable)")
+    p.add_argument('--min-mbps', type=float, help="fail below this throughput")
+
+
+def add_common_options(p):
+    p.add_argument('--format', choices=('json', 'ndjson', 'csv'), default='json')
+    p.add_argument('-o', '--output', help="write results here instead of stdout")
+    p.add_argument('--iperf', default=None, help="iperf3 binary (default: $NETTEST_IPERF3 or PATH)")
+    p.add_argument('--max-runs', type=int, default=4, help="concurrent iperf3 runs")
+    p.add_argument('--save', action='store_true', help="record runs in the results history")
+    p.add_argument('--history-db', help="history database (implies --save)")
+    p.add_argument('-v', '--verbose', action='store_true', help="progress and iperf3 log on stderr")
+
+
+def build_parser():
+    ap = argparse.ArgumentParser(prog='nettest', description="Headless iperf3 test runner")
+    sub = ap.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('run', help="run one test per server and check thresholds")
+    add_test_options(p)
+    p.add_argument('--max-loss', type=float, help="fail above this UDP loss (%%)")
+    p.add_argument('--max-jitter', type=float, help="fail above this UDP jitter (ms)")
+    p.add_argument('--max-retransmits', type=int, help="fail above this many TCP retransmits")
+    p.add_argument('--fail-on-anomaly', action='store_true',
+                   help="exit 4 if a throughput drop, loss burst or jitter spike was detected")
+    p.add_argument('--capture-dir', help="where anomaly captures go (default ~/.nettest/captures)")
+    p.add_argument('--no-capture', action='store_true', help="don't write anomaly captures")
+    p.add_argument('--journal', metavar='DIR',
+                   help="also write every log line and interval to a rotating on-disk journal")
+    add_common_options(p)
+    p.set_defaults(func=cmd_run)
+
+    p = sub.add_parser('ratesearch', help="find the highest UDP rate under a loss target")
+    add_test_options(p, duration=3)
+    p.add_argument('--start', default='100M')
+    p.add_argument('--min-rate', default='1M')
+    p.add_argument('--max-rate', default='10G')
+    p.add_argument('--loss-target', type=float, default=0.1, help="%% (default 0.1)")
+    p.add_argument('--jitter-ceiling', type=float, help="ms")
+    p.add_argument('--resolution', type=float, default=0.05)
+    p.add_argument('--max-probes', type=int, default=16)
+    add_common_options(p)
+    p.set_defaults(func=cmd_ratesearch)
+
+    p = sub.add_parser('sweep', help="run a parameter grid and rank the cells")
+    add_test_options(p)
+    p.add_argument('--grid', action='append', required=True, metavar='KEY=V1,V2',
+                   help="parallel, window, length, zerocopy or omit values (repeatable)")
+    p.add_argument('--prune-ratio', type=float, default=0.6)
+    p.add_argument('--heatmap', default='parallel,window', help="two axes, comma-separated")
+    add_common_options(p)
+    p.set_defaults(func=cmd_sweep)
+
+    p = sub.add_parser('mesh', help="test every ordered pair of hosts, conflict-free rounds")
+    add_test_options(p, servers='*')
+    p.add_argument('--hosts-file', help="more hosts: one per line, or a JSON list of host objects")
+    p.add_argument('--duplex', action='store_true',
+                   help="a host may send and receive in the same round (full-duplex links)")
+    add_common_options(p)
+    p.set_defaults(func=cmd_mesh)
+
+    p = sub.add_parser('server', help="built-in iperf3 server (stock iperf3 clients can test against it)")
+    p.add_argument('-p', '--port', type=int, default=5201)
+    p.add_argument('-B', '--bind', help="address to listen on (default: all)")
+    p.add_argument('-i', '--interval', type=float, default=1.0, help="report interval, 0 for none")
+    p.add_argument('-1', '--one-off', action='store_true', help="handle one test, then exit")
+    p.add_argument('--format', choices=('text', 'ndjson'), default='text')
+    p.add_argument('-o', '--output', help="write the report here instead of stdout")
+    p.set_defaults(func=cmd_server)
+
+    p = sub.add_parser('export', help="stream a run's intervals from a running daemon as CSV/NDJSON")
+    p.add_argument('run_id', metavar='RUN', help="run id (see /api/runs)")
+    p.add_argument('--url', default='http://localhost:8000', help="dashboard/daemon address")
+    p.add_argument('--format', dest='export_format', choices=('csv', 'ndjson'), default='csv')
+    p.add_argument('--gzip', action='store_true', help="gzip-compressed output")
+    p.add_argument('--from', dest='from_', type=float, help="range start (see --key)")
+    p.add_argument('--to', dest='to_', type=float, help="range end (see --key)")
+    p.add_argument('--key', choices=('ts', 'end'), default='ts',
+                   help="range on wall-clock epoch seconds (ts) or test seconds (end)")
+    p.add_argument('--stream', default='-1', help="-1 aggregate (default), a socket id, or all")
+    p.add_argument('-o', '--output', help="file to write (default stdout)")
+    p.set_defaults(func=cmd_export, format=None)
+
+    p = sub.add_parser('daemon', help="serve the web dashboard headless (no browser)")
+    p.add_argument('--host', default='localhost')
+    p.add_argument('--port', dest='http_port', type=int, default=8000)
+    p.add_argument('--max-runs', type=int, default=4)
+    p.add_argument('--history-db')
+    p.add_argument('--no-history', action='store_true')
+    p.add_argument('--pool', type=int, default=0, metavar='N', help="also run N local iperf3 servers")
+    p.add_argument('--pool-base-port', type=int, default=5201)
+    p.add_argument('--pool-backend', choices=('iperf3', 'builtin'), default='iperf3')
+    p.add_argument('--journal-dir', help="main log journal directory")
+    p.add_argument('--no-journal', action='store_true')
+    p.set_defaults(func=cmd_daemon, format=None, output=None)
+    return ap
+
+
+def _on_sigterm(signum, frame):
+    # systemd / CI stop jobs with SIGTERM: stop iperf3 cleanly like Ctrl+C
+    raise KeyboardInterrupt
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if getattr(args, 'iperf', 1) is None:
+        args.iperf = iperf_executable()
+    signal.signal(signal.SIGTERM, _on_sigterm)
+    writer = Writer(args.format, args.output) if args.format else None
+    try:
+        return args.func(args, writer)
+    except ValueError as e:
+        print(f"nettest: {e}", file=sys.stderr)
+        return EXIT_USAGE
+    except KeyboardInterrupt:
+        return EXIT_INTERRUPTED
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,5 @@
+"""Shared, GUI-independent building blocks for the NetTest front-ends.
+
+Both ``NetTest_ui/main.py`` (Tk) and ``NetTest_web/main.py`` (browser) import
+from this package, so everything in here sticks to the standard library.
+"""
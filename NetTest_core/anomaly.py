@@ -0,0 +1,248 @@
+"""Online detection of throughput drops, loss bursts and jitter spikes.
+
+Each metric of the aggregate interval stream is tracked by a one-sided
+tabular CUSUM against an EWMA baseline:
+
+    z = direction * (x - mean) / sigma
+    S = max(0, S + z - k)           alarm once S > h
+
+``mean`` and ``sigma`` are exponentially weighted (``alpha``) and learnt
+over the first ``warmup`` intervals. They are then only updated while S is
+0, so a slow slide cannot drag the baseline along with it. ``sigma`` has a
+floor so a very steady link does not alarm on tiny wiggles. An alarm also
+needs the change itself to be material (``min_change``), e.g. throughput at
+least 20 % below the baseline. It ends after ``clear`` intervals in a row
+without such a change. If the new level persists for ``rebase_after``
+intervals, it becomes the baseline.
+
+Metrics (UDP loss and jitter only when iperf3 reports them):
+
+* ``throughput_drop``  bits per second falling
+* ``loss_burst``       lost percent rising (percentage points)
+* ``jitter_spike``     jitter rising
+
+Every update is O(1). The last ``before`` intervals are kept in a ring. When
+an anomaly starts, the ring and the next ``after`` intervals form a
+*capture*, written as NDJSON to ``capture_dir``. That directory defaults to
+``$NETTEST_CAPTURE_DIR`` or ``~/.nettest/captures``; ``capture=False`` keeps
+captures in memory only.
+
+``feed()`` returns anomaly events (dicts) with ``phase`` ``'start'``,
+``'end'`` or ``'captured'``.
+"""
+import collections
+import json
+import math
+import os
+import time
+
+THROUGHPUT_DROP = 'throughput_drop'
+LOSS_BURST = 'loss_burst'
+JITTER_SPIKE = 'jitter_spike'
+
+PHASE_START = 'start'
+PHASE_END = 'end'
+PHASE_CAPTURED = 'captured'
+
+# metric: (record field, direction, sigma floor (relative, absolute), min change (relative, absolute))
+METRICS = {
+    THROUGHPUT_DROP: ('bits_per_second', -1, (0.05, 1e3), (0.2, 0.0)),
+    LOSS_BURST: ('lost_percent', 1, (0.0, 0.5), (0.0, 1.0)),
+    JITTER_SPIKE: ('jitter_ms', 1, (0.2, 0.05), (1.0, 0.0)),
+}
+
+
+def default_capture_dir():
+    """``$NETTEST_CAPTURE_DIR`` or ``~/.nettest/captures``."""
+    path = os.environ.get('NETTEST_CAPTURE_DIR')
+    if path:
+        return path
+    return os.path.join(os.path.expanduser('~'), '.nettest', 'captures')
+
+
+class _Cusum:
+    """One-sided CUSUM of one metric against its EWMA baseline."""
+
+    __slots__ = ('kind', 'field', 'direction', 'floor_rel', 'floor_abs', 'min_rel', 'min_abs',
+                 'n', 'mean', 'var', 's', 'alarm', 'normal', 'alarm_n', 'alarm_mean', 'peak')
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.field, self.direction, (self.floor_rel, self.floor_abs), \
+            (self.min_rel, self.min_abs) = METRICS[kind]
+        self.n = 0
+        self.mean = 0.0
+        self.var = 0.0
+        self.s = 0.0
+        self.alarm = None           # the open 'start' event
+        self.normal = 0             # intervals in a row without a material change
+        self.alarm_n = 0
+        self.alarm_mean = 0.0
+        self.peak = 0.0
+
+    def sigma(self):
+        return max(math.sqrt(self.var), self.floor_rel * abs(self.mean), self.floor_abs)
+
+    def learn(self, x, alpha):
+        if self.n == 0:
+            self.mean = x
+        else:
+            d = x - self.mean
+            self.mean += alpha * d
+            self.var = (1 - alpha) * (self.var + alpha * d * d)
+        self.n += 1
+
+    def material(self, x):
+        change = self.direction * (x - self.mean)
+        return change > 0 and change >= max(self.min_rel * abs(self.mean), self.min_abs)
+
+
+class AnomalyDetector:
+    """Feed aggregate interval records; get anomaly events back."""
+
+    def __init__(self, run_id='', warmup=5, alpha=0.1, k=0.5, h=8.0, clear=3,
+                 rebase_after=60, before=20, after=10, capture=True, capture_dir=None):
+        self.run_id = run_id
+        self.warmup = max(2, int(warmup))
+        self.alpha = float(alpha)
+        self.k = float(k)
+        self.h = float(h)
+        self.clear = max(1, int(clear))
+        self.rebase_after = int(rebase_after)
+        self.after = int(after)
+        self.capture_dir = (capture_dir or default_capture_dir()) if capture else None
+        self.metrics = [_Cusum(kind) for kind in METRICS]
+        self.ring = collections.deque(maxlen=int(before))
+        self.captures = []          # open captures: [event, records, remaining]
+        self.events = []            # every anomaly of this run
+        self.last = None
+        self._seq = 0
+
+    @property
+    def active(self):
+        """Kinds currently in alarm."""
+        return [m.kind for m in self.metrics if m.alarm is not None]
+
+    def feed(self, rec, records=None):
+        """One aggregate record (and the interval's per-stream ``records``)."""
+        if rec.omitted:
+            return ()
+        out = []
+        row = records if records is not None else [rec]
+        for cap in self.captures:
+            cap[1].append(row)
+            cap[2] -= 1
+        self.ring.append(row)
+        self.last = rec
+        for m in self.metrics:
+            x = getattr(rec, m.field)
+            if x is not None:
+                ev = self._update(m, float(x), rec)
+                if ev is not None:
+                    out.append(ev)
+        if self.captures and self.captures[0][2] <= 0:
+            while self.captures and self.captures[0][2] <= 0:
+                out.append(self._close_capture(self.captures.pop(0)))
+        return out
+
+    def finish(self):
+        """End open anomalies and write out captures still collecting when the run ends."""
+        out = [self._end(m, self.last, 'run ended') for m in self.metrics
+               if m.alarm is not None and self.last is not None]
+        out += [self._close_capture(cap) for cap in self.captures]
+        self.captures = []
+        return out
+
+    def _update(self, m, x, rec):
+        if m.n < self.warmup:
+            m.learn(x, self.alpha)
+            return None
+        sigma = m.sigma()
+        z = m.direction * (x - m.mean) / sigma
+        m.s = max(0.0, m.s + z - self.k)
+        if m.alarm is None:
+            if m.s == 0.0:
+                m.learn(x, self.alpha)
+            elif m.s > self.h and m.material(x):
+                return self._start(m, x, rec)
+            return None
+
+        # in alarm: track the new level, end once the change is gone
+        m.alarm_n += 1
+        m.alarm_mean += (x - m.alarm_mean) / m.alarm_n
+        m.peak = max(m.peak, m.direction * (x - m.mean))
+        m.normal = 0 if m.material(x) else m.normal + 1
+        if m.normal >= self.clear:
+            return self._end(m, rec, 'recovered')
+        if self.rebase_after and m.alarm_n >= self.rebase_after:
+            ev = self._end(m, rec, 'new baseline')
+            m.mean = m.alarm_mean
+            return ev
+        return None
+
+    def _start(self, m, x, rec):
+        self._seq += 1
+        m.alarm_n, m.alarm_mean, m.normal = 1, x, 0
+        m.peak = m.direction * (x - m.mean)
+        ev = m.alarm = {
+            'id': f"{self.run_id}-{self._seq}" if self.run_id else str(self._seq),
+            'run': self.run_id,
+            'kind': m.kind,
+            'phase': PHASE_START,
+            'value': x,
+            'baseline': m.mean,
+            'sigma': m.sigma(),
+            'score': m.s,
+            'start': rec.start,
+            'end': None,
+            'ts': rec.ts or time.time(),
+            'capture': None,
+        }
+        self.events.append(ev)
+        self.captures.append([ev, list(self.ring), self.after])
+        return dict(ev)
+
+    def _end(self, m, rec, reason):
+        ev = m.alarm
+        ev.update(phase=PHASE_END, end=rec.end, peak=m.peak, level=m.alarm_mean, reason=reason)
+        m.alarm = None
+        m.s = 0.0
+        return dict(ev)
+
+    def _close_capture(self, cap):
+        ev, rows, _ = cap
+        path = None
+        if self.capture_dir:
+            try:
+                path = self._write(ev, rows)
+            except OSError as e:
+                ev['capture_error'] = str(e)
+        ev['capture'] = path
+        return dict(ev, phase=PHASE_CAPTURED, intervals=len(rows),
+                    records=[[r.to_dict() for r in row] for row in rows])
+
+    def _write(self, ev, rows):
+        os.makedirs(self.capture_dir, exist_ok=True)
+        stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(ev['ts']))
+        path = os.path.join(self.capture_dir, f"{ev['id']}-{stamp}-{ev['kind']}.ndjson")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(dict(ev, type='anomaly')) + "\n")
+            for row in rows:
+                for r in row:
+                    f.write(json.dumps(dict(r.to_dict(), type='interval')) + "\n")
+        return path
+
+
+def format_anomaly(ev):
+    """One log line per anomaly event."""
+    what = {THROUGHPUT_DROP: "throughput drop", LOSS_BURST: "loss burst",
+            JITTER_SPIKE: "jitter spike"}[ev['kind']]
+    unit = {THROUGHPUT_DROP: (1e6, 'Mbps'), LOSS_BURST: (1, '%'), JITTER_SPIKE: (1, 'ms')}[ev['kind']]
+    value = f"{ev['value'] / unit[0]:.2f} {unit[1]} vs baseline {ev['baseline'] / unit[0]:.2f} {unit[1]}"
+    if ev['phase'] == PHASE_START:
+        return f"[Anomaly] {what} at {ev['start']:.1f}s: {value}"
+    if ev['phase'] == PHASE_END:
+        return f"[Anomaly] {what} over at {ev['end']:.1f}s ({ev['reason']}, " \
+               f"{ev['start']:.1f}-{ev['end']:.1f}s, level {ev['level'] / unit[0]:.2f} {unit[1]})"
+    where = ev['capture'] or ev.get('capture_error') or "not saved"
+    return f"[Anomaly] {what} capture: {ev['intervals']} intervals -> {where}"
@@ -0,0 +1,145 @@
+"""Breakpoint sampling on iperf3's own interval clock.
+
+A ``BreakpointSampler`` is fed the aggregate ``IntervalRecord`` of every
+reporting interval and emits a *breakpoint* whenever the interval end time
+reported by iperf3 crosses the next period boundary. Because boundaries are
+measured in test seconds rather than wall-clock arrival time, the result
+does not depend on pipe buffering, queue depth or how slow a UI is.
+
+Modes:
+
+``fixed``        the interval that reaches the boundary, as reported
+``window-avg``   time-weighted average of all intervals in the period
+``min-max``      window average plus the min and max interval in the period
+
+Intervals are not split: one that straddles a boundary counts towards the
+period it ends in. ``snapshot()`` takes a manual breakpoint from the newest
+interval at any time.
+"""
+import time
+
+MODE_FIXED = 'fixed'
+MODE_WINDOW_AVG = 'window-avg'
+MODE_MIN_MAX = 'min-max'
+MODES = (MODE_FIXED, MODE_WINDOW_AVG, MODE_MIN_MAX)
+
+_EPS = 1e-6
+
+
+class BreakpointSampler:
+    def __init__(self, period=5.0, mode=MODE_FIXED, start=0.0):
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {MODES}")
+        period = float(period)
+        if period <= 0:
+            raise ValueError("period must be > 0")
+        self.period = period
+        self.mode = mode
+        self.start = float(start)       # test time sampling began at
+        self.next_at = self.start + period
+        self.points = []
+        self.last = None                # newest record seen
+        self._reset_window()
+
+    def _reset_window(self):
+        self._w_start = None
+        self._w_seconds = 0.0
+        self._w_bits = 0.0
+        self._w_jitter = 0.0
+        self._w_jitter_s = 0.0
+        self._w_lost = 0
+        self._w_packets = 0
+        self._w_min = None
+        self._w_max = None
+        self._w_retr = 0
+        self._w_count = 0
+
+    def _accumulate(self, rec):
+        seconds = rec.seconds or (rec.end - rec.start)
+        if self._w_start is None:
+            self._w_start = rec.start
+        self._w_seconds += seconds
+        self._w_bits += rec.bits_per_second * seconds
+        if rec.jitter_ms is not None:
+            self._w_jitter += rec.jitter_ms * seconds
+            self._w_jitter_s += seconds
+        if rec.packets:
+            self._w_packets += rec.packets
+            self._w_lost += rec.lost_packets or 0
+        if rec.retransmits:
+            self._w_retr += rec.retransmits
+        mbps = rec.mbps
+        if self._w_min is None or mbps < self._w_min:
+            self._w_min = mbps
+        if self._w_max is None or mbps > self._w_max:
+            self._w_max = mbps
+        self._w_count += 1
+
+    def feed(self, rec):
+        """Add one aggregate interval record; return the breakpoints it completes."""
+        if rec is None or rec.omitted or rec.end <= self.start + _EPS:
+            return []
+        self.last = rec
+        if self.mode != MODE_FIXED:
+            self._accumulate(rec)
+        out = []
+        while rec.end >= self.next_at - _EPS:
+            out.append(self._emit(rec))
+            self.next_at += self.period
+        return out
+
+    def _emit(self, rec, manual=False):
+        windowed = not manual and self.mode != MODE_FIXED and self._w_count
+        point = {
+            'index': len(self.points) + 1,
+            'mode': 'manual' if manual else self.mode,
+            't': rec.end if manual else self.next_at,    # test seconds
+            'window_start': self._w_start if windowed else rec.start,
+            'window_end': rec.end,
+            'interval_start': rec.start,
+            'interval_end': rec.end,
+            'ts': rec.ts or time.time(),
+        }
+        if not windowed:
+            # fixed mode, or a boundary the previous interval already passed
+            point.update(mbps=rec.mbps, samples=1, jitter_ms=rec.jitter_ms,
+                         loss_percent=rec.lost_percent, retransmits=rec.retransmits)
+        else:
+            point.update(
+                mbps=self._w_bits / self._w_seconds / 1e6 if self._w_seconds else rec.mbps,
+                samples=self._w_count,
+                jitter_ms=self._w_jitter / self._w_jitter_s if self._w_jitter_s else None,
+                loss_percent=self._w_lost * 100.0 / self._w_packets if self._w_packets else None,
+                retransmits=self._w_retr,
+            )
+            if self.mode == MODE_MIN_MAX:
+                point.update(min_mbps=self._w_min, max_mbps=self._w_max)
+            self._reset_window()
+        self.points.append(point)
+        return point
+
+    def snapshot(self):
+        """Manual breakpoint from the newest interval, or None before the first one."""
+        if self.last is None:
+            return None
+        return self._emit(self.last, manual=True)
+
+    def summary(self):
+        values = [p['mbps'] for p in self.points]
+        if not values:
+            return {'count': 0, 'avg_mbps': None, 'min_mbps': None, 'max_mbps': None}
+        return {'count': len(values), 'avg_mbps': sum(values) / len(values),
+                'min_mbps': min(values), 'max_mbps': max(values)}
+
+
+def format_point(p):
+    """One log line for a breakpoint, iperf3-style."""
+    line = (f"[BP {p['index']:>3}] {p['window_start']:7.2f}-{p['window_end']:<7.2f} sec  "
+            f"{p['mbps']:10.2f} Mbits/sec  ({p['mode']})")
+    if 'min_mbps' in p:
+        line += f"  min {p['min_mbps']:.2f}  max {p['max_mbps']:.2f}"
+    if p.get('jitter_ms') is not None:
+        line += f"  jitter {p['jitter_ms']:.3f} ms"
+    if p.get('loss_percent') is not None:
+        line += f"  loss {p['loss_percent']:.2f}%"
+    return line
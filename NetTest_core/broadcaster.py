@@ -0,0 +1,144 @@
+"""Fan-out of log lines / events to any number of SSE subscribers.
+
+Messages live in a fixed-capacity ring buffer and carry a monotonically
+increasing sequence number, which doubles as the SSE ``id:`` field. A
+subscriber only has to remember the last sequence number it has seen: it
+blocks in ``wait`` until something newer is published (no polling), and a
+reconnecting browser resumes from its ``Last-Event-ID`` header.
+"""
+import threading
+
+
+class Message:
+    __slots__ = ('seq', 'event', 'data')
+
+    def __init__(self, seq, event, data):
+        self.seq = seq
+        self.event = event      # None for plain log lines
+        self.data = data
+
+    def to_sse(self):
+        """Encode as one SSE frame (multi-line data split into data: fields)."""
+        head = f"id: {self.seq}\n"
+        if self.event:
+            head += f"event: {self.event}\n"
+        if '\n' in self.data:
+            body = "".join(f"data: {part}\n" for part in self.data.split('\n'))
+        else:
+            body = f"data: {self.data}\n"
+        return head + body + "\n"
+
+
+class Broadcaster:
+    def __init__(self, capacity=10000):
+        self.capacity = capacity
+        self._ring = [None] * capacity
+        self._seq = 0           # sequence number of the newest message
+        self._first = 1         # oldest sequence number still valid (moved by clear)
+        self._cond = threading.Condition()
+        self._listeners = []
+        self._sinks = []
+        self.dropped = 0        # messages subscribers fell too far behind to receive
+
+    @property
+    def last_seq(self):
+        return self._seq
+
+    def publish(self, data, event=None):
+        """Append a message and wake every waiting subscriber. Returns its seq."""
+        with self._cond:
+            self._seq += 1
+            seq = self._seq
+            self._ring[seq % self.capacity] = Message(seq, event, data)
+            self._cond.notify_all()
+            sinks = list(self._sinks)
+            listeners = list(self._listeners)
+        # outside the lock: a sink's disk I/O (journal rotation fsync) must not
+        # stall subscribers or other publishers
+        for sink in sinks:
+            sink.publish(data, event)
+        for callback in listeners:
+            callback(seq)
+        return seq
+
+    def clear(self):
+        """Forget buffered messages. Sequence numbers keep increasing."""
+        with self._cond:
+            self._first = self._seq + 1
+            self._ring = [None] * self.capacity
+
+    def oldest_seq(self):
+        return max(self._first, self._seq - self.capacity + 1)
+
+    def since(self, seq, limit=None):
+        """Messages with a sequence number greater than ``seq``, oldest first.
+
+        If the ring has already overwritten part of that range, delivery
+        resumes at the oldest message still held and the gap is counted in
+        ``dropped``.
+        """
+        with self._cond:
+            newest = self._seq
+            start = seq + 1
+            oldest = self.oldest_seq()
+            if start < oldest:
+                if seq > 0 and start >= self._first:
+                    self.dropped += oldest - start
+                start = oldest
+            if limit is not None:
+                newest = min(newest, start + limit - 1)
+            ring, cap = self._ring, self.capacity
+            return [ring[i % cap] for i in range(start, newest + 1)]
+
+    def tail(self, count, event=None):
+        """The newest ``count`` messages of the given event type (None = log lines)."""
+        with self._cond:
+            out = []
+            i = self._seq
+            oldest = self.oldest_seq()
+            while i >= oldest and len(out) < count:
+                msg = self._ring[i % self.capacity]
+                if msg is not None and msg.event == event:
+                    out.append(msg)
+                i -= 1
+            out.reverse()
+            return out
+
+    def wait(self, seq, timeout=None):
+        """Block until a message newer than ``seq`` exists. False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._seq > seq, timeout)
+
+    def add_listener(self, callback):
+        """Register ``callback(seq)``, called after every publish.
+
+        Used by event loops that cannot block in ``wait``; the callback runs
+        on the publishing thread and must be cheap and thread-safe.
+        """
+        with self._cond:
+            self._listeners.append(callback)
+
+    def add_sink(self, sink):
+        """Also hand every message to ``sink.publish(data, event)`` (e.g. a
+        ``Journal``) on the publishing thread, after the lock is released. The
+        sink must be thread-safe; concurrent publishers may reach it in either
+        order (journal entries carry their own timestamps)."""
+        with self._cond:
+            self._sinks.append(sink)
+
+    def remove_listener(self, callback):
+        with self._cond:
+            try:
+                self._listeners.remove(callback)
+            except ValueError:
+                pass
+
+
+def parse_last_event_id(value):
+    """``Last-Event-ID`` header -> int sequence number, or None."""
+    if not value:
+        return None
+    try:
+        return int(value.strip())
+    except ValueError:
+        return None
@@ -0,0 +1,88 @@
+"""Streaming export of a run's interval samples as CSV or NDJSON.
+
+``export_series`` walks a ``SeriesStore`` one chunk at a time and yields
+encoded ``bytes`` blocks, optionally gzip-compressed as it goes. Memory use
+stays the same however long the run was: at most one store chunk plus one
+output block (``block_bytes``) at a time. The web backend sends the blocks
+as a chunked HTTP body; the CLI and the Tk app write them to a file.
+
+Columns are those of ``tsstore.COLUMN_NAMES``. Missing values (NaN floats,
+-1 in the integer ``retr``/``cwnd``/``rtt``/``rttvar`` columns) become an
+empty CSV field or JSON ``null``. ``stream`` is
+-1 for the aggregate row, as in ``/api/runs/<id>/series``.
+"""
+import json
+import zlib
+
+from .tsstore import AGGREGATE, COLUMN_NAMES
+
+_OPTIONAL_INTS = ('retr', 'cwnd', 'rtt', 'rttvar')     # -1 = not reported
+
+FORMATS = ('csv', 'ndjson')
+CONTENT_TYPES = {'csv': 'text/csv; charset=utf-8', 'ndjson': 'application/x-ndjson'}
+
+
+def _csv_value(v):
+    if v != v:
+        return ''
+    return repr(v)
+
+
+def _rows(part, columns):
+    cols = [part[name] for name in columns]
+    ints = [i for i, name in enumerate(columns) if name in _OPTIONAL_INTS]
+    for row in zip(*cols):
+        if ints and any(row[i] < 0 for i in ints):
+            row = tuple(None if i in ints and v < 0 else v for i, v in enumerate(row))
+        yield row
+
+
+def _lines(series, fmt, t0, t1, key, stream, columns):
+    if fmt == 'csv':
+        yield ",".join(columns) + "\n"
+    for part in series.iter_range(t0, t1, key, stream, columns):
+        if fmt == 'csv':
+            yield "".join(",".join('' if v is None else _csv_value(v) for v in row) + "\n"
+                          for row in _rows(part, columns))
+        else:
+            yield "".join(json.dumps({name: (None if v is None or v != v else v)
+                                      for name, v in zip(columns, row)}) + "\n"
+                          for row in _rows(part, columns))
+
+
+def export_series(series, fmt='csv', t0=None, t1=None, key='ts', stream=AGGREGATE,
+                  columns=COLUMN_NAMES, gzip=False, block_bytes=64 * 1024):
+    """Encoded blocks of the rows with ``t0 <= key <= t1``. Raises ValueError
+    for a bad format, key or column (before anything is produced)."""
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {FORMATS}")
+    if key not in ('ts', 'end'):
+        raise ValueError("key must be ts or end")
+    bad = [c for c in columns if c not in COLUMN_NAMES]
+    if bad:
+        raise ValueError(f"unknown column(s): {', '.join(bad)}")
+    return _blocks(_lines(series, fmt, t0, t1, key, stream, tuple(columns)), gzip, block_bytes)
+
+
+def _blocks(texts, gzip, block_bytes):
+    # wbits=31: a gzip container, compressed incrementally
+    comp = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None
+    buf, size = [], 0
+    for text in texts:
+        data = text.encode('utf-8')
+        if comp is not None:
+            data = comp.compress(data)
+        if data:
+            buf.append(data)
+            size += len(data)
+        if size >= block_bytes:
+            yield b"".join(buf)
+            buf, size = [], 0
+    if comp is not None:
+        buf.append(comp.flush())
+    if buf:
+        yield b"".join(buf)
+
+
+def export_filename(name, fmt, gzip=False):
+    return f"{name}.{fmt}" + (".gz" if gzip else "")
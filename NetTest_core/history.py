@@ -0,0 +1,377 @@
+"""Persistent results history in a local SQLite database.
+
+Every finished run is written automatically (config, summary and a
+downsampled interval series) by a background writer that batches inserts
+into one transaction. The database runs in WAL mode so dashboards can
+query while a batch is being written. ``query_runs`` and ``trend`` answer
+questions like "how did link X perform over the last 30 days".
+"""
+import contextlib
+import json
+import math
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from .iperf_stream import parallel_of
+from .tsstore import AGGREGATE
+
+SERIES_POINTS = 500         # downsampled samples stored per run
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id           INTEGER PRIMARY KEY,
+    run_id       TEXT NOT NULL,
+    label        TEXT,
+    started      REAL NOT NULL,
+    finished     REAL,
+    day          INTEGER NOT NULL,      -- local calendar day, days since 1970-01-01
+    server       TEXT,
+    port         INTEGER,
+    protocol     TEXT,
+    direction    TEXT,
+    parallel     INTEGER,
+    duration     REAL,
+    command      TEXT,
+    config       TEXT,                  -- spec as JSON
+    state        TEXT,
+    exit_code    INTEGER,
+    samples      INTEGER,
+    avg_bps      REAL,
+    min_bps      REAL,
+    max_bps      REAL,
+    p50_bps      REAL,
+    p95_bps      REAL,
+    jitter_ms    REAL,
+    loss_percent REAL,
+    retransmits  INTEGER
+);
+CREATE INDEX IF NOT EXISTS runs_started ON runs(started);
+CREATE INDEX IF NOT EXISTS runs_server ON runs(server, started);
+CREATE INDEX IF NOT EXISTS runs_protocol ON runs(protocol, started);
+CREATE INDEX IF NOT EXISTS runs_direction ON runs(direction, started);
+CREATE TABLE IF NOT EXISTS samples (
+    run          INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    t            REAL NOT NULL,         -- interval end, seconds since test start
+    bps          REAL,
+    jitter_ms    REAL,
+    loss_percent REAL,
+    retransmits  INTEGER
+);
+CREATE INDEX IF NOT EXISTS samples_run ON samples(run, t);
+"""
+
+_RUN_COLUMNS = ('run_id', 'label', 'started', 'finished', 'day', 'server', 'port', 'protocol',
+                'direction', 'parallel', 'duration', 'command', 'config', 'state', 'exit_code',
+                'samples', 'avg_bps', 'min_bps', 'max_bps', 'p50_bps', 'p95_bps',
+                'jitter_ms', 'loss_percent', 'retransmits')
+
+
+def default_db_path():
+    """``$NETTEST_HISTORY_DB`` or ``~/.nettest/history.sqlite3``."""
+    path = os.environ.get('NETTEST_HISTORY_DB')
+    if path:
+        return path
+    return os.path.join(os.path.expanduser('~'), '.nettest', 'history.sqlite3')
+
+
+def local_day(ts):
+    t = time.localtime(ts)
+    return int((ts + t.tm_gmtoff) // 86400)
+
+
+def day_to_iso(day):
+    return time.strftime('%Y-%m-%d', time.gmtime(day * 86400))
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list (q in 0..100)."""
+    if not sorted_values:
+        return None
+    k = max(0, min(len(sorted_values) - 1, math.ceil(q / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+def _clean(v):
+    return None if v is None or v != v else v
+
+
+def describe_command(cmd):
+    """Best-effort config (server, port, protocol ...) parsed from an iperf3 command."""
+    desc = {'server': None, 'port': 5201, 'protocol': 'tcp', 'direction': 'upload',
+            'parallel': parallel_of(cmd), 'duration': 10.0}
+    for i, arg in enumerate(cmd):
+        nxt = cmd[i + 1] if i + 1 < len(cmd) else None
+        if arg in ('-c', '--client') and nxt:
+            desc['server'] = nxt
+        elif arg in ('-p', '--port') and nxt:
+            try:
+                desc['port'] = int(nxt)
+            except ValueError:
+                pass
+        elif arg in ('-t', '--time') and nxt:
+            try:
+                desc['duration'] = float(nxt)
+            except ValueError:
+                pass
+        elif arg in ('-u', '--udp'):
+            desc['protocol'] = 'udp'
+        elif arg in ('-R', '--reverse'):
+            desc['direction'] = 'download'
+        elif arg == '--bidir':
+            desc['direction'] = 'bidir'
+    return desc
+
+
+def downsample(end, bps, jitter, loss, retr, points=SERIES_POINTS):
+    """Bucket-average parallel columns down to at most ``points`` rows."""
+    n = len(end)
+    if n <= points:
+        return [(end[i], bps[i], _clean(jitter[i]), _clean(loss[i]),
+                 retr[i] if retr[i] >= 0 else None) for i in range(n)]
+    out = []
+    step = n / points
+    for b in range(points):
+        i, j = int(b * step), int((b + 1) * step)
+        size = j - i
+        jit = [v for v in jitter[i:j] if v == v]
+        los = [v for v in loss[i:j] if v == v]
+        rtr = [v for v in retr[i:j] if v >= 0]
+        out.append((end[j - 1], sum(bps[i:j]) / size,
+                    sum(jit) / len(jit) if jit else None,
+                    sum(los) / len(los) if los else None,
+                    sum(rtr) if rtr else None))
+    return out
+
+
+def run_row(run):
+    """Summarise a finished ``runs.Run`` into (runs-row dict, sample tuples)."""
+    desc = describe_command(run.cmd)
+    spec = run.spec or {}
+    for key in ('server', 'port', 'protocol', 'direction', 'parallel', 'duration'):
+        if spec.get(key):
+            desc[key] = spec[key]
+
+    cols = run.series.range(columns=('end', 'bps', 'jitter', 'loss', 'retr'), stream=AGGREGATE)
+    bps_sorted = sorted(cols['bps'])
+    jit = [v for v in cols['jitter'] if v == v]
+    los = [v for v in cols['loss'] if v == v]
+    rtr = [v for v in cols['retr'] if v >= 0]
+
+    # UDP senders only learn jitter/loss from the receiver's end-of-test totals
+    for rec in run.summary_records:
+        if rec.stream is None and rec.jitter_ms is not None and not jit:
+            jit = [rec.jitter_ms]
+            los = [rec.lost_percent] if rec.lost_percent is not None else los
+
+    started = run.started or run.created
+    row = {
+        'run_id': run.id,
+        'label': spec.get('label') or '',
+        'started': started,
+        'finished': run.finished,
+        'day': local_day(started),
+        'server': desc['server'],
+        'port': desc['port'],
+        'protocol': desc['protocol'],
+        'direction': desc['direction'],
+        'parallel': desc['parallel'],
+        'duration': desc['duration'],
+        'command': ' '.join(run.cmd),
+        'config': json.dumps(spec),
+        'state': run.state,
+        'exit_code': run.exit_code,
+        'samples': len(bps_sorted),
+        'avg_bps': sum(bps_sorted) / len(bps_sorted) if bps_sorted else None,
+        'min_bps': bps_sorted[0] if bps_sorted else None,
+        'max_bps': bps_sorted[-1] if bps_sorted else None,
+        'p50_bps': percentile(bps_sorted, 50),
+        'p95_bps': percentile(bps_sorted, 95),
+        'jitter_ms': sum(jit) / len(jit) if jit else None,
+        'loss_percent': sum(los) / len(los) if los else None,
+        'retransmits': sum(rtr) if rtr else None,
+    }
+    samples = downsample(cols['end'], cols['bps'], cols['jitter'], cols['loss'], cols['retr'])
+    return row, samples
+
+
+class HistoryDB:
+    """SQLite results store with a batching background writer."""
+
+    def __init__(self, path=None, batch_size=64, batch_window=0.5):
+        self.path = path or default_db_path()
+        if self.path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self._local = threading.local()
+        # ':memory:' is a separate empty database per connection, so that case
+        # shares one connection between the threads, serialized by a lock
+        self._shared = self._open() if self.path == ':memory:' else None
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._pending = 0           # queued rows not yet committed (or failed)
+        self._done = threading.Condition()
+        self._writer = None
+        self.written = 0
+        with self._db() as conn:
+            conn.executescript(_SCHEMA)
+            conn.commit()
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=self.path != ':memory:')
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    @contextlib.contextmanager
+    def _db(self):
+        """The calling thread's connection (the shared one, locked, for ':memory:')."""
+        if self._shared is not None:
+            with self._lock:
+                yield self._shared
+            return
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._open()
+        yield conn
+
+    # -- writing --------------------------------------------------------------
+
+    def record_run(self, run):
+        """Queue a finished run for the writer thread (cheap; safe from any thread)."""
+        self.record(*run_row(run))
+
+    def record(self, row, samples=()):
+        with self._done:
+            self._pending += 1
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, daemon=True,
+                                                name='history-writer')
+                self._writer.start()
+        self._queue.put((row, list(samples)))
+
+    def flush(self, timeout=None):
+        """Wait until everything queued so far is committed. False on timeout."""
+        with self._done:
+            return self._done.wait_for(lambda: self._pending == 0, timeout)
+
+    def _write_loop(self):
+        insert_run = (f"INSERT INTO runs ({', '.join(_RUN_COLUMNS)}) "
+                      f"VALUES ({', '.join('?' * len(_RUN_COLUMNS))})")
+        insert_sample = ("INSERT INTO samples (run, t, bps, jitter_ms, loss_percent, retransmits) "
+                         "VALUES (?, ?, ?, ?, ?, ?)")
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                with self._db() as conn, conn:
+                    for row, samples in batch:
+                        cur = conn.execute(insert_run, [row.get(c) for c in _RUN_COLUMNS])
+                        pk = cur.lastrowid
+                        conn.executemany(insert_sample, [(pk,) + tuple(s) for s in samples])
+                self.written += len(batch)
+            except sqlite3.Error as e:
+                print(f"[History] write failed: {e}")
+            with self._done:
+                self._pending -= len(batch)
+                if self._pending == 0:
+                    self._done.notify_all()
+
+    # -- reading --------------------------------------------------------------
+
+    def _where(self, server=None, protocol=None, direction=None, since=None, until=None):
+        clauses, args = [], []
+        if server:
+            clauses.append("server = ?")
+            args.append(server)
+        if protocol:
+            clauses.append("protocol = ?")
+            args.append(protocol)
+        if direction:
+            clauses.append("direction = ?")
+            args.append(direction)
+        if since is not None:
+            clauses.append("started >= ?")
+            args.append(since)
+        if until is not None:
+            clauses.append("started < ?")
+            args.append(until)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", args
+
+    def query_runs(self, server=None, protocol=None, direction=None, since=None, until=None,
+                   limit=100, offset=0):
+        """Newest-first run summaries matching the filters."""
+        where, args = self._where(server, protocol, direction, since, until)
+        with self._db() as conn:
+            rows = conn.execute(
+                f"SELECT id, {', '.join(_RUN_COLUMNS)} FROM runs{where} "
+                f"ORDER BY started DESC LIMIT ? OFFSET ?", args + [int(limit), int(offset)]).fetchall()
+        out = []
+        for r in rows:
+            d = dict(r)
+            d['config'] = json.loads(d['config'] or '{}')
+            out.append(d)
+        return out
+
+    def run_samples(self, pk):
+        with self._db() as conn:
+            rows = conn.execute(
+                "SELECT t, bps, jitter_ms, loss_percent, retransmits FROM samples "
+                "WHERE run = ? ORDER BY t", (pk,)).fetchall()
+        return [dict(r) for r in rows]
+
+    def trend(self, server=None, protocol=None, direction=None, days=30, now=None):
+        """Per-day throughput p50/p95 (of run averages), mean loss and run count."""
+        now = time.time() if now is None else now
+        since = now - days * 86400
+        where, args = self._where(server, protocol, direction, since, None)
+        with self._db() as conn:
+            rows = conn.execute(
+                f"SELECT day, avg_bps, loss_percent FROM runs{where} ORDER BY day", args).fetchall()
+        out = []
+        cur_day, bps, loss = None, [], []
+
+        def close_day():
+            bps.sort()
+            out.append({
+                'day': day_to_iso(cur_day),
+                'runs': len(bps),
+                'p50_bps': percentile(bps, 50),
+                'p95_bps': percentile(bps, 95),
+                'min_bps': bps[0] if bps else None,
+                'max_bps': bps[-1] if bps else None,
+                'loss_percent': sum(loss) / len(loss) if loss else None,
+            })
+
+        for day, avg_bps, loss_pct in rows:
+            if day != cur_day:
+                if cur_day is not None:
+                    close_day()
+                cur_day, bps, loss = day, [], []
+            if avg_bps is not None:
+                bps.append(avg_bps)
+            if loss_pct is not None:
+                loss.append(loss_pct)
+        if cur_day is not None:
+            close_day()
+        return out
+
+    def servers(self):
+        with self._db() as conn:
+            rows = conn.execute(
+                "SELECT server, COUNT(*) AS runs, MAX(started) AS last FROM runs "
+                "GROUP BY server ORDER BY last DESC").fetchall()
+        return [dict(r) for r in rows]
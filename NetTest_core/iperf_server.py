@@ -0,0 +1,916 @@
+"""Pure-Python iperf3 server (``iperf3 -s``) on asyncio.
+
+``IperfServer`` speaks iperf3's control-channel protocol, so a stock iperf3
+3.x client can run TCP and UDP tests against it without the C binary:
+``-P``, ``-R``, ``--bidir``, ``-b``, ``-n``/``-k``, ``-O``, ``-w``, ``-N``
+and ``--get-server-output`` are honoured. Results go back to the client in
+the standard results JSON, so the client prints its usual sender/receiver
+summary. As with iperf3, one test runs at a time and other clients get
+ACCESS_DENIED ("the server is busy running a test").
+
+Received data is read with ``recv_into`` / ``recvfrom_into`` from event-loop
+reader callbacks straight into one buffer preallocated per test; it is never
+copied or decoded beyond the UDP sequence header. That is plenty for
+loopback and lab links, but not a replacement for the C server at 10G+.
+
+The server reports like a run: ``listener(kind, payload)`` gets
+``('text', line)``, ``('interval', records)`` (``IntervalRecord``s, [SUM]
+last), ``('summary', records)``, ``('error', message)`` and, once a test is
+over, ``('session', dict)``.
+
+Reader callbacks need a selector event loop. ``start()`` creates one in a
+background thread (the Windows default proactor loop has no ``add_reader``).
+"""
+import asyncio
+import collections
+import json
+import os
+import socket
+import struct
+import threading
+import time
+
+from .iperf_stream import IntervalRecord, format_record
+
+DEFAULT_PORT = 5201
+COOKIE_SIZE = 37                # 36 characters + NUL
+
+# control-channel states (iperf_api.h), sent as one signed byte
+TEST_START = 1
+TEST_RUNNING = 2
+TEST_END = 4
+PARAM_EXCHANGE = 9
+CREATE_STREAMS = 10
+SERVER_TERMINATE = 11
+CLIENT_TERMINATE = 12
+EXCHANGE_RESULTS = 13
+DISPLAY_RESULTS = 14
+IPERF_DONE = 16
+ACCESS_DENIED = -1
+SERVER_ERROR = -2
+
+# i_errno values sent after SERVER_ERROR; the client prints its own text
+IENUMSTREAMS = 6
+IEBLOCKSIZE = 7
+IEUNIMP = 13
+
+UDP_CONNECT_MSG = 0x36373839
+UDP_CONNECT_REPLY = 0x39383736
+LEGACY_UDP_CONNECT_MSG = 123456789
+LEGACY_UDP_CONNECT_REPLY = 987654321
+
+MAX_STREAMS = 128
+MAX_TCP_BLOCK = 1024 * 1024
+MAX_UDP_BLOCK = 65507
+MAX_JSON_BYTES = 8 * 1024 * 1024
+RECV_BUFFER = 256 * 1024
+UDP_RCVBUF = 4 * 1024 * 1024    # fewer drops while Python catches up
+READS_PER_WAKEUP = 16           # recv_into calls per readable callback
+UDP_BURST = 64                  # datagrams sent between event-loop yields
+
+SETUP_TIMEOUT = 10.0            # cookie, parameters, streams, results
+END_GRACE = 30.0                # beyond -t + -O before a silent client is dropped
+
+STATE_STOPPED = 'stopped'
+STATE_LISTENING = 'listening'
+STATE_RUNNING = 'running'
+
+_RULE = '-' * 59
+
+
+class TestError(Exception):
+    """Refuse a test: the client is sent SERVER_ERROR with ``errno``."""
+
+    def __init__(self, errno, message):
+        super().__init__(message)
+        self.errno = errno
+
+
+def tcp_info(sock):
+    """(total_retrans, snd_cwnd bytes, rtt us, rttvar us) from Linux TCP_INFO, else None."""
+    if not hasattr(socket, 'TCP_INFO'):
+        return None
+    try:
+        raw = sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_INFO, 104)
+    except OSError:
+        return None
+    if len(raw) < 104:
+        return None
+    mss, = struct.unpack_from('I', raw, 16)
+    rtt, rttvar, _ssthresh, cwnd = struct.unpack_from('4I', raw, 68)
+    retrans, = struct.unpack_from('I', raw, 100)
+    return retrans, cwnd * mss, rtt, rttvar
+
+
+def congestion_of(sock):
+    if not hasattr(socket, 'TCP_CONGESTION'):
+        return None
+    try:
+        return sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_CONGESTION, 16).split(b'\0', 1)[0].decode()
+    except OSError:
+        return None
+
+
+def listen_socket(host, port):
+    """Listening TCP socket; dual-stack IPv6 when no host is given."""
+    if not host and socket.has_dualstack_ipv6():
+        sock = socket.create_server(('', port), family=socket.AF_INET6, dualstack_ipv6=True)
+    else:
+        sock = socket.create_server((host or '', port))
+    sock.setblocking(False)
+    return sock
+
+
+def _peer(addr):
+    host = addr[0]
+    return host[7:] if host.startswith('::ffff:') else host, addr[1]
+
+
+async def _recv_exact(loop, sock, n):
+    buf = bytearray(n)
+    view = memoryview(buf)
+    got = 0
+    while got < n:
+        k = await loop.sock_recv_into(sock, view[got:])
+        if not k:
+            raise ConnectionError("connection closed by peer")
+        got += k
+    return buf
+
+
+class _Stream:
+    __slots__ = ('id', 'sock', 'addr', 'sending', 'bytes', 'packets', 'errors', 'outoforder',
+                 'jitter', 'prev_transit', 'omitted_bytes', 'omitted_packets', 'omitted_errors',
+                 'retrans_base', 'prev', 'closed')
+
+    def __init__(self, stream_id, sock, addr, sending):
+        self.id = stream_id
+        self.sock = sock            # TCP data socket; None for UDP (shared socket)
+        self.addr = addr
+        self.sending = sending      # True when the server is the sender
+        self.bytes = 0
+        self.packets = 0            # UDP: highest sequence number seen / datagrams sent
+        self.errors = 0             # UDP: datagrams lost
+        self.outoforder = 0
+        self.jitter = 0.0           # seconds, RFC 1889 running estimate
+        self.prev_transit = None
+        self.omitted_bytes = 0
+        self.omitted_packets = 0
+        self.omitted_errors = 0
+        self.retrans_base = None
+        self.prev = (0, 0, 0, 0)    # bytes, packets, errors, retransmits at the last report
+        self.closed = False
+
+    def retransmits(self):
+        info = tcp_info(self.sock) if self.sock is not None else None
+        if info is None or self.retrans_base is None:
+            return None
+        return info[0] - self.retrans_base
+
+
+class _Test:
+    """One client's test, from the cookie to IPERF_DONE."""
+
+    def __init__(self, server, ctrl, addr, cookie):
+        self.server = server
+        self.loop = server._loop
+        self.ctrl = ctrl
+        self.addr = addr
+        self.cookie = cookie
+        self.params = {}
+        self.udp = False
+        self.reverse = False
+        self.bidir = False
+        self.parallel = 1
+        self.expected = 1
+        self.blksize = 128 * 1024
+        self.rate = 0               # bits/s per stream, 0 = unlimited
+        self.bytes_limit = 0
+        self.blocks_limit = 0
+        self.header = struct.Struct('!III')
+        self.streams = []
+        self.udp_peers = {}
+        self.udp_sock = None
+        self.accepting = False
+        self.running = False
+        self.omitting = False
+        self.all_streams = asyncio.Event()
+        self.rbuf = None
+        self.payload = None
+        self.bytes_sent = 0
+        self.blocks_sent = 0
+        self.t0 = None              # loop time the measurement started (after -O)
+        self.last_report = 0.0
+        self.seconds = 0.0
+        self.tasks = []
+        self.lines = []
+        self.error = None
+        self.state = 'setup'
+        self.started = time.time()
+        self.finished = None
+        self.peer_results = None
+        self.summary = []
+        self._cpu0 = None
+
+    # -- control channel --------------------------------------------------------
+
+    async def send_state(self, state):
+        await self.loop.sock_sendall(self.ctrl, struct.pack('b', state))
+
+    async def read_state(self):
+        return struct.unpack('b', await _recv_exact(self.loop, self.ctrl, 1))[0]
+
+    async def read_json(self):
+        size, = struct.unpack('!I', await _recv_exact(self.loop, self.ctrl, 4))
+        if size > MAX_JSON_BYTES:
+            raise ConnectionError(f"JSON message too large ({size} bytes)")
+        return json.loads(bytes(await _recv_exact(self.loop, self.ctrl, size)).decode('utf-8'))
+
+    async def write_json(self, obj):
+        data = json.dumps(obj, separators=(',', ':')).encode('utf-8')
+        await self.loop.sock_sendall(self.ctrl, struct.pack('!I', len(data)) + data)
+
+    def log(self, line):
+        self.lines.append(line)
+        self.server._emit('text', line)
+
+    # -- test ---------------------------------------------------------------------
+
+    async def run(self):
+        host, port = _peer(self.addr)
+        self.log(f"Accepted connection from {host}, port {port}")
+        try:
+            await self.send_state(PARAM_EXCHANGE)
+            self.params = await asyncio.wait_for(self.read_json(), SETUP_TIMEOUT)
+            self.configure(self.params)
+            self.accepting = True
+            await self.send_state(CREATE_STREAMS)
+            await asyncio.wait_for(self.all_streams.wait(), SETUP_TIMEOUT)
+            self.accepting = False
+            await self.send_state(TEST_START)
+            self.start()
+            await self.send_state(TEST_RUNNING)
+            self.state = STATE_RUNNING
+            limit = None
+            if self.params.get('time'):
+                limit = float(self.params['time']) + float(self.params.get('omit') or 0) + END_GRACE
+            while True:
+                state = await asyncio.wait_for(self.read_state(), limit)
+                if state == TEST_END:
+                    break
+                if state == CLIENT_TERMINATE:
+                    raise ConnectionError("the client has terminated")
+            self.stop()
+            await self.send_state(EXCHANGE_RESULTS)
+            self.peer_results = await asyncio.wait_for(self.read_json(), SETUP_TIMEOUT)
+            await self.write_json(self.results())
+            await self.send_state(DISPLAY_RESULTS)
+            self.summarize()
+            self.state = 'finished'
+            try:
+                await asyncio.wait_for(self.read_state(), SETUP_TIMEOUT)     # IPERF_DONE
+            except (OSError, ConnectionError, asyncio.TimeoutError):
+                pass
+        except TestError as e:
+            self.fail(str(e))
+            try:
+                await self.loop.sock_sendall(self.ctrl, struct.pack('!bii', SERVER_ERROR, e.errno, 0))
+            except OSError:
+                pass
+        except asyncio.TimeoutError:
+            self.fail("timed out waiting for the client")
+        except (OSError, ConnectionError, ValueError) as e:
+            self.fail(str(e) or type(e).__name__)
+        except asyncio.CancelledError:
+            # server shutting down: tell the client, like iperf3 on SIGTERM
+            self.fail("the server has terminated")
+            try:
+                self.ctrl.send(struct.pack('b', SERVER_TERMINATE))
+            except OSError:
+                pass
+            raise
+        finally:
+            self.close()
+
+    def fail(self, message):
+        if self.state != 'finished':
+            self.state = 'failed'
+            self.error = message
+            self.log(f"iperf3: error - {message}")
+            self.server._emit('error', message)
+
+    def configure(self, p):
+        if p.get('udp'):
+            self.udp = True
+        elif not p.get('tcp'):
+            raise TestError(IEUNIMP, "only TCP and UDP tests are supported")
+        self.reverse = bool(p.get('reverse'))
+        self.bidir = bool(p.get('bidirectional'))
+        self.parallel = int(p.get('parallel') or 1)
+        if not 1 <= self.parallel <= MAX_STREAMS:
+            raise TestError(IENUMSTREAMS, f"too many parallel streams ({self.parallel})")
+        self.expected = self.parallel * (2 if self.bidir else 1)
+        default_blk = 1460 if self.udp else 128 * 1024
+        self.blksize = int(p.get('len') or default_blk)
+        if not 0 < self.blksize <= (MAX_UDP_BLOCK if self.udp else MAX_TCP_BLOCK):
+            raise TestError(IEBLOCKSIZE, f"block size {self.blksize} out of range")
+        self.rate = int(p.get('bandwidth') or 0)
+        self.bytes_limit = int(p.get('num') or 0)
+        self.blocks_limit = int(p.get('blockcount') or 0)
+        if p.get('udp_counters_64bit'):
+            self.header = struct.Struct('!IIQ')
+        if self.udp and self.blksize < self.header.size:
+            raise TestError(IEBLOCKSIZE, f"block size {self.blksize} below the UDP header")
+        self.rbuf = bytearray(max(RECV_BUFFER, self.blksize))
+        if self.reverse or self.bidir:
+            self.payload = bytearray(b'0123456789' * (self.blksize // 10 + 1))[:self.blksize] \
+                if p.get('repeating_payload') else bytearray(os.urandom(self.blksize))
+        if self.udp:
+            self.open_udp()
+
+    def open_udp(self):
+        family = self.ctrl.family
+        sock = socket.socket(family, socket.SOCK_DGRAM)
+        try:
+            if family == socket.AF_INET6:
+                sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 0)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF,
+                                max(UDP_RCVBUF, int(self.params.get('window') or 0)))
+            except OSError:
+                pass
+            sock.bind((self.server.host or '', self.server.port))
+            sock.setblocking(False)
+        except OSError:
+            sock.close()
+            raise
+        self.udp_sock = sock
+        self.loop.add_reader(sock, self.on_udp_readable)
+
+    # -- streams ------------------------------------------------------------------
+
+    def add_stream(self, sock, addr):
+        """Register a data connection / UDP peer; the first -P of --bidir are received."""
+        index = len(self.streams)
+        sending = index >= self.parallel if self.bidir else self.reverse
+        stream_id = 1 if not self.streams else index + 2    # iperf3 numbers 1, 3, 4, ...
+        st = _Stream(stream_id, sock, addr, sending)
+        if sock is not None:
+            sock.setblocking(False)
+            window = int(self.params.get('window') or 0)
+            try:
+                if window:
+                    sock.setsockopt(socket.SOL_SOCKET,
+                                    socket.SO_SNDBUF if sending else socket.SO_RCVBUF, window)
+                if self.params.get('nodelay'):
+                    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            except OSError:
+                pass
+            if sending:
+                info = tcp_info(sock)
+                st.retrans_base = info[0] if info else None
+        self.streams.append(st)
+        local = _peer(self.ctrl.getsockname())[0]
+        local_port = (sock or self.udp_sock).getsockname()[1]
+        host, port = _peer(addr)
+        self.log(f"[{st.id:>3}] local {local} port {local_port} connected to {host} port {port}")
+        if len(self.streams) >= self.expected:
+            self.accepting = False
+            self.all_streams.set()
+        return st
+
+    def on_tcp_readable(self, st):
+        recv_into = st.sock.recv_into
+        buf = self.rbuf
+        got = 0
+        for _ in range(READS_PER_WAKEUP):
+            try:
+                n = recv_into(buf)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError:
+                n = 0
+            if not n:
+                self.loop.remove_reader(st.sock)
+                st.closed = True
+                break
+            got += n
+        st.bytes += got
+
+    def on_udp_readable(self):
+        sock = self.udp_sock
+        buf = self.rbuf
+        for _ in range(READS_PER_WAKEUP * 16):
+            try:
+                n, addr = sock.recvfrom_into(buf)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                continue        # e.g. ICMP port unreachable surfacing on Windows
+            st = self.udp_peers.get(addr)
+            if st is None:
+                self.udp_hello(n, addr)
+            elif st.sending or not self.running:
+                if n == 4 and not self.running:
+                    self.udp_hello(n, addr, st)     # client retried the handshake
+            elif n >= self.header.size:
+                self.udp_datagram(st, n)
+
+    def udp_hello(self, n, addr, st=None):
+        if n != 4 or (st is None and not self.accepting):
+            return
+        reply = None
+        for order in ('<', '>'):
+            msg, = struct.unpack_from(order + 'I', self.rbuf)
+            if msg == UDP_CONNECT_MSG:
+                reply = struct.pack(order + 'I', UDP_CONNECT_REPLY)
+            elif msg == LEGACY_UDP_CONNECT_MSG:
+                reply = struct.pack(order + 'I', LEGACY_UDP_CONNECT_REPLY)
+        if reply is None:
+            return
+        if st is None:
+            st = self.udp_peers[addr] = self.add_stream(None, addr)
+        try:
+            self.udp_sock.sendto(reply, addr)
+        except OSError:
+            pass
+
+    def udp_datagram(self, st, n):
+        sec, usec, pcount = self.header.unpack_from(self.rbuf)
+        st.bytes += n
+        if pcount >= st.packets + 1:
+            if pcount > st.packets + 1:
+                st.errors += pcount - 1 - st.packets
+            st.packets = pcount
+        else:
+            st.outoforder += 1
+            if st.errors > 0:
+                st.errors -= 1
+        transit = time.time() - (sec + usec * 1e-6)
+        if st.prev_transit is not None:
+            d = abs(transit - st.prev_transit)
+            st.jitter += (d - st.jitter) / 16.0
+        st.prev_transit = transit
+
+    # -- running ------------------------------------------------------------------
+
+    def start(self):
+        loop = self.loop
+        self._cpu0 = (os.times(), loop.time())
+        self.t0 = loop.time()
+        self.running = True
+        omit = float(self.params.get('omit') or 0)
+        if omit > 0:
+            self.omitting = True
+            loop.call_later(omit, self.end_omit)
+        for st in self.streams:
+            if st.sending:
+                sender = self.udp_sender(st) if self.udp else self.tcp_sender(st)
+                self.tasks.append(loop.create_task(sender))
+            elif st.sock is not None:
+                loop.add_reader(st.sock, self.on_tcp_readable, st)
+        if self.server.interval > 0:
+            self.tasks.append(loop.create_task(self.reporter()))
+        self.log("[ ID] Interval           Transfer     Bitrate")
+
+    def end_omit(self):
+        if not self.running:
+            return
+        self.report(force=True)
+        self.omitting = False
+        self.t0 = self.loop.time()
+        self.last_report = 0.0
+        for st in self.streams:
+            st.omitted_bytes = st.bytes
+            st.omitted_packets = st.packets
+            st.omitted_errors = st.errors
+            st.prev = (st.bytes, st.packets, st.errors, st.prev[3])
+
+    def limit_reached(self):
+        return (self.bytes_limit and self.bytes_sent >= self.bytes_limit) or \
+               (self.blocks_limit and self.blocks_sent >= self.blocks_limit)
+
+    def pace(self, st, t_start):
+        """Seconds to wait so ``st`` stays at the requested per-stream rate."""
+        if not self.rate:
+            return 0
+        return st.bytes * 8.0 / self.rate - (self.loop.time() - t_start)
+
+    async def tcp_sender(self, st):
+        loop = self.loop
+        view = memoryview(self.payload)
+        t_start = loop.time()
+        while not self.limit_reached():
+            try:
+                await loop.sock_sendall(st.sock, view)
+            except OSError:
+                return      # client went away; the control channel reports it
+            st.bytes += len(view)
+            self.bytes_sent += len(view)
+            self.blocks_sent += 1
+            # sock_sendall does not yield when the kernel takes the block at once
+            await asyncio.sleep(max(0, self.pace(st, t_start)))
+
+    async def udp_sender(self, st):
+        loop = self.loop
+        sock = self.udp_sock
+        buf = self.payload
+        size = len(buf)
+        pack_into = self.header.pack_into
+        t_start = loop.time()
+        while not self.limit_reached():
+            for _ in range(UDP_BURST):
+                if self.pace(st, t_start) > 0:
+                    break
+                now = time.time()
+                sec = int(now)
+                pack_into(buf, 0, sec, int((now - sec) * 1e6), st.packets + 1)
+                try:
+                    sock.sendto(buf, st.addr)
+                except (BlockingIOError, InterruptedError):
+                    break
+                except OSError:
+                    continue    # ENOBUFS and friends: the datagram is lost
+                st.packets += 1
+                st.bytes += size
+                self.bytes_sent += size
+                self.blocks_sent += 1
+            await asyncio.sleep(max(0, min(self.pace(st, t_start), 0.05)))
+
+    async def reporter(self):
+        interval = self.server.interval
+        while True:
+            await asyncio.sleep(max(0, self.t0 + self.last_report + interval - self.loop.time()))
+            self.report()
+
+    def report(self, force=False, final=False):
+        """Emit one interval (per-stream records plus [SUM]) ending now."""
+        now = self.loop.time() - self.t0
+        seconds = now - self.last_report
+        if seconds <= 0 or (not force and not final and seconds < self.server.interval * 0.5):
+            return
+        if final and seconds < self.server.interval * 0.1:
+            return      # iperf3 skips a sliver of an interval at the end too
+        ts = time.time()
+        records = []
+        for st in self.streams:
+            retr = st.retransmits() if st.sending and not self.udp else None
+            b0, p0, e0, r0 = st.prev
+            d_bytes, d_packets, d_errors = st.bytes - b0, st.packets - p0, st.errors - e0
+            fields = {}
+            if self.udp and not st.sending:
+                fields = dict(jitter_ms=st.jitter * 1000, lost_packets=d_errors, packets=d_packets,
+                              lost_percent=d_errors * 100.0 / d_packets if d_packets else 0.0)
+            elif self.udp:
+                fields = dict(packets=d_packets)
+            elif retr is not None:
+                info = tcp_info(st.sock)
+                fields = dict(retransmits=retr - r0, snd_cwnd=info[1], rtt=info[2], rttvar=info[3])
+            st.prev = (st.bytes, st.packets, st.errors, retr if retr is not None else r0)
+            records.append(IntervalRecord(
+                stream=st.id, start=self.last_report, end=now, seconds=seconds, bytes=d_bytes,
+                bits_per_second=d_bytes * 8.0 / seconds, omitted=self.omitting,
+                sender=st.sending, ts=ts, **fields))
+        if len(records) > 1:
+            records.append(_sum_of(records, self.last_report, now, ts))
+        self.last_report = now
+        for rec in records:
+            self.log(format_record(rec))
+        self.server._emit('interval', records)
+
+    def stop(self):
+        """TEST_END: stop sending and reading, close the last interval."""
+        if not self.running:
+            return
+        for task in self.tasks:
+            task.cancel()
+        self.tasks = []
+        if not self.omitting:
+            self.report(final=True)
+        self.seconds = self.loop.time() - self.t0
+        self.running = False
+        for st in self.streams:
+            if st.sock is not None and not st.sending and not st.closed:
+                self.loop.remove_reader(st.sock)
+
+    # -- results ------------------------------------------------------------------
+
+    def cpu_util(self):
+        if self._cpu0 is None:
+            return 0.0, 0.0, 0.0
+        t0, w0 = self._cpu0
+        t1, wall = os.times(), self.loop.time() - w0
+        if wall <= 0:
+            return 0.0, 0.0, 0.0
+        user = (t1.user - t0.user) * 100.0 / wall
+        system = (t1.system - t0.system) * 100.0 / wall
+        return user + system, user, system
+
+    def results(self):
+        """The server's half of EXCHANGE_RESULTS, as iperf3's send_results() builds it."""
+        total, user, system = self.cpu_util()
+        sending = [st for st in self.streams if st.sending]
+        has_retr = bool(sending) and not self.udp and all(st.retrans_base is not None for st in sending)
+        out = {
+            'cpu_util_total': total,
+            'cpu_util_user': user,
+            'cpu_util_system': system,
+            'sender_has_retransmits': (1 if has_retr else 0) if sending else -1,
+            'streams': [],
+        }
+        if not self.udp and self.streams:
+            cc = congestion_of(self.streams[0].sock)
+            if cc:
+                out['congestion_used'] = cc
+        for st in self.streams:
+            retr = st.retransmits() if has_retr and st.sending else None
+            out['streams'].append({
+                'id': st.id,
+                'bytes': st.bytes - st.omitted_bytes,
+                'retransmits': retr if retr is not None else -1,
+                'jitter': st.jitter,
+                'errors': st.errors,
+                'omitted_errors': st.omitted_errors,
+                'packets': st.packets,
+                'omitted_packets': st.omitted_packets,
+                'start_time': 0,
+                'end_time': self.seconds,
+            })
+        if self.params.get('get_server_output'):
+            out['server_output_text'] = "\n".join(self.lines) + "\n"
+        return out
+
+    def summarize(self):
+        """End-of-test sender/receiver records from both halves of the exchange."""
+        peers = {s.get('id'): s for s in (self.peer_results or {}).get('streams', ())}
+        ts = time.time()
+        records = []
+        for st in self.streams:
+            peer = peers.get(st.id, {})
+            peer_seconds = float(peer.get('end_time', self.seconds) or 0) - float(peer.get('start_time') or 0)
+            local = _final_record(st.id, st.bytes - st.omitted_bytes, self.seconds, st.sending, ts)
+            remote = _final_record(st.id, int(peer.get('bytes') or 0), peer_seconds or self.seconds,
+                                   not st.sending, ts)
+            if self.udp:
+                rx = st if not st.sending else None
+                packets = (st.packets - st.omitted_packets) if rx else \
+                    int(peer.get('packets') or 0) - int(peer.get('omitted_packets') or 0)
+                lost = (st.errors - st.omitted_errors) if rx else \
+                    int(peer.get('errors') or 0) - int(peer.get('omitted_errors') or 0)
+                udp = dict(jitter_ms=(st.jitter if rx else float(peer.get('jitter') or 0)) * 1000,
+                           lost_packets=lost, packets=packets,
+                           lost_percent=lost * 100.0 / packets if packets else 0.0)
+                if rx:
+                    local = local._replace(**udp)
+                else:
+                    remote = remote._replace(**udp)
+            else:
+                retr = st.retransmits() if st.sending else peer.get('retransmits')
+                sender_rec = local if st.sending else remote
+                if retr is not None and retr >= 0:
+                    sender_rec = sender_rec._replace(retransmits=retr)
+                if st.sending:
+                    local = sender_rec
+                else:
+                    remote = sender_rec
+            pair = (local, remote) if local.sender else (remote, local)
+            records.extend(pair)
+        if len(self.streams) > 1:
+            for sender in (True, False):
+                part = [r for r in records if r.sender is sender]
+                records.append(_sum_of(part, 0.0, self.seconds, ts)._replace(final=True, sender=sender))
+        self.summary = records
+        self.log(_RULE)
+        for rec in records:
+            self.log(format_record(rec))
+        self.server._emit('summary', records)
+
+    def session(self):
+        """JSON-friendly record of this test for ``IperfServer.sessions``."""
+        host, port = _peer(self.addr)
+        totals = {r.sender: r for r in self.summary if r.stream is None} or \
+            {r.sender: r for r in self.summary}
+        received = totals.get(False)
+        return {
+            'client': host,
+            'port': port,
+            'client_version': self.params.get('client_version'),
+            'protocol': 'udp' if self.udp else 'tcp',
+            'reverse': self.reverse,
+            'bidir': self.bidir,
+            'parallel': self.parallel,
+            'state': self.state,
+            'error': self.error,
+            'started': self.started,
+            'finished': self.finished,
+            'seconds': self.seconds,
+            'sent_mbps': totals[True].mbps if True in totals else None,
+            'received_mbps': received.mbps if received is not None else None,
+            'jitter_ms': received.jitter_ms if received is not None else None,
+            'loss_percent': received.lost_percent if received is not None else None,
+        }
+
+    def close(self):
+        self.accepting = False
+        if self.running:
+            self.stop()
+        for task in self.tasks:
+            task.cancel()
+        for st in self.streams:
+            if st.sock is not None:
+                if not st.sending and not st.closed:
+                    self.loop.remove_reader(st.sock)
+                st.sock.close()
+        if self.udp_sock is not None:
+            self.loop.remove_reader(self.udp_sock)
+            self.udp_sock.close()
+        self.ctrl.close()
+        self.finished = time.time()
+
+
+def _final_record(stream, nbytes, seconds, sender, ts):
+    return IntervalRecord(stream=stream, start=0.0, end=seconds, seconds=seconds, bytes=nbytes,
+                          bits_per_second=nbytes * 8.0 / seconds if seconds else 0.0,
+                          sender=sender, final=True, ts=ts)
+
+
+def _sum_of(records, start, end, ts):
+    """[SUM] record of per-stream records (jitter averaged, losses added up)."""
+    seconds = end - start
+    nbytes = sum(r.bytes for r in records)
+    fields = {}
+    if any(r.retransmits is not None for r in records):
+        fields['retransmits'] = sum(r.retransmits or 0 for r in records)
+    if any(r.packets is not None for r in records):
+        fields['packets'] = sum(r.packets or 0 for r in records)
+    jitter = [r.jitter_ms for r in records if r.jitter_ms is not None]
+    if jitter:
+        lost = sum(r.lost_packets or 0 for r in records)
+        fields.update(jitter_ms=sum(jitter) / len(jitter), lost_packets=lost,
+                      lost_percent=lost * 100.0 / fields['packets'] if fields.get('packets') else 0.0)
+    return IntervalRecord(stream=None, start=start, end=end, seconds=seconds, bytes=nbytes,
+                          bits_per_second=nbytes * 8.0 / seconds if seconds > 0 else 0.0,
+                          omitted=records[0].omitted, sender=records[0].sender, ts=ts, **fields)
+
+
+class IperfServer:
+    """An ``iperf3 -s`` on ``host:port`` (``port=0`` picks a free port)."""
+
+    def __init__(self, host=None, port=DEFAULT_PORT, interval=1.0, one_off=False,
+                 listener=None, keep=50):
+        self.host = host or None
+        self.port = int(port)
+        self.interval = float(interval)
+        self.one_off = one_off
+        self.listener = listener
+        self.state = STATE_STOPPED
+        self.error = None
+        self.test = None                            # the _Test in progress
+        self.tests = 0
+        self.sessions = collections.deque(maxlen=keep)
+        self.started = None
+        self.ready = threading.Event()
+        self._loop = None
+        self._task = None
+        self._thread = None
+        self._closing = False
+
+    def _emit(self, kind, payload):
+        if self.listener is not None:
+            self.listener(kind, payload)
+
+    def _banner(self):
+        for line in (_RULE, f"Server listening on {self.port} (test #{self.tests + 1})", _RULE):
+            self._emit('text', line)
+
+    async def serve(self):
+        """Accept tests until cancelled (or after one test with ``one_off``)."""
+        loop = self._loop = asyncio.get_running_loop()
+        self._task = asyncio.current_task()
+        try:
+            sock = listen_socket(self.host, self.port)
+        except OSError as e:
+            self.state, self.error = STATE_STOPPED, str(e)
+            self._emit('error', f"unable to start listener: {e}")
+            self.ready.set()
+            raise
+        self.port = sock.getsockname()[1]
+        self.state = STATE_LISTENING
+        self.started = time.time()
+        self.ready.set()
+        self._banner()
+        handlers = set()
+        try:
+            while True:
+                conn, addr = await loop.sock_accept(sock)
+                task = loop.create_task(self._on_connect(conn, addr))
+                handlers.add(task)
+                task.add_done_callback(handlers.discard)
+        finally:
+            self._closing = True
+            sock.close()
+            for task in list(handlers):
+                task.cancel()
+            if handlers:
+                await asyncio.gather(*handlers, return_exceptions=True)
+            self.state = STATE_STOPPED
+
+    async def _on_connect(self, conn, addr):
+        loop = self._loop
+        conn.setblocking(False)
+        try:
+            cookie = bytes(await asyncio.wait_for(_recv_exact(loop, conn, COOKIE_SIZE), SETUP_TIMEOUT))
+        except (OSError, ConnectionError, asyncio.TimeoutError):
+            conn.close()
+            return
+        test = self.test
+        if test is None:
+            await self._run_test(conn, addr, cookie)
+        elif test.accepting and not test.udp and cookie == test.cookie:
+            test.add_stream(conn, addr)
+        else:
+            try:
+                conn.send(struct.pack('b', ACCESS_DENIED))
+            except OSError:
+                pass
+            conn.close()
+
+    async def _run_test(self, conn, addr, cookie):
+        self.test = test = _Test(self, conn, addr, cookie)
+        self.state = STATE_RUNNING
+        try:
+            await test.run()
+        finally:
+            self.test = None
+            self.tests += 1
+            session = dict(test.session(), test=self.tests)
+            self.sessions.append(session)
+            self._emit('session', session)
+            if self.one_off:
+                self._task.cancel()
+            elif not self._closing:
+                self.state = STATE_LISTENING
+                self._banner()
+
+    def status(self):
+        test = self.test
+        return {
+            'host': self.host,
+            'port': self.port,
+            'state': self.state,
+            'error': self.error,
+            'started': self.started,
+            'tests': self.tests,
+            'current': test.session() if test is not None else None,
+            'last': self.sessions[-1] if self.sessions else None,
+        }
+
+    # -- background thread ----------------------------------------------------------
+
+    def start(self, timeout=5.0):
+        """Serve from a daemon thread on its own selector loop; returns once listening."""
+        def run():
+            loop = asyncio.SelectorEventLoop()
+            try:
+                loop.run_until_complete(self.serve())
+            except (asyncio.CancelledError, OSError):
+                pass
+            finally:
+                loop.close()
+        self.ready.clear()
+        self._closing = False
+        self._thread = threading.Thread(target=run, name=f"iperf-server-{self.port}", daemon=True)
+        self._thread.start()
+        self.ready.wait(timeout)
+        if self.state != STATE_LISTENING:
+            raise OSError(self.error or "server did not start")
+        return self
+
+    def stop(self, timeout=5.0):
+        loop, task = self._loop, self._task
+        if loop is not None and task is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(task.cancel)
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    def wait(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+def format_session(s):
+    """One log line per finished test."""
+    what = f"{s['protocol'].upper()}{' -R' if s['reverse'] else ''}{' --bidir' if s['bidir'] else ''}" \
+           f" -P {s['parallel']}"
+    if s['state'] != 'finished':
+        return f"[Test {s.get('test', '?')}] {s['client']} {what}: {s['state']} ({s['error']})"
+    parts = [f"[Test {s.get('test', '?')}] {s['client']} {what}"]
+    if s['received_mbps'] is not None:
+        parts.append(f"received {s['received_mbps']:.2f} Mbps")
+    if s['sent_mbps'] is not None:
+        parts.append(f"sent {s['sent_mbps']:.2f} Mbps")
+    if s['loss_percent'] is not None:
+        parts.append(f"jitter {s['jitter_ms']:.3f} ms loss {s['loss_percent']:.2f}%")
+    return "  ".join(parts)
+
@@ -0,0 +1,446 @@
+"""Structured ingestion of iperf3 output.
+
+iperf3 >= 3.10 can emit one JSON object per line (``--json-stream``); older
+binaries only support a single JSON document at the end of the run (``-J``).
+``IperfOutputParser`` accepts output line by line in any of these formats
+(plus the classic human-readable text as a last resort) and turns it into
+``IntervalRecord`` tuples, so callers never have to regex-scrape bandwidth
+strings themselves.
+
+Events produced by ``IperfOutputParser.feed`` are ``(kind, payload)`` tuples:
+
+* ``('start', dict)``      -- the JSON ``start`` block (JSON modes only)
+* ``('interval', list)``   -- all records of one reporting interval; the
+  ``[SUM]`` record, when iperf3 prints one, is always last
+* ``('summary', list)``    -- end-of-test sender/receiver totals
+* ``('error', str)``       -- iperf3 reported an error
+* ``('text', str)``        -- a human-readable log line (rendered from JSON
+  records in JSON modes, passed through verbatim in text mode)
+"""
+import functools
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from typing import NamedTuple, Optional
+
+# iperf3 gained --json-stream in 3.10
+JSON_STREAM_MIN_VERSION = (3, 10)
+
+MODE_JSON_STREAM = 'json-stream'
+MODE_JSON = 'json'
+MODE_TEXT = 'text'
+
+
+class IntervalRecord(NamedTuple):
+    """One iperf3 measurement for a single stream (or the [SUM] of all streams)."""
+    stream: Optional[int]           # socket id, None for the [SUM] record
+    start: float                    # seconds since test start, as reported by iperf3
+    end: float
+    seconds: float
+    bytes: int
+    bits_per_second: float
+    retransmits: Optional[int] = None
+    snd_cwnd: Optional[int] = None  # bytes
+    rtt: Optional[int] = None       # microseconds
+    rttvar: Optional[int] = None    # microseconds
+    jitter_ms: Optional[float] = None
+    lost_packets: Optional[int] = None
+    packets: Optional[int] = None
+    lost_percent: Optional[float] = None
+    omitted: bool = False
+    sender: Optional[bool] = None
+    final: bool = False             # end-of-test total rather than an interval
+    ts: float = 0.0                 # wall clock when the record was decoded
+
+    @property
+    def is_sum(self):
+        return self.stream is None
+
+    @property
+    def mbps(self):
+        return self.bits_per_second / 1e6
+
+    def to_dict(self):
+        return self._asdict()
+
+
+def aggregate_of(records):
+    """Return the record describing the whole test for one interval.
+
+    That is the [SUM] record when iperf3 printed one, or the only stream when
+    the test ran with a single stream. ``None`` if neither applies.
+    """
+    if not records:
+        return None
+    last = records[-1]
+    if last.stream is None:
+        return last
+    if len(records) == 1:
+        return last
+    return None
+
+
+# ---------------------------------------------------------------------------
+# Binary capability detection / command preparation
+# ---------------------------------------------------------------------------
+
+_VERSION_RE = re.compile(r'iperf\s+(\d+)\.(\d+)')
+
+
+def parse_version(text):
+    m = _VERSION_RE.search(text or '')
+    if not m:
+        return None
+    return int(m.group(1)), int(m.group(2))
+
+
+@functools.lru_cache(maxsize=8)
+def detect_output_mode(exe_path):
+    """Probe ``exe_path -v`` once and pick the best structured output flag."""
+    kwargs = {}
+    if sys.platform == 'win32':
+        kwargs['creationflags'] = subprocess.CREATE_NO_WINDOW
+    env = os.environ.copy()
+    if os.path.isabs(exe_path):
+        env["PATH"] = os.path.dirname(exe_path) + os.pathsep + env.get("PATH", "")
+    try:
+        out = subprocess.run([exe_path, '-v'], stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                             stdin=subprocess.DEVNULL, timeout=5, env=env, **kwargs).stdout
+    except (OSError, subprocess.SubprocessError):
+        return MODE_TEXT
+    version = parse_version(out.decode('utf-8', 'replace'))
+    if version is None:
+        return MODE_TEXT
+    return MODE_JSON_STREAM if version >= JSON_STREAM_MIN_VERSION else MODE_JSON
+
+
+def command_output_mode(cmd):
+    """Output mode an already-built command line will produce."""
+    if '--json-stream' in cmd:
+        return MODE_JSON_STREAM
+    if '-J' in cmd or '--json' in cmd:
+        return MODE_JSON
+    return MODE_TEXT
+
+
+def prepare_command(cmd, mode=None):
+    """Return ``cmd`` with the structured-output flag added for client runs.
+
+    ``mode`` defaults to whatever ``detect_output_mode`` finds for ``cmd[0]``.
+    Commands that already choose an output format, or that are not client
+    tests (``-v``, ``-s`` ...), are returned unchanged.
+    """
+    cmd = list(cmd)
+    if not cmd or '-c' not in cmd and '--client' not in cmd:
+        return cmd
+    if command_output_mode(cmd) != MODE_TEXT:
+        return cmd
+    if mode is None:
+        mode = detect_output_mode(cmd[0])
+    if mode == MODE_JSON_STREAM:
+        cmd.append('--json-stream')
+    elif mode == MODE_JSON:
+        cmd.append('-J')
+    return cmd
+
+
+# ---------------------------------------------------------------------------
+# JSON decoding
+# ---------------------------------------------------------------------------
+
+def _record_from_json(d, stream, final=False, ts=0.0):
+    seconds = d.get('seconds') or (d.get('end', 0.0) - d.get('start', 0.0))
+    return IntervalRecord(
+        stream=stream,
+        start=float(d.get('start', 0.0)),
+        end=float(d.get('end', 0.0)),
+        seconds=float(seconds),
+        bytes=int(d.get('bytes', 0)),
+        bits_per_second=float(d.get('bits_per_second', 0.0)),
+        retransmits=d.get('retransmits'),
+        snd_cwnd=d.get('snd_cwnd'),
+        rtt=d.get('rtt'),
+        rttvar=d.get('rttvar'),
+        jitter_ms=d.get('jitter_ms'),
+        lost_packets=d.get('lost_packets'),
+        packets=d.get('packets'),
+        lost_percent=d.get('lost_percent'),
+        omitted=bool(d.get('omitted', False)),
+        sender=d.get('sender'),
+        final=final,
+        ts=ts,
+    )
+
+
+def records_from_interval(data, ts=0.0):
+    """Convert one JSON ``interval`` object into records (sum last)."""
+    records = [_record_from_json(s, s.get('socket'), ts=ts) for s in data.get('streams', ())]
+    if 'sum' in data:
+        records.append(_record_from_json(data['sum'], None, ts=ts))
+    return records
+
+
+def records_from_end(data, ts=0.0):
+    """Convert the JSON ``end`` object into end-of-test records."""
+    records = []
+    for s in data.get('streams', ()):
+        for key in ('sender', 'receiver', 'udp'):
+            part = s.get(key)
+            if part:
+                if key != 'udp' and 'sender' not in part:
+                    part = dict(part, sender=(key == 'sender'))
+                records.append(_record_from_json(part, part.get('socket'), final=True, ts=ts))
+    for key in ('sum_sent', 'sum_received', 'sum'):
+        part = data.get(key)
+        if part:
+            if key != 'sum' and 'sender' not in part:
+                part = dict(part, sender=(key == 'sum_sent'))
+            records.append(_record_from_json(part, None, final=True, ts=ts))
+    return records
+
+
+# ---------------------------------------------------------------------------
+# Text fallback
+# ---------------------------------------------------------------------------
+
+_UNIT = {'': 1, 'K': 1e3, 'M': 1e6, 'G': 1e9, 'T': 1e12}
+_BYTE_UNIT = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+
+_TEXT_LINE_RE = re.compile(
+    r'^\[\s*(\d+|SUM)\](?:\[[A-Z-]+\])?\s+(\d+(?:\.\d+)?)-\s*(\d+(?:\.\d+)?)\s+sec'
+    r'\s+(\d+(?:\.\d+)?)\s+([KMGT]?)Bytes'
+    r'\s+(\d+(?:\.\d+)?)\s+([KMGT]?)bits/sec(.*)$')
+_TEXT_UDP_RE = re.compile(r'(\d+(?:\.\d+)?)\s+ms\s+(\d+)/(\d+)\s+\(([\d.e+-]+|nan)%\)')
+_TEXT_COUNT_RE = re.compile(r'^\s+(\d+)(?:\s+(\d+(?:\.\d+)?)\s+([KMGT]?)Bytes)?')
+
+
+def parse_text_line(line, ts=0.0, udp=False):
+    """Parse one human-readable iperf3 result line, or return ``None``.
+
+    ``udp`` tells a UDP sender's datagram count apart from TCP's Retr column;
+    the two are indistinguishable without the table header.
+    """
+    m = _TEXT_LINE_RE.match(line.strip())
+    if not m:
+        return None
+    sid, start, end, xfer, xunit, bw, bunit, rest = m.groups()
+    start, end = float(start), float(end)
+    fields = {
+        'stream': None if sid == 'SUM' else int(sid),
+        'start': start,
+        'end': end,
+        'seconds': end - start,
+        'bytes': int(float(xfer) * _BYTE_UNIT[xunit]),
+        'bits_per_second': float(bw) * _UNIT[bunit],
+        'omitted': '(omitted)' in rest,
+        'final': 'sender' in rest or 'receiver' in rest,
+        'ts': ts,
+    }
+    if 'sender' in rest:
+        fields['sender'] = True
+    elif 'receiver' in rest:
+        fields['sender'] = False
+    u = _TEXT_UDP_RE.search(rest)
+    if u:
+        fields['jitter_ms'] = float(u.group(1))
+        fields['lost_packets'] = int(u.group(2))
+        fields['packets'] = int(u.group(3))
+        try:
+            fields['lost_percent'] = float(u.group(4))
+        except ValueError:
+            pass
+    else:
+        t = _TEXT_COUNT_RE.match(rest)
+        if t and udp:
+            fields['packets'] = int(t.group(1))
+        elif t:
+            fields['retransmits'] = int(t.group(1))
+            if t.group(2):
+                fields['snd_cwnd'] = int(float(t.group(2)) * _BYTE_UNIT[t.group(3)])
+    return IntervalRecord(**fields)
+
+
+# ---------------------------------------------------------------------------
+# Rendering (JSON records -> iperf3-like log lines)
+# ---------------------------------------------------------------------------
+
+def format_unit(value, suffix, base=1000.0):
+    """Format like iperf3: three significant digits and a K/M/G/T prefix."""
+    for prefix in ('', 'K', 'M', 'G', 'T'):
+        if abs(value) < base or prefix == 'T':
+            break
+        value /= base
+    if value >= 100 or value == 0 or prefix == '':
+        return f"{value:.0f} {prefix}{suffix}"
+    if value >= 10:
+        return f"{value:.1f} {prefix}{suffix}"
+    return f"{value:.2f} {prefix}{suffix}"
+
+
+def format_record(rec):
+    sid = 'SUM' if rec.stream is None else f"{rec.stream:>3}"
+    line = (f"[{sid}] {rec.start:6.2f}-{rec.end:<6.2f} sec  "
+            f"{format_unit(rec.bytes, 'Bytes', 1024.0):>10}  "
+            f"{format_unit(rec.bits_per_second, 'bits/sec'):>14}")
+    if rec.jitter_ms is not None:
+        loss = rec.lost_percent if rec.lost_percent is not None else 0.0
+        line += f"  {rec.jitter_ms:.3f} ms  {rec.lost_packets}/{rec.packets} ({loss:.2g}%)"
+    elif rec.packets is not None:
+        line += f"  {rec.packets}"
+    elif rec.retransmits is not None:
+        line += f"  {rec.retransmits:>4}"
+        if rec.snd_cwnd is not None:
+            line += f"  {format_unit(rec.snd_cwnd, 'Bytes', 1024.0):>10}"
+    if rec.omitted:
+        line += "  (omitted)"
+    if rec.final and rec.sender is not None:
+        line += "  sender" if rec.sender else "  receiver"
+    return line
+
+
+# ---------------------------------------------------------------------------
+# Incremental parser
+# ---------------------------------------------------------------------------
+
+class IperfOutputParser:
+    """Feed iperf3 output line by line, get ``(kind, payload)`` events back.
+
+    ``parallel`` is only needed for the text fallback, where iperf3 prints
+    each stream on its own line and the [SUM] line is missing for ``-P 1``.
+    ``render`` controls whether JSON records are echoed as ``'text'`` events
+    so log windows keep showing familiar iperf3 lines.
+    """
+
+    def __init__(self, parallel=1, render=True):
+        self.parallel = max(1, int(parallel or 1))
+        self.render = render
+        self.mode = None            # detected from the output itself
+        self._doc = []              # pending lines of a -J document
+        self._group = []            # pending per-stream text records
+        self._udp = False           # text header said "Total Datagrams"
+
+    def feed(self, line):
+        events = []
+        stripped = line.strip()
+        if not stripped:
+            return events
+
+        if self._doc:
+            self._doc.append(line)
+            if stripped == '}' and not line[:1].isspace():
+                self._finish_document(events)
+            return events
+
+        if stripped[0] == '{':
+            if stripped.startswith('{"event"'):
+                try:
+                    obj = json.loads(stripped)
+                except ValueError:
+                    obj = None
+                if obj is not None:
+                    self.mode = MODE_JSON_STREAM
+                    self._handle_stream_event(obj, events)
+                    return events
+            if stripped == '{':
+                self._doc.append(line)
+                return events
+
+        self._handle_text(line.rstrip('\r\n'), events)
+        return events
+
+    def finish(self):
+        """Flush anything still buffered once the process has exited."""
+        events = []
+        if self._doc:
+            self._finish_document(events)
+        self._flush_group(events)
+        return events
+
+    # -- JSON stream --------------------------------------------------------
+
+    def _handle_stream_event(self, obj, events):
+        kind = obj.get('event')
+        data = obj.get('data')
+        ts = time.time()
+        if kind == 'start':
+            events.append(('start', data))
+        elif kind == 'interval':
+            self._emit(events, 'interval', records_from_interval(data, ts))
+        elif kind == 'end':
+            self._emit(events, 'summary', records_from_end(data, ts))
+        elif kind == 'error':
+            events.append(('error', str(data)))
+            events.append(('text', f"iperf3: {data}"))
+
+    def _finish_document(self, events):
+        text = "".join(self._doc)
+        self._doc = []
+        try:
+            doc = json.loads(text)
+        except ValueError:
+            for line in text.splitlines():
+                self._handle_text(line, events)
+            return
+        self.mode = MODE_JSON
+        ts = time.time()
+        if 'start' in doc:
+            events.append(('start', doc['start']))
+        for interval in doc.get('intervals', ()):
+            self._emit(events, 'interval', records_from_interval(interval, ts))
+        if doc.get('end'):
+            self._emit(events, 'summary', records_from_end(doc['end'], ts))
+        if doc.get('error'):
+            events.append(('error', doc['error']))
+            events.append(('text', f"iperf3: {doc['error']}"))
+
+    def _emit(self, events, kind, records):
+        if not records:
+            return
+        if self.render:
+            for rec in records:
+                events.append(('text', format_record(rec)))
+        events.append((kind, records))
+
+    # -- text fallback ------------------------------------------------------
+
+    def _handle_text(self, line, events):
+        if self.mode is None:
+            self.mode = MODE_TEXT
+        events.append(('text', line))
+        if line.startswith('[ ID]'):
+            self._udp = 'Datagrams' in line
+            return
+        rec = parse_text_line(line, time.time(), self._udp)
+        if rec is None:
+            if line.lstrip().startswith('iperf3: error'):
+                events.append(('error', line.strip()))
+            return
+        if rec.final:
+            self._flush_group(events)
+            events.append(('summary', [rec]))
+            return
+        if self._group and (self._group[0].start, self._group[0].end) != (rec.start, rec.end):
+            self._flush_group(events)
+        self._group.append(rec)
+        # with -P 1 iperf3 prints no [SUM] line, so the stream line is final
+        if rec.stream is None or self.parallel == 1:
+            self._flush_group(events)
+
+    def _flush_group(self, events):
+        if self._group:
+            events.append(('interval', self._group))
+            self._group = []
+
+
+def parallel_of(cmd):
+    """Number of parallel streams requested by ``-P``/``--parallel`` in ``cmd``."""
+    for i, arg in enumerate(cmd[:-1]):
+        if arg in ('-P', '--parallel'):
+            try:
+                return max(1, int(cmd[i + 1]))
+            except ValueError:
+                return 1
+    return 1
@@ -0,0 +1,366 @@
+"""Append-only, disk-backed log journal for long (soak) runs.
+
+Every log line and parsed record is appended as one NDJSON entry to a
+numbered *segment* file (``000001.ndjson``, ``000002.ndjson`` ...) in the
+journal directory. A new segment starts once the current one reaches
+``segment_bytes``. Only the newest ``hot_lines`` log lines stay in memory,
+so memory use does not grow with the length of a run. Nothing written by
+this ``Journal`` is ever dropped. With ``max_bytes`` set, segments left by
+earlier sessions in the same directory are deleted, oldest first, to stay
+under it; if this session alone passes the limit it keeps everything and
+reports that through ``error`` / ``info()['over_limit']``.
+
+Entry layout (``t`` always first, so a reader can get the timestamp
+without parsing the whole line)::
+
+    {"t": 1700000000.123, "l": "[2023-11-14 22:13:20] Starting command: ..."}
+    {"t": 1700000001.125, "e": "interval", "d": [{"stream": 5, ...}, ...]}
+
+``l`` is a log line; ``e``/``d`` are an event and its JSON payload, the
+same pairs the broadcasters carry. A ``Journal`` has the ``publish(data,
+event=None)`` method of a ``Broadcaster``, so it can be a run channel or a
+broadcaster sink.
+
+Writes go through a buffered file. A background thread flushes and fsyncs
+at most every ``sync_interval`` seconds, so a crash loses at most that
+much. Each segment keeps a small in-memory index: first/last timestamp,
+entry count, and a ``(t, offset)`` mark every ``INDEX_EVERY`` entries.
+``read(t0, t1)`` uses it to skip straight to the right segment and offset.
+Opening an existing directory re-indexes its segments and appends to a new
+one. The front-ends therefore use one stable directory each
+(``default_journal_dir``) and prune earlier sessions past
+``FRONTEND_MAX_BYTES``, so the journal survives restarts without growing by
+a directory per launch.
+"""
+import bisect
+import collections
+import json
+import os
+import threading
+import time
+
+INDEX_EVERY = 256           # entries between (t, offset) index marks
+SEGMENT_SUFFIX = '.ndjson'
+FRONTEND_MAX_BYTES = 1024 * 1024 * 1024     # cap of the GUIs' shared journal directories
+
+
+def default_journal_dir(name='web'):
+    """``$NETTEST_JOURNAL_DIR`` or ``~/.nettest/journal``, plus ``<name>`` (one per front-end)."""
+    base = os.environ.get('NETTEST_JOURNAL_DIR') or \
+        os.path.join(os.path.expanduser('~'), '.nettest', 'journal')
+    return os.path.join(base, name)
+
+
+def entry_time(line):
+    """Timestamp of a raw entry line (bytes) without parsing the rest."""
+    return float(line[5:line.index(b',')])
+
+
+class _Segment:
+    __slots__ = ('number', 'path', 'first', 'last', 'entries', 'size', 'marks', 'mark_times')
+
+    def __init__(self, number, path):
+        self.number = number
+        self.path = path
+        self.first = None           # timestamp of the first entry
+        self.last = None
+        self.entries = 0
+        self.size = 0               # bytes written (flushed or not)
+        self.marks = []             # byte offset of every INDEX_EVERY-th entry
+        self.mark_times = []        # and its timestamp (kept apart for bisect)
+
+    def note(self, t, offset):
+        if self.entries % INDEX_EVERY == 0:
+            self.marks.append(offset)
+            self.mark_times.append(t)
+        if self.first is None:
+            self.first = t
+        self.last = t
+        self.entries += 1
+
+    def info(self):
+        return {'number': self.number, 'path': self.path, 'first': self.first,
+                'last': self.last, 'entries': self.entries, 'bytes': self.size}
+
+
+class Journal:
+    """Rotating NDJSON journal of log lines and records (thread-safe)."""
+
+    def __init__(self, directory=None, segment_bytes=16 * 1024 * 1024, sync_interval=1.0,
+                 hot_lines=1000, max_bytes=None):
+        self.directory = directory or default_journal_dir()
+        os.makedirs(self.directory, exist_ok=True)
+        self.segment_bytes = max(4096, int(segment_bytes))
+        self.sync_interval = float(sync_interval)
+        self.max_bytes = max_bytes
+        self.hot = collections.deque(maxlen=hot_lines)  # newest log lines, for the UIs
+        self.entries = 0
+        self.removed = 0            # earlier sessions' segments deleted to honour max_bytes
+        self.over_limit = False     # this session alone is over max_bytes (nothing dropped)
+        self.error = None           # last write error (the journal keeps going)
+        self._lock = threading.Lock()
+        self._segments = [self._scan(n, p) for n, p in self._existing()]
+        self._earlier = len(self._segments)     # leading segments from earlier sessions
+        self._file = None
+        self._dirty = False
+        self._closed = False
+        self._open_segment()
+        self._trim()                # segments left by earlier sessions count too
+        self._syncer = threading.Thread(target=self._sync_loop, daemon=True, name='journal-sync')
+        self._syncer.start()
+
+    # -- writing --------------------------------------------------------------
+
+    def publish(self, data, event=None):
+        """Append one message (Broadcaster signature: a log line, or event JSON)."""
+        if event is None:
+            self._append(time.time(), json.dumps(data, ensure_ascii=False), None)
+            self.hot.append(data)
+        else:
+            self._append(time.time(), data, event)
+
+    def write_lines(self, lines):
+        """Append a batch of log lines (one timestamp; trailing newlines dropped)."""
+        now = time.time()
+        with self._lock:
+            for line in lines:
+                line = line.rstrip('\n')
+                self._write(now, json.dumps(line, ensure_ascii=False), None)
+                self.hot.append(line)
+
+    def record(self, event, payload):
+        """Append an event with a payload that still needs JSON encoding."""
+        self._append(time.time(), json.dumps(payload), event)
+
+    def _append(self, t, data, event):
+        with self._lock:
+            self._write(t, data, event)
+
+    def _write(self, t, data, event):
+        if self._closed:
+            return
+        if event is None:
+            line = f'{{"t": {t:.3f}, "l": {data}}}\n'
+        else:
+            line = f'{{"t": {t:.3f}, "e": {json.dumps(event)}, "d": {data}}}\n'
+        raw = line.encode('utf-8')
+        seg = self._segments[-1]
+        if seg.size and seg.size + len(raw) > self.segment_bytes:
+            self._rotate()
+            seg = self._segments[-1]
+        try:
+            self._file.write(raw)
+        except (OSError, ValueError) as e:
+            self.error = str(e)
+            return
+        seg.note(t, seg.size)
+        seg.size += len(raw)
+        self.entries += 1
+        self._dirty = True
+
+    def _open_segment(self):
+        number = self._segments[-1].number + 1 if self._segments else 1
+        while True:
+            path = os.path.join(self.directory, f"{number:06d}{SEGMENT_SUFFIX}")
+            try:
+                # exclusive: a second app instance on the same directory takes the next number
+                self._file = open(path, 'xb', buffering=256 * 1024)
+                break
+            except FileExistsError:
+                number += 1
+        self._segments.append(_Segment(number, path))
+
+    def _rotate(self):
+        try:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+        except (OSError, ValueError) as e:
+            self.error = str(e)
+        self._open_segment()
+        self._dirty = False
+        self._trim()
+
+    def _trim(self):
+        """Delete earlier sessions' segments, oldest first, while over ``max_bytes``."""
+        if not self.max_bytes:
+            return
+        total = sum(s.size for s in self._segments)
+        while total > self.max_bytes and self._earlier:
+            seg = self._segments.pop(0)
+            self._earlier -= 1
+            total -= seg.size
+            self.removed += 1
+            try:
+                os.remove(seg.path)
+            except OSError:
+                pass
+        if total > self.max_bytes and not self.over_limit:
+            self.over_limit = True
+            self.error = (f"journal is {total / 1e6:.0f} MB, over its {self.max_bytes / 1e6:.0f} MB "
+                          f"limit; the current session is kept in full")
+
+    def _sync_loop(self):
+        while not self._closed:
+            time.sleep(self.sync_interval)
+            self.sync()
+
+    def sync(self):
+        """Flush buffered entries to disk and fsync them."""
+        with self._lock:
+            if not self._dirty or self._closed:
+                return
+            try:
+                self._file.flush()
+                # fsync a duplicate so the lock is not held during the disk wait
+                fd = os.dup(self._file.fileno())
+            except (OSError, ValueError) as e:
+                self.error = str(e)
+                return
+            self._dirty = False
+        try:
+            os.fsync(fd)
+        except OSError as e:
+            self.error = str(e)
+        finally:
+            os.close(fd)
+
+    def close(self):
+        self.sync()
+        with self._lock:
+            self._closed = True
+            try:
+                self._file.close()
+            except OSError:
+                pass
+
+    # -- reading --------------------------------------------------------------
+
+    def segments(self):
+        with self._lock:
+            return [s.info() for s in self._segments]
+
+    def info(self):
+        with self._lock:
+            first = next((s.first for s in self._segments if s.first is not None), None)
+            last = next((s.last for s in reversed(self._segments) if s.last is not None), None)
+            return {
+                'directory': self.directory,
+                'segments': len(self._segments),
+                'entries': self.entries,
+                'bytes': sum(s.size for s in self._segments),
+                'first': first,
+                'last': last,
+                'removed_segments': self.removed,
+                'over_limit': self.over_limit,
+                'error': self.error,
+            }
+
+    def tail(self, count=None):
+        """The newest log lines still held in memory."""
+        lines = list(self.hot)
+        return lines if count is None else lines[-count:]
+
+    def read_raw(self, t0=None, t1=None):
+        """Raw entry lines (bytes, newline included) with ``t0 <= t <= t1``, oldest first."""
+        with self._lock:
+            if self._dirty:
+                try:
+                    self._file.flush()
+                except (OSError, ValueError):
+                    pass
+            # (segment, byte limit) snapshot: later appends are not read
+            plan = [(s, s.size) for s in self._segments
+                    if s.entries and (t0 is None or s.last >= t0) and (t1 is None or s.first <= t1)]
+            plan = [(s, size, list(s.marks), list(s.mark_times)) for s, size in plan]
+        for seg, size, marks, mark_times in plan:
+            offset = 0
+            if t0 is not None and marks:
+                i = bisect.bisect_left(mark_times, t0) - 1
+                offset = marks[max(i, 0)]
+            try:
+                f = open(seg.path, 'rb')
+            except OSError:
+                continue            # deleted by max_bytes meanwhile
+            with f:
+                f.seek(offset)
+                pos = offset
+                for line in f:
+                    pos += len(line)
+                    if pos > size or not line.endswith(b'\n'):
+                        break
+                    try:
+                        t = entry_time(line)
+                    except ValueError:
+                        continue    # torn last line after a crash
+                    if t0 is not None and t < t0:
+                        continue
+                    if t1 is not None and t > t1:
+                        return
+                    yield line
+
+    def read(self, t0=None, t1=None, events=None):
+        """Entries as dicts (``t`` plus ``l`` or ``e``/``d``); ``events`` filters
+        event names, with None standing for log lines."""
+        for line in self.read_raw(t0, t1):
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if events is None or entry.get('e') in events:
+                yield entry
+
+    def lines(self, t0=None, t1=None):
+        """Log lines (text) in the range."""
+        for entry in self.read(t0, t1, events=(None,)):
+            yield entry['l']
+
+    def export(self, t0=None, t1=None, fmt='text', chunk_bytes=64 * 1024):
+        """Bytes chunks of a time range: ``'text'`` (log lines only) or ``'ndjson'``
+        (every entry as stored). For a file or a streamed HTTP body."""
+        if fmt not in ('text', 'ndjson'):
+            raise ValueError("format must be text or ndjson")
+        if fmt == 'ndjson':
+            items = self.read_raw(t0, t1)
+        else:
+            items = ((line + "\n").encode('utf-8') for line in self.lines(t0, t1))
+        return self._chunked(items, chunk_bytes)
+
+    @staticmethod
+    def _chunked(items, chunk_bytes):
+        buf, size = [], 0
+        for item in items:
+            buf.append(item)
+            size += len(item)
+            if size >= chunk_bytes:
+                yield b"".join(buf)
+                buf, size = [], 0
+        if buf:
+            yield b"".join(buf)
+
+    # -- existing segments ----------------------------------------------------
+
+    def _existing(self):
+        found = []
+        for name in os.listdir(self.directory):
+            stem, ext = os.path.splitext(name)
+            if ext == SEGMENT_SUFFIX and stem.isdigit():
+                found.append((int(stem), os.path.join(self.directory, name)))
+        return sorted(found)
+
+    def _scan(self, number, path):
+        seg = _Segment(number, path)
+        offset = 0
+        with open(path, 'rb') as f:
+            for line in f:
+                try:
+                    t = entry_time(line)
+                except ValueError:
+                    t = None
+                if t is not None and line.endswith(b'\n'):
+                    seg.note(t, offset)
+                offset += len(line)
+        seg.size = offset
+        self.entries += seg.entries
+        return seg
+
@@ -0,0 +1,90 @@
+"""Largest-Triangle-Three-Buckets (LTTB) downsampling, incremental.
+
+LTTB keeps the shape of a line while cutting it down to one point per
+bucket. In each bucket it picks the point that makes the largest triangle
+with the point picked in the previous bucket and the mean of the next
+bucket. Spikes and dips survive, which a plain average would smooth away.
+
+Here buckets have a fixed width in x (a chart's pixel column) instead of a
+fixed point count. Then a bucket's pick never changes once the bucket
+after it is complete. ``LttbDecimator`` therefore only works on points
+that arrived since the last call, so keeping a 24-hour series decimated
+costs O(new points) per frame. The one O(n) pass is after the bucket width
+changes (the chart's x range grew or it was resized).
+"""
+import bisect
+
+
+class LttbDecimator:
+    """Incremental LTTB over x buckets ``[x0 + k * width, x0 + (k + 1) * width)``.
+
+    ``xs`` must be non-decreasing and may only grow between calls (the same
+    sequences each time, e.g. ``array.array`` columns being appended to).
+    """
+
+    def __init__(self, width, x0=0.0):
+        self.reset(width, x0)
+
+    def reset(self, width, x0=0.0):
+        """Start over with another bucket width (the next call rescans)."""
+        self.width = float(width)
+        self.x0 = x0
+        self.px = []                # picked points: first point, then one per decided bucket
+        self.py = []
+        self.pos = 0                # first point not yet covered by a decided bucket
+
+    def update(self, xs, ys, final=False):
+        """Decide every bucket whose successor is complete (all of them with
+        ``final``, keeping the last point). Returns how many points were picked."""
+        n = len(xs)
+        before = len(self.px)
+        if not self.px:
+            if not n:
+                return 0
+            self.px.append(xs[0])
+            self.py.append(ys[0])
+            self.pos = 1
+        width, x0 = self.width, self.x0
+        while self.pos < n:
+            i = self.pos
+            # bucket of xs[i], then the (non-empty) bucket after it
+            # (max(): float rounding must not give an empty bucket)
+            j = max(i + 1, bisect.bisect_left(xs, x0 + ((xs[i] - x0) // width + 1) * width, i, n))
+            k = n
+            if j < n:
+                k = max(j + 1, bisect.bisect_left(xs, x0 + ((xs[j] - x0) // width + 1) * width, j, n))
+            if k >= n and not final:
+                break               # the next bucket (or this one) may still grow
+            if j >= n:
+                best = n - 1        # last bucket: keep the last point
+            else:
+                cx = sum(xs[j:k]) / (k - j)
+                cy = sum(ys[j:k]) / (k - j)
+                ax, ay = self.px[-1], self.py[-1]
+                best, best_area = i, -1.0
+                for m in range(i, j):
+                    # twice the triangle area (a, m, c); the factor does not matter
+                    area = abs((ax - cx) * (ys[m] - ay) - (ax - xs[m]) * (cy - ay))
+                    if area > best_area:
+                        best, best_area = m, area
+            self.px.append(xs[best])
+            self.py.append(ys[best])
+            self.pos = j
+        return len(self.px) - before
+
+    def points(self, xs, ys):
+        """``(x, y)`` lists to draw: the picks, then the undecided raw tail."""
+        self.update(xs, ys)
+        return self.px + list(xs[self.pos:]), self.py + list(ys[self.pos:])
+
+
+def lttb(xs, ys, buckets):
+    """Downsample to about ``buckets`` points spread evenly over the x range."""
+    if len(xs) <= buckets or len(xs) < 3:
+        return list(xs), list(ys)
+    span = xs[-1] - xs[0]
+    if span <= 0:
+        return [xs[0], xs[-1]], [ys[0], ys[-1]]
+    dec = LttbDecimator(span / buckets, xs[0])
+    dec.update(xs, ys, final=True)
+    return dec.px, dec.py
@@ -0,0 +1,316 @@
+"""All-pairs (mesh) throughput tests across a host inventory.
+
+Every ordered pair ``A -> B`` of hosts gets one test: A runs the iperf3
+client, B the server. Tests run in *rounds*. Within a round no host takes
+part in two tests, so tests don't compete for a host's NIC or CPU. Each
+round is as large as possible:
+
+* by default a host is in at most one test per round. The schedule is the
+  round-robin "circle" method, run once per direction: ``2 (N - 1)`` rounds
+  of ``N / 2`` tests (``2 N`` rounds for odd N).
+* with ``duplex=True`` a host may send in one test while it receives in
+  another (full-duplex links). Round k is the shift ``i -> i + k``: ``N - 1``
+  rounds of ``N`` tests.
+
+A round starts all of its tests at once, past the manager's
+``max_concurrent`` if need be (``RunManager.submit(unlimited=True)``), so
+every test of a round covers the same time window.
+
+A host is ``'name=address:port'``, ``'address[:port]'`` or a dict::
+
+    {'name': 'lab1', 'address': '10.0.0.1', 'port': 5201,
+     'bind': '10.0.0.1',              # client source address (-B), default address
+     'exec': 'ssh -o BatchMode=yes lab1'}   # run its client there instead of here
+
+Without ``exec`` every client runs on this machine and is bound to the sending
+host's address with ``-B``. That is enough for multi-homed test boxes. It can
+also be tried locally against loopback aliases (``127.0.0.2``, ``127.0.0.3``
+... on Linux) or several ports of a local ``ServerPool``. With ``exec`` the
+client command is prefixed with it, so it runs on the sending host itself.
+
+The result holds an N x N throughput matrix (``None`` on the diagonal and
+for failed pairs) and loss, jitter and retransmit matrices.
+"""
+import shlex
+import threading
+import time
+import uuid
+
+from .runs import DEFAULT_PORT, build_command, normalize_spec
+
+STATE_RUNNING = 'running'
+STATE_DONE = 'done'
+STATE_CANCELLED = 'cancelled'
+STATE_FAILED = 'failed'
+
+PAIR_DONE = 'done'
+PAIR_FAILED = 'failed'
+
+
+def normalize_hosts(hosts, default_port=DEFAULT_PORT):
+    """Validate an inventory (list, or comma/newline separated string). Raises ValueError."""
+    if isinstance(hosts, str):
+        hosts = [h.strip() for h in hosts.replace('\n', ',').split(',') if h.strip()]
+    out = []
+    for h in hosts or ():
+        if isinstance(h, str):
+            name, _, addr = h.rpartition('=')
+            address, port = addr, None
+            # 'host:port', but leave bare IPv6 addresses alone
+            if addr.count(':') == 1 or addr.startswith('['):
+                address, _, port = addr.rpartition(':')
+                address = address.strip('[]')
+            h = {'name': name, 'address': address, 'port': port}
+        elif not isinstance(h, dict):
+            raise ValueError("hosts must be strings or objects")
+        address = (h.get('address') or '').strip()
+        if not address:
+            raise ValueError("every host needs an address")
+        try:
+            port = int(h.get('port') or default_port or DEFAULT_PORT)
+        except (TypeError, ValueError):
+            raise ValueError(f"bad port for host {address}")
+        if not 0 < port < 65536:
+            raise ValueError(f"port out of range for host {address}")
+        out.append({
+            'name': (h.get('name') or '').strip() or address,
+            'address': address,
+            'port': port,
+            'bind': h.get('bind') or (None if h.get('exec') else address),
+            'exec': h.get('exec') or None,
+        })
+    if len(out) < 2:
+        raise ValueError("a mesh needs at least two hosts")
+    names = [h['name'] for h in out]
+    if len(set(names)) != len(names):
+        # same address on several ports (a local pool): tell them apart by port
+        for h in out:
+            if names.count(h['name']) > 1:
+                h['name'] = f"{h['address']}:{h['port']}"
+        names = [h['name'] for h in out]
+        if len(set(names)) != len(names):
+            raise ValueError("host names must be unique")
+    return out
+
+
+def schedule(n, duplex=False):
+    """Rounds of ``(sender, receiver)`` index pairs covering every ordered pair once."""
+    if n < 2:
+        return []
+    if duplex:
+        return [[(i, (i + k) % n) for i in range(n)] for k in range(1, n)]
+    # circle method: fix the first slot, rotate the others; None is the bye for odd n
+    ring = list(range(n)) + ([None] if n % 2 else [])
+    m = len(ring)
+    forward, backward = [], []
+    for r in range(m - 1):
+        pairs = [(ring[i], ring[m - 1 - i]) for i in range(m // 2)]
+        # alternate who sends first so no host always leads
+        pairs = [(a, b) if r % 2 == 0 else (b, a) for a, b in pairs if a is not None and b is not None]
+        forward.append(pairs)
+        backward.append([(b, a) for a, b in pairs])
+        ring = ring[:1] + ring[-1:] + ring[1:-1]
+    return forward + backward
+
+
+class Mesh:
+    """Run every ordered host pair through a ``RunManager``, round by round.
+
+    ``spec`` holds the test options shared by all pairs (see
+    ``runs.normalize_spec``; server and port come from the inventory).
+    ``listener(kind, payload)``, if given, is called with ``('round',
+    {'index', 'total', 'pairs'})`` when a round starts, ``('pair',
+    pair_dict)`` after every test and ``('done', result_dict)`` at the end.
+    """
+
+    def __init__(self, manager, hosts, spec=None, duration=10, duplex=False,
+                 exe='iperf3', remote_exe='iperf3', listener=None):
+        self.id = uuid.uuid4().hex[:8]
+        self.manager = manager
+        spec = dict(spec or {})
+        self.hosts = normalize_hosts(hosts, spec.get('port'))
+        # the sending host always runs the client
+        self.spec = normalize_spec(dict(spec, server=self.hosts[0]['address'], direction='upload'))
+        self.duration = int(duration)
+        if self.duration < 1:
+            raise ValueError("duration must be >= 1")
+        self.duplex = bool(duplex)
+        self.rounds = schedule(len(self.hosts), self.duplex)
+        self.exe = exe
+        self.remote_exe = remote_exe
+        self.listener = listener
+        self.state = STATE_RUNNING
+        self.error = None
+        self.round = 0
+        self.pairs = []
+        self.created = time.time()
+        self.finished = None
+        self._runs = []
+        self._cancelled = False
+
+    @property
+    def total_pairs(self):
+        n = len(self.hosts)
+        return n * (n - 1)
+
+    # -- driving ----------------------------------------------------------------
+
+    def start(self):
+        """Run the mesh in a daemon thread; returns self."""
+        threading.Thread(target=self.run, daemon=True).start()
+        return self
+
+    def cancel(self):
+        self._cancelled = True
+        for run in list(self._runs):
+            self.manager.stop(run.id)
+
+    def run(self):
+        """Run every round (blocking) and return ``result()``."""
+        try:
+            for index, pairs in enumerate(self.rounds, 1):
+                if self._cancelled:
+                    break
+                self.run_round(index, pairs)
+            self.state = STATE_CANCELLED if self._cancelled else STATE_DONE
+        except Exception as e:
+            self.error = str(e)
+            self.state = STATE_FAILED
+        self.finished = time.time()
+        result = self.result()
+        self._notify('done', result)
+        return result
+
+    def command(self, sender, receiver):
+        """Client command line for one pair."""
+        src, dst = self.hosts[sender], self.hosts[receiver]
+        extra = list(self.spec['extra_args'])
+        if src['bind']:
+            extra += ['-B', src['bind']]
+        spec = dict(self.spec, server=dst['address'], port=dst['port'],
+                    duration=self.duration, extra_args=extra)
+        if src['exec']:
+            return shlex.split(src['exec']) + build_command(spec, self.remote_exe)
+        return build_command(spec, self.exe)
+
+    def run_round(self, index, pairs):
+        self.round = index
+        names = [(self.hosts[a]['name'], self.hosts[b]['name']) for a, b in pairs]
+        self._notify('round', {'index': index, 'total': len(self.rounds),
+                               'pairs': [f"{a} -> {b}" for a, b in names]})
+        label = f"mesh {self.id} r{index}"
+        done = [threading.Event() for _ in pairs]
+        # the whole round starts at once, whatever the manager's max_concurrent
+        runs = [self.manager.submit(self.command(a, b), spec=dict(self.spec, label=label),
+                                    listener=_finish_listener(ev), unlimited=True)
+                for (a, b), ev in zip(pairs, done)]
+        self._runs = runs
+        for ev in done:
+            ev.wait()
+        self._runs = []
+        if self._cancelled:
+            return
+        for (a, b), run in zip(pairs, runs):
+            pair = pair_result(run)
+            pair.update(round=index, sender=self.hosts[a]['name'], receiver=self.hosts[b]['name'])
+            self.pairs.append(pair)
+            self._notify('pair', pair)
+
+    def _notify(self, kind, payload):
+        if self.listener is not None:
+            self.listener(kind, payload)
+
+    # -- results ----------------------------------------------------------------
+
+    def matrix(self, key='mbps'):
+        """``[sender][receiver]`` values of one pair field, in inventory order."""
+        index = {h['name']: i for i, h in enumerate(self.hosts)}
+        n = len(self.hosts)
+        values = [[None] * n for _ in range(n)]
+        for pair in self.pairs:
+            if pair['state'] == PAIR_DONE:
+                values[index[pair['sender']]][index[pair['receiver']]] = pair[key]
+        return values
+
+    def result(self):
+        return {
+            'id': self.id,
+            'state': self.state,
+            'error': self.error,
+            'hosts': [h['name'] for h in self.hosts],
+            'protocol': self.spec['protocol'],
+            'duration': self.duration,
+            'duplex': self.duplex,
+            'rounds': len(self.rounds),
+            'round': self.round,
+            'total_pairs': self.total_pairs,
+            'pairs': list(self.pairs),
+            'matrix': {key: self.matrix(key)
+                       for key in ('mbps', 'loss_percent', 'jitter_ms', 'retransmits')},
+            'created': self.created,
+            'finished': self.finished,
+        }
+
+
+def _finish_listener(event):
+    """Run listener that sets ``event`` once the run has finished (or was cancelled)."""
+    def listener(kind, payload):
+        if kind == 'finish':
+            event.set()
+    return listener
+
+
+def pair_result(run):
+    """Throughput, loss, jitter and retransmits of one finished pair test."""
+    records = [r for r in run.summary_records if r.stream is None] or run.summary_records
+    receiver = udp = None
+    for rec in records:
+        if rec.lost_percent is not None:
+            udp = rec
+        if rec.sender is False:
+            receiver = rec
+    ser = run.series
+    mean = ser.agg_sum_bps / ser.agg_count / 1e6 if ser.agg_count else None
+    ok = run.state == 'finished' and (receiver is not None or mean is not None)
+    return {
+        'state': PAIR_DONE if ok else PAIR_FAILED,
+        'reason': '' if ok else (run.error or f"iperf3 exited with {run.exit_code}"),
+        # receiver total when iperf3 reported one, else the interval mean
+        'mbps': receiver.mbps if receiver is not None else mean,
+        'loss_percent': udp.lost_percent if udp is not None else None,
+        'jitter_ms': udp.jitter_ms if udp is not None else None,
+        'retransmits': run.retransmits if udp is None else None,
+        'run': run.id,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Text rendering (log output of both front-ends)
+# ---------------------------------------------------------------------------
+
+def _num(v, fmt='.1f'):
+    return '--' if v is None else format(v, fmt)
+
+
+def format_pair(pair, total=None):
+    of = f"/{total}" if total else ''
+    text = f"[Mesh r{pair['round']}{of}] {pair['sender']} -> {pair['receiver']}  {_num(pair['mbps']):>9} Mbps"
+    if pair['loss_percent'] is not None:
+        text += f"  loss {pair['loss_percent']:.3f}%  jitter {_num(pair['jitter_ms'], '.3f')} ms"
+    elif pair['retransmits'] is not None:
+        text += f"  retr {pair['retransmits']}"
+    if pair['state'] != PAIR_DONE:
+        text += f"  FAILED ({pair['reason']})"
+    return text
+
+
+def format_matrix(result, key='mbps', fmt='.1f'):
+    """Text table: one row per sender, one column per receiver."""
+    names = result['hosts']
+    values = result['matrix'][key]
+    width = max(8, max(len(n) for n in names) + 1)
+    lines = ['from/to'.ljust(width) + ''.join(f"{n:>{width}}" for n in names)]
+    for j, (name, row) in enumerate(zip(names, values)):
+        cells = ['-' if i == j else _num(v, fmt) for i, v in enumerate(row)]
+        lines.append(f"{name:<{width}}" + ''.join(f"{c:>{width}}" for c in cells))
+    return lines
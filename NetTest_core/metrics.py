@@ -0,0 +1,174 @@
+"""Minimal Prometheus instrumentation (text exposition format 0.0.4).
+
+Counters, gauges and histograms with optional labels, all thread-safe, plus
+a ``Registry`` that renders them. Values that are cheaper to read at scrape
+time than to maintain (run state, ring-buffer depth ...) are added by
+*collectors*: callables returning ``(name, type, help, [(labels, value)])``.
+
+The module-level metrics below are updated by ``NetTest_core.runs``; hosts
+render them through ``REGISTRY``.
+"""
+import bisect
+import math
+import threading
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + '}'
+
+
+def format_value(value):
+    if value is None:
+        return 'NaN'
+    if isinstance(value, float):
+        if math.isnan(value):
+            return 'NaN'
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+        return repr(value)
+    return str(value)
+
+
+class _Metric:
+    type = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def _labels_of(self, key):
+        return dict(zip(self.labelnames, key))
+
+    def header(self):
+        return f"# HELP {self.name} {self.documentation}\n# TYPE {self.name} {self.type}\n"
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def render(self):
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + "".join(
+            f"{self.name}{format_labels(self._labels_of(k))} {format_value(v)}\n" for k, v in items)
+
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        with self._lock:
+            items = [(k, (list(v[0]), v[1], v[2])) for k, v in self._values.items()]
+        out = [self.header()]
+        for key, (counts, total, count) in items:
+            labels = self._labels_of(key)
+            cumulative = 0
+            for bound, n in zip(self.buckets + (math.inf,), counts):
+                cumulative += n
+                le = '+Inf' if bound == math.inf else format_value(float(bound))
+                out.append(f"{self.name}_bucket{format_labels(dict(labels, le=le))} {cumulative}\n")
+            out.append(f"{self.name}_sum{format_labels(labels)} {format_value(total)}\n")
+            out.append(f"{self.name}_count{format_labels(labels)} {count}\n")
+        return "".join(out)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs):
+        return self.register(Counter(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs):
+        return self.register(Gauge(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs):
+        return self.register(Histogram(*args, **kwargs))
+
+    def add_collector(self, collect):
+        """``collect()`` -> iterable of ``(name, type, help, [(labels_dict, value), ...])``.
+
+        Samples whose value is None are left out (e.g. jitter of a TCP run).
+        """
+        self._collectors.append(collect)
+
+    def render(self):
+        out = [m.render() for m in self._metrics]
+        for collect in self._collectors:
+            for name, mtype, documentation, samples in collect():
+                out.append(f"# HELP {name} {documentation}\n# TYPE {name} {mtype}\n")
+                out.extend(f"{name}{format_labels(labels)} {format_value(value)}\n"
+                           for labels, value in samples if value is not None)
+        return "".join(out)
+
+
+REGISTRY = Registry()
+
+OUTPUT_LINES = REGISTRY.counter(
+    'nettest_output_lines_total', 'iperf3 output lines captured')
+PARSE_SECONDS = REGISTRY.histogram(
+    'nettest_parse_seconds', 'Time to parse and dispatch one reader chunk of iperf3 output',
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1))
+RUNS_FINISHED = REGISTRY.counter(
+    'nettest_runs_finished_total', 'Runs that reached a final state', ('state',))
+RUN_LIFETIME = REGISTRY.histogram(
+    'nettest_subprocess_lifetime_seconds', 'Wall time from iperf3 start to exit',
+    buckets=(1, 2.5, 5, 10, 15, 30, 60, 120, 300, 600, 1800, 3600))
@@ -0,0 +1,314 @@
+"""Automatic UDP max-rate search.
+
+``RateSearch`` finds the highest ``-b`` a link sustains by running short
+UDP probes through a ``RunManager``. It doubles the rate from ``start``
+until a probe fails (or halves it until one passes), then bisects between
+the best passing and the lowest failing rate until they are within
+``resolution`` of each other.
+
+A probe passes when:
+
+* receiver loss is at most ``loss_target`` percent
+* jitter is at most ``jitter_ceiling`` ms, if a ceiling is set
+* the achieved rate is within ``shortfall`` of the offered rate
+
+A probe that is clearly failing is stopped early instead of running to the
+end. That means loss far above the target, jitter far above the ceiling, or
+a sender that cannot reach the offered rate. Upload probes only learn their
+loss from the end-of-test receiver totals, so they can only be stopped early
+on rate or jitter; download (``-R``) probes also see loss per interval.
+
+The result holds the maximum sustainable rate and every probe, so callers
+can draw the loss/jitter vs. offered-rate curve.
+"""
+import threading
+import time
+import uuid
+
+from .iperf_stream import aggregate_of
+
+UNITS = {'': 1, 'K': 1e3, 'M': 1e6, 'G': 1e9, 'T': 1e12}
+
+EARLY_MIN_INTERVALS = 2     # intervals to wait before judging a probe early
+EARLY_LOSS_FACTOR = 5.0     # stop once loss exceeds this multiple of the target ...
+EARLY_LOSS_MARGIN = 0.5     # ... and the target plus this many percentage points
+EARLY_JITTER_FACTOR = 2.0
+
+STATE_RUNNING = 'running'
+STATE_DONE = 'done'
+STATE_CANCELLED = 'cancelled'
+STATE_FAILED = 'failed'
+
+
+def parse_rate(text):
+    """``'100M'`` / ``'1.5G'`` / ``2e6`` -> bits per second."""
+    if isinstance(text, (int, float)):
+        return float(text)
+    text = str(text).strip()
+    unit = text[-1:].upper()
+    if unit and unit in UNITS:
+        return float(text[:-1]) * UNITS[unit]
+    return float(text)
+
+
+def format_rate(bps):
+    """Bits per second as an iperf3 ``-b`` argument (``'250M'``, ``'1.2G'``)."""
+    for unit in ('G', 'M', 'K'):
+        if bps >= UNITS[unit]:
+            return f"{bps / UNITS[unit]:.4g}{unit}"
+    return f"{bps:.0f}"
+
+
+class RateSearch:
+    """Search for the maximum UDP rate of one ``server:port``.
+
+    ``spec`` is a run spec (see ``runs.normalize_spec``) without a bandwidth;
+    protocol is forced to UDP. ``listener(kind, payload)``, if given, is
+    called with ``('probe', probe_dict)`` after every probe and
+    ``('done', result_dict)`` at the end.
+    """
+
+    def __init__(self, manager, spec, start='100M', min_rate='1M', max_rate='10G',
+                 loss_target=0.1, jitter_ceiling=None, probe_duration=3,
+                 resolution=0.05, shortfall=0.1, max_probes=16,
+                 exe='iperf3', listener=None):
+        self.id = uuid.uuid4().hex[:8]
+        self.manager = manager
+        self.spec = dict(spec, protocol='udp', bandwidth=None)
+        self.start_rate = parse_rate(start)
+        self.min_rate = parse_rate(min_rate)
+        self.max_rate = parse_rate(max_rate)
+        if not 0 < self.min_rate <= self.start_rate <= self.max_rate:
+            raise ValueError("rates must satisfy 0 < min_rate <= start <= max_rate")
+        self.loss_target = float(loss_target)
+        self.jitter_ceiling = float(jitter_ceiling) if jitter_ceiling else None
+        self.probe_duration = int(probe_duration)
+        self.resolution = float(resolution)
+        self.shortfall = float(shortfall)
+        self.max_probes = int(max_probes)
+        self.exe = exe
+        self.listener = listener
+        self.state = STATE_RUNNING
+        self.error = None
+        self.probes = []
+        self.best = None            # highest passing rate so far
+        self.lowest_fail = None     # lowest failing rate so far
+        self.created = time.time()
+        self.finished = None
+        self._watch = None
+        self._cancelled = False
+
+    # -- driving ----------------------------------------------------------------
+
+    def start(self):
+        """Run the search in a daemon thread; returns self."""
+        threading.Thread(target=self.run, daemon=True).start()
+        return self
+
+    def cancel(self):
+        self._cancelled = True
+        watch = self._watch
+        if watch is not None and watch.run is not None:
+            self.manager.stop(watch.run.id)
+
+    def run(self):
+        """Run the whole search (blocking) and return ``result()``."""
+        try:
+            while not self._cancelled and len(self.probes) < self.max_probes:
+                rate = self.next_rate()
+                if rate is None:
+                    break
+                self.probe(rate)
+            self.state = STATE_CANCELLED if self._cancelled else STATE_DONE
+        except Exception as e:
+            self.error = str(e)
+            self.state = STATE_FAILED
+        self.finished = time.time()
+        result = self.result()
+        self._notify('done', result)
+        return result
+
+    def next_rate(self):
+        """Rate of the next probe, or None once the search has converged."""
+        best, fail = self.best, self.lowest_fail
+        if not self.probes:
+            return self.start_rate
+        if fail is None:
+            # ramp up until something fails or the ceiling passes
+            return None if best >= self.max_rate else min(best * 2, self.max_rate)
+        if best is None:
+            # even the lowest rate tried fails: ramp down
+            return None if fail <= self.min_rate else max(fail / 2, self.min_rate)
+        if (fail - best) / fail <= self.resolution:
+            return None
+        return (best + fail) / 2
+
+    def converged(self):
+        best, fail = self.best, self.lowest_fail
+        if best is not None and best >= self.max_rate:
+            return True
+        return best is not None and fail is not None and (fail - best) / fail <= self.resolution
+
+    # -- one probe ----------------------------------------------------------------
+
+    def probe(self, rate):
+        """Run one probe at ``rate`` bps and record its verdict."""
+        # iperf3's -b is per stream
+        per_stream = rate / max(1, int(self.spec.get('parallel') or 1))
+        spec = dict(self.spec, bandwidth=format_rate(per_stream), duration=self.probe_duration,
+                    label=f"ratesearch {self.id} #{len(self.probes) + 1}")
+        watch = self._watch = _ProbeWatch(self, rate)
+        watch.run = self.manager.submit_spec(spec, self.exe, listener=watch.on_event)
+        watch.done.wait()
+        self._watch = None
+        if self._cancelled:
+            return None
+        probe = watch.verdict()
+        probe['index'] = len(self.probes) + 1
+        self.probes.append(probe)
+        if probe['passed']:
+            self.best = rate if self.best is None else max(self.best, rate)
+        else:
+            self.lowest_fail = rate if self.lowest_fail is None else min(self.lowest_fail, rate)
+        self._notify('probe', probe)
+        if probe['error']:
+            # the probe could not measure anything; halving the rate won't help
+            raise RuntimeError(probe['error'])
+        return probe
+
+    def _notify(self, kind, payload):
+        if self.listener is not None:
+            self.listener(kind, payload)
+
+    def result(self):
+        return {
+            'id': self.id,
+            'state': self.state,
+            'error': self.error,
+            'target': f"{self.spec.get('server')}:{self.spec.get('port')}",
+            'direction': self.spec.get('direction'),
+            'loss_target': self.loss_target,
+            'jitter_ceiling': self.jitter_ceiling,
+            'max_rate_bps': self.best,
+            'max_rate_mbps': self.best / 1e6 if self.best is not None else None,
+            'lowest_fail_bps': self.lowest_fail,
+            'converged': self.converged(),
+            'probes': list(self.probes),
+            'created': self.created,
+            'finished': self.finished,
+        }
+
+
+class _ProbeWatch:
+    """Follows one probe run; stops it early when it is clearly failing."""
+
+    def __init__(self, search, rate):
+        self.search = search
+        self.rate = rate
+        self.run = None
+        self.done = threading.Event()
+        self.intervals = 0
+        self.bits = 0.0
+        self.seconds = 0.0
+        self.lost = 0
+        self.packets = 0
+        self.jitter_max = None
+        self.early = None           # reason the probe was cut short
+        self.exit_code = None
+
+    def on_event(self, kind, payload):
+        if kind == 'interval':
+            rec = aggregate_of(payload)
+            if rec is not None and not rec.omitted:
+                self._add(rec)
+                if self.early is None:
+                    self.early = self._clearly_failing()
+                    if self.early is not None and self.run is not None:
+                        self.search.manager.stop(self.run.id)
+        elif kind == 'finish':
+            self.exit_code = payload
+            self.done.set()
+
+    def _add(self, rec):
+        self.intervals += 1
+        self.bits += rec.bits_per_second * rec.seconds
+        self.seconds += rec.seconds
+        if rec.packets and rec.lost_packets is not None:
+            self.packets += rec.packets
+            self.lost += rec.lost_packets
+        if rec.jitter_ms is not None:
+            self.jitter_max = max(self.jitter_max or 0.0, rec.jitter_ms)
+
+    def _clearly_failing(self):
+        s = self.search
+        if self.intervals < EARLY_MIN_INTERVALS:
+            return None
+        if self.packets:
+            loss = self.lost * 100.0 / self.packets
+            if loss > max(s.loss_target * EARLY_LOSS_FACTOR, s.loss_target + EARLY_LOSS_MARGIN):
+                return f"loss {loss:.2f}%"
+        if s.jitter_ceiling and self.jitter_max is not None \
+                and self.jitter_max > s.jitter_ceiling * EARLY_JITTER_FACTOR:
+            return f"jitter {self.jitter_max:.3f} ms"
+        achieved = self.bits / self.seconds if self.seconds else 0.0
+        if achieved < self.rate * (1 - 2 * s.shortfall):
+            return f"rate {achieved / 1e6:.1f} of {self.rate / 1e6:.1f} Mbps"
+        return None
+
+    def _receiver_total(self):
+        # the end-of-test [SUM] (or single stream) carries the receiver's loss
+        records = [r for r in self.run.summary_records if r.lost_percent is not None]
+        records = [r for r in records if r.stream is None] or records
+        for rec in records:
+            if rec.sender is False:
+                return rec
+        return records[-1] if records else None
+
+    def verdict(self):
+        s = self.search
+        total = self._receiver_total() if self.early is None else None
+        if total is not None:
+            achieved, loss, jitter = total.bits_per_second, total.lost_percent, total.jitter_ms
+        else:
+            achieved = self.bits / self.seconds if self.seconds else None
+            loss = self.lost * 100.0 / self.packets if self.packets else None
+            jitter = self.jitter_max
+        reasons = []
+        error = None
+        if self.early is not None:
+            reasons.append(f"stopped early: {self.early}")
+        elif self.exit_code != 0 or self.run.error:
+            error = self.run.error or f"iperf3 exited with {self.exit_code}"
+            reasons.append(error)
+        else:
+            if loss is None:
+                reasons.append("no loss figure")
+            elif loss > s.loss_target:
+                reasons.append(f"loss {loss:.3f}% > {s.loss_target:g}%")
+            if s.jitter_ceiling and jitter is not None and jitter > s.jitter_ceiling:
+                reasons.append(f"jitter {jitter:.3f} ms > {s.jitter_ceiling:g} ms")
+            if achieved is None or achieved < self.rate * (1 - s.shortfall):
+                reasons.append("rate not reached")
+        return {
+            'rate_bps': self.rate,
+            'rate_mbps': self.rate / 1e6,
+            'achieved_mbps': achieved / 1e6 if achieved is not None else None,
+            'loss_percent': loss,
+            'jitter_ms': jitter,
+            'seconds': self.seconds,
+            'early_stop': self.early is not None,
+            'passed': not reasons,
+            'reason': "; ".join(reasons),
+            'error': error,
+            'run': self.run.id,
+        }
+
+
+def format_probe(p):
+    """One log line per probe."""
+    def num(v, fmt):
+        return '--' if v is None else format(v, fmt)
+    return (f"[Probe {p['index']:>2}] -b {format_rate(p['rate_bps']):>6}  "
+            f"got {num(p['achieved_mbps'], '.2f')} Mbps  loss {num(p['loss_percent'], '.3f')}%  "
+            f"jitter {num(p['jitter_ms'], '.3f')} ms  {'PASS' if p['passed'] else 'FAIL'}"
+            + (f"  ({p['reason']})" if p['reason'] else ""))
@@ -0,0 +1,119 @@
+"""Chunked, cancellable line reader for iperf3 output.
+
+Instead of a text-mode ``readline`` per line, raw bytes are pulled with
+``os.read`` in large chunks, split on ``\\n`` in one pass and decoded once
+per chunk. On POSIX the read blocks in a ``selectors`` selector together
+with a wake-up pipe, so ``cancel()`` returns control to the reader
+immediately even while iperf3 is silent. Windows pipes cannot be selected;
+there the reader blocks in ``os.read`` and is released by the process
+exiting (``Run.stop`` terminates it).
+"""
+import os
+import selectors
+import sys
+import threading
+
+CHUNK_SIZE = 64 * 1024
+
+
+class LineSplitter:
+    """Incremental bytes -> complete text lines (each ending in ``\\n``)."""
+
+    __slots__ = ('encoding', '_partial')
+
+    def __init__(self, encoding='utf-8'):
+        self.encoding = encoding
+        self._partial = b''
+
+    def feed(self, data):
+        """Lines completed by ``data``; a trailing partial line is kept for later."""
+        end = data.rfind(b'\n')
+        if end < 0:
+            self._partial += data
+            return []
+        block = self._partial + data[:end + 1] if self._partial else data[:end + 1]
+        self._partial = data[end + 1:]
+        text = block.decode(self.encoding, 'replace')
+        if '\r' in text:
+            text = text.replace('\r\n', '\n')   # PTYs translate \n to \r\n
+        lines = text.split('\n')
+        lines.pop()                             # empty string after the final \n
+        return [line + '\n' for line in lines]
+
+    def flush(self):
+        """The unterminated remainder, if any, as a final line."""
+        if not self._partial:
+            return []
+        text = self._partial.decode(self.encoding, 'replace').rstrip('\r')
+        self._partial = b''
+        return [text + '\n']
+
+
+class ChunkReader:
+    """Iterate batches of lines from a raw file descriptor until EOF or ``cancel()``.
+
+    EIO (the child side of a PTY closing) counts as EOF.
+    """
+
+    def __init__(self, fd, chunk_size=CHUNK_SIZE, encoding='utf-8'):
+        self.fd = fd
+        self.chunk_size = chunk_size
+        self.splitter = LineSplitter(encoding)
+        self.cancelled = False
+        self._selector = None
+        self._wake_r = self._wake_w = None
+        # cancel() comes from other threads; it must not write to a wake-up
+        # fd that close() has already released (the number may be reused)
+        self._lock = threading.Lock()
+        if sys.platform != 'win32':
+            self._wake_r, self._wake_w = os.pipe()
+            os.set_blocking(self._wake_w, False)
+            self._selector = selectors.DefaultSelector()
+            self._selector.register(fd, selectors.EVENT_READ)
+            self._selector.register(self._wake_r, selectors.EVENT_READ)
+
+    def cancel(self):
+        """Stop iterating as soon as possible (safe from any thread)."""
+        self.cancelled = True
+        with self._lock:
+            if self._wake_w is not None:
+                try:
+                    os.write(self._wake_w, b'x')
+                except OSError:
+                    pass
+
+    def _read(self):
+        if self._selector is not None:
+            for key, _ in self._selector.select():
+                if key.fd == self._wake_r:
+                    return b''
+        try:
+            return os.read(self.fd, self.chunk_size)
+        except OSError:
+            return b''
+
+    def __iter__(self):
+        try:
+            while not self.cancelled:
+                data = self._read()
+                if not data:
+                    break
+                lines = self.splitter.feed(data)
+                if lines:
+                    yield lines
+            if not self.cancelled:
+                rest = self.splitter.flush()
+                if rest:
+                    yield rest
+        finally:
+            self.close()
+
+    def close(self):
+        with self._lock:
+            selector, self._selector = self._selector, None
+            wake_r, self._wake_r = self._wake_r, None
+            wake_w, self._wake_w = self._wake_w, None
+        if selector is not None:
+            selector.close()
+            os.close(wake_r)
+            os.close(wake_w)
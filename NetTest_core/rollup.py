@@ -0,0 +1,185 @@
+"""Multi-resolution min/avg/max rollups of a run's aggregate intervals.
+
+Charts never need every interval of a long run, only one value per screen
+column. ``Rollup`` keeps the aggregate intervals in fixed buckets of 1 s,
+10 s and 60 s of test time (``RESOLUTIONS``). Each bucket holds the count,
+sum, min and max of every metric in ``METRICS``. ``add()`` is O(1) per
+level. Each level keeps its newest ``capacity`` buckets, so memory stays
+bounded however long the run is: 6 h at 1 s, 24 h at 10 s, a week at 60 s.
+
+``query(t0, t1, points)`` picks the finest level that covers the range in
+at most ``points`` buckets, merging neighbouring 60 s buckets when even
+that level has too many. A dashboard that connects in the middle of a run
+gets the whole history at screen resolution in one small response.
+
+Live updates go out as compact ``sample`` events: a JSON array of the
+``SAMPLE_FIELDS`` values of one aggregate interval (``sample_of``).
+"""
+import array
+import bisect
+import math
+import threading
+
+RESOLUTIONS = (1, 10, 60)   # bucket widths, seconds of test time
+CAPACITIES = (6 * 3600, 24 * 360, 7 * 24 * 60)  # buckets kept per level
+METRICS = ('mbps', 'jitter_ms', 'lost_percent', 'retransmits')
+SAMPLE_FIELDS = ('end', 'ts') + METRICS
+MAX_POINTS = 10000
+
+
+def sample_of(rec):
+    """``sample`` event payload of an aggregate record (values in SAMPLE_FIELDS order)."""
+    return [round(rec.end, 3), round(rec.ts, 3), round(rec.mbps, 4), rec.jitter_ms,
+            rec.lost_percent, rec.retransmits]
+
+
+def _values(rec):
+    return (rec.mbps, rec.jitter_ms, rec.lost_percent, rec.retransmits)
+
+
+class _Level:
+    """Buckets of one resolution: the start of each, plus count/sum/min/max per metric."""
+
+    def __init__(self, resolution, capacity):
+        self.resolution = resolution
+        self.capacity = capacity
+        self.keys = array.array('q')        # bucket number (start // resolution)
+        self.cols = [(array.array('l'), array.array('d'), array.array('d'), array.array('d'))
+                     for _ in METRICS]
+        self.trimmed = False                # oldest buckets were dropped
+
+    def add(self, key, values):
+        keys = self.keys
+        if not keys or key > keys[-1]:
+            keys.append(key)
+            for (n, s, lo, hi), v in zip(self.cols, values):
+                if v is None:
+                    n.append(0)
+                    s.append(0.0)
+                    lo.append(math.inf)
+                    hi.append(-math.inf)
+                else:
+                    n.append(1)
+                    s.append(v)
+                    lo.append(v)
+                    hi.append(v)
+            if len(keys) > self.capacity * 1.25:
+                self._trim()
+            return
+        # same bucket (or iperf3 stepped back in time): fold into the newest one
+        for (n, s, lo, hi), v in zip(self.cols, values):
+            if v is not None:
+                n[-1] += 1
+                s[-1] += v
+                if v < lo[-1]:
+                    lo[-1] = v
+                if v > hi[-1]:
+                    hi[-1] = v
+
+    def _trim(self):
+        cut = len(self.keys) - self.capacity
+        del self.keys[:cut]
+        for col in self.cols:
+            for a in col:
+                del a[:cut]
+        self.trimmed = True
+
+    def covers(self, key0):
+        """True if no bucket at or after ``key0`` has been dropped."""
+        return not self.trimmed or (self.keys and self.keys[0] <= key0)
+
+
+class Rollup:
+    """1 s / 10 s / 60 s min/avg/max buckets of aggregate intervals (thread-safe)."""
+
+    def __init__(self, resolutions=RESOLUTIONS, capacities=CAPACITIES):
+        self.levels = [_Level(r, c) for r, c in zip(resolutions, capacities)]
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def add(self, rec):
+        """Add one aggregate ``IntervalRecord`` (bucketed by its start time)."""
+        values = _values(rec)
+        with self._lock:
+            for level in self.levels:
+                level.add(int(rec.start // level.resolution), values)
+            self.count += 1
+
+    def query(self, t0=None, t1=None, points=1000, metrics=METRICS):
+        """Buckets overlapping ``[t0, t1]`` (test seconds), at most ``points`` of them.
+
+        Returns ``{'resolution', 'buckets', 't', <metric>: {'min', 'avg', 'max'}}``
+        with column lists; ``t`` is each bucket's start and a metric with no
+        value in a bucket gives None there. Raises ValueError for an unknown metric.
+        """
+        bad = [m for m in metrics if m not in METRICS]
+        if bad:
+            raise ValueError(f"unknown metric(s): {', '.join(bad)}")
+        points = max(1, min(int(points), MAX_POINTS))
+        with self._lock:
+            level, lo, hi = self._pick(t0, t1, points)
+            factor = max(1, math.ceil((hi - lo) / points))
+            # aligned groups can straddle both ends of the range: one more may be needed
+            while len(self._groups(level.keys, lo, hi, factor)) > points:
+                factor += 1
+            out = self._collect(level, lo, hi, factor, metrics)
+        out['count'] = self.count
+        return out
+
+    def _pick(self, t0, t1, points):
+        best = None
+        for level in self.levels:
+            keys = level.keys
+            key0 = int(t0 // level.resolution) if t0 is not None else None
+            lo = 0 if t0 is None else bisect.bisect_left(keys, key0)
+            hi = len(keys) if t1 is None else bisect.bisect_right(keys, int(t1 // level.resolution))
+            if not level.covers(key0 if key0 is not None else -1):
+                continue
+            best = (level, lo, hi)
+            if hi - lo <= points:
+                break
+        if best is None:                # every level dropped part of the range
+            level = self.levels[-1]
+            lo = 0 if t0 is None else bisect.bisect_left(level.keys, int(t0 // level.resolution))
+            hi = len(level.keys) if t1 is None else \
+                bisect.bisect_right(level.keys, int(t1 // level.resolution))
+            best = (level, lo, hi)
+        return best
+
+    @staticmethod
+    def _groups(keys, lo, hi, factor):
+        """(group number, i, j) runs of buckets: ``factor`` buckets per group,
+        aligned on the bucket number so groups stay put as the run grows."""
+        groups = []
+        i = lo
+        while i < hi:
+            group = keys[i] // factor
+            j = i + 1
+            while j < hi and keys[j] // factor == group:
+                j += 1
+            groups.append((group, i, j))
+            i = j
+        return groups
+
+    def _collect(self, level, lo, hi, factor, metrics):
+        res = level.resolution
+        bounds = [(group * factor * res, i, j)
+                  for group, i, j in self._groups(level.keys, lo, hi, factor)]
+        out = {'resolution': res * factor, 'buckets': len(bounds),
+               't': [t for t, _, _ in bounds]}
+        for name, (n, s, mn, mx) in zip(METRICS, level.cols):
+            if name not in metrics:
+                continue
+            mins, avgs, maxs = [], [], []
+            for _, i, j in bounds:
+                count = sum(n[i:j])
+                if count:
+                    mins.append(round(min(mn[i:j]), 4))
+                    avgs.append(round(sum(s[i:j]) / count, 4))
+                    maxs.append(round(max(mx[i:j]), 4))
+                else:
+                    mins.append(None)
+                    avgs.append(None)
+                    maxs.append(None)
+            out[name] = {'min': mins, 'avg': avgs, 'max': maxs}
+        return out
@@ -0,0 +1,771 @@
+"""Test specs, per-run state and a concurrency-limited run scheduler.
+
+A *spec* is a plain dict describing one iperf3 client test (see
+``normalize_spec``). ``RunManager.submit`` turns specs into ``Run`` objects;
+each run owns its command line, log channel (a ``Broadcaster``), live
+metrics and stop handle. The manager starts queued runs as slots free up,
+never exceeding ``max_concurrent`` and never pointing two clients at the
+same iperf3 ``server:port`` at once (an iperf3 server only serves one test).
+
+Runs are executed by a *launcher*: by default a daemon thread running
+``execute_run``; an asyncio host can swap in ``execute_run_async``.
+"""
+import collections
+import json
+import os
+import shlex
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+from .anomaly import AnomalyDetector, format_anomaly
+from .breakpoints import BreakpointSampler
+from .broadcaster import Broadcaster
+from .iperf_stream import IperfOutputParser, parallel_of, prepare_command
+from .metrics import OUTPUT_LINES, PARSE_SECONDS, RUN_LIFETIME, RUNS_FINISHED
+from .reader import CHUNK_SIZE, ChunkReader, LineSplitter
+from .rollup import Rollup, sample_of
+from .stats import RunStats
+from .tcpstats import TcpStats, format_storm, format_summary as format_tcp_summary
+from .tsstore import SeriesStore
+
+DEFAULT_PORT = 5201
+STOP_GRACE = 2.0            # seconds between terminate() and a hard kill on stop
+STATS_EVERY = 1.0           # minimum seconds between live 'stats' events
+
+STATE_QUEUED = 'queued'
+STATE_RUNNING = 'running'
+STATE_FINISHED = 'finished'
+STATE_FAILED = 'failed'
+STATE_STOPPED = 'stopped'
+
+ACTIVE_STATES = (STATE_QUEUED, STATE_RUNNING)
+
+
+# ---------------------------------------------------------------------------
+# Specs and command lines
+# ---------------------------------------------------------------------------
+
+def normalize_spec(d):
+    """Validate a test spec dict and fill in defaults. Raises ValueError.
+
+    Either ``command`` (a raw iperf3 command, string or list) or ``server``
+    must be given, unless ``pool`` is set: then the run is pointed at a
+    server from the local pool. The remaining keys mirror the GUI form.
+    """
+    if not isinstance(d, dict):
+        raise ValueError("spec must be an object")
+    spec = {
+        'label': d.get('label') or '',
+        'command': d.get('command'),
+        'server': (d.get('server') or '').strip(),
+        'protocol': (d.get('protocol') or 'tcp').lower(),
+        'direction': (d.get('direction') or 'upload').lower(),
+        'bandwidth': d.get('bandwidth') or None,
+        'window': d.get('window') or None,          # -w socket buffer, e.g. '4M'
+        'length': d.get('length') or None,          # -l read/write buffer length
+        'zerocopy': bool(d.get('zerocopy')),        # -Z
+        'extra_args': list(d.get('extra_args') or ()),
+        'pool': bool(d.get('pool')),                # use a local ServerPool port
+    }
+    if not spec['command'] and not spec['server'] and not spec['pool']:
+        raise ValueError("spec needs a 'server' or a 'command'")
+    if spec['protocol'] not in ('tcp', 'udp'):
+        raise ValueError("protocol must be 'tcp' or 'udp'")
+    if spec['direction'] not in ('upload', 'download'):
+        raise ValueError("direction must be 'upload' or 'download'")
+    try:
+        spec['port'] = int(d.get('port') or DEFAULT_PORT)
+        spec['duration'] = int(d.get('duration') or 10)
+        spec['interval'] = float(d.get('interval') or 1)
+        spec['parallel'] = int(d.get('parallel') or 1)
+        spec['omit'] = int(d.get('omit') or 0)
+    except (TypeError, ValueError):
+        raise ValueError("port, duration, interval, parallel and omit must be numbers")
+    if not 0 < spec['port'] < 65536:
+        raise ValueError("port out of range")
+    if spec['parallel'] < 1:
+        raise ValueError("parallel must be >= 1")
+    return spec
+
+
+def build_command(spec, exe='iperf3'):
+    """iperf3 client command line for a normalized spec."""
+    if spec.get('command'):
+        cmd = spec['command']
+        cmd = shlex.split(cmd) if isinstance(cmd, str) else list(cmd)
+        if cmd and cmd[0] == 'iperf3':
+            cmd[0] = exe
+        return prepare_command(cmd)
+
+    cmd = [exe, '-c', spec['server'],
+           '-p', str(spec['port']),
+           '-i', f"{spec['interval']:g}",
+           '-t', str(spec['duration']),
+           '--forceflush']
+    if spec['protocol'] == 'udp':
+        cmd.append('-u')
+        if spec.get('bandwidth'):
+            cmd.extend(['-b', str(spec['bandwidth'])])
+    if spec['direction'] == 'download':
+        cmd.append('-R')
+    if spec['parallel'] > 1:
+        cmd.extend(['-P', str(spec['parallel'])])
+    if spec.get('window'):
+        cmd.extend(['-w', str(spec['window'])])
+    if spec.get('length'):
+        cmd.extend(['-l', str(spec['length'])])
+    if spec.get('zerocopy'):
+        cmd.append('-Z')
+    if spec.get('omit'):
+        cmd.extend(['-O', str(spec['omit'])])
+    cmd.extend(spec.get('extra_args') or ())
+    return prepare_command(cmd)
+
+
+def target_of(cmd):
+    """``(host, port)`` an iperf3 client command connects to, or None."""
+    host, port = None, DEFAULT_PORT
+    for i, arg in enumerate(cmd[:-1]):
+        if arg in ('-c', '--client'):
+            host = cmd[i + 1].lower()
+        elif arg in ('-p', '--port'):
+            try:
+                port = int(cmd[i + 1])
+            except ValueError:
+                pass
+    return (host, port) if host else None
+
+
+def retarget_command(cmd, host, port):
+    """Copy of client command ``cmd`` aimed at ``host:port`` instead."""
+    cmd = list(cmd)
+    at = 1
+    for flag, value in ((('-c', '--client'), host), (('-p', '--port'), str(port))):
+        for i, arg in enumerate(cmd[:-1]):
+            if arg in flag:
+                cmd[i + 1] = value
+                at = i + 2
+                break
+        else:
+            cmd[at:at] = [flag[0], value]
+            at += 2
+    return cmd
+
+
+_prefix_cache = (None, '')
+
+
+def log_prefix():
+    """``[YYYY-mm-dd HH:MM:SS] `` for now, formatted at most once per second."""
+    global _prefix_cache
+    sec = int(time.time())
+    cached_sec, prefix = _prefix_cache
+    if sec != cached_sec:
+        prefix = time.strftime("[%Y-%m-%d %H:%M:%S] ", time.localtime(sec))
+        _prefix_cache = (sec, prefix)
+    return prefix
+
+
+# ---------------------------------------------------------------------------
+# A single run
+# ---------------------------------------------------------------------------
+
+class Run:
+    """State of one iperf3 invocation.
+
+    ``channels`` are extra broadcasters that mirror this run's messages (the
+    dashboard mirrors its own run into the global ``/stream``). ``listener``,
+    if given, is called as ``listener(kind, payload)`` from the reader for
+    every parser event; the Tk GUI uses it to feed its UI queue.
+
+    ``anomaly`` holds ``AnomalyDetector`` options; None turns detection off.
+    """
+
+    def __init__(self, cmd, spec=None, run_id=None, channels=(), listener=None, history=2000,
+                 anomaly=None):
+        self.id = run_id or uuid.uuid4().hex[:8]
+        self.spec = spec or {}
+        self.cmd = list(cmd)
+        self.target = target_of(self.cmd)
+        self.state = STATE_QUEUED
+        self.exit_code = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.process = None
+        self.reader = None          # ChunkReader while output is being captured
+        self.broadcaster = Broadcaster(capacity=history)
+        self.channels = (self.broadcaster,) + tuple(channels)
+        self.listener = listener
+        self.parser = IperfOutputParser(parallel=parallel_of(self.cmd))
+        self.series = SeriesStore()
+        self.rollup = Rollup()      # 1 s / 10 s / 60 s min/avg/max buckets for charts
+        self.last = None            # newest aggregate IntervalRecord
+        self.retransmits = 0        # TCP retransmits over all stored intervals
+        self.stats = RunStats()     # streaming percentiles of the aggregate intervals
+        self.tcp = TcpStats()       # per-stream retransmits/cwnd/RTT, fairness, retransmit storms
+        self._stats_sent = 0.0
+        self.sampler = None         # BreakpointSampler of the current/last sampling session
+        self.sampling = False
+        self._bp_lock = threading.Lock()
+        self.detector = AnomalyDetector(self.id, **anomaly) if anomaly is not None else None
+        self.summary_records = []
+        self._stop_requested = False
+        self._on_done = None
+        self.unlimited = False      # start past RunManager.max_concurrent (mesh rounds)
+
+    @property
+    def active(self):
+        return self.state in ACTIVE_STATES
+
+    # -- output ---------------------------------------------------------------
+
+    def log(self, message):
+        line = log_prefix() + message
+        for ch in self.channels:
+            ch.publish(line)
+        if self.listener is not None:
+            self.listener('text', message)
+
+    def emit(self, event, payload):
+        data = json.dumps(payload)
+        for ch in self.channels:
+            ch.publish(data, event=event)
+
+    def feed(self, line):
+        """Process one raw output line from the iperf3 process."""
+        self._handle(self.parser.feed(line))
+
+    def feed_lines(self, lines):
+        """Process a batch of raw output lines (one reader chunk)."""
+        t0 = time.perf_counter()
+        parse, handle = self.parser.feed, self._handle
+        for line in lines:
+            events = parse(line)
+            if events:
+                handle(events)
+        PARSE_SECONDS.observe(time.perf_counter() - t0)
+        OUTPUT_LINES.inc(len(lines))
+
+    def _handle(self, events):
+        for kind, payload in events:
+            if kind == 'text':
+                self.log(payload.strip())
+                continue  # log() already told the listener
+            elif kind == 'interval':
+                rec = self._on_interval(payload)
+                self.emit('interval', [r.to_dict() for r in payload])
+                if rec is not None:
+                    self.emit('sample', sample_of(rec))
+                if rec is not None and rec.ts - self._stats_sent >= STATS_EVERY:
+                    self._stats_sent = rec.ts
+                    self.emit('stats', self.stats.summary())
+                if rec is not None and self.sampling:
+                    with self._bp_lock:
+                        points = self.sampler.feed(rec) if self.sampling else ()
+                    for point in points:
+                        self._on_breakpoint(point)
+                if rec is not None and self.detector is not None:
+                    for ev in self.detector.feed(rec, payload):
+                        self._on_anomaly(ev)
+                if rec is not None:
+                    self._on_tcp(payload)
+            elif kind == 'summary':
+                self.summary_records.extend(payload)
+                self.emit('summary', [r.to_dict() for r in payload])
+            elif kind == 'error':
+                self.error = payload
+            if self.listener is not None:
+                self.listener(kind, payload)
+
+    def _on_interval(self, records):
+        rec = self.series.append_interval(records)
+        if rec is not None:
+            self.last = rec
+            self.stats.add(rec)
+            self.rollup.add(rec)
+            if rec.retransmits:
+                self.retransmits += rec.retransmits
+        return rec
+
+    # -- breakpoint sampling --------------------------------------------------
+
+    def start_breakpoints(self, period=5.0, mode='fixed'):
+        """Start sampling every ``period`` test seconds from the newest interval on."""
+        sampler = BreakpointSampler(period, mode, start=self.last.end if self.last else 0.0)
+        with self._bp_lock:
+            self.sampler = sampler
+            self.sampling = True
+        self.emit('breakpoint-state', self.breakpoint_state())
+        return sampler
+
+    def stop_breakpoints(self):
+        with self._bp_lock:
+            was = self.sampling
+            self.sampling = False
+        if was:
+            self.emit('breakpoint-state', self.breakpoint_state())
+        return was
+
+    def breakpoint_snapshot(self):
+        """Manual breakpoint from the newest interval (None before the first one)."""
+        with self._bp_lock:
+            if self.sampler is None:
+                self.sampler = BreakpointSampler()
+            if not self.sampling:
+                self.sampler.last = self.last
+            point = self.sampler.snapshot()
+        if point is not None:
+            self._on_breakpoint(point)
+        return point
+
+    def breakpoint_state(self, points=False):
+        sampler = self.sampler
+        out = {
+            'active': self.sampling,
+            'period': sampler.period if sampler else None,
+            'mode': sampler.mode if sampler else None,
+            'summary': sampler.summary() if sampler else None,
+        }
+        if points:
+            out['points'] = list(sampler.points) if sampler else []
+        return out
+
+    def _on_breakpoint(self, point):
+        self.emit('breakpoint', point)
+        if self.listener is not None:
+            self.listener('breakpoint', point)
+
+    # -- anomaly detection ----------------------------------------------------
+
+    @property
+    def anomalies(self):
+        """Anomalies detected so far (dicts, updated as they end and get captured)."""
+        return list(self.detector.events) if self.detector is not None else []
+
+    def _on_anomaly(self, ev):
+        self.log(format_anomaly(ev))
+        # the interval window itself went to the capture file
+        self.emit('anomaly', {k: v for k, v in ev.items() if k != 'records'})
+        if self.listener is not None:
+            self.listener('anomaly', ev)
+
+    # -- TCP path metrics and fairness -----------------------------------------
+
+    def _on_tcp(self, records):
+        view, storms = self.tcp.feed(records)
+        if view is not None:
+            self._emit_tcp('interval', view)
+        for ev in storms:
+            self.log(format_storm(ev))
+            self._emit_tcp('storm', ev)
+
+    def _emit_tcp(self, kind, data):
+        payload = {'kind': kind, 'data': data}
+        self.emit('tcp', payload)
+        if self.listener is not None:
+            self.listener('tcp', payload)
+
+    # -- lifecycle ------------------------------------------------------------
+
+    def mark_started(self, process):
+        self.process = process
+        self.started = time.time()
+        self.state = STATE_RUNNING
+        self.log(f"Starting command: {' '.join(self.cmd)}")
+        if self._stop_requested:
+            # stop() came between the launcher's check and the spawn, while
+            # there was no process to terminate
+            self.stop()
+
+    def mark_finished(self, code, error=None):
+        self._handle(self.parser.finish())
+        if self.detector is not None:
+            for ev in self.detector.finish():
+                self._on_anomaly(ev)
+        if self.stats.throughput.count:
+            self.emit('stats', self.stats.summary())
+        for ev in self.tcp.finish():
+            self.log(format_storm(ev))
+            self._emit_tcp('storm', ev)
+        if self.tcp.intervals:
+            tcp = self.tcp.summary()
+            for line in format_tcp_summary(tcp):
+                self.log(line)
+            self._emit_tcp('summary', tcp)
+        self.exit_code = code
+        if error:
+            self.error = error
+            self.log(f"Execution Error: {error}")
+        if self._stop_requested:
+            self.state = STATE_STOPPED
+        elif code == 0 and not error:
+            self.state = STATE_FINISHED
+        else:
+            self.state = STATE_FAILED
+        self.finished = time.time()
+        self.process = None
+        self.reader = None
+        self.stop_breakpoints()
+        RUNS_FINISHED.inc(state=self.state)
+        if self.started is not None:
+            RUN_LIFETIME.observe(self.finished - self.started)
+        self.log("Process finished.")
+        if self.listener is not None:
+            self.listener('finish', code if code is not None else -1)
+        if self._on_done is not None:
+            self._on_done(self)
+
+    def stop(self):
+        """Terminate the process (or cancel the run if it has not started)."""
+        self._stop_requested = True
+        proc = self.process
+        if proc is not None:
+            try:
+                proc.terminate()
+            except (ProcessLookupError, OSError):
+                pass
+            # iperf3 normally prints its summary and exits; if it hangs (or a
+            # grandchild keeps the PTY open) kill it and abandon the reader
+            timer = threading.Timer(STOP_GRACE, self._force_stop, args=(proc,))
+            timer.daemon = True
+            timer.start()
+            return True
+        return False
+
+    def _force_stop(self, proc):
+        if self.process is not proc:
+            return  # already finished
+        try:
+            proc.kill()
+        except (ProcessLookupError, OSError):
+            pass
+        reader = self.reader
+        if reader is not None:
+            reader.cancel()
+
+    def summary(self):
+        ser = self.series
+        last = self.last
+        return {
+            'id': self.id,
+            'label': self.spec.get('label', ''),
+            'state': self.state,
+            'command': self.cmd,
+            'target': f"{self.target[0]}:{self.target[1]}" if self.target else None,
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+            'exit_code': self.exit_code,
+            'error': self.error,
+            'samples': ser.agg_count,
+            'avg_mbps': ser.agg_sum_bps / ser.agg_count / 1e6 if ser.agg_count else None,
+            'max_mbps': ser.agg_max_bps / 1e6 if ser.agg_count else None,
+            'last': last.to_dict() if last else None,
+            'stats': self.stats.summary(),
+            'breakpoints': self.breakpoint_state(),
+            'anomalies': len(self.detector.events) if self.detector is not None else 0,
+            'tcp': self.tcp.last,
+        }
+
+
+# ---------------------------------------------------------------------------
+# Process execution
+# ---------------------------------------------------------------------------
+
+def process_env(cmd):
+    """Environment for iperf3: packaged builds need their folder in PATH (cygwin1.dll)."""
+    env = os.environ.copy()
+    if cmd and os.path.isabs(cmd[0]):
+        env["PATH"] = os.path.dirname(cmd[0]) + os.pathsep + env.get("PATH", "")
+    return env
+
+
+def _windows_kwargs():
+    if sys.platform != 'win32':
+        return {}
+    startupinfo = subprocess.STARTUPINFO()
+    startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+    return {'startupinfo': startupinfo, 'creationflags': subprocess.CREATE_NO_WINDOW}
+
+
+def _capture(run, fd):
+    """Feed everything readable from ``fd`` into ``run``, a chunk at a time."""
+    run.reader = ChunkReader(fd)
+    for lines in run.reader:
+        run.feed_lines(lines)
+
+
+def execute_run(run):
+    """Run ``run`` to completion on the calling thread (Windows/POSIX aware)."""
+    code, error = None, None
+    cmd = run.cmd
+    try:
+        if run._stop_requested:
+            run.log("Cancelled before start.")
+            return      # the finally clause records it as stopped
+        if sys.platform == 'win32':
+            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                    stdin=subprocess.DEVNULL, env=process_env(cmd),
+                                    bufsize=0, **_windows_kwargs())
+            run.mark_started(proc)
+            _capture(run, proc.stdout.fileno())
+        else:
+            # PTY keeps iperf3 line-buffered even without --forceflush
+            try:
+                import pty
+            except ImportError:
+                pty = None
+            if pty is not None:
+                master_fd, slave_fd = pty.openpty()
+                try:
+                    proc = subprocess.Popen(cmd, stdout=slave_fd, stderr=slave_fd,
+                                            stdin=subprocess.DEVNULL, env=process_env(cmd),
+                                            close_fds=True)
+                finally:
+                    os.close(slave_fd)  # Close slave in parent
+                run.mark_started(proc)
+                try:
+                    _capture(run, master_fd)
+                finally:
+                    os.close(master_fd)
+            else:
+                proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                        stdin=subprocess.DEVNULL, env=process_env(cmd),
+                                        bufsize=0)
+                run.mark_started(proc)
+                _capture(run, proc.stdout.fileno())
+        code = proc.wait()
+    except Exception as e:
+        error = str(e)
+    finally:
+        run.mark_finished(code, error)
+
+
+async def execute_run_async(run):
+    """asyncio counterpart of ``execute_run``: no thread, no PTY."""
+    import asyncio      # only asyncio hosts pay for the import (headless CLI startup)
+    code, error = None, None
+    cmd = run.cmd
+    try:
+        if run._stop_requested:
+            run.log("Cancelled before start.")
+            return      # the finally clause records it as stopped
+        kwargs = {}
+        if sys.platform == 'win32':
+            kwargs['creationflags'] = subprocess.CREATE_NO_WINDOW
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+            stdin=asyncio.subprocess.DEVNULL,
+            env=process_env(cmd),
+            **kwargs
+        )
+        run.mark_started(proc)
+        splitter = LineSplitter()
+        while True:
+            data = await proc.stdout.read(CHUNK_SIZE)
+            if not data:
+                break
+            run.feed_lines(splitter.feed(data))
+        run.feed_lines(splitter.flush())
+        code = await proc.wait()
+    except Exception as e:
+        error = str(e)
+    finally:
+        run.mark_finished(code, error)
+
+
+def thread_launcher(run):
+    threading.Thread(target=execute_run, args=(run,), daemon=True,
+                     name=f"iperf-run-{run.id}").start()
+
+
+def asyncio_launcher(loop):
+    """Launcher that executes runs as tasks on ``loop`` (callable from any thread)."""
+    import asyncio
+
+    def launch(run):
+        asyncio.run_coroutine_threadsafe(execute_run_async(run), loop)
+    return launch
+
+
+# ---------------------------------------------------------------------------
+# Scheduler
+# ---------------------------------------------------------------------------
+
+class RunManager:
+    """Runs queued tests concurrently, one client per iperf3 server:port."""
+
+    def __init__(self, max_concurrent=4, launcher=thread_launcher, keep=200, anomaly=True):
+        self.max_concurrent = max(1, int(max_concurrent))
+        # AnomalyDetector options for new runs (True = defaults, None = detection off)
+        self.anomaly = {} if anomaly is True else (anomaly if anomaly is not False else None)
+        self.launcher = launcher
+        self.keep = keep                        # finished runs kept for the API
+        self._lock = threading.RLock()
+        self._runs = collections.OrderedDict()  # id -> Run, oldest first
+        self._pending = collections.deque()
+        self._busy_targets = set()
+        self._running = 0
+        self._finish_hooks = []
+        self.pool = None                        # ServerPool handing out local ports
+
+    def attach_pool(self, pool):
+        """Use ``pool`` (a ServerPool, or None to detach) for runs submitted with ``pool``."""
+        with self._lock:
+            if self.pool is None and pool is not None and self._release_pooled not in self._finish_hooks:
+                self.add_finish_hook(self._release_pooled)
+            self.pool = pool
+
+    def _release_pooled(self, run):
+        pool = self.pool
+        if pool is not None:
+            pool.release_run(run)
+
+    def submit(self, cmd, spec=None, channels=(), listener=None, unlimited=False):
+        """Queue one command line and start it as soon as constraints allow.
+
+        ``unlimited`` runs wait only for their server:port, not for a free
+        ``max_concurrent`` slot (a mesh round is conflict-free by construction
+        and must start all at once). They still count towards the limit.
+        """
+        run = Run(cmd, spec=spec, channels=channels, listener=listener, anomaly=self.anomaly)
+        run._on_done = self._on_done
+        run.unlimited = unlimited
+        with self._lock:
+            self._runs[run.id] = run
+            self._pending.append(run)
+            self._trim()
+        self._dispatch()
+        return run
+
+    def submit_spec(self, spec_dict, exe='iperf3', channels=(), listener=None):
+        return self.submit_specs([spec_dict], exe, channels, listener)[0]
+
+    def submit_specs(self, spec_dicts, exe='iperf3', channels=(), listener=None):
+        """Validate every spec first, then submit them all. Raises ValueError
+        (nothing submitted) if any spec is invalid."""
+        specs = [normalize_spec(d) for d in spec_dicts]
+        cmds = [build_command(spec, exe) for spec in specs]
+        pool = self.pool
+        if any(spec['pool'] for spec in specs) and (pool is None or pool.state != 'running'):
+            raise ValueError("no local server pool is running")
+        runs = []
+        for spec, cmd in zip(specs, cmds):
+            if spec['pool']:
+                runs.append(self.submit_pooled(cmd, spec=spec, channels=channels, listener=listener))
+            else:
+                runs.append(self.submit(cmd, spec=spec, channels=channels, listener=listener))
+        return runs
+
+    def submit_pooled(self, cmd, spec=None, channels=(), listener=None):
+        """Like ``submit``, but against a free server of the attached pool. Raises ValueError."""
+        pool = self.pool
+        if pool is None or pool.state != 'running':
+            raise ValueError("no local server pool is running")
+        return pool.assign(lambda host, port: self.submit(retarget_command(cmd, host, port), spec=spec,
+                                                          channels=channels, listener=listener))
+
+    def get(self, run_id):
+        with self._lock:
+            return self._runs.get(run_id)
+
+    def runs(self):
+        with self._lock:
+            return list(self._runs.values())
+
+    def is_pending(self, run):
+        """True while ``run`` is still waiting for a slot or its server:port."""
+        with self._lock:
+            return run in self._pending
+
+    def active_runs(self):
+        return [r for r in self.runs() if r.active]
+
+    def stop(self, run_id):
+        """Stop a running test or cancel a queued one. False if unknown/finished."""
+        with self._lock:
+            run = self._runs.get(run_id)
+            if run is None or not run.active:
+                return False
+            queued = run in self._pending
+            if queued:
+                self._pending.remove(run)
+                run._stop_requested = True
+                run._on_done = self._on_cancelled   # it never took a slot
+        if queued:
+            # same finish path as a run that ran: 'finish' to the listener, finish hooks
+            run.log("Cancelled before start.")
+            run.mark_finished(None)
+            return True
+        run.stop()
+        return True
+
+    def stop_all(self):
+        for run in self.active_runs():
+            self.stop(run.id)
+
+    def add_finish_hook(self, callback):
+        """Register ``callback(run)``, called on the run's thread once it has finished
+        (on the caller's thread of ``stop`` for a run cancelled while queued)."""
+        self._finish_hooks.append(callback)
+
+    def set_max_concurrent(self, n):
+        with self._lock:
+            self.max_concurrent = max(1, int(n))
+        self._dispatch()
+
+    def _dispatch(self):
+        to_launch = []
+        with self._lock:
+            for run in list(self._pending):
+                if self._running >= self.max_concurrent and not run.unlimited:
+                    continue
+                if run.target is not None and run.target in self._busy_targets:
+                    continue  # that server:port is busy; later runs may still fit
+                self._pending.remove(run)
+                if run.target is not None:
+                    self._busy_targets.add(run.target)
+                self._running += 1
+                to_launch.append(run)
+        for run in to_launch:
+            try:
+                self.launcher(run)
+            except Exception as e:
+                run.mark_finished(None, str(e))
+
+    def _on_done(self, run):
+        with self._lock:
+            self._running -= 1
+            self._busy_targets.discard(run.target)
+        self._dispatch()
+        self._run_finish_hooks(run)
+
+    def _on_cancelled(self, run):
+        """``_on_done`` of a run cancelled while queued: no slot or target to give back."""
+        self._run_finish_hooks(run)
+
+    def _run_finish_hooks(self, run):
+        for callback in self._finish_hooks:
+            try:
+                callback(run)
+            except Exception as e:
+                print(f"[RunManager] finish hook failed: {e}")
+
+    def _trim(self):
+        excess = len(self._runs) - self.keep
+        if excess <= 0:
+            return
+        for run_id, run in list(self._runs.items()):
+            if excess <= 0:
+                break
+            if not run.active:
+                del self._runs[run_id]
+                run.series.close()
+                excess -= 1
@@ -0,0 +1,397 @@
+"""Supervised pool of local iperf3 servers on a port range.
+
+``ServerPool`` starts ``size`` servers on free ports from
+``base_port .. base_port + port_range - 1`` and keeps them alive:
+
+* a server that exits is restarted with exponential backoff (1 s, 2 s, ...
+  up to 30 s). After ``MAX_FAILURES`` quick failures in a row it is marked
+  ``failed``.
+* a port that something else has taken in the meantime is swapped for
+  another free one from the range.
+
+Servers are either ``iperf3 -s`` processes (backend ``'iperf3'``) or the
+built-in ``IperfServer`` (backend ``'builtin'``, no binary needed).
+
+Client runs get their port from ``assign()``. It prefers a server with no
+run attached and no test in progress, and otherwise shares the least loaded
+one. Then ``RunManager`` queues runs on the same ``server:port`` behind each
+other as usual. A run's lease ends when it finishes (``release_run``, a
+``RunManager`` finish hook) or when it is found no longer active.
+
+``listener(kind, payload)`` gets ``('text', line)`` for pool events and
+``('status', status())`` whenever a server changes state.
+"""
+import collections
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from .runs import _windows_kwargs, process_env
+
+BACKEND_IPERF3 = 'iperf3'
+BACKEND_BUILTIN = 'builtin'
+BACKENDS = (BACKEND_IPERF3, BACKEND_BUILTIN)
+
+SLOT_STARTING = 'starting'
+SLOT_READY = 'ready'
+SLOT_TESTING = 'testing'        # a client is connected (ours or anyone's)
+SLOT_RESTARTING = 'restarting'
+SLOT_FAILED = 'failed'
+SLOT_STOPPED = 'stopped'
+
+SUPERVISE_INTERVAL = 0.5
+RESTART_BASE_DELAY = 1.0
+RESTART_MAX_DELAY = 30.0
+STABLE_SECONDS = 30.0           # uptime after which a crash no longer counts as "quick"
+MAX_FAILURES = 5
+TAIL_LINES = 20
+
+
+def port_free(host, port):
+    """True if a TCP listener could bind ``host:port`` right now."""
+    family = socket.AF_INET6 if host and ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    try:
+        if sys.platform != 'win32':
+            # ignore TIME_WAIT leftovers; on Windows this flag would allow stealing the port
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((host or '', port))
+        return True
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+
+class _Slot:
+    def __init__(self, port):
+        self.port = port
+        self.state = SLOT_STOPPED
+        self.process = None         # iperf3 -s Popen
+        self.server = None          # IperfServer
+        self.started = None
+        self.restarts = 0
+        self.failures = 0           # quick failures in a row
+        self.retry_at = None
+        self.last_exit = None
+        self.error = None
+        self.in_test = False
+        self.tests = 0
+        self.leases = []            # runs handed this port
+        self.tail = collections.deque(maxlen=TAIL_LINES)
+
+    @property
+    def pid(self):
+        return self.process.pid if self.process is not None else None
+
+    def active_leases(self):
+        self.leases = [r for r in self.leases if r.active]
+        return self.leases
+
+    @property
+    def up(self):
+        return self.state in (SLOT_READY, SLOT_TESTING)
+
+    @property
+    def busy(self):
+        return self.in_test or bool(self.active_leases())
+
+    def status(self):
+        return {
+            'port': self.port,
+            'state': self.state,
+            'busy': self.busy,
+            'in_test': self.in_test,
+            'runs': [r.id for r in self.active_leases()],
+            'pid': self.pid,
+            'started': self.started,
+            'uptime': time.time() - self.started if self.started and self.up else None,
+            'tests': self.tests,
+            'restarts': self.restarts,
+            'last_exit': self.last_exit,
+            'error': self.error,
+            'tail': list(self.tail),
+        }
+
+
+class ServerPool:
+    def __init__(self, size=4, base_port=5201, port_range=None, host=None,
+                 backend=BACKEND_IPERF3, exe='iperf3', listener=None):
+        if backend not in BACKENDS:
+            raise ValueError(f"backend must be one of {BACKENDS}")
+        self.size = int(size)
+        self.base_port = int(base_port)
+        self.port_range = int(port_range or max(self.size * 4, 16))
+        if not 1 <= self.size <= self.port_range:
+            raise ValueError("size must be between 1 and port_range")
+        if not (0 < self.base_port and self.base_port + self.port_range - 1 < 65536):
+            raise ValueError("port range out of bounds")
+        self.host = host or None
+        self.backend = backend
+        self.exe = exe
+        self.listener = listener
+        self.slots = []
+        self.state = SLOT_STOPPED
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def connect_host(self):
+        """Address clients should use to reach the pool."""
+        if self.host in (None, '', '0.0.0.0', '::'):
+            return '127.0.0.1'
+        return self.host
+
+    def _log(self, message):
+        if self.listener is not None:
+            self.listener('text', f"[Pool] {message}")
+
+    def _changed(self):
+        if self.listener is not None:
+            self.listener('status', self.status())
+
+    # -- lifecycle ------------------------------------------------------------------
+
+    def start(self):
+        """Pick free ports, start every server and the supervisor; returns self."""
+        with self._lock:
+            self._stop.clear()
+            self.state = 'running'
+            taken = set()
+            for _ in range(self.size):
+                port = self._free_port(taken)
+                if port is None:
+                    self._log(f"only {len(self.slots)} free port(s) in "
+                              f"{self.base_port}-{self.base_port + self.port_range - 1}")
+                    break
+                taken.add(port)
+                slot = _Slot(port)
+                self.slots.append(slot)
+                self._spawn(slot)
+        self._thread = threading.Thread(target=self._supervise, name='iperf-server-pool', daemon=True)
+        self._thread.start()
+        self._changed()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        with self._lock:
+            self.state = SLOT_STOPPED
+            for slot in self.slots:
+                self._kill(slot)
+                slot.state = SLOT_STOPPED
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(2)
+        self._log("stopped")
+        self._changed()
+
+    def restart(self, port):
+        """Restart one server now (also revives a ``failed`` one). False if unknown."""
+        with self._lock:
+            slot = self._slot(port)
+            if slot is None or self.state != 'running':
+                return False
+            self._kill(slot)
+            slot.failures = 0
+            slot.restarts += 1
+            self._spawn(slot)
+        self._changed()
+        return True
+
+    def _free_port(self, taken):
+        for port in range(self.base_port, self.base_port + self.port_range):
+            if port not in taken and port_free(self.host, port):
+                return port
+        return None
+
+    def _slot(self, port):
+        for slot in self.slots:
+            if slot.port == int(port):
+                return slot
+        return None
+
+    # -- one server -----------------------------------------------------------------
+
+    def _spawn(self, slot):
+        slot.state = SLOT_STARTING
+        slot.in_test = False
+        slot.error = None
+        slot.retry_at = None
+        slot.started = time.time()
+        try:
+            if self.backend == BACKEND_BUILTIN:
+                from .iperf_server import IperfServer
+                slot.server = IperfServer(self.host, slot.port,
+                                          listener=lambda kind, payload: self._on_builtin(slot, kind, payload))
+                slot.server.start()
+                slot.state = SLOT_READY
+                self._log(f"{slot.port} listening (built-in server)")
+            else:
+                cmd = [self.exe, '-s', '-p', str(slot.port), '--forceflush']
+                if self.host:
+                    cmd += ['-B', self.host]
+                slot.process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                                stdin=subprocess.DEVNULL, env=process_env(cmd),
+                                                **_windows_kwargs())
+                threading.Thread(target=self._read_output, args=(slot, slot.process), daemon=True,
+                                 name=f"iperf-server-{slot.port}").start()
+                self._log(f"{slot.port} started (pid {slot.process.pid})")
+        except (OSError, ValueError) as e:
+            slot.process = slot.server = None
+            self._failed(slot, str(e))
+
+    def _kill(self, slot):
+        proc, server = slot.process, slot.server
+        slot.process = slot.server = None
+        if server is not None:
+            server.stop()
+        if proc is not None and proc.poll() is None:
+            proc.terminate()
+            try:
+                proc.wait(2)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+    def _read_output(self, slot, proc):
+        # iperf3 -s announces every state change on stdout
+        for raw in iter(proc.stdout.readline, b''):
+            line = raw.decode('utf-8', 'replace').rstrip()
+            if not line:
+                continue
+            changed = False
+            with self._lock:
+                if slot.process is not proc:
+                    continue
+                slot.tail.append(line)
+                if line.startswith('Server listening on'):
+                    changed = slot.state != SLOT_READY
+                    slot.state = SLOT_READY
+                    slot.in_test = False
+                elif line.startswith('Accepted connection from'):
+                    slot.state = SLOT_TESTING
+                    slot.in_test = changed = True
+                    slot.tests += 1
+                elif 'error' in line:
+                    slot.error = line
+            if changed:
+                self._changed()
+        proc.stdout.close()
+
+    def _on_builtin(self, slot, kind, payload):
+        if kind == 'text':
+            slot.tail.append(payload)
+            if payload.startswith('Accepted connection from'):
+                with self._lock:
+                    slot.state = SLOT_TESTING
+                    slot.in_test = True
+                    slot.tests += 1
+                self._changed()
+        elif kind == 'session':
+            with self._lock:
+                if slot.state == SLOT_TESTING:
+                    slot.state = SLOT_READY
+                slot.in_test = False
+                if payload.get('error'):
+                    slot.error = payload['error']
+            self._changed()
+
+    def _failed(self, slot, reason):
+        """The server is gone: schedule a restart, or give up after repeated quick failures."""
+        uptime = time.time() - (slot.started or time.time())
+        slot.failures = 1 if uptime >= STABLE_SECONDS else slot.failures + 1
+        slot.error = reason
+        slot.in_test = False
+        if slot.failures >= MAX_FAILURES:
+            slot.state = SLOT_FAILED
+            self._log(f"{slot.port} failed {slot.failures} times in a row, giving up ({reason})")
+        else:
+            delay = min(RESTART_MAX_DELAY, RESTART_BASE_DELAY * 2 ** (slot.failures - 1))
+            slot.state = SLOT_RESTARTING
+            slot.retry_at = time.time() + delay
+            self._log(f"{slot.port} down ({reason}), restarting in {delay:g}s")
+
+    def _supervise(self):
+        while not self._stop.wait(SUPERVISE_INTERVAL):
+            changed = False
+            with self._lock:
+                if self._stop.is_set():
+                    break
+                now = time.time()
+                for slot in self.slots:
+                    if slot.process is not None and slot.process.poll() is not None:
+                        slot.last_exit = slot.process.returncode
+                        slot.process = None
+                        self._failed(slot, slot.error or f"exited with {slot.last_exit}")
+                        changed = True
+                    elif slot.server is not None and slot.server.state == 'stopped':
+                        error, slot.server = slot.server.error, None
+                        self._failed(slot, error or "server stopped")
+                        changed = True
+                    if slot.state == SLOT_RESTARTING and now >= slot.retry_at:
+                        if not port_free(self.host, slot.port):
+                            # someone else took the port meanwhile: move to another one
+                            port = self._free_port({s.port for s in self.slots})
+                            if port is not None:
+                                self._log(f"{slot.port} is taken, moving to {port}")
+                                slot.port = port
+                        slot.restarts += 1
+                        self._spawn(slot)
+                        changed = True
+            if changed:
+                self._changed()
+
+    # -- ports for client runs --------------------------------------------------------
+
+    def assign(self, submit):
+        """Call ``submit(host, port)`` with the best pool port and lease it to the returned run.
+
+        Raises ValueError when no server is up.
+        """
+        with self._lock:
+            up = [s for s in self.slots if s.up]
+            if not up:
+                raise ValueError("no local iperf3 server is running")
+            slot = min(up, key=lambda s: (len(s.active_leases()), s.in_test))
+            run = submit(self.connect_host, slot.port)
+            slot.leases.append(run)
+        self._changed()
+        return run
+
+    def release_run(self, run):
+        """Finish hook: drop ``run``'s lease."""
+        with self._lock:
+            found = False
+            for slot in self.slots:
+                if run in slot.leases:
+                    slot.leases.remove(run)
+                    found = True
+        if found:
+            self._changed()
+
+    def status(self):
+        with self._lock:
+            servers = [s.status() for s in self.slots]
+        return {
+            'state': self.state,
+            'backend': self.backend,
+            'host': self.host,
+            'connect_host': self.connect_host,
+            'base_port': self.base_port,
+            'port_range': self.port_range,
+            'size': self.size,
+            'up': sum(1 for s in servers if s['state'] in (SLOT_READY, SLOT_TESTING)),
+            'free': sum(1 for s in servers if s['state'] == SLOT_READY and not s['busy']),
+            'busy': sum(1 for s in servers if s['busy']),
+            'servers': servers,
+        }
+
+
+def format_pool(status):
+    """One-line summary for logs and status bars."""
+    if status['state'] != 'running':
+        return "pool stopped"
+    return (f"{status['up']}/{status['size']} up, {status['free']} free, {status['busy']} busy "
+            f"({status['backend']}, {status['connect_host']})")
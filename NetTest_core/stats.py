@@ -0,0 +1,140 @@
+"""Constant-memory streaming distribution statistics.
+
+``StreamingStats`` is an HDR-style log-bucketed histogram: a value ``v``
+lands in bucket ``floor(log(v) / log(1 + 2 * rel_error))``, so any quantile
+it reports is within ``rel_error`` (1% by default) of the true sample value.
+Buckets are kept sparsely; however long a run lasts, the whole dynamic
+range of bits/s (1 bps .. 1 Tbps) fits in about 1400 buckets. Mean,
+variance (Welford), min and max are tracked exactly alongside.
+
+``RunStats`` bundles one ``StreamingStats`` each for throughput, jitter and
+loss of a run's aggregate interval records.
+"""
+import math
+
+DEFAULT_PERCENTILES = (1, 5, 50, 95, 99)
+
+
+class StreamingStats:
+    __slots__ = ('rel_error', '_log_base', '_buckets', '_zeros',
+                 'count', 'mean', '_m2', 'min', 'max')
+
+    def __init__(self, rel_error=0.01):
+        self.rel_error = rel_error
+        self._log_base = math.log1p(2 * rel_error)
+        self._buckets = {}      # bucket index -> count (positive values)
+        self._zeros = 0         # values <= 0 (a stalled interval is 0 bps)
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        if value is None or value != value:
+            return
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        if value <= 0:
+            self._zeros += 1
+        else:
+            i = math.floor(math.log(value) / self._log_base)
+            self._buckets[i] = self._buckets.get(i, 0) + 1
+
+    def merge(self, other):
+        """Fold another StreamingStats (same rel_error) into this one."""
+        if not other.count:
+            return
+        n = self.count + other.count
+        delta = other.mean - self.mean
+        self._m2 += other._m2 + delta * delta * self.count * other.count / n
+        self.mean += delta * other.count / n
+        self.count = n
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        self._zeros += other._zeros
+        for i, c in other._buckets.items():
+            self._buckets[i] = self._buckets.get(i, 0) + c
+
+    @property
+    def stdev(self):
+        return math.sqrt(self._m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    @property
+    def cv(self):
+        """Coefficient of variation (stdev / mean), None while the mean is 0."""
+        return self.stdev / self.mean if self.mean else None
+
+    def _bucket_value(self, i):
+        # geometric midpoint of [base^i, base^(i+1)), clamped to what was seen
+        value = math.exp((i + 0.5) * self._log_base)
+        return min(max(value, self.min), self.max)
+
+    def percentiles(self, qs=DEFAULT_PERCENTILES):
+        """``{q: value}`` for each percentile ``q`` in 0..100 (None when empty)."""
+        if not self.count:
+            return {q: None for q in qs}
+        order = sorted(self._buckets.copy().items())   # copy: the reader may be adding
+        out = {}
+        for q in qs:
+            rank = max(1, math.ceil(q / 100.0 * self.count))
+            if rank <= self._zeros:
+                out[q] = self.min if self.min <= 0 else 0.0
+                continue
+            seen = self._zeros
+            value = self.max
+            for i, c in order:
+                seen += c
+                if seen >= rank:
+                    value = self._bucket_value(i)
+                    break
+            out[q] = value
+        return out
+
+    def percentile(self, q):
+        return self.percentiles((q,))[q]
+
+    def summary(self, qs=DEFAULT_PERCENTILES, scale=1.0):
+        """JSON-friendly dict; ``scale`` divides every value (e.g. 1e6 for Mbps)."""
+        def s(v):
+            return None if v is None else v / scale
+        out = {'count': self.count, 'mean': s(self.mean) if self.count else None,
+               'min': s(self.min), 'max': s(self.max),
+               'stdev': s(self.stdev) if self.count else None, 'cv': self.cv}
+        for q, v in self.percentiles(qs).items():
+            out[f'p{q:g}'] = s(v)
+        return out
+
+    def memory_buckets(self):
+        return len(self._buckets)
+
+
+class RunStats:
+    """Throughput / jitter / loss distributions of one run's aggregate intervals."""
+
+    def __init__(self, rel_error=0.01):
+        self.throughput = StreamingStats(rel_error)     # bits/s
+        self.jitter = StreamingStats(rel_error)         # ms
+        self.loss = StreamingStats(rel_error)           # %
+
+    def add(self, rec):
+        """Add one aggregate ``IntervalRecord``."""
+        self.throughput.add(rec.bits_per_second)
+        if rec.jitter_ms is not None:
+            self.jitter.add(rec.jitter_ms)
+        if rec.lost_percent is not None:
+            self.loss.add(rec.lost_percent)
+
+    def summary(self):
+        return {
+            'throughput_mbps': self.throughput.summary(scale=1e6),
+            'jitter_ms': self.jitter.summary(),
+            'loss_percent': self.loss.summary(),
+        }
+
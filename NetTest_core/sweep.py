@@ -0,0 +1,361 @@
+"""Parameter sweeps over iperf3 tuning options.
+
+A *grid* maps spec keys to the values to try::
+
+    {'parallel': [1, 4, 8], 'window': ['512K', '4M'], 'length': ['128K'],
+     'zerocopy': [False, True], 'omit': [2]}
+
+``Sweep`` runs every combination (a *cell*) against every target in turn,
+through a ``RunManager``. Warm-up intervals are left out via ``-O``: cells
+use ``DEFAULT_OMIT`` seconds unless the spec or the grid sets ``omit``, so
+TCP slow start never feeds the pruning estimate. While a
+cell runs, its throughput so far is compared with the best finished cell of
+the same target. A cell is stopped (*pruned*) once even an optimistic
+estimate of its mean is below ``prune_ratio`` of that best:
+
+    mean + 2 * stdev / sqrt(n) < prune_ratio * best
+
+The result ranks the cells per target and holds heatmap data: the best
+throughput for each pair of values on two chosen axes.
+"""
+import itertools
+import math
+import threading
+import time
+import uuid
+
+from .iperf_stream import aggregate_of
+from .stats import StreamingStats
+
+AXES = ('parallel', 'window', 'length', 'zerocopy', 'omit')
+DEFAULT_HEATMAP = ('parallel', 'window')
+
+PRUNE_MIN_INTERVALS = 3     # intervals a cell gets before it can be pruned
+DEFAULT_OMIT = 2            # -O seconds of a cell when neither spec nor grid sets omit
+
+STATE_RUNNING = 'running'
+STATE_DONE = 'done'
+STATE_CANCELLED = 'cancelled'
+STATE_FAILED = 'failed'
+
+CELL_DONE = 'done'
+CELL_PRUNED = 'pruned'
+CELL_FAILED = 'failed'
+
+
+def normalize_grid(grid):
+    """Validate a grid; values may be lists or comma-separated strings."""
+    if not isinstance(grid, dict) or not grid:
+        raise ValueError("grid must be a non-empty object")
+    out = {}
+    for key, values in grid.items():
+        if key not in AXES:
+            raise ValueError(f"grid keys must be among {AXES}")
+        if isinstance(values, str):
+            values = [v.strip() for v in values.split(',') if v.strip()]
+        elif not isinstance(values, (list, tuple)):
+            values = [values]
+        if not values:
+            raise ValueError(f"grid '{key}' has no values")
+        if key in ('parallel', 'omit'):
+            values = [int(v) for v in values]
+        elif key == 'zerocopy':
+            values = [v if isinstance(v, bool) else str(v).lower() in ('1', 'true', 'yes', 'on')
+                      for v in values]
+        else:
+            values = [str(v) for v in values]
+        out[key] = list(dict.fromkeys(values))      # drop duplicates, keep order
+    return out
+
+
+def expand_grid(grid):
+    """Every combination of a normalized grid, as a list of param dicts."""
+    keys = list(grid)
+    return [dict(zip(keys, combo)) for combo in itertools.product(*(grid[k] for k in keys))]
+
+
+def describe_params(params):
+    """``'-P 4 -w 4M -Z'`` for a cell's params."""
+    flags = {'parallel': '-P', 'window': '-w', 'length': '-l', 'omit': '-O'}
+    parts = []
+    for key in AXES:
+        if key not in params:
+            continue
+        if key == 'zerocopy':
+            if params[key]:
+                parts.append('-Z')
+        else:
+            parts.append(f"{flags[key]} {params[key]}")
+    return ' '.join(parts) or '(defaults)'
+
+
+class Sweep:
+    """Run a parameter grid against one or more targets.
+
+    ``specs`` are run specs (see ``runs.normalize_spec``), one per target
+    (host pair); grid values override their fields. ``listener(kind,
+    payload)``, if given, is called with ``('cell', cell_dict)`` after every
+    cell and ``('done', result_dict)`` at the end.
+    """
+
+    def __init__(self, manager, specs, grid, duration=10, prune_ratio=0.6,
+                 heatmap=DEFAULT_HEATMAP, exe='iperf3', listener=None):
+        if not specs:
+            raise ValueError("sweep needs at least one target")
+        self.id = uuid.uuid4().hex[:8]
+        self.manager = manager
+        self.specs = [dict(s) for s in specs]
+        self.grid = normalize_grid(grid)
+        self.params = expand_grid(self.grid)
+        self.duration = int(duration)
+        self.prune_ratio = float(prune_ratio) if prune_ratio else 0.0
+        if not 0 <= self.prune_ratio < 1:
+            raise ValueError("prune_ratio must be in [0, 1)")
+        heatmap = tuple(heatmap or ())
+        if len(heatmap) != 2 or not set(heatmap) <= set(AXES):
+            raise ValueError(f"heatmap needs two axes among {AXES}")
+        self.heatmap_axes = heatmap
+        self.exe = exe
+        self.listener = listener
+        self.state = STATE_RUNNING
+        self.error = None
+        self.cells = []
+        self.best = {}              # target -> best finished mean bps
+        self.created = time.time()
+        self.finished = None
+        self._watch = None
+        self._cancelled = False
+
+    @property
+    def total_cells(self):
+        return len(self.params) * len(self.specs)
+
+    # -- driving ----------------------------------------------------------------
+
+    def start(self):
+        """Run the sweep in a daemon thread; returns self."""
+        threading.Thread(target=self.run, daemon=True).start()
+        return self
+
+    def cancel(self):
+        self._cancelled = True
+        watch = self._watch
+        if watch is not None and watch.run is not None:
+            self.manager.stop(watch.run.id)
+
+    def run(self):
+        """Run every cell (blocking) and return ``result()``."""
+        try:
+            for spec in self.specs:
+                for params in self.params:
+                    if self._cancelled:
+                        break
+                    self.run_cell(spec, params)
+            self.state = STATE_CANCELLED if self._cancelled else STATE_DONE
+        except Exception as e:
+            self.error = str(e)
+            self.state = STATE_FAILED
+        self.finished = time.time()
+        result = self.result()
+        self._notify('done', result)
+        return result
+
+    def run_cell(self, spec, params):
+        index = len(self.cells) + 1
+        cell_spec = dict(spec, duration=self.duration,
+                         label=f"sweep {self.id} #{index}", **params)
+        if 'omit' not in params and not int(spec.get('omit') or 0):
+            cell_spec['omit'] = DEFAULT_OMIT
+        watch = self._watch = _CellWatch(self, target_name(spec))
+        watch.run = self.manager.submit_spec(cell_spec, self.exe, listener=watch.on_event)
+        watch.done.wait()
+        self._watch = None
+        if self._cancelled:
+            return None
+        cell = watch.result()
+        cell.update(index=index, params=params, command=describe_params(params))
+        self.cells.append(cell)
+        if cell['state'] == CELL_DONE and cell['mean_mbps'] is not None:
+            bps = cell['mean_mbps'] * 1e6
+            if bps > self.best.get(cell['target'], 0.0):
+                self.best[cell['target']] = bps
+        self._notify('cell', cell)
+        return cell
+
+    def _notify(self, kind, payload):
+        if self.listener is not None:
+            self.listener(kind, payload)
+
+    # -- results ----------------------------------------------------------------
+
+    def ranking(self):
+        """``{target: [cell, ...]}`` best first; pruned and failed cells last."""
+        out = {}
+        for cell in self.cells:
+            out.setdefault(cell['target'], []).append(cell)
+        order = {CELL_DONE: 0, CELL_PRUNED: 1, CELL_FAILED: 2}
+        for cells in out.values():
+            cells.sort(key=lambda c: (order[c['state']], -(score(c) or 0.0)))
+        return out
+
+    def heatmaps(self):
+        """Best score (Mbps) per value pair of the two heatmap axes, per target.
+
+        A pruned cell's partial mean counts, so the map has no holes where the
+        sweep gave up early.
+        """
+        x_key, y_key = self.heatmap_axes
+        xs = self.grid.get(x_key, [None])
+        ys = self.grid.get(y_key, [None])
+        out = {}
+        for target, cells in self.ranking().items():
+            values = [[None] * len(xs) for _ in ys]
+            for cell in cells:
+                if cell['state'] == CELL_FAILED:
+                    continue        # pruned cells still show roughly where they were
+                xi = xs.index(cell['params'].get(x_key)) if x_key in self.grid else 0
+                yi = ys.index(cell['params'].get(y_key)) if y_key in self.grid else 0
+                s = score(cell)
+                if s is not None and (values[yi][xi] is None or s > values[yi][xi]):
+                    values[yi][xi] = s
+            out[target] = {'x': x_key, 'y': y_key, 'xs': xs, 'ys': ys, 'values': values}
+        return out
+
+    def result(self):
+        ranking = self.ranking()
+        return {
+            'id': self.id,
+            'state': self.state,
+            'error': self.error,
+            'grid': self.grid,
+            'duration': self.duration,
+            'prune_ratio': self.prune_ratio,
+            'total_cells': self.total_cells,
+            'cells': list(self.cells),
+            'ranking': {t: [c['index'] for c in cells] for t, cells in ranking.items()},
+            'best': {t: cells[0] for t, cells in ranking.items()
+                     if cells and cells[0]['state'] == CELL_DONE},
+            'heatmaps': self.heatmaps(),
+            'created': self.created,
+            'finished': self.finished,
+        }
+
+
+def target_name(spec):
+    return f"{spec.get('server')}:{spec.get('port') or 5201}"
+
+
+def score(cell):
+    """Throughput a cell is ranked by: receiver total if known, else the interval mean."""
+    return cell['receiver_mbps'] if cell['receiver_mbps'] is not None else cell['mean_mbps']
+
+
+class _CellWatch:
+    """Follows one cell's run; prunes it once it is clearly worse than the best."""
+
+    def __init__(self, sweep, target):
+        self.sweep = sweep
+        self.target = target
+        self.run = None
+        self.done = threading.Event()
+        self.throughput = StreamingStats()
+        self.retransmits = 0
+        self.pruned = None
+        self.exit_code = None
+
+    def on_event(self, kind, payload):
+        if kind == 'interval':
+            rec = aggregate_of(payload)
+            if rec is not None and not rec.omitted:
+                self.throughput.add(rec.bits_per_second)
+                self.retransmits += rec.retransmits or 0
+                if self.pruned is None:
+                    self.pruned = self._clearly_worse()
+                    if self.pruned is not None and self.run is not None:
+                        self.sweep.manager.stop(self.run.id)
+        elif kind == 'finish':
+            self.exit_code = payload
+            self.done.set()
+
+    def _clearly_worse(self):
+        best = self.sweep.best.get(self.target)
+        t = self.throughput
+        if not best or not self.sweep.prune_ratio or t.count < PRUNE_MIN_INTERVALS:
+            return None
+        optimistic = t.mean + 2 * t.stdev / math.sqrt(t.count)
+        if optimistic < self.sweep.prune_ratio * best:
+            return f"{t.mean / 1e6:.1f} Mbps vs best {best / 1e6:.1f}"
+        return None
+
+    def _receiver_total(self):
+        for rec in self.run.summary_records:
+            if rec.stream is None and rec.sender is False:
+                return rec
+        return None
+
+    def result(self):
+        t = self.throughput
+        pct = t.percentiles((5, 95))
+        receiver = self._receiver_total() if self.pruned is None else None
+        if self.pruned is not None:
+            state, reason = CELL_PRUNED, f"pruned: {self.pruned}"
+        elif self.exit_code != 0 or self.run.error or not t.count:
+            state = CELL_FAILED
+            reason = self.run.error or (f"iperf3 exited with {self.exit_code}"
+                                        if self.exit_code != 0 else "no intervals")
+        else:
+            state, reason = CELL_DONE, ''
+        return {
+            'target': self.target,
+            'state': state,
+            'reason': reason,
+            'intervals': t.count,
+            'mean_mbps': t.mean / 1e6 if t.count else None,
+            'stdev_mbps': t.stdev / 1e6 if t.count else None,
+            'p5_mbps': pct[5] / 1e6 if t.count else None,
+            'p95_mbps': pct[95] / 1e6 if t.count else None,
+            'receiver_mbps': receiver.mbps if receiver is not None else None,
+            'retransmits': self.retransmits,
+            'run': self.run.id,
+        }
+
+
+# ---------------------------------------------------------------------------
+# Text rendering (log output of both front-ends)
+# ---------------------------------------------------------------------------
+
+def _num(v, fmt='.1f'):
+    return '--' if v is None else format(v, fmt)
+
+
+def format_cell(cell, total=None):
+    of = f"/{total}" if total else ''
+    return (f"[Sweep {cell['index']:>3}{of}] {cell['target']}  {cell['command']:<28} "
+            f"{_num(score(cell)):>9} Mbps  p5 {_num(cell['p5_mbps'])}  "
+            f"retr {cell['retransmits']}  {cell['state'].upper()}"
+            + (f"  ({cell['reason']})" if cell['reason'] else ""))
+
+
+def format_table(result, top=10):
+    """Ranked table per target, best first."""
+    cells = {c['index']: c for c in result['cells']}
+    lines = []
+    for target, order in result['ranking'].items():
+        lines.append(f"Sweep ranking for {target}")
+        lines.append(f"{'#':>3}  {'params':<28} {'Mbps':>9} {'p5':>9} {'p95':>9} {'retr':>6}  state")
+        for rank, index in enumerate(order[:top], 1):
+            c = cells[index]
+            lines.append(f"{rank:>3}  {c['command']:<28} {_num(score(c)):>9} {_num(c['p5_mbps']):>9} "
+                         f"{_num(c['p95_mbps']):>9} {c['retransmits']:>6}  {c['state']}")
+    return lines
+
+
+def format_heatmap(heatmap):
+    """A heatmap as a text grid: rows are the y axis, columns the x axis."""
+    xs, ys = heatmap['xs'], heatmap['ys']
+    width = max([9] + [len(str(x)) + 1 for x in xs])
+    corner = f"{heatmap['y']} \\ {heatmap['x']}"
+    lines = [f"{corner:>14}" + "".join(f"{str(x):>{width}}" for x in xs)]
+    for y, row in zip(ys, heatmap['values']):
+        lines.append(f"{str(y):>14}" + "".join(f"{_num(v):>{width}}" for v in row))
+    return lines
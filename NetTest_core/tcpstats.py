@@ -0,0 +1,288 @@
+"""Per-stream TCP path metrics, stream fairness and retransmit storms.
+
+``TcpStats`` is fed every interval (all streams plus the [SUM] record) and
+keeps, per iperf3 stream, the bytes moved, retransmits, and the snd_cwnd,
+RTT and RTT variance that iperf3 reports on the sender side. Every update
+is O(streams).
+
+Fairness is Jain's index of the streams' throughput::
+
+    J = (sum x)^2 / (n * sum x^2)
+
+J is 1.0 when every stream gets the same share and 1/n when one stream
+gets everything. ``min_share`` and ``max_share`` are the smallest and
+largest stream's fraction of the total. Both are computed per interval
+(live view) and over the whole run from each stream's total bytes
+(summary).
+
+A *retransmit storm* is an interval whose retransmits per second reach
+``storm_min`` and ``storm_factor`` times the baseline. The baseline is an
+EWMA of the rate in earlier intervals outside storms. Storm intervals in a
+row form one storm, which ends after ``clear`` calm intervals.
+
+``feed()`` returns ``(view, events)``: the live view of the interval (or
+None when the records carry neither TCP metrics nor several streams) and
+storm events with ``phase`` ``'start'`` or ``'end'``.
+"""
+from .iperf_stream import aggregate_of
+
+PHASE_START = 'start'
+PHASE_END = 'end'
+
+
+def jain_index(values):
+    """Jain's fairness index of non-negative values (None when all are 0)."""
+    total = sum(values)
+    squares = sum(v * v for v in values)
+    if not values or squares <= 0:
+        return None
+    return total * total / (len(values) * squares)
+
+
+def shares(values):
+    """(min share, max share) of the total, or (None, None)."""
+    total = sum(values)
+    if not values or total <= 0:
+        return None, None
+    return min(values) / total, max(values) / total
+
+
+def _ms(us):
+    return None if us is None else us / 1000.0
+
+
+class _Stream:
+    __slots__ = ('stream', 'bytes', 'seconds', 'intervals', 'retransmits',
+                 'rtt_n', 'rtt_sum', 'rtt_min', 'rtt_max', 'rttvar_sum',
+                 'cwnd_n', 'cwnd_sum', 'cwnd_max', 'last')
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.bytes = 0
+        self.seconds = 0.0
+        self.intervals = 0
+        self.retransmits = None
+        self.rtt_n = 0
+        self.rtt_sum = 0
+        self.rtt_min = None
+        self.rtt_max = None
+        self.rttvar_sum = 0
+        self.cwnd_n = 0
+        self.cwnd_sum = 0
+        self.cwnd_max = None
+        self.last = None
+
+    def add(self, rec):
+        self.bytes += rec.bytes
+        self.seconds += rec.seconds
+        self.intervals += 1
+        self.last = rec
+        if rec.retransmits is not None:
+            self.retransmits = (self.retransmits or 0) + rec.retransmits
+        if rec.rtt is not None:
+            self.rtt_n += 1
+            self.rtt_sum += rec.rtt
+            self.rttvar_sum += rec.rttvar or 0
+            self.rtt_min = rec.rtt if self.rtt_min is None else min(self.rtt_min, rec.rtt)
+            self.rtt_max = rec.rtt if self.rtt_max is None else max(self.rtt_max, rec.rtt)
+        if rec.snd_cwnd is not None:
+            self.cwnd_n += 1
+            self.cwnd_sum += rec.snd_cwnd
+            self.cwnd_max = rec.snd_cwnd if self.cwnd_max is None else max(self.cwnd_max, rec.snd_cwnd)
+
+    def summary(self, total_bytes):
+        return {
+            'stream': self.stream,
+            'mbps': self.bytes * 8 / self.seconds / 1e6 if self.seconds else None,
+            'share': self.bytes / total_bytes if total_bytes else None,
+            'retransmits': self.retransmits,
+            'rtt_ms': self.rtt_sum / self.rtt_n / 1000.0 if self.rtt_n else None,
+            'rtt_min_ms': _ms(self.rtt_min),
+            'rtt_max_ms': _ms(self.rtt_max),
+            'rttvar_ms': self.rttvar_sum / self.rtt_n / 1000.0 if self.rtt_n else None,
+            'cwnd': round(self.cwnd_sum / self.cwnd_n) if self.cwnd_n else None,
+            'cwnd_max': self.cwnd_max,
+        }
+
+
+def _stream_view(rec, total_bps):
+    return {
+        'stream': rec.stream,
+        'mbps': rec.mbps,
+        'share': rec.bits_per_second / total_bps if total_bps > 0 else None,
+        'retransmits': rec.retransmits,
+        'cwnd': rec.snd_cwnd,
+        'rtt_ms': _ms(rec.rtt),
+        'rttvar_ms': _ms(rec.rttvar),
+    }
+
+
+class TcpStats:
+    """Per-stream totals, fairness and retransmit storms of one run."""
+
+    def __init__(self, storm_min=50.0, storm_factor=5.0, alpha=0.1, clear=2):
+        self.storm_min = float(storm_min)       # retransmits per second
+        self.storm_factor = float(storm_factor)
+        self.alpha = float(alpha)
+        self.clear = max(1, int(clear))
+        self.streams = {}           # socket id -> _Stream
+        self.intervals = 0
+        self.retransmits = None     # aggregate total
+        self.jain_n = 0
+        self.jain_sum = 0.0
+        self.jain_min = None
+        self.baseline = None        # EWMA retransmits/s outside storms
+        self.storm = None           # the open storm
+        self.calm = 0
+        self.storms = []
+        self.last = None            # newest live view
+
+    def feed(self, records):
+        """One interval's records. Returns ``(view or None, storm events)``."""
+        agg = aggregate_of(records)
+        if agg is None or agg.omitted:
+            return None, ()
+        streams = [r for r in records if r.stream is not None] or [agg]
+        tcp = any(r.retransmits is not None or r.rtt is not None for r in streams)
+        if not tcp and len(streams) < 2:
+            return None, ()
+        self.intervals += 1
+        for rec in streams:
+            st = self.streams.get(rec.stream)
+            if st is None:
+                st = self.streams[rec.stream] = _Stream(rec.stream)
+            st.add(rec)
+
+        bps = [r.bits_per_second for r in streams]
+        jain = jain_index(bps) if len(streams) > 1 else None
+        lo, hi = shares(bps) if len(streams) > 1 else (None, None)
+        if jain is not None:
+            self.jain_n += 1
+            self.jain_sum += jain
+            self.jain_min = jain if self.jain_min is None else min(self.jain_min, jain)
+
+        retr = agg.retransmits
+        if retr is None and any(r.retransmits is not None for r in streams):
+            retr = sum(r.retransmits or 0 for r in streams)
+        events = []
+        if retr is not None:
+            self.retransmits = (self.retransmits or 0) + retr
+            ev = self._storm(retr / agg.seconds if agg.seconds > 0 else 0.0, retr, agg)
+            if ev is not None:
+                events.append(ev)
+
+        rtt = [r.rtt for r in streams if r.rtt is not None]
+        var = [r.rttvar for r in streams if r.rttvar is not None]
+        cwnd = [r.snd_cwnd for r in streams if r.snd_cwnd is not None]
+        total = sum(bps)
+        self.last = {
+            'start': agg.start,
+            'end': agg.end,
+            'mbps': agg.mbps,
+            'retransmits': retr,
+            'total_retransmits': self.retransmits,
+            'cwnd': sum(cwnd) if cwnd else None,
+            'rtt_ms': sum(rtt) / len(rtt) / 1000.0 if rtt else None,
+            'rttvar_ms': sum(var) / len(var) / 1000.0 if var else None,
+            'jain': jain,
+            'min_share': lo,
+            'max_share': hi,
+            'storm': self.storm is not None,
+            'storms': len(self.storms),
+            'streams': [_stream_view(r, total) for r in streams] if len(streams) > 1 else [],
+        }
+        return self.last, events
+
+    def _storm(self, rate, retr, agg):
+        base = self.baseline
+        hot = rate >= self.storm_min and (base is None or rate >= self.storm_factor * max(base, 1.0))
+        if self.storm is None:
+            if hot and base is not None:
+                self.calm = 0
+                self.storm = {'phase': PHASE_START, 'start': agg.start, 'end': agg.end,
+                              'retransmits': retr, 'peak_rate': rate, 'baseline': base,
+                              'intervals': 1}
+                self.storms.append(self.storm)
+                return dict(self.storm)
+            self.baseline = rate if base is None else base + self.alpha * (rate - base)
+            return None
+        storm = self.storm
+        storm['retransmits'] += retr
+        storm['intervals'] += 1
+        storm['peak_rate'] = max(storm['peak_rate'], rate)
+        storm['end'] = agg.end
+        self.calm = 0 if hot else self.calm + 1
+        if self.calm >= self.clear:
+            storm['phase'] = PHASE_END
+            self.storm = None
+            return dict(storm)
+        return None
+
+    def finish(self):
+        """End a storm still open when the run ends."""
+        if self.storm is None:
+            return ()
+        self.storm['phase'] = PHASE_END
+        ev = dict(self.storm)
+        self.storm = None
+        return (ev,)
+
+    def summary(self):
+        total = sum(st.bytes for st in self.streams.values())
+        per = [st.summary(total) for _, st in sorted(self.streams.items(),
+                                                     key=lambda kv: (kv[0] is None, kv[0] or 0))]
+        totals = [st.bytes for st in self.streams.values()]
+        multi = len(totals) > 1
+        lo, hi = shares(totals) if multi else (None, None)
+        return {
+            'intervals': self.intervals,
+            'streams': per,
+            'jain': jain_index(totals) if multi else None,
+            'min_share': lo,
+            'max_share': hi,
+            'jain_interval_mean': self.jain_sum / self.jain_n if self.jain_n else None,
+            'jain_interval_min': self.jain_min,
+            'retransmits': self.retransmits,
+            'storms': [dict(s) for s in self.storms],
+        }
+
+
+def format_storm(ev):
+    if ev['phase'] == PHASE_START:
+        return (f"[TCP] retransmit storm at {ev['start']:.1f}s: {ev['peak_rate']:.0f} retr/s "
+                f"(baseline {ev['baseline']:.1f}/s)")
+    return (f"[TCP] retransmit storm over at {ev['end']:.1f}s ({ev['start']:.1f}-{ev['end']:.1f}s, "
+            f"{ev['retransmits']} retransmits, peak {ev['peak_rate']:.0f}/s)")
+
+
+def _bytes(v):
+    if v is None:
+        return "-"
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if v < 1024 or unit == 'GB':
+            return f"{v:.0f} {unit}" if unit == 'B' else f"{v:.1f} {unit}"
+        v /= 1024.0
+
+
+def _num(v, fmt):
+    return "-" if v is None else format(v, fmt)
+
+
+def format_summary(s):
+    """Log lines: one per stream, then fairness and storms."""
+    lines = []
+    for st in s['streams']:
+        name = "SUM" if st['stream'] is None else str(st['stream'])
+        share = f" ({st['share'] * 100:.1f}%)" if st['share'] is not None and len(s['streams']) > 1 else ""
+        lines.append(f"[TCP] stream {name}: {_num(st['mbps'], '.2f')} Mbps{share}, "
+                     f"retr {_num(st['retransmits'], 'd')}, "
+                     f"RTT {_num(st['rtt_ms'], '.2f')} ms (var {_num(st['rttvar_ms'], '.2f')}, "
+                     f"max {_num(st['rtt_max_ms'], '.2f')}), "
+                     f"cwnd {_bytes(st['cwnd'])} (max {_bytes(st['cwnd_max'])})")
+    if s['jain'] is not None:
+        lines.append(f"[TCP] fairness: Jain {s['jain']:.3f} (per interval mean "
+                     f"{_num(s['jain_interval_mean'], '.3f')}, min {_num(s['jain_interval_min'], '.3f')}), "
+                     f"stream share {s['min_share'] * 100:.1f}%-{s['max_share'] * 100:.1f}%")
+    if s['retransmits'] is not None:
+        lines.append(f"[TCP] retransmits: {s['retransmits']}, storms: {len(s['storms'])}")
+    return lines
@@ -0,0 +1,265 @@
+"""Compact, columnar storage for parsed interval samples.
+
+Rows are kept in typed ``array.array`` columns grouped into fixed-size
+chunks, so a sample costs a few dozen bytes instead of a tuple of Python
+objects. Appends are O(1). Once more than ``max_hot_chunks`` chunks are in
+memory, the oldest full chunk is written to a spill file and only a small
+index entry (row count, first/last timestamps, file offset) stays
+resident. Range queries bisect that index and then the chunk itself.
+
+Row layout (missing values are NaN for floats, -1 for integers):
+
+    ts      wall-clock time the sample was decoded (s since epoch)
+    start   interval start reported by iperf3 (s since test start)
+    end     interval end reported by iperf3
+    bps     bits per second
+    jitter  UDP jitter (ms)
+    loss    UDP loss (%)
+    retr    TCP retransmits in the interval
+    cwnd    TCP send congestion window at the end of the interval (bytes)
+    rtt     TCP smoothed RTT (microseconds)
+    rttvar  TCP RTT variance (microseconds)
+    stream  iperf3 socket id; AGGREGATE (-1) for the whole-test row
+
+iperf3 reports cwnd/RTT per stream only (sender side). With several
+streams the aggregate row gets the sum of their windows and the mean of
+their RTTs.
+"""
+import array
+import bisect
+import math
+import os
+import threading
+
+from .iperf_stream import aggregate_of
+
+AGGREGATE = -1
+NAN = float('nan')
+
+COLUMNS = (('ts', 'd'), ('start', 'd'), ('end', 'd'), ('bps', 'd'),
+           ('jitter', 'd'), ('loss', 'd'), ('retr', 'q'), ('cwnd', 'q'), ('rtt', 'q'),
+           ('rttvar', 'q'), ('stream', 'q'))
+COLUMN_NAMES = tuple(name for name, _ in COLUMNS)
+_INDEX_KEYS = ('ts', 'end')
+
+
+def path_of(records):
+    """Aggregate ``snd_cwnd`` (sum), ``rtt`` and ``rttvar`` (means) of the streams."""
+    cwnd = [r.snd_cwnd for r in records if r.stream is not None and r.snd_cwnd is not None]
+    rtt = [r.rtt for r in records if r.stream is not None and r.rtt is not None]
+    var = [r.rttvar for r in records if r.stream is not None and r.rttvar is not None]
+    return {'snd_cwnd': sum(cwnd) if cwnd else None,
+            'rtt': round(sum(rtt) / len(rtt)) if rtt else None,
+            'rttvar': round(sum(var) / len(var)) if var else None}
+
+
+class _Chunk:
+    __slots__ = ('cols', 'rows', 'first', 'last', 'offset')
+
+    def __init__(self):
+        self.cols = {name: array.array(code) for name, code in COLUMNS}
+        self.rows = 0
+        self.first = {}         # key column -> first value
+        self.last = {}          # key column -> last value
+        self.offset = None      # position in the spill file once spilled
+
+
+class SeriesStore:
+    def __init__(self, chunk_rows=4096, max_hot_chunks=16, spill_dir=None):
+        self.chunk_rows = chunk_rows
+        self.max_hot_chunks = max(1, max_hot_chunks)
+        self.spill_dir = spill_dir
+        self._chunks = []           # all chunks, oldest first
+        self._hot_from = 0          # index of the oldest chunk still in memory
+        self._spill = None          # open spill file
+        self._spill_path = None
+        self._lock = threading.RLock()
+        self.rows = 0
+        # running aggregate-row totals (cheap live stats without a scan)
+        self.agg_count = 0
+        self.agg_sum_bps = 0.0
+        self.agg_max_bps = 0.0
+        self.agg_last = None
+
+    def __len__(self):
+        return self.rows
+
+    # -- writing --------------------------------------------------------------
+
+    def append(self, ts, start, end, bps, jitter=NAN, loss=NAN, retr=-1, stream=AGGREGATE,
+               cwnd=-1, rtt=-1, rttvar=-1):
+        with self._lock:
+            chunk = self._chunks[-1] if self._chunks else None
+            if chunk is None or chunk.rows >= self.chunk_rows:
+                chunk = _Chunk()
+                self._chunks.append(chunk)
+                self._maybe_spill()
+            c = chunk.cols
+            c['ts'].append(ts)
+            c['start'].append(start)
+            c['end'].append(end)
+            c['bps'].append(bps)
+            c['jitter'].append(jitter)
+            c['loss'].append(loss)
+            c['retr'].append(retr)
+            c['cwnd'].append(cwnd)
+            c['rtt'].append(rtt)
+            c['rttvar'].append(rttvar)
+            c['stream'].append(stream)
+            if not chunk.rows:
+                chunk.first = {'ts': ts, 'end': end}
+            chunk.last = {'ts': ts, 'end': end}
+            chunk.rows += 1
+            self.rows += 1
+            if stream == AGGREGATE:
+                self.agg_count += 1
+                self.agg_sum_bps += bps
+                if bps > self.agg_max_bps:
+                    self.agg_max_bps = bps
+                self.agg_last = (ts, start, end, bps, jitter, loss, retr, cwnd, rtt, rttvar, stream)
+
+    def append_record(self, rec, stream=None):
+        self.append(rec.ts, rec.start, rec.end, rec.bits_per_second,
+                    NAN if rec.jitter_ms is None else rec.jitter_ms,
+                    NAN if rec.lost_percent is None else rec.lost_percent,
+                    -1 if rec.retransmits is None else rec.retransmits,
+                    (AGGREGATE if rec.stream is None else rec.stream) if stream is None else stream,
+                    -1 if rec.snd_cwnd is None else rec.snd_cwnd,
+                    -1 if rec.rtt is None else rec.rtt,
+                    -1 if rec.rttvar is None else rec.rttvar)
+
+    def append_interval(self, records):
+        """Store one interval: each stream (only with -P > 1) plus the aggregate row.
+
+        Returns the aggregate record (with the streams' cwnd/RTT folded in, see
+        above), or None if the interval had none or was inside the ``-O`` omit
+        window (omitted intervals are not stored).
+        """
+        agg = aggregate_of(records)
+        if agg is None or agg.omitted:
+            return None
+        if len(records) > 1:
+            for rec in records:
+                if rec.stream is not None:
+                    self.append_record(rec)
+            if agg.rtt is None:
+                agg = agg._replace(**path_of(records))
+        self.append_record(agg, stream=AGGREGATE)
+        return agg
+
+    def _maybe_spill(self):
+        # keep at most max_hot_chunks in memory, spilling full ones oldest first
+        while len(self._chunks) - self._hot_from > self.max_hot_chunks:
+            chunk = self._chunks[self._hot_from]
+            if self._spill is None:
+                import tempfile     # only long runs spill; keeps startup short
+                fd, self._spill_path = tempfile.mkstemp(prefix='nettest-series-', suffix='.bin',
+                                                        dir=self.spill_dir)
+                self._spill = os.fdopen(fd, 'w+b')
+            self._spill.seek(0, os.SEEK_END)
+            chunk.offset = self._spill.tell()
+            for name in COLUMN_NAMES:
+                chunk.cols[name].tofile(self._spill)
+            self._spill.flush()
+            chunk.cols = None
+            self._hot_from += 1
+
+    def _load(self, chunk):
+        if chunk.cols is not None:
+            return chunk.cols
+        cols = {}
+        self._spill.seek(chunk.offset)
+        for name, code in COLUMNS:
+            col = array.array(code)
+            col.fromfile(self._spill, chunk.rows)
+            cols[name] = col
+        return cols
+
+    # -- reading --------------------------------------------------------------
+
+    def range(self, t0=None, t1=None, key='ts', stream=AGGREGATE, columns=COLUMN_NAMES):
+        """Rows with ``t0 <= key <= t1`` as ``{column: list}``.
+
+        ``key`` is ``'ts'`` (wall clock) or ``'end'`` (iperf3 interval end);
+        both are non-decreasing within a run. ``stream=None`` returns all rows.
+        """
+        out = {name: [] for name in columns}
+        for part in self.iter_range(t0, t1, key, stream, columns):
+            for name in columns:
+                out[name].extend(part[name])
+        return out
+
+    def iter_range(self, t0=None, t1=None, key='ts', stream=AGGREGATE, columns=COLUMN_NAMES):
+        """Like ``range``, but one ``{column: list}`` per chunk, so a caller can
+        stream any number of rows while holding at most one chunk."""
+        if key not in _INDEX_KEYS:
+            raise ValueError(f"key must be one of {_INDEX_KEYS}")
+        with self._lock:
+            chunks = list(self._chunks)
+        lo = 0
+        if t0 is not None:
+            lasts = [c.last[key] for c in chunks]
+            lo = bisect.bisect_left(lasts, t0)
+        for chunk in chunks[lo:]:
+            # the lock is only held while slicing, never across a yield
+            with self._lock:
+                if not chunk.rows:
+                    continue
+                if t1 is not None and chunk.first[key] > t1:
+                    return
+                cols = self._load(chunk)
+                keycol = cols[key]
+                i = bisect.bisect_left(keycol, t0) if t0 is not None else 0
+                j = bisect.bisect_right(keycol, t1) if t1 is not None else len(keycol)
+                if i >= j:
+                    continue
+                if stream is None:
+                    part = {name: cols[name][i:j].tolist() for name in columns}
+                else:
+                    sel = [k for k in range(i, j) if cols['stream'][k] == stream]
+                    part = {name: [cols[name][k] for k in sel] for name in columns}
+            if part[columns[0]]:
+                yield part
+
+    def column(self, name, t0=None, t1=None, key='ts', stream=AGGREGATE):
+        return self.range(t0, t1, key, stream, columns=(name,))[name]
+
+    def stats(self, name='bps', t0=None, t1=None, key='ts', stream=AGGREGATE):
+        """``{'count', 'mean', 'min', 'max'}`` of a column over a range (NaNs skipped)."""
+        values = [v for v in self.column(name, t0, t1, key, stream) if not math.isnan(v)]
+        if not values:
+            return {'count': 0, 'mean': None, 'min': None, 'max': None}
+        return {'count': len(values), 'mean': sum(values) / len(values),
+                'min': min(values), 'max': max(values)}
+
+    def last(self):
+        """Most recent aggregate row as a dict, or None."""
+        if self.agg_last is None:
+            return None
+        return dict(zip(COLUMN_NAMES, self.agg_last))
+
+    def streams(self):
+        """Socket ids of the per-stream rows seen in memory-resident chunks."""
+        with self._lock:
+            ids = set()
+            for chunk in self._chunks[self._hot_from:]:
+                ids.update(chunk.cols['stream'])
+            ids.discard(AGGREGATE)
+            return sorted(ids)
+
+    def memory_bytes(self):
+        with self._lock:
+            return sum(col.itemsize * len(col)
+                       for chunk in self._chunks[self._hot_from:]
+                       for col in chunk.cols.values())
+
+    def close(self):
+        """Drop the spill file. The store is unusable for spilled ranges afterwards."""
+        with self._lock:
+            if self._spill is not None:
+                self._spill.close()
+                self._spill = None
+                try:
+                    os.remove(self._spill_path)
+                except OSError:
+                    pass
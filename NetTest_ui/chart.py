@@ -0,0 +1,234 @@
+"""实时曲线 (Tk Canvas): 吞吐 / 抖动 / 丢包 / 重传
+
+- 增量绘制: 每帧只为新确定的点追加一段折线，外加一条随数据移动的 "尾巴"；
+  整张图只在坐标轴变化 (时间超出范围、纵轴超出上限、窗口缩放) 时重画
+- LTTB 降采样: 每个像素列最多一个点 (NetTest_core.lttb)，24 小时 1 秒
+  区间的数据每帧也只处理新到的点
+- 帧率上限: 读取线程只把数据放进队列，图表按自己的定时器 (最多 CHART_MAX_FPS 帧/秒)
+  取出并绘制，与 100 ms 的 process_queue 周期互不影响
+"""
+import array
+import collections
+import math
+import tkinter as tk
+
+from NetTest_core.lttb import LttbDecimator
+
+CHART_MAX_FPS = 5           # 帧率上限
+CHART_HEIGHT = 200
+CHART_DEFAULT_SPAN = 60.0   # 未知测试时长时的初始横轴范围 (秒)
+MARGIN_LEFT = 52            # 纵轴刻度区宽度
+MARGIN_RIGHT = 8
+MARGIN_BOTTOM = 14          # 横轴时间刻度
+PANEL_GAP = 4
+
+# (标题, 单位, 颜色, 数值格式, 纵轴最小上限)
+TRACES = (
+    ("吞吐", "Mbps", '#4fc1ff', '{:.1f}', 1.0),
+    ("抖动", "ms", '#d7ba7d', '{:.3f}', 0.1),
+    ("丢包", "%", '#f48771', '{:.2f}', 1.0),
+    ("重传", "", '#c586c0', '{:.0f}', 1.0),
+)
+
+
+def nice_ceil(v):
+    """>= v 的 1/2/5 x 10^k 整数刻度"""
+    if v <= 0:
+        return 1.0
+    base = 10 ** math.floor(math.log10(v))
+    for m in (1, 2, 5, 10):
+        if m * base >= v:
+            return m * base
+    return 10 * base
+
+
+def format_seconds(s):
+    s = int(round(s))
+    if s < 600:
+        return f"{s}s"
+    if s < 36000:
+        return f"{s // 60}m"
+    return f"{s // 3600}h{s % 3600 // 60:02d}"
+
+
+class _Trace:
+    """一条曲线: 原始点 (列式数组) + LTTB 降采样状态 + 画布对象"""
+
+    def __init__(self, title, unit, color, fmt, floor):
+        self.title, self.unit, self.color, self.fmt, self.floor = title, unit, color, fmt, floor
+        self.xs = array.array('d')
+        self.ys = array.array('d')
+        self.vmax = 0.0             # 数据最大值
+        self.ymax = floor           # 当前纵轴上限
+        self.dec = LttbDecimator(1.0)
+        self.drawn = 0              # 已画成线段的 LTTB 点数
+        self.tail = None            # 尾巴 (未确定的原始点) 的画布对象
+        self.label = None           # 标题与最新值的画布对象
+
+
+class LiveChart:
+    """四个上下排列的小图，共用时间轴 (iperf3 区间结束时间，秒)"""
+
+    def __init__(self, parent, colors, height=CHART_HEIGHT, fps=CHART_MAX_FPS):
+        self.colors = colors
+        self.canvas = tk.Canvas(parent, height=height, bg=colors['input_bg'],
+                                highlightthickness=0)
+        self.frame_ms = max(1, int(1000 / fps))
+        self.pending = collections.deque()  # 读取线程写入，图表定时器取出
+        self.traces = [_Trace(*t) for t in TRACES]
+        self.span = CHART_DEFAULT_SPAN
+        self.size = (0, 0)
+        self.bucket = None          # 当前 LTTB 桶宽 (秒/像素)
+        self.layout_dirty = True
+        self.canvas.bind('<Configure>', self._on_resize)
+        self.canvas.after(self.frame_ms, self._tick)
+
+    def pack(self, **kw):
+        self.canvas.pack(**kw)
+
+    def push(self, x, mbps, jitter, loss, retr):
+        """追加一个区间 (可在读取线程中调用)；没有的指标传 None"""
+        self.pending.append((x, mbps, jitter, loss, retr))
+
+    def clear(self, span=None):
+        """清空曲线；span 为预计测试时长 (秒)"""
+        self.pending.clear()
+        self.traces = [_Trace(*t) for t in TRACES]
+        self.span = float(span) if span and span > 0 else CHART_DEFAULT_SPAN
+        self.bucket = None
+        self.layout_dirty = True
+
+    # ---------------- 帧循环 ----------------
+
+    def _tick(self):
+        try:
+            self._frame()
+        finally:
+            self.canvas.after(self.frame_ms, self._tick)
+
+    def _on_resize(self, event):
+        if (event.width, event.height) != self.size:
+            self.layout_dirty = True
+
+    def _frame(self):
+        fresh = False
+        while self.pending:
+            x, *values = self.pending.popleft()
+            for tr, v in zip(self.traces, values):
+                if v is None or v != v:
+                    continue
+                if tr.xs and x < tr.xs[-1]:
+                    continue        # 时间倒退 (异常输出) 的点丢弃，LTTB 要求 x 递增
+                tr.xs.append(x)
+                tr.ys.append(v)
+                tr.vmax = max(tr.vmax, v)
+                fresh = True
+        if not fresh and not self.layout_dirty:
+            return
+
+        # 坐标轴变化才整体重画
+        last = max((tr.xs[-1] for tr in self.traces if tr.xs), default=0.0)
+        while last > self.span:
+            self.span *= 2
+            self.layout_dirty = True
+        for tr in self.traces:
+            if tr.vmax > tr.ymax:
+                tr.ymax = nice_ceil(tr.vmax * 1.2)
+                self.layout_dirty = True
+
+        if self.layout_dirty:
+            self._redraw()
+        else:
+            for i, tr in enumerate(self.traces):
+                self._extend(i, tr)
+
+    # ---------------- 坐标 ----------------
+
+    def _geometry(self):
+        w, h = self.canvas.winfo_width(), self.canvas.winfo_height()
+        self.size = (w, h)
+        plot_w = max(1, w - MARGIN_LEFT - MARGIN_RIGHT)
+        panel_h = max(1.0, (h - MARGIN_BOTTOM) / len(self.traces))
+        return plot_w, panel_h
+
+    def _xy(self, i, tr, xs, ys):
+        """数据点 -> 画布坐标 (扁平列表)"""
+        sx = self.plot_w / self.span
+        top = i * self.panel_h + PANEL_GAP
+        bottom = (i + 1) * self.panel_h
+        sy = (bottom - top) / tr.ymax
+        out = []
+        for x, y in zip(xs, ys):
+            out.append(MARGIN_LEFT + x * sx)
+            out.append(bottom - min(y, tr.ymax) * sy)
+        return out
+
+    # ---------------- 绘制 ----------------
+
+    def _redraw(self):
+        c = self.canvas
+        c.delete('all')
+        self.layout_dirty = False
+        self.plot_w, self.panel_h = self._geometry()
+        bucket = self.span / self.plot_w    # 每个像素列一个 LTTB 桶
+        if bucket != self.bucket:
+            self.bucket = bucket
+            for tr in self.traces:
+                tr.dec.reset(bucket)
+        grid, muted = self.colors['border'], '#808080'
+        right = MARGIN_LEFT + self.plot_w
+
+        for i, tr in enumerate(self.traces):
+            top = i * self.panel_h + PANEL_GAP
+            bottom = (i + 1) * self.panel_h
+            c.create_line(MARGIN_LEFT, bottom, right, bottom, fill=grid)
+            c.create_line(MARGIN_LEFT, top, right, top, fill=grid, dash=(2, 4))
+            c.create_text(MARGIN_LEFT - 4, top, text=tr.fmt.format(tr.ymax), anchor='ne',
+                          fill=muted, font=('Consolas', 8))
+            c.create_text(MARGIN_LEFT - 4, bottom, text="0", anchor='se',
+                          fill=muted, font=('Consolas', 8))
+            tr.label = c.create_text(MARGIN_LEFT + 4, top + 1, anchor='nw', fill=tr.color,
+                                     font=('Segoe UI', 8), text=self._label_text(tr))
+            # 已确定的 LTTB 点一次画完，剩下的交给尾巴
+            tr.dec.update(tr.xs, tr.ys)
+            tr.drawn = len(tr.dec.px)
+            if tr.drawn >= 2:
+                c.create_line(*self._xy(i, tr, tr.dec.px, tr.dec.py), fill=tr.color)
+            tr.tail = c.create_line(0, 0, 0, 0, fill=tr.color)
+            self._update_tail(i, tr)
+
+        for k in range(5):
+            x = self.span * k / 4
+            c.create_text(MARGIN_LEFT + self.plot_w * k / 4, self.size[1] - 1,
+                          text=format_seconds(x), fill=muted, font=('Consolas', 8),
+                          anchor='s' if 0 < k < 4 else ('sw' if k == 0 else 'se'))
+
+    def _extend(self, i, tr):
+        """只追加新确定的 LTTB 点 (接在上一段末尾)，再移动尾巴"""
+        if not tr.xs:
+            return
+        tr.dec.update(tr.xs, tr.ys)
+        px, py = tr.dec.px, tr.dec.py
+        if len(px) > tr.drawn:
+            start = max(tr.drawn - 1, 0)
+            if len(px) - start >= 2:
+                self.canvas.create_line(*self._xy(i, tr, px[start:], py[start:]), fill=tr.color)
+            tr.drawn = len(px)
+        self._update_tail(i, tr)
+        self.canvas.itemconfigure(tr.label, text=self._label_text(tr))
+
+    def _update_tail(self, i, tr):
+        px, py = tr.dec.px, tr.dec.py
+        if not px:
+            return
+        xs = px[-1:] + list(tr.xs[tr.dec.pos:])
+        ys = py[-1:] + list(tr.ys[tr.dec.pos:])
+        if len(xs) < 2:
+            xs, ys = xs * 2, ys * 2
+        self.canvas.coords(tr.tail, *self._xy(i, tr, xs, ys))
+
+    @staticmethod
+    def _label_text(tr):
+        unit = f" {tr.unit}" if tr.unit else ""
+        value = tr.fmt.format(tr.ys[-1]) if tr.ys else "--"
+        return f"{tr.title}  {value}{unit}"
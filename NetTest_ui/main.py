@@ -1,14 +1,33 @@
 import tkinter as tk
 from tkinter import ttk, scrolledtext, filedialog, messagebox
-import subprocess
-import threading
+import collections
 import queue
 import time
 import os
 import sys
-import re
 from datetime import datetime
 
+# 共享核心库 NetTest_core 位于本目录的上一级
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from NetTest_core.anomaly import PHASE_CAPTURED, PHASE_START
+from NetTest_core.breakpoints import MODES as BP_MODES, format_point
+from NetTest_core.export import export_series
+from NetTest_core.history import HistoryDB
+from NetTest_core.iperf_stream import aggregate_of, prepare_command
+from NetTest_core.journal import FRONTEND_MAX_BYTES, Journal, default_journal_dir
+from NetTest_core.mesh import Mesh, format_matrix, format_pair
+from NetTest_core.ratesearch import RateSearch, format_probe, format_rate
+from NetTest_core.runs import RunManager, normalize_spec
+from NetTest_core.server_pool import BACKENDS as POOL_BACKENDS, ServerPool, format_pool
+from NetTest_core.sweep import Sweep, format_cell, format_heatmap, format_table
+from NetTest_core.tcpstats import PHASE_START as STORM_START
+from chart import LiveChart
+
+UI_TICK_MS = 100            # UI 队列处理周期
+UI_MAX_EVENTS = 20000       # 每个周期最多处理的事件数，剩余的下个周期继续
+LOG_RENDER_LINES = 2000     # 日志窗口最多保留的行数 (渲染窗口)
+LOG_CACHE_LINES = 5000      # 日志存档不可用时的内存日志缓存 (用于保存)
+
 class IperfApp:
     def __init__(self, root):
         self.root = root
@@ -17,22 +36,41 @@ class IperfApp:
         
         # --- 全局状态 ---
         self.running = False
-        self.process = None
+        self.run = None             # 当前表单对应的测试 (NetTest_core.runs.Run)
+        self.search = None          # 进行中的 UDP 最大速率搜索
+        self.sweep = None           # 进行中的参数扫描
+        self.mesh = None            # 进行中的全互联测试
+        self.pool = None            # 本地 iperf3 服务端池 (ServerPool)
+        self.run_manager = RunManager(max_concurrent=4)
+        # 结果历史库 (SQLite)，每次测试结束自动保存
+        try:
+            self.history = HistoryDB()
+            self.run_manager.add_finish_hook(self.history.record_run)
+        except Exception as e:
+            print(f"[History] disabled: {e}")
+            self.history = None
         self.queue = queue.Queue()
         self.start_time = 0
         self.total_duration = 10
         self.stdout_file = None
         
         # --- 数据存储 ---
-        self.log_data = []          # 原始日志缓存
-        self.breakpoint_data = []   # 断点记录
+        # 日志存档: 完整日志与解析记录写入磁盘分段文件，内存只留尾部
+        try:
+            self.journal = Journal(default_journal_dir('tk'), max_bytes=FRONTEND_MAX_BYTES)
+        except OSError as e:
+            print(f"[Journal] disabled: {e}")
+            self.journal = None
+        self.log_since = time.time()  # "保存主日志" 从此刻起导出 (清除数据时重置)
+        self.log_data = collections.deque(maxlen=LOG_CACHE_LINES)  # 日志存档不可用时的内存缓存
+        self.breakpoint_data = []   # 断点记录 (日志行)
         self.bp_recorded_values = [] 
+        self.anomalies = {}         # 异常检测结果 (id -> 事件)，由 Run 的 CUSUM 检测器给出
         self.stats = self.reset_stats()
         
-        # --- 断点测试配置 ---
+        # --- 断点测试配置 (采样由 Run 按 iperf3 区间时间完成) ---
         self.breakpoint_active = False
         self.breakpoint_interval = 5.0
-        self.next_breakpoint_time = 0
 
         # --- UI 初始化 ---
         self.colors = self.init_colors()
@@ -40,7 +78,7 @@ class IperfApp:
         self.create_widgets()
         
         # --- 启动事件循环 ---
-        self.root.after(100, self.process_queue)
+        self.root.after(UI_TICK_MS, self.process_queue)
         self.root.protocol("WM_DELETE_WINDOW", self.on_close)
 
     def init_colors(self):
@@ -59,7 +97,6 @@ class IperfApp:
 
     def reset_stats(self):
         return {
-            'total_mbps': 0.0, 'count': 0, 'max_mbps': 0.0,
             'total_jitter': 0.0, 'jitter_count': 0,
             'total_lost': 0, 'total_packets': 0,
             'total_retr': 0
@@ -131,14 +168,15 @@ class IperfApp:
         style.map('Danger.TButton', background=[('active', '#8a1f0b')])
         
         style.configure('Horizontal.TProgressbar', background=c['primary'], troughcolor=c['input_bg'], bordercolor=c['border'])
+        style.configure('Vertical.TScrollbar', background=c['input_bg'], troughcolor=c['panel_bg'],
+                        bordercolor=c['border'], arrowcolor=c['fg'])
 
     def create_widgets(self):
         container = tk.Frame(self.root, bg=self.colors['bg'])
         container.pack(fill='both', expand=True, padx=8, pady=8)
         
-        # === 左侧控制区 ===
-        left_panel = ttk.Frame(container, style='Panel.TFrame', padding=10)
-        left_panel.pack(side='left', fill='y', padx=(0, 8))
+        # === 左侧控制区 (可滚动) ===
+        left_panel = self._build_scroll_panel(container)
         
         self._build_config_form(left_panel)
         self._build_control_buttons(left_panel)
@@ -148,8 +186,43 @@ class IperfApp:
         right_panel.pack(side='right', fill='both', expand=True)
         
         self._build_stats_panel(right_panel)
+        self._build_chart_panel(right_panel)
         self._build_log_panel(right_panel)
 
+    def _build_scroll_panel(self, parent):
+        """左侧控制区: 放在 Canvas 里，内容高于窗口时用滚动条/滚轮查看下方的扫描、网格、服务器池等控件"""
+        bg = self.colors['panel_bg']
+        outer = ttk.Frame(parent, style='Panel.TFrame')
+        outer.pack(side='left', fill='y', padx=(0, 8))
+        canvas = tk.Canvas(outer, bg=bg, highlightthickness=0, bd=0)
+        bar = ttk.Scrollbar(outer, orient='vertical', command=canvas.yview)
+        canvas.configure(yscrollcommand=bar.set)
+        bar.pack(side='right', fill='y')
+        canvas.pack(side='left', fill='y', expand=True)
+
+        inner = tk.Frame(canvas, bg=bg, padx=10, pady=10)
+        canvas.create_window(0, 0, window=inner, anchor='nw')
+
+        def on_resize(_event):
+            w, h = inner.winfo_reqwidth(), inner.winfo_reqheight()
+            canvas.configure(width=w, scrollregion=(0, 0, w, h))
+
+        def on_wheel(event):
+            # 只处理指针在左侧区域内的滚轮，日志框等保持自己的滚动
+            under = self.root.winfo_containing(event.x_root, event.y_root)
+            path = str(under) if under is not None else ''
+            if path != str(outer) and not path.startswith(str(outer) + '.'):
+                return
+            if event.num == 4 or getattr(event, 'delta', 0) > 0:
+                canvas.yview_scroll(-1, 'units')
+            elif event.num == 5 or getattr(event, 'delta', 0) < 0:
+                canvas.yview_scroll(1, 'units')
+
+        inner.bind('<Configure>', on_resize)
+        for seq in ('<MouseWheel>', '<Button-4>', '<Button-5>'):  # Windows/macOS, X11
+            self.root.bind_all(seq, on_wheel, add='+')
+        return inner
+
     def _build_config_form(self, parent):
         ttk.Label(parent, text="配置参数", style='Title.TLabel', background=self.colors['panel_bg']).pack(anchor='w', pady=(0, 10))
         
@@ -164,18 +237,28 @@ class IperfApp:
         # 协议及带宽
         ttk.Label(form, text="协议:", style='Panel.TLabel').pack(anchor='w', pady=(5, 2))
         self.protocol_var = tk.StringVar(value="tcp")
-        proto_box = tk.Frame(form, bg=form_bg)
-        proto_box.pack(fill='x', pady=(0, 5))
+        self.proto_box = tk.Frame(form, bg=form_bg)
+        self.proto_box.pack(fill='x', pady=(0, 5))
         
         # 协议单选
-        ttk.Radiobutton(proto_box, text="TCP", variable=self.protocol_var, value="tcp", 
+        ttk.Radiobutton(self.proto_box, text="TCP", variable=self.protocol_var, value="tcp", 
                        command=self.toggle_udp_ui).pack(side='left', padx=5)
-        ttk.Radiobutton(proto_box, text="UDP", variable=self.protocol_var, value="udp", 
+        ttk.Radiobutton(self.proto_box, text="UDP", variable=self.protocol_var, value="udp", 
                        command=self.toggle_udp_ui).pack(side='left', padx=5)
         
         # UDP 带宽输入框 (默认隐藏)
         self.udp_bw_frame = tk.Frame(form, bg=form_bg)
         self.udp_bw_entry = self._add_input_row_layout(self.udp_bw_frame, "UDP 带宽 (-b):", "100M")
+        # UDP 最大速率自动搜索 (短测试二分 -b，直到丢包/抖动达标)
+        self.udp_search_frame = tk.Frame(form, bg=form_bg)
+        loss_row = tk.Frame(self.udp_search_frame, bg=form_bg)
+        loss_row.pack(fill='x', pady=2)
+        self.udp_loss_entry = self._add_input_row_layout(loss_row, "丢包上限 (%):", "0.1")
+        jitter_row = tk.Frame(self.udp_search_frame, bg=form_bg)
+        jitter_row.pack(fill='x', pady=2)
+        self.udp_jitter_entry = self._add_input_row_layout(jitter_row, "抖动上限 (ms):", "")
+        self.btn_search = ttk.Button(self.udp_search_frame, text="自动搜索最大速率", command=self.toggle_rate_search)
+        self.btn_search.pack(fill='x', pady=2)
 
         # 方向
         ttk.Label(form, text="方向:", style='Panel.TLabel').pack(anchor='w', pady=(5, 2))
@@ -189,6 +272,11 @@ class IperfApp:
         self.duration = self._add_input_row(form, "持续时间 (s):", "10")
         self.interval = self._add_input_row(form, "报告间隔 (s):", "1")
         self.parallel = self._add_input_row(form, "并行流数 (-P):", "1")
+        self.window = self._add_input_row(form, "窗口 (-w):", "")
+        self.length = self._add_input_row(form, "缓冲长度 (-l):", "")
+        self.omit = self._add_input_row(form, "预热忽略 (-O):", "0")
+        self.zerocopy_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(form, text="零拷贝 (-Z)", variable=self.zerocopy_var).pack(anchor='w', pady=2)
 
         ttk.Separator(parent, orient='horizontal').pack(fill='x', pady=10)
 
@@ -203,18 +291,62 @@ class IperfApp:
         # 断点模块
         ttk.Label(parent, text="断点测试 (采样)", style='Title.TLabel', background=self.colors['panel_bg']).pack(anchor='w', pady=(15, 5))
         self.bp_interval_entry = self._add_input_row(parent, "采样间隔 (s):", "5")
+        bp_mode_frame = tk.Frame(parent, bg=self.colors['panel_bg'])
+        bp_mode_frame.pack(fill='x', pady=2)
+        ttk.Label(bp_mode_frame, text="采样模式:", style='Panel.TLabel', width=15).pack(side='left')
+        self.bp_mode_var = tk.StringVar(value=BP_MODES[0])
+        ttk.Combobox(bp_mode_frame, textvariable=self.bp_mode_var, values=BP_MODES,
+                     state='readonly').pack(side='right', fill='x', expand=True)
         
         self.btn_bp_start = ttk.Button(parent, text="开始采样", command=self.start_breakpoint_test)
         self.btn_bp_start.pack(fill='x', pady=5)
         
         self.btn_bp_stop = ttk.Button(parent, text="停止采样", command=self.stop_breakpoint_test, state='disabled')
         self.btn_bp_stop.pack(fill='x', pady=5)
+
+        self.btn_bp_manual = ttk.Button(parent, text="手动断点", command=self.manual_breakpoint, state='disabled')
+        self.btn_bp_manual.pack(fill='x', pady=5)
         
+        # 参数扫描: 逗号分隔的取值，逐格运行并排名
+        ttk.Label(parent, text="参数扫描", style='Title.TLabel', background=self.colors['panel_bg']).pack(anchor='w', pady=(15, 5))
+        self.sweep_parallel_entry = self._add_input_row(parent, "-P 取值:", "1,2,4,8")
+        self.sweep_window_entry = self._add_input_row(parent, "-w 取值:", "256K,1M,4M")
+        self.sweep_duration_entry = self._add_input_row(parent, "每格时长 (s):", "10")
+        self.btn_sweep = ttk.Button(parent, text="开始扫描", command=self.toggle_sweep)
+        self.btn_sweep.pack(fill='x', pady=5)
+
+        # 全互联测试: 主机两两互测，每轮内任一主机只参与一个测试
+        ttk.Label(parent, text="全互联测试", style='Title.TLabel', background=self.colors['panel_bg']).pack(anchor='w', pady=(15, 5))
+        self.mesh_hosts_entry = self._add_input_row(parent, "主机 (逗号分隔):", "")
+        self.mesh_duration_entry = self._add_input_row(parent, "每对时长 (s):", "10")
+        self.mesh_duplex_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(parent, text="全双工 (收发并行)", variable=self.mesh_duplex_var).pack(anchor='w', pady=2)
+        self.btn_mesh = ttk.Button(parent, text="开始全互联", command=self.toggle_mesh)
+        self.btn_mesh.pack(fill='x', pady=5)
+
+        # 本地服务端池: 本机启动 N 个 iperf3 -s，测试自动分配空闲端口，崩溃自动重启
+        ttk.Label(parent, text="本地服务端池", style='Title.TLabel', background=self.colors['panel_bg']).pack(anchor='w', pady=(15, 5))
+        self.pool_size_entry = self._add_input_row(parent, "服务端数量:", "4")
+        self.pool_port_entry = self._add_input_row(parent, "起始端口:", "5201")
+        pool_backend_frame = tk.Frame(parent, bg=self.colors['panel_bg'])
+        pool_backend_frame.pack(fill='x', pady=2)
+        ttk.Label(pool_backend_frame, text="服务端:", style='Panel.TLabel', width=15).pack(side='left')
+        self.pool_backend_var = tk.StringVar(value=POOL_BACKENDS[0])
+        ttk.Combobox(pool_backend_frame, textvariable=self.pool_backend_var, values=POOL_BACKENDS,
+                     state='readonly').pack(side='right', fill='x', expand=True)
+        self.use_pool_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(parent, text="使用本地池 (忽略服务器 IP/端口)", variable=self.use_pool_var).pack(anchor='w', pady=2)
+        self.lbl_pool = ttk.Label(parent, text="未启动", style='Panel.TLabel', wraplength=220)
+        self.lbl_pool.pack(anchor='w', pady=2)
+        self.btn_pool = ttk.Button(parent, text="启动服务端池", command=self.toggle_pool)
+        self.btn_pool.pack(fill='x', pady=5)
+
         ttk.Separator(parent, orient='horizontal').pack(fill='x', pady=15)
         
         # 数据操作
         ttk.Button(parent, text="保存主日志", command=lambda: self.save_data('main')).pack(fill='x', pady=2)
         ttk.Button(parent, text="保存断点日志", command=lambda: self.save_data('bp')).pack(fill='x', pady=2)
+        ttk.Button(parent, text="导出区间数据 (CSV/NDJSON)", command=self.export_series).pack(fill='x', pady=2)
         ttk.Button(parent, text="清空数据", command=self.clear_data).pack(fill='x', pady=2)
 
     def _build_stats_panel(self, parent):
@@ -231,6 +363,21 @@ class IperfApp:
         self.lbl_avg_bw = self._create_stat_item(grid, 1, "平均带宽", "-")
         self.lbl_max_bw = self._create_stat_item(grid, 2, "最大带宽", "-")
         self.lbl_bp_count = self._create_stat_item(grid, 3, "断点记录", "0")
+        self.lbl_pct_bw = self._create_stat_item(grid, 0, "带宽 P5 / P50 / P95", "-", row=1)
+        self.lbl_stdev_bw = self._create_stat_item(grid, 1, "标准差 / 变异系数", "-", row=1)
+        self.lbl_p1_bw = self._create_stat_item(grid, 2, "带宽 P1 / P99", "-", row=1)
+        self.lbl_jitter = self._create_stat_item(grid, 3, "抖动 P50 / P95", "-", row=1)
+        self.lbl_anomaly = self._create_stat_item(grid, 0, "异常 (CUSUM)", "0", row=2)
+        self.lbl_retr = self._create_stat_item(grid, 1, "重传 / 风暴", "-", row=2)
+        self.lbl_tcp_path = self._create_stat_item(grid, 2, "cwnd / RTT (±var)", "-", row=2)
+        self.lbl_fairness = self._create_stat_item(grid, 3, "公平性 Jain / 份额", "-", row=2)
+
+    def _build_chart_panel(self, parent):
+        panel = ttk.Frame(parent, style='Panel.TFrame', padding=5)
+        panel.pack(fill='x', pady=(0, 8))
+        # 实时曲线: 自带帧率上限的定时器，数据由读取线程直接推入
+        self.chart = LiveChart(panel, self.colors)
+        self.chart.pack(fill='x')
 
     def _build_log_panel(self, parent):
         split = tk.Frame(parent, bg=self.colors['bg'])
@@ -268,9 +415,9 @@ class IperfApp:
         entry.pack(side='right', fill='x', expand=True)
         return entry
 
-    def _create_stat_item(self, parent, col, title, initial):
+    def _create_stat_item(self, parent, col, title, initial, row=0):
         frame = tk.Frame(parent, bg=self.colors['panel_bg'], bd=0)
-        frame.grid(row=0, column=col, sticky='nsew', padx=5)
+        frame.grid(row=row, column=col, sticky='nsew', padx=5, pady=(0 if row == 0 else 6, 0))
         parent.grid_columnconfigure(col, weight=1)
         ttk.Label(frame, text=title, style='StatsLabel.TLabel').pack(anchor='w')
         lbl = ttk.Label(frame, text=initial, style='Stats.TLabel')
@@ -279,14 +426,16 @@ class IperfApp:
 
     def toggle_udp_ui(self):
         if self.protocol_var.get() == 'udp':
-            self.udp_bw_frame.pack(fill='x', pady=2, after=self.proto_frame)
+            self.udp_bw_frame.pack(fill='x', pady=2, after=self.proto_box)
+            self.udp_search_frame.pack(fill='x', pady=2, after=self.udp_bw_frame)
         else:
             self.udp_bw_frame.pack_forget()
+            self.udp_search_frame.pack_forget()
 
     # ---------------- 核心逻辑 ----------------
 
     def start_test(self):
-        if self.running: return
+        if self.running or self.search is not None or self.sweep is not None or self.mesh is not None: return
 
         self.clear_data(clear_ui=False)
         self.txt_main_log.delete(1.0, tk.END)
@@ -312,14 +461,26 @@ class IperfApp:
 
         self.running = True
         self.start_time = time.time()
+        self.chart.clear(self.total_duration)
         
         # UI 状态更新
         self._set_ui_state(running=True)
         self.lbl_status.configure(text="运行中", foreground=self.colors['success'])
 
-        # 启动线程
-        t = threading.Thread(target=self.run_subprocess, args=(cmd,), daemon=True)
-        t.start()
+        # 交给调度器: 独立线程读取输出，解析结果经 self.queue 回到 UI
+        if self.use_pool_var.get():
+            try:
+                # 本地池分配空闲端口 (改写 -c/-p)
+                self.run = self.run_manager.submit_pooled(cmd, listener=self._on_run_event)
+            except ValueError as e:
+                self.running = False
+                self._set_ui_state(running=False)
+                self.lbl_status.configure(text="就绪", foreground=self.colors['fg'])
+                messagebox.showerror("本地服务端池", str(e))
+                return
+            self.txt_main_log.insert(tk.END, "本地池分配: %s:%d\n\n" % self.run.target)
+        else:
+            self.run = self.run_manager.submit(cmd, listener=self._on_run_event)
 
     def build_command(self, exe_path):
         cmd = [exe_path, '-c', self.server_ip.get().strip(), 
@@ -345,49 +506,41 @@ class IperfApp:
             if (p := int(self.parallel.get())) > 1:
                 cmd.extend(['-P', str(p)])
         except: pass
-        
-        return cmd
 
-    def run_subprocess(self, cmd):
-        app_dir = os.path.dirname(cmd[0])
-        
-        startupinfo = None
-        if sys.platform == 'win32':
-            startupinfo = subprocess.STARTUPINFO()
-            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-            # 使用 SW_HIDE 隐藏黑框
-        
+        if w := self.window.get().strip():
+            cmd.extend(['-w', w])
+        if l := self.length.get().strip():
+            cmd.extend(['-l', l])
         try:
-            self.process = subprocess.Popen(
-                cmd,
-                cwd=app_dir, # 工作目录设为 exe 所在目录
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                stdin=subprocess.DEVNULL, # 关闭输入
-                text=True, # 启用文本缓冲
-                bufsize=1, # 行缓冲
-                encoding='utf-8',
-                errors='replace',
-                startupinfo=startupinfo
-            )
-            
-            self.queue.put(('log', f"[System] 进程 PID: {self.process.pid} 已启动\n"))
-            
-            # 实时读取循环
-            while self.running:
-                line = self.process.stdout.readline()
-                if line:
-                    self.queue.put(('log', line))
-                elif self.process.poll() is not None:
-                    break # 进程结束且无新输出
-            
-            code = self.process.wait()
-            self.queue.put(('finish', code))
-            
-        except Exception as e:
-            self.queue.put(('error', str(e)))
-        finally:
-            self.running = False
+            if (o := int(self.omit.get() or 0)) > 0:
+                cmd.extend(['-O', str(o)])
+        except ValueError:
+            raise ValueError("预热忽略必须为整数")
+        if self.zerocopy_var.get():
+            cmd.append('-Z')
+        
+        # 优先使用 --json-stream 结构化输出 (旧版 iperf3 退回 -J)
+        return prepare_command(cmd)
+
+    def _on_run_event(self, kind, payload):
+        """Run 事件 -> UI 队列 (在读取线程中调用)
+
+        解析与统计都在读取线程完成，UI 线程只应用算好的结果。
+        """
+        if kind == 'text':
+            self.queue.put(('log', payload + "\n"))
+        elif kind == 'interval':
+            view = self._on_interval(payload)
+            if view is not None:
+                self.queue.put(('interval', view))
+            if self.journal is not None:
+                self.journal.record('interval', [r.to_dict() for r in payload])
+        elif kind == 'summary':
+            self._on_summary(payload)
+            if self.journal is not None:
+                self.journal.record('summary', [r.to_dict() for r in payload])
+        elif kind in ('breakpoint', 'anomaly', 'tcp', 'finish'):
+            self.queue.put((kind, payload))
 
     def on_close(self):
         if self.running:
@@ -398,100 +551,196 @@ class IperfApp:
             self.destroy()
 
     def destroy(self):
-        if self.process and self.process.poll() is None:
-            try: self.process.kill()
-            except: pass
+        self.run_manager.stop_all()
+        if self.pool is not None:
+            self.pool.stop()
+        if self.journal is not None:
+            self.journal.close()
         self.root.destroy()
         sys.exit(0)
 
     # ---------------- 业务逻辑处理 ----------------
 
     def process_queue(self):
+        # 合并本周期的所有事件: 日志一次插入，标签只应用最新的结果
+        lines = []
+        view = None
+        tcp = None
+        points = []
+        pool = None
+        finish = None
         try:
-            while True:
+            for _ in range(UI_MAX_EVENTS):
                 type_, data = self.queue.get_nowait()
                 if type_ == 'log':
-                    self._append_log(data)
-                    self._parse_line_metrics(data)
+                    lines.append(data)
+                elif type_ == 'interval':
+                    view = data
+                elif type_ == 'breakpoint':
+                    points.append(data)
+                elif type_ == 'anomaly':
+                    self._on_anomaly(data)
+                elif type_ == 'tcp':
+                    if data['kind'] == 'interval':
+                        tcp = data['data']     # 只显示最新的区间
+                    elif data['kind'] == 'storm':
+                        self._on_storm(data['data'])
+                elif type_ == 'ratesearch':
+                    self._on_search_done(data)
+                elif type_ == 'sweep':
+                    self._on_sweep_done(data)
+                elif type_ == 'mesh':
+                    self._on_mesh_done(data)
+                elif type_ == 'pool':
+                    pool = data
                 elif type_ == 'finish':
-                    self._on_finished(data)
-                elif type_ == 'error':
-                    self._append_log(f"[Error] {data}\n")
-                    self._on_finished(-1)
+                    finish = data
+                    break
         except queue.Empty: pass
-        self.root.after(100, self.process_queue)
 
-    def _append_log(self, text):
-        # 限制日志长度，防卡顿
-        if len(self.log_data) > 5000:
-            del self.log_data[:1000]
-            self.txt_main_log.delete('1.0', '1001.0')
-        
-        self.log_data.append(text)
-        self.txt_main_log.insert(tk.END, text)
-        self.txt_main_log.see(tk.END)
+        if lines:
+            self._append_log(lines)
+        if view is not None:
+            self._apply_view(view)
+        if tcp is not None:
+            self._apply_tcp(tcp)
+        if points:
+            self._record_breakpoints(points)
+        if pool is not None:
+            self.lbl_pool.configure(text=format_pool(pool))
+        if finish is not None:
+            self._on_finished(finish)
+        # 还有积压时尽快再处理一轮
+        self.root.after(1 if not self.queue.empty() else UI_TICK_MS, self.process_queue)
 
-    def _parse_line_metrics(self, line):
-        if '[SUM]' in line or 'sender' in line or 'receiver' in line:
-            return
+    def _append_log(self, lines):
+        """追加一批日志 (字符串或字符串列表)，一次插入、一次滚动"""
+        if isinstance(lines, str):
+            lines = [lines]
+        if self.journal is not None:
+            self.journal.write_lines(lines)
+        else:
+            self.log_data.extend(lines)
+        log = self.txt_main_log
+        follow = log.yview()[1] >= 0.999   # 用户向上翻看时不自动滚动
+        # 只渲染渲染窗口能保留的部分
+        log.insert(tk.END, "".join(lines[-LOG_RENDER_LINES:]))
+        # 渲染窗口: 超出部分一次性删除
+        excess = int(log.index('end-1c').split('.')[0]) - LOG_RENDER_LINES
+        if excess > 0:
+            log.delete('1.0', f'{excess + 1}.0')
+        if follow:
+            log.see(tk.END)
 
-        # 匹配带宽: "38.6 Mbits/sec"
-        match = re.search(r'\s+(\d+(?:\.\d+)?)\s+([KMGT]?bits\/sec)', line)
-        if match:
-            mbps = self._convert_to_mbps(float(match.group(1)), match.group(2))
-            
-            # 更新实时统计
-            s = self.stats
-            s['count'] += 1
-            s['total_mbps'] += mbps
-            s['max_mbps'] = max(s['max_mbps'], mbps)
-            
-            avg = s['total_mbps'] / s['count']
-            self.lbl_avg_bw.configure(text=f"{avg:.2f} Mbps")
-            self.lbl_max_bw.configure(text=f"{s['max_mbps']:.2f} Mbps")
-
-            # 更新进度条
-            elapsed = time.time() - self.start_time
-            if self.total_duration > 0:
-                p = (elapsed / self.total_duration) * 100
-                self.progress_var.set(min(p, 100))
-            
-            # 解析 UDP Jitter/Loss 或 TCP Retr
-            self._parse_extra_metrics(line)
+    def _on_interval(self, records):
+        """计算区间的显示值 (读取线程)。返回 UI 视图字典或 None
 
-            # 断点采样
-            if self.breakpoint_active and elapsed >= self.next_breakpoint_time:
-                self._record_breakpoint(mbps, elapsed)
+        Run 先把区间存入 run.series / run.stats 再回调这里，UI 不另存一份。
+        """
+        run = self.run
+        agg = aggregate_of(records)
+        if run is None or agg is None or agg.omitted:
+            return None
+        rec = run.last      # 本区间的汇总行 (已并入各流的 cwnd/RTT)
 
-    def _parse_extra_metrics(self, line):
-        if self.protocol_var.get() == 'udp':
-            # UDP: 0.034 ms  0/89 (0%)
-            m = re.search(r'(\d+(?:\.\d+)?)\s+ms\s+(\d+)/(\d+)', line)
-            if m:
-                self.stats['total_jitter'] += float(m.group(1))
-                self.stats['jitter_count'] += 1
-                self.stats['total_lost'] += int(m.group(2))
-                self.stats['total_packets'] += int(m.group(3))
-        else:
-            # TCP Retr (iperf3 output format varies, usually column after bandwidth)
-            # 简化处理：从行中提取 Retr 字段有点复杂，暂略或根据具体版本调整
-            pass
-
-    def _convert_to_mbps(self, val, unit):
-        if unit.startswith('G'): return val * 1000
-        if unit.startswith('K'): return val / 1000
-        if unit == 'bits/sec': return val / 1000000
-        return val
-
-    def _record_breakpoint(self, mbps, elapsed):
-        self.bp_recorded_values.append(mbps)
-        ts = datetime.now().strftime("%H:%M:%S")
-        log = f"[{ts}] T:{elapsed:.1f}s BW:{mbps:.2f} Mbps"
-        self.breakpoint_data.append(log)
-        self.txt_bp_log.insert(tk.END, log + "\n")
+        # UDP Jitter/Loss 与 TCP Retr
+        self._apply_extra_metrics(rec)
+        self.chart.push(rec.end, rec.mbps, rec.jitter_ms, rec.lost_percent, rec.retransmits)
+
+        # 实时统计 (由时序存储的累计值提供)
+        ser = run.series
+        view = {
+            'mbps': rec.mbps,
+            'avg': ser.agg_sum_bps / ser.agg_count / 1e6,
+            'max': ser.agg_max_bps / 1e6,
+            'elapsed': time.time() - self.start_time,
+            'progress': None,
+            'bw': run.stats.throughput.summary(scale=1e6),
+            'jitter': run.stats.jitter.summary(qs=(50, 95)),
+        }
+        # 进度按 iperf3 报告的区间结束时间
+        if self.total_duration > 0:
+            view['progress'] = min(rec.end / self.total_duration * 100, 100)
+        return view
+
+    def _apply_view(self, view):
+        self.lbl_avg_bw.configure(text=f"{view['avg']:.2f} Mbps")
+        self.lbl_max_bw.configure(text=f"{view['max']:.2f} Mbps")
+        if view['progress'] is not None:
+            self.progress_var.set(view['progress'])
+        bw = view['bw']
+        self.lbl_pct_bw.configure(text=f"{bw['p5']:.1f} / {bw['p50']:.1f} / {bw['p95']:.1f}")
+        self.lbl_stdev_bw.configure(text=f"{bw['stdev']:.2f} / {(bw['cv'] or 0) * 100:.1f}%")
+        self.lbl_p1_bw.configure(text=f"{bw['p1']:.1f} / {bw['p99']:.1f}")
+        jit = view['jitter']
+        if jit['count']:
+            self.lbl_jitter.configure(text=f"{jit['p50']:.3f} / {jit['p95']:.3f} ms")
+
+    def _apply_extra_metrics(self, rec):
+        s = self.stats
+        if rec.jitter_ms is not None:
+            s['total_jitter'] += rec.jitter_ms
+            s['jitter_count'] += 1
+            s['total_lost'] += rec.lost_packets or 0
+            s['total_packets'] += rec.packets or 0
+        if rec.retransmits is not None:
+            s['total_retr'] += rec.retransmits
+
+    def _on_summary(self, records):
+        # UDP 客户端发送端的区间数据不含抖动/丢包，使用结束汇总中的接收端数据
+        s = self.stats
+        if s['jitter_count'] > 0:
+            return
+        for rec in records:
+            if rec.stream is None and rec.jitter_ms is not None:
+                s['total_jitter'] = rec.jitter_ms
+                s['jitter_count'] = 1
+                s['total_lost'] = rec.lost_packets or 0
+                s['total_packets'] = rec.packets or 0
+
+    def _record_breakpoints(self, points):
+        """显示 Run 采样得到的断点 (按 iperf3 区间时间，不受 UI 延迟影响)"""
+        lines = []
+        for p in points:
+            self.bp_recorded_values.append(p['mbps'])
+            ts = datetime.fromtimestamp(p['ts']).strftime("%H:%M:%S")
+            lines.append(f"[{ts}] {format_point(p)}\n")
+        self.breakpoint_data.extend(lines)
+        self.txt_bp_log.insert(tk.END, "".join(lines))
         self.txt_bp_log.see(tk.END)
-        self.lbl_bp_count.configure(text=str(len(self.breakpoint_data)))
-        self.next_breakpoint_time += self.breakpoint_interval
+        self.lbl_bp_count.configure(text=str(len(self.bp_recorded_values)))
+
+    def _on_anomaly(self, ev):
+        """吞吐下降 / 突发丢包 / 抖动尖峰: 计数并标出进行中的异常 (日志行由 Run 输出)"""
+        if ev['phase'] == PHASE_CAPTURED:
+            if ev['id'] in self.anomalies:
+                self.anomalies[ev['id']]['capture'] = ev['capture']
+            return
+        self.anomalies[ev['id']] = ev
+        names = {'throughput_drop': "吞吐下降", 'loss_burst': "突发丢包", 'jitter_spike': "抖动尖峰"}
+        open_ = [a for a in self.anomalies.values() if a['phase'] == PHASE_START]
+        latest = open_[-1] if open_ else ev
+        text = f"{len(self.anomalies)} ({names[latest['kind']]}{' 进行中' if open_ else ''})"
+        self.lbl_anomaly.configure(text=text, foreground=self.colors['warning'] if open_ else self.colors['fg'])
+
+    def _apply_tcp(self, v):
+        """各流 TCP 指标 (Run 计算): 累计重传 / 风暴数、cwnd 与 RTT、Jain 公平性与份额"""
+        if v['total_retransmits'] is not None:
+            self.lbl_retr.configure(text=f"{v['total_retransmits']} / {v['storms']}"
+                                         + (" (风暴中)" if v['storm'] else ""))
+        if v['rtt_ms'] is not None or v['cwnd'] is not None:
+            cwnd = f"{v['cwnd'] / 1024:.0f} KB" if v['cwnd'] is not None else "-"
+            rtt = f"{v['rtt_ms']:.2f}" if v['rtt_ms'] is not None else "-"
+            var = f" ±{v['rttvar_ms']:.2f}" if v['rttvar_ms'] is not None else ""
+            self.lbl_tcp_path.configure(text=f"{cwnd} / {rtt}{var} ms")
+        if v['jain'] is not None:
+            self.lbl_fairness.configure(
+                text=f"{v['jain']:.3f} / {v['min_share'] * 100:.0f}-{v['max_share'] * 100:.0f}%")
+
+    def _on_storm(self, ev):
+        """重传风暴开始标红，结束恢复 (日志行由 Run 输出)"""
+        color = self.colors['warning'] if ev['phase'] == STORM_START else self.colors['fg']
+        self.lbl_retr.configure(foreground=color)
 
     def _on_finished(self, code):
         self.running = False
@@ -508,20 +757,39 @@ class IperfApp:
 
     def _generate_summary_report(self):
         s = self.stats
-        if s['count'] == 0: return
+        ser = self.run.series if self.run is not None else None
+        if ser is None or ser.agg_count == 0: return
 
-        avg = s['total_mbps'] / s['count']
+        avg = ser.agg_sum_bps / ser.agg_count / 1e6
+        dist = self.run.stats       # 与网页端 'stats' 事件同一个 RunStats
+        bw = dist.throughput.summary(scale=1e6)
         lines = [
             "\n========= 测试汇总 =========",
             f"平均带宽: {avg:.2f} Mbps",
-            f"峰值带宽: {s['max_mbps']:.2f} Mbps",
+            f"峰值带宽: {ser.agg_max_bps / 1e6:.2f} Mbps",
+            f"带宽分位: P1 {bw['p1']:.2f} | P5 {bw['p5']:.2f} | P50 {bw['p50']:.2f} | "
+            f"P95 {bw['p95']:.2f} | P99 {bw['p99']:.2f} Mbps",
+            f"带宽波动: 标准差 {bw['stdev']:.2f} Mbps, 变异系数 {(bw['cv'] or 0) * 100:.1f}%",
         ]
+        jit = dist.jitter.summary()
+        if jit['count']:
+            lines.append(f"抖动分布: P50 {jit['p50']:.3f} | P95 {jit['p95']:.3f} | "
+                         f"P99 {jit['p99']:.3f} | 最大 {jit['max']:.3f} ms")
         
         if self.protocol_var.get() == 'udp' and s['jitter_count'] > 0:
             avg_jit = s['total_jitter'] / s['jitter_count']
             loss_rate = (s['total_lost'] / s['total_packets'] * 100) if s['total_packets'] else 0
             lines.append(f"平均抖动: {avg_jit:.3f} ms")
             lines.append(f"丢包情况: {s['total_lost']}/{s['total_packets']} ({loss_rate:.2f}%)")
+        elif self.protocol_var.get() == 'tcp':
+            lines.append(f"重传次数: {s['total_retr']}")
+        # 多流公平性与重传风暴 (逐流明细见上方 [TCP] 日志行)
+        tcp = self.run.tcp.summary() if self.run is not None and self.run.tcp.intervals else None
+        if tcp is not None and tcp['jain'] is not None:
+            lines.append(f"流公平性: Jain {tcp['jain']:.3f}, 份额 {tcp['min_share'] * 100:.1f}%"
+                         f" - {tcp['max_share'] * 100:.1f}% ({len(tcp['streams'])} 条流)")
+        if tcp is not None and tcp['retransmits'] is not None:
+            lines.append(f"重传风暴: {len(tcp['storms'])} 次")
             
         lines.append("===========================\n")
         text = "\n".join(lines)
@@ -532,14 +800,202 @@ class IperfApp:
         inv_state = 'normal' if running else 'disabled'
         self.btn_start.configure(state=state)
         self.btn_stop.configure(state=inv_state)
+        self.btn_bp_manual.configure(state=inv_state)
 
     # ---------------- 功能逻辑 ----------------
 
     def stop_test(self):
-        if self.process and self.running:
-            self.process.terminate()
+        if self.run and self.running:
+            self.run_manager.stop(self.run.id)
             self._append_log("\n[User] 请求停止...\n")
 
+    def toggle_rate_search(self):
+        if self.search is not None:
+            self.search.cancel()
+            self._append_log("\n[User] 请求取消速率搜索...\n")
+            return
+        if self.running or self.sweep is not None or self.mesh is not None:
+            messagebox.showwarning("提示", "请先停止当前测试")
+            return
+        iperf_exe, missing = self.check_dependencies()
+        if missing:
+            messagebox.showerror("组件缺失", "\n".join(missing))
+            return
+        try:
+            spec = self._form_spec()
+            self.search = RateSearch(self.run_manager, spec,
+                                     start=self.udp_bw_entry.get().strip() or '100M',
+                                     loss_target=float(self.udp_loss_entry.get()),
+                                     jitter_ceiling=self.udp_jitter_entry.get().strip() or None,
+                                     exe=iperf_exe, listener=self._on_search_event)
+        except ValueError as e:
+            messagebox.showerror("配置错误", str(e))
+            return
+        self.btn_search.configure(text="取消搜索")
+        self.btn_start.configure(state='disabled')
+        self._append_log(f"--- UDP 最大速率搜索: 丢包 <= {self.search.loss_target:g}% ---\n")
+        self.search.start()
+
+    def _on_search_event(self, kind, payload):
+        """RateSearch 回调 (搜索线程) -> UI 队列"""
+        if kind == 'probe':
+            self.queue.put(('log', format_probe(payload) + "\n"))
+        else:
+            self.queue.put(('ratesearch', payload))
+
+    def _on_search_done(self, result):
+        self.search = None
+        self.btn_search.configure(text="自动搜索最大速率")
+        self.btn_start.configure(state='normal')
+        best = result['max_rate_bps']
+        if best:
+            self.udp_bw_entry.delete(0, tk.END)
+            self.udp_bw_entry.insert(0, format_rate(best))
+        status = {'done': "完成", 'cancelled': "已取消"}.get(result['state'], f"失败 ({result['error']})")
+        self._append_log(f"--- 搜索{status}: 最大可持续速率 "
+                         f"{format_rate(best) + 'bits/sec' if best else '未找到'} "
+                         f"({len(result['probes'])} 次探测"
+                         f"{'' if result['converged'] else ', 未收敛'}) ---\n")
+
+    def _form_spec(self):
+        """表单 -> 运行规格 (速率搜索与参数扫描共用)"""
+        return normalize_spec({
+            'server': self.server_ip.get(), 'port': self.server_port.get().strip(),
+            'interval': self.interval.get().strip(), 'direction': self.direction_var.get(),
+            'protocol': self.protocol_var.get(), 'bandwidth': self.udp_bw_entry.get().strip(),
+            'parallel': self.parallel.get().strip(), 'window': self.window.get().strip(),
+            'length': self.length.get().strip(), 'omit': self.omit.get().strip(),
+            'zerocopy': self.zerocopy_var.get(),
+        })
+
+    def toggle_sweep(self):
+        if self.sweep is not None:
+            self.sweep.cancel()
+            self._append_log("\n[User] 请求取消参数扫描...\n")
+            return
+        if self.running or self.search is not None or self.mesh is not None:
+            messagebox.showwarning("提示", "请先停止当前测试")
+            return
+        iperf_exe, missing = self.check_dependencies()
+        if missing:
+            messagebox.showerror("组件缺失", "\n".join(missing))
+            return
+        grid = {'parallel': self.sweep_parallel_entry.get(), 'window': self.sweep_window_entry.get()}
+        grid = {k: v for k, v in grid.items() if v.strip()}
+        try:
+            spec = self._form_spec()
+            self.sweep = Sweep(self.run_manager, [spec], grid,
+                               duration=int(self.sweep_duration_entry.get()),
+                               exe=iperf_exe, listener=self._on_sweep_event)
+        except ValueError as e:
+            messagebox.showerror("配置错误", str(e))
+            return
+        self.btn_sweep.configure(text="取消扫描")
+        self.btn_start.configure(state='disabled')
+        self._append_log(f"--- 参数扫描: {self.sweep.total_cells} 格, 每格 {self.sweep.duration}s ---\n")
+        self.sweep.start()
+
+    def _on_sweep_event(self, kind, payload):
+        """Sweep 回调 (扫描线程) -> UI 队列"""
+        if kind == 'cell':
+            self.queue.put(('log', format_cell(payload, self.sweep.total_cells) + "\n"))
+        else:
+            self.queue.put(('sweep', payload))
+
+    def _on_sweep_done(self, result):
+        self.sweep = None
+        self.btn_sweep.configure(text="开始扫描")
+        self.btn_start.configure(state='normal')
+        status = {'done': "完成", 'cancelled': "已取消"}.get(result['state'], f"失败 ({result['error']})")
+        lines = [f"--- 扫描{status} ---"] + format_table(result)
+        for target, heatmap in result['heatmaps'].items():
+            lines.append(f"热力图 {target} (Mbps)")
+            lines.extend(format_heatmap(heatmap))
+        self._append_log("\n".join(lines) + "\n")
+
+    def toggle_mesh(self):
+        if self.mesh is not None:
+            self.mesh.cancel()
+            self._append_log("\n[User] 请求取消全互联测试...\n")
+            return
+        if self.running or self.search is not None or self.sweep is not None:
+            messagebox.showwarning("提示", "请先停止当前测试")
+            return
+        iperf_exe, missing = self.check_dependencies()
+        if missing:
+            messagebox.showerror("组件缺失", "\n".join(missing))
+            return
+        spec = {
+            'port': self.server_port.get().strip(), 'interval': self.interval.get().strip(),
+            'protocol': self.protocol_var.get(), 'bandwidth': self.udp_bw_entry.get().strip(),
+            'parallel': self.parallel.get().strip(), 'window': self.window.get().strip(),
+            'length': self.length.get().strip(), 'omit': self.omit.get().strip(),
+            'zerocopy': self.zerocopy_var.get(),
+        }
+        try:
+            self.mesh = Mesh(self.run_manager, self.mesh_hosts_entry.get(), spec,
+                             duration=int(self.mesh_duration_entry.get()),
+                             duplex=self.mesh_duplex_var.get(),
+                             exe=iperf_exe, listener=self._on_mesh_event)
+        except ValueError as e:
+            messagebox.showerror("配置错误", str(e))
+            return
+        self.btn_mesh.configure(text="取消全互联")
+        self.btn_start.configure(state='disabled')
+        self._append_log(f"--- 全互联测试: {len(self.mesh.hosts)} 台主机, {self.mesh.total_pairs} 对, "
+                         f"{len(self.mesh.rounds)} 轮, 每对 {self.mesh.duration}s ---\n")
+        self.mesh.start()
+
+    def _on_mesh_event(self, kind, payload):
+        """Mesh 回调 (测试线程) -> UI 队列"""
+        if kind == 'round':
+            self.queue.put(('log', f"[Mesh] 第 {payload['index']}/{payload['total']} 轮: "
+                                   + ", ".join(payload['pairs']) + "\n"))
+        elif kind == 'pair':
+            self.queue.put(('log', format_pair(payload, len(self.mesh.rounds)) + "\n"))
+        else:
+            self.queue.put(('mesh', payload))
+
+    def _on_mesh_done(self, result):
+        self.mesh = None
+        self.btn_mesh.configure(text="开始全互联")
+        self.btn_start.configure(state='normal')
+        status = {'done': "完成", 'cancelled': "已取消"}.get(result['state'], f"失败 ({result['error']})")
+        lines = [f"--- 全互联{status} ---", "吞吐量矩阵 (Mbps, 行发送 -> 列接收)"] + format_matrix(result)
+        if result['protocol'] == 'udp':
+            lines += ["丢包矩阵 (%)"] + format_matrix(result, 'loss_percent', '.3f')
+        self._append_log("\n".join(lines) + "\n")
+
+    def toggle_pool(self):
+        if self.pool is not None:
+            self.pool.stop()
+            self.run_manager.attach_pool(None)
+            self.pool = None
+            self.btn_pool.configure(text="启动服务端池")
+            self.lbl_pool.configure(text="未启动")
+            return
+        iperf_exe, missing = self.check_dependencies()
+        if missing and self.pool_backend_var.get() == 'iperf3':
+            messagebox.showerror("组件缺失", "\n".join(missing))
+            return
+        try:
+            self.pool = ServerPool(size=int(self.pool_size_entry.get()),
+                                   base_port=int(self.pool_port_entry.get()),
+                                   backend=self.pool_backend_var.get(), exe=iperf_exe,
+                                   listener=self._on_pool_event)
+        except ValueError as e:
+            messagebox.showerror("配置错误", str(e))
+            return
+        self.run_manager.attach_pool(self.pool.start())
+        self.btn_pool.configure(text="停止服务端池")
+
+    def _on_pool_event(self, kind, payload):
+        """ServerPool 回调 (监控线程) -> UI 队列"""
+        if kind == 'text':
+            self.queue.put(('log', payload + "\n"))
+        else:
+            self.queue.put(('pool', payload))
+
     def start_breakpoint_test(self):
         if not self.running:
             messagebox.showwarning("提示", "请先启动主测试")
@@ -548,17 +1004,27 @@ class IperfApp:
             self.breakpoint_interval = float(self.bp_interval_entry.get())
         except:
             self.breakpoint_interval = 5.0
+        mode = self.bp_mode_var.get()
+        try:
+            self.run.start_breakpoints(self.breakpoint_interval, mode)
+        except ValueError as e:
+            messagebox.showerror("错误", str(e))
+            return
             
         self.breakpoint_active = True
-        elapsed = time.time() - self.start_time
-        self.next_breakpoint_time = elapsed + self.breakpoint_interval
-        
         self.btn_bp_start.configure(state='disabled')
         self.btn_bp_stop.configure(state='normal')
-        self.txt_bp_log.insert(tk.END, f"--- 开始记录 (间隔:{self.breakpoint_interval}s) ---\n")
+        self.txt_bp_log.insert(tk.END, f"--- 开始记录 (间隔:{self.breakpoint_interval}s, 模式:{mode}) ---\n")
+
+    def manual_breakpoint(self):
+        # 断点经 Run 的 'breakpoint' 事件回到 UI 队列
+        if self.run is not None and self.run.breakpoint_snapshot() is None:
+            self.txt_bp_log.insert(tk.END, "--- 尚无区间数据 ---\n")
 
     def stop_breakpoint_test(self):
         self.breakpoint_active = False
+        if self.run is not None:
+            self.run.stop_breakpoints()
         self.btn_bp_start.configure(state='normal')
         self.btn_bp_stop.configure(state='disabled')
         
@@ -567,16 +1033,26 @@ class IperfApp:
             self.txt_bp_log.insert(tk.END, f"--- 记录结束 (平均: {avg:.2f} Mbps) ---\n")
 
     def clear_data(self, clear_ui=True):
-        self.log_data = []
+        self.log_data = collections.deque(maxlen=LOG_CACHE_LINES)
+        self.log_since = time.time()
         self.breakpoint_data = []
         self.bp_recorded_values = []
         self.stats = self.reset_stats()
+        if not self.running:
+            self.run = None         # 区间数据属于 Run，清空后不再导出上一次测试
+        self.anomalies = {}
+        self.lbl_anomaly.configure(text="0", foreground=self.colors['fg'])
+        for lbl in (self.lbl_retr, self.lbl_tcp_path, self.lbl_fairness):
+            lbl.configure(text="-", foreground=self.colors['fg'])
+        self.chart.clear()
         
         if clear_ui:
             self.txt_main_log.delete(1.0, tk.END)
             self.txt_bp_log.delete(1.0, tk.END)
             self.lbl_avg_bw.configure(text="-")
             self.lbl_max_bw.configure(text="-")
+            for lbl in (self.lbl_pct_bw, self.lbl_stdev_bw, self.lbl_p1_bw, self.lbl_jitter):
+                lbl.configure(text="-")
             self.progress_var.set(0)
             self.lbl_status.configure(text="就绪", foreground=self.colors['fg'])
 
@@ -585,13 +1061,40 @@ class IperfApp:
         path = filedialog.asksaveasfilename(initialfile=fname, defaultextension=".txt")
         if not path: return
         
-        content = "".join(self.log_data) if type_ == 'main' else "".join(self.breakpoint_data)
         try:
-            with open(path, 'w', encoding='utf-8') as f: f.write(content)
+            if type_ == 'main' and self.journal is not None:
+                # 从日志存档流式导出，长时间测试也不丢行
+                with open(path, 'wb') as f:
+                    for chunk in self.journal.export(self.log_since):
+                        f.write(chunk)
+            else:
+                content = "".join(self.log_data) if type_ == 'main' else "".join(self.breakpoint_data)
+                with open(path, 'w', encoding='utf-8') as f: f.write(content)
             messagebox.showinfo("保存成功", path)
         except Exception as e:
             messagebox.showerror("错误", str(e))
 
+    def export_series(self):
+        """区间采样流式导出: 按扩展名选 CSV / NDJSON，.gz 结尾则边写边压缩"""
+        ser = self.run.series if self.run is not None else None
+        if ser is None or not len(ser):
+            messagebox.showinfo("提示", "暂无区间数据")
+            return
+        fname = f"iperf_intervals_{datetime.now().strftime('%H%M%S')}.csv"
+        path = filedialog.asksaveasfilename(
+            initialfile=fname, defaultextension=".csv",
+            filetypes=[("CSV", "*.csv"), ("NDJSON", "*.ndjson"), ("gzip", "*.gz"), ("全部", "*.*")])
+        if not path: return
+        gz = path.endswith('.gz')
+        fmt = 'ndjson' if path[:-3 if gz else None].endswith(('.ndjson', '.jsonl')) else 'csv'
+        try:
+            with open(path, 'wb') as f:
+                for block in export_series(ser, fmt, stream=None, gzip=gz):
+                    f.write(block)
+            messagebox.showinfo("导出成功", path)
+        except Exception as e:
+            messagebox.showerror("错误", str(e))
+
 if __name__ == "__main__":
     root = tk.Tk()
     app = IperfApp(root)
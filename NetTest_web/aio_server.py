@@ -0,0 +1,256 @@
+"""Single-threaded asyncio HTTP/SSE server for the dashboard.
+
+Serves the same routes as ``main.RequestHandler`` (the static assets, the
+SSE streams and the ``/api/*`` calls) on one event loop, so hundreds of
+browsers can hold a ``/stream`` open without an OS thread each. Only the standard library is used.
+
+``backend`` is the ``main`` module: this file owns the transport, ``main``
+owns state (``broadcaster``, ``manager``) and behaviour (``handle_api``,
+``stream_source``).
+"""
+import asyncio
+import json
+import weakref
+
+from NetTest_core.broadcaster import parse_last_event_id
+
+MAX_HEADER_BYTES = 64 * 1024
+MAX_BODY_BYTES = 1024 * 1024
+
+_REASONS = {200: 'OK', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found',
+            405: 'Method Not Allowed', 413: 'Payload Too Large'}
+
+
+class HttpError(Exception):
+    def __init__(self, status, msg=''):
+        super().__init__(msg)
+        self.status = status
+
+
+class Request:
+    __slots__ = ('method', 'path', 'query', 'headers', 'body')
+
+    def __init__(self, method, path, query, headers, body):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.headers = headers      # lower-cased names
+        self.body = body
+
+    def json(self):
+        if not self.body:
+            return {}
+        try:
+            return json.loads(self.body.decode('utf-8'))
+        except ValueError:
+            raise HttpError(400, "Invalid JSON body")
+
+
+async def read_request(reader):
+    """Parse one HTTP/1.x request, or return None if the peer went away."""
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError:
+        return None
+    except asyncio.LimitOverrunError:
+        raise HttpError(413, "Header too large")
+    lines = head.decode('latin-1').split("\r\n")
+    try:
+        method, target, _version = lines[0].split(" ", 2)
+    except ValueError:
+        raise HttpError(400, "Bad request line")
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    path, _, query = target.partition('?')
+    body = b''
+    length = int(headers.get('content-length') or 0)
+    if length > MAX_BODY_BYTES:
+        raise HttpError(413, "Body too large")
+    if length:
+        body = await reader.readexactly(length)
+    return Request(method.upper(), path, query, headers, body)
+
+
+def response_head(status, content_type=None, length=None, extra=None):
+    head = f"HTTP/1.1 {status} {_REASONS.get(status, 'OK')}\r\n"
+    if content_type:
+        head += f"Content-Type: {content_type}\r\n"
+    if length is not None:
+        head += f"Content-Length: {length}\r\n"
+    for name, value in (extra or {}).items():
+        head += f"{name}: {value}\r\n"
+    return (head + "\r\n").encode('latin-1')
+
+
+class Waker:
+    """Wakes every waiting SSE coroutine after a publish, from any thread.
+
+    One shared future per "generation": publishing resolves it and installs
+    a fresh one, so the broadcaster calls us once no matter how many clients
+    are attached, and a burst of publishes coalesces into a single wake-up.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.future = loop.create_future()
+        self._pending = False
+
+    def notify(self, _seq=None):
+        # Runs on the publishing thread; hop onto the loop only once per burst
+        if not self._pending:
+            self._pending = True
+            self.loop.call_soon_threadsafe(self._fire)
+
+    def _fire(self):
+        self._pending = False
+        fut, self.future = self.future, self.loop.create_future()
+        fut.set_result(None)
+
+    async def wait(self, timeout):
+        try:
+            await asyncio.wait_for(asyncio.shield(self.future), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+class AsyncServer:
+    def __init__(self, backend):
+        self.backend = backend
+        self.loop = None
+        self._wakers = weakref.WeakKeyDictionary()  # broadcaster -> Waker
+        self.clients = 0            # attached SSE subscribers
+
+    async def start(self, host, port):
+        self.loop = asyncio.get_running_loop()
+        self.backend.use_event_loop(self.loop)
+        return await asyncio.start_server(self._handle, host, port,
+                                          limit=MAX_HEADER_BYTES, reuse_address=True,
+                                          backlog=1024)
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    req = await read_request(reader)
+                except HttpError as e:
+                    await self._send_json(writer, e.status, {"status": "error", "msg": str(e)})
+                    break
+                if req is None:
+                    break
+                source = self.backend.stream_source(req.path) if req.method == 'GET' else None
+                if source is not None:
+                    await self._stream(req, writer, source)
+                    break
+                await self._dispatch(req, writer)
+                if req.headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, req, writer):
+        if req.method in ('GET', 'HEAD') and req.path in self.backend.static_files:
+            await self._send_static(req, writer)
+        elif req.method == 'GET' and req.path == '/metrics':
+            body = self.backend.metrics_text()
+            writer.write(response_head(200, self.backend.METRICS_CONTENT_TYPE, len(body)) + body)
+            await writer.drain()
+        elif req.method in ('GET', 'POST') and req.path.startswith('/api/'):
+            try:
+                data = req.json() if req.method == 'POST' else self.backend.query_params(req.query)
+                download = self.backend.download_source(req.path, data) if req.method == 'GET' else None
+            except HttpError as e:
+                await self._send_json(writer, e.status, {"status": "error", "msg": str(e)})
+                return
+            except ValueError as e:
+                await self._send_json(writer, 200, {"status": "error", "msg": str(e)})
+                return
+            if download is not None:
+                await self._send_download(writer, *download)
+                return
+            # handlers may block (pool stop joins threads and waits for servers,
+            # history queries hit SQLite): keep them off the event loop, which
+            # also carries every SSE client and the iperf3 output
+            result = await self.loop.run_in_executor(None, self.backend.handle_api,
+                                                     req.method, req.path, data)
+            await self._send_json(writer, 200, result)
+        elif req.method not in ('GET', 'POST'):
+            await self._send_json(writer, 405, {"status": "error", "msg": "Method not allowed"})
+        else:
+            await self._send_json(writer, 404, {"status": "error", "msg": "Not found"})
+
+    async def _send_json(self, writer, status, obj):
+        body = json.dumps(obj).encode('utf-8')
+        writer.write(response_head(status, 'application/json', len(body)) + body)
+        await writer.drain()
+
+    async def _send_download(self, writer, content_type, filename, chunks):
+        # chunked, so the connection stays usable; chunks come from disk, so read
+        # them off the event loop
+        writer.write(response_head(200, content_type, extra={
+            'Content-Disposition': f'attachment; filename="{filename}"',
+            'Transfer-Encoding': 'chunked'}))
+        while True:
+            chunk = await self.loop.run_in_executor(None, next, chunks, None)
+            if not chunk:
+                break
+            writer.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+            await writer.drain()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    async def _send_static(self, req, writer):
+        status, headers, body = self.backend.static_files.respond(
+            req.path, req.headers, head=req.method == 'HEAD')
+        writer.write(response_head(status, extra=headers) + body)
+        await writer.drain()
+
+    def _waker_for(self, broadcaster):
+        waker = self._wakers.get(broadcaster)
+        if waker is None:
+            waker = self._wakers[broadcaster] = Waker(self.loop)
+            broadcaster.add_listener(waker.notify)
+        return waker
+
+    async def _stream(self, req, writer, broadcaster):
+        waker = self._waker_for(broadcaster)
+        writer.write(response_head(200, 'text/event-stream', extra={
+            'Cache-Control': 'no-cache', 'Connection': 'keep-alive'}))
+        writer.write(b"retry: 2000\n\n")
+
+        # Same resume rules as the threaded handler
+        last_seq = parse_last_event_id(req.headers.get('last-event-id'))
+        if last_seq is None or last_seq > broadcaster.last_seq:
+            last_seq = broadcaster.last_seq
+            history = broadcaster.tail(self.backend.SSE_HISTORY_LINES)
+        else:
+            history = broadcaster.since(last_seq)
+
+        self.clients += 1
+        self.backend.sse_clients.inc()
+        try:
+            while True:
+                if history:
+                    writer.write("".join(m.to_sse() for m in history).encode('utf-8'))
+                    last_seq = max(last_seq, history[-1].seq)
+                    await writer.drain()
+                if broadcaster.last_seq <= last_seq:
+                    if not await waker.wait(self.backend.SSE_KEEPALIVE):
+                        writer.write(b": keep-alive\n\n")
+                        await writer.drain()
+                history = broadcaster.since(last_seq)
+        finally:
+            self.clients -= 1
+            self.backend.sse_clients.dec()
+
+
+async def serve(host, port, backend):
+    server = AsyncServer(backend)
+    tcp = await server.start(host, port)
+    async with tcp:
+        await tcp.serve_forever()
@@ -1,14 +1,30 @@
+import asyncio
 import http.server
 import socketserver
 import os
 import sys
 import threading
-import subprocess
 import time
 import json
-import webbrowser
 # import signal
 
+# Shared core package lives one level up (NetTest_core)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from NetTest_core.broadcaster import Broadcaster, parse_last_event_id
+from NetTest_core.export import CONTENT_TYPES as EXPORT_TYPES, export_filename, export_series
+from NetTest_core.history import HistoryDB
+from NetTest_core.iperf_stream import detect_output_mode
+from NetTest_core.journal import FRONTEND_MAX_BYTES, Journal, default_journal_dir
+from NetTest_core.mesh import Mesh, format_matrix, format_pair
+from NetTest_core.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, REGISTRY
+from NetTest_core.ratesearch import RateSearch, format_probe, format_rate
+from NetTest_core.rollup import METRICS as ROLLUP_METRICS
+from NetTest_core.runs import RunManager, asyncio_launcher, build_command, log_prefix, normalize_spec
+from NetTest_core.server_pool import ServerPool, format_pool
+from NetTest_core.sweep import Sweep, format_cell, format_heatmap, format_table
+from NetTest_core.tsstore import COLUMN_NAMES
+from static_assets import StaticFiles
+
 # --- Helper for PyInstaller paths ---
 def get_resource_path(relative_path):
     """Get absolute path to resource, works for dev and for PyInstaller"""
@@ -35,231 +51,728 @@ def get_resource_path(relative_path):
 # Configuration
 PORT = 8000
 HTML_FILE = get_resource_path("front-end.html")
+static_files = StaticFiles(os.path.dirname(HTML_FILE))  # allow-listed assets, cached in memory
+
+SSE_HISTORY_LINES = 50      # log lines replayed to a fresh (non-resuming) client
+SSE_KEEPALIVE = 15.0        # seconds between keep-alive comments on an idle stream
 
 # Global state
-iperf_process = None
-running = False
-log_history = []
-msg_queue = []  # Queue for SSE messages
+broadcaster = Broadcaster(capacity=10000)  # ring buffer feeding /stream
+manager = RunManager(max_concurrent=4)     # every iperf3 process runs through here
+dashboard_run = None                       # the run driven by the page's start/stop buttons
+history = None                             # HistoryDB once open_history() succeeded
+journal = None                             # Journal of the main log once open_journal() succeeded
+searches = {}                              # UDP max-rate searches by id
+sweeps = {}                                # parameter sweeps by id
+meshes = {}                                # all-pairs mesh tests by id
+pool = None                                # ServerPool of local iperf3 servers, if started
+sse_clients = REGISTRY.gauge('nettest_sse_clients', 'Attached SSE subscribers (all streams)')
 
 def add_log(message):
-    """Add log to history and queue for SSE"""
-    global log_history, msg_queue
-    timestamp = time.strftime("[%Y-%m-%d %H:%M:%S] ", time.localtime())
-    full_msg = timestamp + message
-    log_history.append(full_msg)
-    # Keep history size reasonable
-    if len(log_history) > 5000:
-        log_history = log_history[-5000:]
-    msg_queue.append(full_msg)
-    # Prevent memory leak in msg_queue (limit to 10000)
-    if len(msg_queue) > 10000:
-        msg_queue = msg_queue[-10000:]
-
-def run_iperf_thread(cmd_list):
-    """Execution thread handling Windows/Linux differences"""
-    global iperf_process, running
-
-    running = True
-    add_log(f"Starting command: {' '.join(cmd_list)}")
-    
-    is_windows = sys.platform == 'win32'
+    """Publish a timestamped log line to SSE subscribers"""
+    broadcaster.publish(log_prefix() + message)
+
+def iperf_executable():
+    """Bundled iperf3 if present, else whatever is on PATH"""
+    iperf_exe = "iperf3.exe" if sys.platform == 'win32' else "iperf3"
+    iperf_path = get_resource_path(iperf_exe)
+    if os.path.exists(iperf_path):
+        return iperf_path
+    print(f"[Warning] Bundled {iperf_exe} not found at {iperf_path}, using system PATH.")
+    return iperf_exe
+
+def resolve_command(cmd_str):
+    """Split a command string and point a bare 'iperf3' at the bundled binary"""
+    # Also asks iperf3 for --json-stream (or -J) so results arrive as records
+    return build_command({'command': cmd_str}, iperf_executable())
+
+def open_history(path=None):
+    """Open the results database and save every finished run into it"""
+    global history
+    try:
+        history = HistoryDB(path)
+    except Exception as e:
+        print(f"[Warning] Results history disabled: {e}")
+        return None
+    manager.add_finish_hook(history.record_run)
+    print(f"Results history: {history.path}")
+    return history
+
+def open_journal(directory=None):
+    """Record everything published to the main log in an on-disk journal"""
+    global journal
+    try:
+        if directory:
+            journal = Journal(directory)
+        else:
+            # one directory for every launch, oldest segments dropped past the cap
+            journal = Journal(default_journal_dir('web'), max_bytes=FRONTEND_MAX_BYTES)
+    except OSError as e:
+        print(f"[Warning] Log journal disabled: {e}")
+        return None
+    broadcaster.add_sink(journal)
+    print(f"Log journal: {journal.directory}")
+    return journal
+
+def close_journal():
+    if journal is not None:
+        journal.close()
+
+def use_event_loop(loop):
+    """Called by the asyncio server: run iperf3 on its loop instead of threads"""
+    manager.launcher = asyncio_launcher(loop)
+
+def shutdown_soon():
+    try:
+        asyncio.get_running_loop().call_later(1, os._exit, 0)
+    except RuntimeError:
+        def kill_server():
+            time.sleep(1)
+            os._exit(0)
+        threading.Thread(target=kill_server, daemon=True).start()
+
+def stream_source(path):
+    """Broadcaster behind an SSE path, or None"""
+    if path == '/stream':
+        return broadcaster
+    parts = path.strip('/').split('/')
+    if len(parts) == 4 and parts[:2] == ['api', 'runs'] and parts[3] == 'stream':
+        run = manager.get(parts[2])
+        return run.broadcaster if run else None
+    return None
+
+def download_source(path, params):
+    """(content type, file name, bytes chunks) behind a download path, or None.
+    Raises ValueError for bad parameters."""
+    if path == '/api/journal/export':
+        if journal is None:
+            raise ValueError("Log journal disabled")
+        fmt = params.get('format', 'text')
+        chunks = journal.export(time_param(params, 'from'), time_param(params, 'to'), fmt)
+        ctype = 'text/plain; charset=utf-8' if fmt == 'text' else 'application/x-ndjson'
+        name = f"nettest-log-{time.strftime('%Y%m%d-%H%M%S')}.{'txt' if fmt == 'text' else 'ndjson'}"
+        return ctype, name, chunks
+    parts = path.strip('/').split('/')
+    if len(parts) == 4 and parts[:2] == ['api', 'runs'] and parts[3] == 'export':
+        run = manager.get(parts[2])
+        if run is None:
+            raise ValueError("Unknown run")
+        return run_export(run, params)
+    return None
+
+def run_export(run, params):
+    """?format=csv|ndjson&gzip=1&from=&to=&key=ts|end&stream=-1|all&columns=a,b"""
+    def num(name):
+        v = params.get(name)
+        return float(v) if v not in (None, '') else None
+    fmt = params.get('format', 'csv')
+    gz = params.get('gzip', '') not in ('', '0', 'false')
+    stream = params.get('stream', '-1')
+    columns = tuple(c for c in params.get('columns', '').split(',') if c) or COLUMN_NAMES
+    chunks = export_series(run.series, fmt, num('from'), num('to'), key=params.get('key', 'ts'),
+                           stream=None if stream == 'all' else int(stream), columns=columns, gzip=gz)
+    ctype = 'application/gzip' if gz else EXPORT_TYPES[fmt]
+    return ctype, export_filename(f"nettest-run-{run.id}", fmt, gz), chunks
+
+def time_param(params, name):
+    """Epoch seconds from a query parameter (negative = that many seconds ago)"""
+    v = params.get(name)
+    if v in (None, ''):
+        return None
+    try:
+        v = float(v)
+    except ValueError:
+        raise ValueError(f"'{name}' must be epoch seconds")
+    return time.time() + v if v < 0 else v
+
+def query_params(query):
+    """'a=1&b=2' -> {'a': '1', 'b': '2'} (GET parameters for handle_api)"""
+    from urllib.parse import parse_qsl
+    return dict(parse_qsl(query))
+
+def json_number(v):
+    # NaN marks a missing value in the series store; JSON has no NaN
+    return None if v != v else v
+
+def series_query(series, params):
+    """Column-wise range query: ?from=&to=&key=ts|end&stream=-1|all&columns=a,b"""
+    def num(name):
+        v = params.get(name)
+        return float(v) if v not in (None, '') else None
+    stream = params.get('stream', '-1')
+    columns = tuple(c for c in params.get('columns', '').split(',') if c) or COLUMN_NAMES
+    try:
+        cols = series.range(num('from'), num('to'), key=params.get('key', 'ts'),
+                            stream=None if stream == 'all' else int(stream), columns=columns)
+    except (KeyError, ValueError) as e:
+        return {"status": "error", "msg": f"Bad query: {e}"}
+    return {"status": "ok", "rows": len(cols[columns[0]]),
+            "columns": {name: [json_number(v) for v in col] for name, col in cols.items()}}
+
+def rollup_query(run, params):
+    """Chart history at screen resolution: ?points=&from=&to= (test seconds)&metrics=a,b"""
+    if run is None:
+        return {"status": "error", "msg": "No run"}
+    def num(name):
+        v = params.get(name)
+        return float(v) if v not in (None, '') else None
+    try:
+        metrics = tuple(m for m in params.get('metrics', '').split(',') if m) or ROLLUP_METRICS
+        rollup = run.rollup.query(num('from'), num('to'), int(params.get('points') or 1000), metrics)
+    except ValueError as e:
+        return {"status": "error", "msg": f"Bad query: {e}"}
+    return {"status": "ok", "run": run.id, "state": run.state, "rollup": rollup}
+
+def breakpoint_api(run, method, data):
+    """GET: sampler state and points; POST {action: start|stop|snapshot, period, mode}"""
+    if run is None:
+        return {"status": "error", "msg": "No run"}
+    if method == 'GET':
+        return {"status": "ok", "breakpoints": run.breakpoint_state(points=True)}
+    action = data.get('action', 'start')
+    if action == 'start':
+        if not run.active:
+            return {"status": "error", "msg": "Not running"}
+        try:
+            run.start_breakpoints(float(data.get('period', 5)), data.get('mode', 'fixed'))
+        except (TypeError, ValueError) as e:
+            return {"status": "error", "msg": str(e)}
+        return {"status": "ok", "msg": "Sampling", "breakpoints": run.breakpoint_state()}
+    if action == 'stop':
+        run.stop_breakpoints()
+        return {"status": "ok", "msg": "Stopped", "breakpoints": run.breakpoint_state()}
+    if action == 'snapshot':
+        point = run.breakpoint_snapshot()
+        if point is None:
+            return {"status": "error", "msg": "No interval yet"}
+        return {"status": "ok", "point": point}
+    return {"status": "error", "msg": "Unknown action"}
+
+def handle_runs_api(method, parts, data):
+    """/api/runs[/<id>[/stop|/series|/rollup|/tcp|/breakpoints|/anomalies]]"""
+    if len(parts) == 2:
+        if method == 'GET':
+            return {"status": "ok", "max_concurrent": manager.max_concurrent,
+                    "runs": [r.summary() for r in manager.runs()]}
+        specs = data.get('specs')
+        if specs is None:
+            specs = [data] if ('server' in data or 'command' in data or data.get('pool')) else []
+        try:
+            if not isinstance(specs, list):
+                raise ValueError("specs must be a list")
+            if 'max_concurrent' in data:
+                try:
+                    limit = int(data['max_concurrent'])
+                except (TypeError, ValueError):
+                    raise ValueError("max_concurrent must be a number")
+                manager.set_max_concurrent(limit)
+            # every spec is validated before any is started
+            runs = manager.submit_specs(specs, iperf_executable())
+        except (TypeError, ValueError) as e:
+            return {"status": "error", "msg": str(e)}
+        return {"status": "ok", "msg": f"Submitted {len(runs)} run(s)",
+                "ids": [r.id for r in runs], "max_concurrent": manager.max_concurrent}
+
+    run = manager.get(parts[2])
+    if run is None:
+        return {"status": "error", "msg": "Unknown run"}
+    if len(parts) == 3 and method == 'GET':
+        return {"status": "ok", "run": run.summary()}
+    if len(parts) == 4 and parts[3] == 'series' and method == 'GET':
+        return series_query(run.series, data)
+    if len(parts) == 4 and parts[3] == 'rollup' and method == 'GET':
+        return rollup_query(run, data)
+    if len(parts) == 4 and parts[3] == 'breakpoints':
+        return breakpoint_api(run, method, data)
+    if len(parts) == 4 and parts[3] == 'anomalies' and method == 'GET':
+        return {"status": "ok", "anomalies": run.anomalies}
+    if len(parts) == 4 and parts[3] == 'tcp' and method == 'GET':
+        return {"status": "ok", "tcp": run.tcp.summary(), "last": run.tcp.last}
+    if len(parts) == 4 and parts[3] == 'stop' and method == 'POST':
+        if manager.stop(run.id):
+            return {"status": "ok", "msg": "Stopping..."}
+        return {"status": "error", "msg": "Not running"}
+    return {"status": "error", "msg": "Unknown endpoint"}
+
+def run_results(run):
+    """(throughput bps, jitter ms, loss %) of a run: latest interval while it runs,
+    test averages / receiver totals once it has finished"""
+    ser = run.series
+    if run.active:
+        last = run.last
+        if last is None:
+            return None, None, None
+        return last.bits_per_second, last.jitter_ms, last.lost_percent
+    bps = ser.agg_sum_bps / ser.agg_count if ser.agg_count else None
+    jitter = loss = None
+    for rec in run.summary_records:
+        if rec.stream is None and rec.jitter_ms is not None:
+            jitter, loss = rec.jitter_ms, rec.lost_percent
+    if jitter is None and run.last is not None:
+        jitter, loss = run.last.jitter_ms, run.last.lost_percent
+    return bps, jitter, loss
+
+def collect_metrics():
+    """Scrape-time metrics: per-run results and server internals"""
+    runs = manager.runs()
+    current = {'throughput': [], 'jitter': [], 'loss': [], 'retr': []}
+    last_by_server = {}
+    states = {}
+    for run in runs:
+        states[run.state] = states.get(run.state, 0) + 1
+        server = f"{run.target[0]}:{run.target[1]}" if run.target else ''
+        if run.active:
+            if run.started is None:
+                continue
+            bps, jitter, loss = run_results(run)
+            labels = {'run': run.id, 'server': server, 'label': run.spec.get('label', '')}
+            current['throughput'].append((labels, bps))
+            current['jitter'].append((labels, jitter))
+            current['loss'].append((labels, loss))
+            current['retr'].append((labels, run.retransmits))
+        elif run.finished and run.started and (
+                server not in last_by_server or run.finished > last_by_server[server].finished):
+            last_by_server[server] = run
+
+    last = {'throughput': [], 'jitter': [], 'loss': [], 'retr': [], 'finished': []}
+    for server, run in last_by_server.items():
+        bps, jitter, loss = run_results(run)
+        labels = {'server': server, 'run': run.id}
+        last['throughput'].append((labels, bps))
+        last['jitter'].append((labels, jitter))
+        last['loss'].append((labels, loss))
+        last['retr'].append((labels, run.retransmits))
+        last['finished'].append((labels, run.finished))
+
+    channels = [({'channel': 'stream'}, broadcaster)] + [
+        ({'channel': f"run:{r.id}"}, r.broadcaster) for r in runs if r.active]
+    return [
+        ('nettest_run_throughput_bits_per_second', 'gauge',
+         'Latest interval throughput of each running test', current['throughput']),
+        ('nettest_run_jitter_ms', 'gauge', 'Latest UDP jitter of each running test', current['jitter']),
+        ('nettest_run_loss_percent', 'gauge', 'Latest UDP loss of each running test', current['loss']),
+        ('nettest_run_retransmits', 'gauge', 'TCP retransmits so far in each running test', current['retr']),
+        ('nettest_last_run_throughput_bits_per_second', 'gauge',
+         'Average throughput of the last finished run per server', last['throughput']),
+        ('nettest_last_run_jitter_ms', 'gauge', 'UDP jitter of the last finished run per server',
+         last['jitter']),
+        ('nettest_last_run_loss_percent', 'gauge', 'UDP loss of the last finished run per server',
+         last['loss']),
+        ('nettest_last_run_retransmits', 'gauge', 'TCP retransmits of the last finished run per server',
+         last['retr']),
+        ('nettest_last_run_finished_timestamp_seconds', 'gauge',
+         'When the last run per server finished', last['finished']),
+        ('nettest_runs', 'gauge', 'Runs known to the scheduler by state',
+         [({'state': k}, v) for k, v in sorted(states.items())]),
+        ('nettest_runs_max_concurrent', 'gauge', 'Scheduler concurrency limit',
+         [({}, manager.max_concurrent)]),
+        ('nettest_broadcast_buffered_messages', 'gauge',
+         'Messages held in the SSE ring buffer (queue depth)',
+         [(labels, b.last_seq - b.oldest_seq() + 1) for labels, b in channels]),
+        ('nettest_broadcast_published_total', 'counter', 'Messages published to an SSE channel',
+         [(labels, b.last_seq) for labels, b in channels]),
+        ('nettest_broadcast_dropped_total', 'counter',
+         'Messages overwritten before a slow subscriber read them',
+         [(labels, b.dropped) for labels, b in channels]),
+    ]
+
+REGISTRY.add_collector(collect_metrics)
+
+def metrics_text():
+    return REGISTRY.render().encode('utf-8')
+
+RATESEARCH_OPTIONS = ('start', 'min_rate', 'max_rate', 'loss_target', 'jitter_ceiling',
+                      'probe_duration', 'resolution', 'max_probes')
+
+def publish_ratesearch(kind, payload):
+    """Probe results go to the main log and, structured, as 'ratesearch' events"""
+    if kind == 'probe':
+        add_log(format_probe(payload))
+    else:
+        best = payload['max_rate_bps']
+        add_log(f"[Rate search] {payload['state']}: max sustainable rate "
+                f"{format_rate(best) + 'bits/sec' if best else 'not found'}"
+                + (f" ({payload['error']})" if payload['error'] else ""))
+    broadcaster.publish(json.dumps({'kind': kind, 'data': payload}), event='ratesearch')
+
+def handle_ratesearch_api(method, parts, data):
+    """/api/ratesearch[/<id>[/cancel]]"""
+    if len(parts) == 2:
+        if method == 'GET':
+            return {"status": "ok", "searches": [s.result() for s in searches.values()]}
+        try:
+            spec = normalize_spec(dict(data, protocol='udp'))
+            options = {k: data[k] for k in RATESEARCH_OPTIONS if data.get(k) not in (None, '')}
+            search = RateSearch(manager, spec, exe=iperf_executable(),
+                                listener=publish_ratesearch, **options)
+        except (TypeError, ValueError) as e:
+            return {"status": "error", "msg": str(e)}
+        searches[search.id] = search
+        add_log(f"[Rate search] {spec['server']}:{spec['port']} {spec['direction']}, "
+                f"loss <= {search.loss_target:g}%"
+                + (f", jitter <= {search.jitter_ceiling:g} ms" if search.jitter_ceiling else ""))
+        search.start()
+        return {"status": "ok", "msg": "Searching", "id": search.id}
+
+    search = searches.get(parts[2])
+    if search is None:
+        return {"status": "error", "msg": "Unknown search"}
+    if len(parts) == 3 and method == 'GET':
+        return {"status": "ok", "search": search.result()}
+    if len(parts) == 4 and parts[3] == 'cancel' and method == 'POST':
+        search.cancel()
+        return {"status": "ok", "msg": "Cancelling..."}
+    return {"status": "error", "msg": "Unknown endpoint"}
+
+def publish_sweep(sweep, kind, payload):
+    """Cell results and the final ranking/heatmaps go to the main log and as 'sweep' events"""
+    if kind == 'cell':
+        add_log(format_cell(payload, sweep.total_cells))
+    else:
+        add_log(f"[Sweep] {payload['state']}" + (f" ({payload['error']})" if payload['error'] else ""))
+        for line in format_table(payload):
+            add_log(line)
+        for target, heatmap in payload['heatmaps'].items():
+            add_log(f"Sweep heatmap for {target} (Mbps)")
+            for line in format_heatmap(heatmap):
+                add_log(line)
+    broadcaster.publish(json.dumps({'kind': kind, 'data': payload}), event='sweep')
+
+def handle_sweep_api(method, parts, data):
+    """/api/sweep[/<id>[/cancel]]"""
+    if len(parts) == 2:
+        if method == 'GET':
+            return {"status": "ok", "sweeps": [s.result() for s in sweeps.values()]}
+        # one spec per host pair: 'specs', or 'servers' sharing the remaining fields
+        servers = data.get('servers')
+        if isinstance(servers, str):
+            servers = [h.strip() for h in servers.split(',') if h.strip()]
+        raw = data.get('specs') or [dict(data, server=h) for h in servers or ()] or [data]
+        try:
+            specs = [normalize_spec(spec) for spec in raw]
+            sweep = Sweep(manager, specs, data.get('grid'),
+                          duration=data.get('duration') or 10,
+                          prune_ratio=data.get('prune_ratio', 0.6),
+                          heatmap=data.get('heatmap') or ('parallel', 'window'),
+                          exe=iperf_executable(),
+                          listener=lambda kind, payload: publish_sweep(sweep, kind, payload))
+        except (TypeError, ValueError) as e:
+            return {"status": "error", "msg": str(e)}
+        sweeps[sweep.id] = sweep
+        add_log(f"[Sweep] {sweep.total_cells} cells over {len(specs)} target(s), "
+                f"{sweep.duration}s each, grid {json.dumps(sweep.grid)}")
+        sweep.start()
+        return {"status": "ok", "msg": "Sweeping", "id": sweep.id, "cells": sweep.total_cells}
+
+    sweep = sweeps.get(parts[2])
+    if sweep is None:
+        return {"status": "error", "msg": "Unknown sweep"}
+    if len(parts) == 3 and method == 'GET':
+        return {"status": "ok", "sweep": sweep.result()}
+    if len(parts) == 4 and parts[3] == 'cancel' and method == 'POST':
+        sweep.cancel()
+        return {"status": "ok", "msg": "Cancelling..."}
+    return {"status": "error", "msg": "Unknown endpoint"}
+
+def publish_mesh(mesh, kind, payload):
+    """Pair results and the final matrices go to the main log and as 'mesh' events"""
+    if kind == 'round':
+        add_log(f"[Mesh] round {payload['index']}/{payload['total']}: " + ', '.join(payload['pairs']))
+    elif kind == 'pair':
+        add_log(format_pair(payload, len(mesh.rounds)))
+    else:
+        add_log(f"[Mesh] {payload['state']}" + (f" ({payload['error']})" if payload['error'] else ""))
+        add_log("Mesh throughput (Mbps), rows send to columns")
+        for line in format_matrix(payload):
+            add_log(line)
+        if payload['protocol'] == 'udp':
+            add_log("Mesh loss (%)")
+            for line in format_matrix(payload, 'loss_percent', '.3f'):
+                add_log(line)
+    broadcaster.publish(json.dumps({'kind': kind, 'data': payload}), event='mesh')
+
+def handle_mesh_api(method, parts, data):
+    """/api/mesh[/<id>[/cancel]]"""
+    if len(parts) == 2:
+        if method == 'GET':
+            return {"status": "ok", "meshes": [m.result() for m in meshes.values()]}
+        spec = {k: v for k, v in data.items() if k not in ('hosts', 'duration', 'duplex')}
+        try:
+            mesh = Mesh(manager, data.get('hosts'), spec,
+                        duration=data.get('duration') or 10, duplex=data.get('duplex'),
+                        exe=iperf_executable(),
+                        listener=lambda kind, payload: publish_mesh(mesh, kind, payload))
+        except (TypeError, ValueError) as e:
+            return {"status": "error", "msg": str(e)}
+        meshes[mesh.id] = mesh
+        add_log(f"[Mesh] {len(mesh.hosts)} hosts, {mesh.total_pairs} pairs in {len(mesh.rounds)} rounds, "
+                f"{mesh.duration}s each")
+        mesh.start()
+        return {"status": "ok", "msg": "Running", "id": mesh.id, "rounds": len(mesh.rounds)}
+
+    mesh = meshes.get(parts[2])
+    if mesh is None:
+        return {"status": "error", "msg": "Unknown mesh"}
+    if len(parts) == 3 and method == 'GET':
+        return {"status": "ok", "mesh": mesh.result()}
+    if len(parts) == 4 and parts[3] == 'cancel' and method == 'POST':
+        mesh.cancel()
+        return {"status": "ok", "msg": "Cancelling..."}
+    return {"status": "error", "msg": "Unknown endpoint"}
+
+POOL_OPTIONS = ('size', 'base_port', 'port_range', 'host', 'backend')
+
+def publish_pool(kind, payload):
+    """Pool messages go to the main log, status changes out as 'pool' events"""
+    if kind == 'text':
+        add_log(payload)
+    else:
+        broadcaster.publish(json.dumps(payload), event='pool')
+
+def start_pool(**options):
+    """(Re)start the local server pool and hand its ports to pooled runs"""
+    global pool
+    options = {k: v for k, v in options.items() if v not in (None, '')}
+    new = ServerPool(exe=iperf_executable(), listener=publish_pool, **options)  # validate first
+    stop_pool()
+    pool = new.start()
+    manager.attach_pool(pool)
+    add_log(f"[Pool] {format_pool(pool.status())}")
+    return pool
+
+def stop_pool():
+    global pool
+    if pool is not None:
+        pool.stop()
+        manager.attach_pool(None)
+        pool = None
+
+def handle_pool_api(method, parts, data):
+    """/api/pool[/stop|/<port>/restart]"""
+    if len(parts) == 2:
+        if method == 'GET':
+            return {"status": "ok", "pool": pool.status() if pool is not None else None}
+        try:
+            start_pool(**{k: data.get(k) for k in POOL_OPTIONS})
+        except (TypeError, ValueError) as e:
+            return {"status": "error", "msg": str(e)}
+        return {"status": "ok", "msg": format_pool(pool.status()), "pool": pool.status()}
+    if method != 'POST':
+        return {"status": "error", "msg": "Unknown endpoint"}
+    if len(parts) == 3 and parts[2] == 'stop':
+        if pool is None:
+            return {"status": "error", "msg": "Pool not running"}
+        stop_pool()
+        return {"status": "ok", "msg": "Pool stopped"}
+    if len(parts) == 4 and parts[3] == 'restart':
+        if pool is None or not parts[2].isdigit() or not pool.restart(int(parts[2])):
+            return {"status": "error", "msg": "Unknown pool server"}
+        return {"status": "ok", "msg": "Restarting...", "pool": pool.status()}
+    return {"status": "error", "msg": "Unknown endpoint"}
+
+def handle_history_api(method, parts, data):
+    """/api/history[/trend|/servers|/<id>/samples] (GET, filters as query params)"""
+    if history is None:
+        return {"status": "error", "msg": "History disabled"}
+    if method != 'GET':
+        return {"status": "error", "msg": "Unknown endpoint"}
+    filters = {k: data.get(k) or None for k in ('server', 'protocol', 'direction')}
+    try:
+        if len(parts) == 2:
+            days = data.get('days')
+            since = time.time() - float(days) * 86400 if days else None
+            runs = history.query_runs(since=since, limit=int(data.get('limit', 100)),
+                                      offset=int(data.get('offset', 0)), **filters)
+            return {"status": "ok", "runs": runs}
+        if len(parts) == 3 and parts[2] == 'trend':
+            return {"status": "ok", "days": history.trend(days=float(data.get('days', 30)), **filters)}
+        if len(parts) == 3 and parts[2] == 'servers':
+            return {"status": "ok", "servers": history.servers()}
+        if len(parts) == 4 and parts[3] == 'samples':
+            return {"status": "ok", "samples": history.run_samples(int(parts[2]))}
+    except ValueError as e:
+        return {"status": "error", "msg": f"Bad query: {e}"}
+    return {"status": "error", "msg": "Unknown endpoint"}
+
+def handle_api(method, path, data):
+    """/api/* dispatch shared by the threaded and asyncio servers"""
+    global dashboard_run
     
-    # Packaged iperf3 needs its directory in PATH to find bundled DLLs (cygwin1.dll)
-    my_env = os.environ.copy()
-    if cmd_list and len(cmd_list) > 0 and os.path.isabs(cmd_list[0]):
-        exe_dir = os.path.dirname(cmd_list[0])
-        my_env["PATH"] = exe_dir + os.pathsep + my_env.get("PATH", "")
+    parts = path.strip('/').split('/')
+    if len(parts) >= 2 and parts[1] == 'runs':
+        return handle_runs_api(method, parts, data)
+    if len(parts) >= 2 and parts[1] == 'history':
+        return handle_history_api(method, parts, data)
+    if len(parts) >= 2 and parts[1] == 'ratesearch':
+        return handle_ratesearch_api(method, parts, data)
+    if len(parts) >= 2 and parts[1] == 'sweep':
+        return handle_sweep_api(method, parts, data)
+    if len(parts) >= 2 and parts[1] == 'mesh':
+        return handle_mesh_api(method, parts, data)
+    if len(parts) >= 2 and parts[1] == 'pool':
+        return handle_pool_api(method, parts, data)
+    if path == '/api/journal' and method == 'GET':
+        if journal is None:
+            return {"status": "error", "msg": "Log journal disabled"}
+        return {"status": "ok", "journal": journal.info(), "segments": journal.segments()}
+    if path == '/api/breakpoints':
+        return breakpoint_api(dashboard_run, method, data)
+    if path == '/api/rollup' and method == 'GET':
+        return rollup_query(dashboard_run, data)
+    if method != 'POST':
+        return {"status": "error", "msg": "Unknown endpoint"}
+
+    response = {"status": "ok", "msg": ""}
     
-    try:
-        if is_windows:
-            # WINDOWS: Use startupinfo to hide window, standard PIPE
-            startupinfo = subprocess.STARTUPINFO()
-            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-            
-            # Windows buffering needs specific handling or just standard polling
-            iperf_process = subprocess.Popen(
-                cmd_list,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                stdin=subprocess.DEVNULL, # 改为 DEVNULL 防止 Bad file descriptor
-                startupinfo=startupinfo,
-                text=True,
-                bufsize=1,  # Line buffering
-                creationflags=subprocess.CREATE_NO_WINDOW,
-                encoding='utf-8', # 强制 UTF-8
-                errors='replace',  # 忽略编码错误
-                env=my_env
-            )
-            
-            # Read line by line
-            while iperf_process and iperf_process.poll() is None:
-                line = iperf_process.stdout.readline()
-                if line:
-                    add_log(line.strip())
+    if path == '/api/start':
+        if dashboard_run is not None and dashboard_run.active:
+            response = {"status": "error", "msg": "Already running"}
         else:
-            # LINUX/MACOS: Switch between PTY and PIPE based on availability
-            # PTY is preferred for line buffering behavior in some tools
+            # The page's own test is mirrored into the global /stream
+            cmd = resolve_command(data.get('command', 'iperf3 -v'))
             try:
-                import pty
-                master_fd, slave_fd = pty.openpty()
-                
-                iperf_process = subprocess.Popen(
-                    cmd_list,
-                    stdout=slave_fd,
-                    stderr=slave_fd,
-                    stdin=subprocess.PIPE,
-                    text=True,
-                    close_fds=True
-                )
-                os.close(slave_fd) # Close slave in parent
-                
-                # Read from master_fd
-                master_file = os.fdopen(master_fd, 'r', encoding='utf-8', errors='replace')
-                
-                while iperf_process and iperf_process.poll() is None:
-                    try:
-                        # Blocking read creates issues if process dies, so we use select or simple readline in thread
-                        # os.read allows us to read partial chunks without waiting for newlines if needed,
-                        # but here we prefer lines.
-                        line = master_file.readline()
-                        if line:
-                            add_log(line.strip())
-                        else:
-                            break
-                    except (IOError, OSError):
-                        break
-            except ImportError:
-                # Fallback if pty not available
-                iperf_process = subprocess.Popen(
-                     cmd_list,
-                     stdout=subprocess.PIPE,
-                     stderr=subprocess.STDOUT,
-                     text=True,
-                     bufsize=1
-                )
-                while iperf_process and iperf_process.poll() is None:
-                    line = iperf_process.stdout.readline()
-                    if line:
-                        add_log(line.strip())
-                    
-    except Exception as e:
-        add_log(f"Execution Error: {str(e)}")
-    finally:
-        running = False
-        add_log("Process finished.")
-        iperf_process = None
+                if data.get('pool'):
+                    dashboard_run = manager.submit_pooled(cmd, channels=(broadcaster,))
+                else:
+                    dashboard_run = manager.submit(cmd, channels=(broadcaster,))
+            except ValueError as e:
+                return {"status": "error", "msg": str(e)}
+            msg = "Queued (server:port busy)" if manager.is_pending(dashboard_run) else "Started"
+            response = {"status": "ok", "msg": msg, "id": dashboard_run.id, "ts": time.time(),
+                        "target": "%s:%d" % dashboard_run.target if dashboard_run.target else None}
+            
+    elif path == '/api/stop':
+        if dashboard_run is not None and manager.stop(dashboard_run.id):
+            response = {"status": "ok", "msg": "Stopping..."}
+        else:
+             response = {"status": "error", "msg": "Not running"}
+
+    elif path == '/api/clear':
+        broadcaster.clear()
+        response = {"status": "ok", "msg": "Cleared"}
+
+    elif path == '/api/shutdown':
+        manager.stop_all()
+        stop_pool()
+        close_journal()
+        shutdown_soon()
+        response = {"status": "ok", "msg": "Shutting down"}
+
+    return response
 
-class RequestHandler(http.server.SimpleHTTPRequestHandler):
+class RequestHandler(http.server.BaseHTTPRequestHandler):
     def do_GET(self):
-        if self.path == '/':
+        path, _, query = self.path.partition('?')
+        if path == '/metrics':
+            body = metrics_text()
             self.send_response(200)
-            self.send_header('Content-type', 'text/html')
+            self.send_header('Content-Type', METRICS_CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
             self.end_headers()
-            if os.path.exists(HTML_FILE):
-                with open(HTML_FILE, 'rb') as f:
-                    self.wfile.write(f.read())
-            else:
-                self.wfile.write(b"Error: front-end.html not found.")
+            self.wfile.write(body)
             return
-            
-        elif self.path == '/stream':
-            self.send_response(200)
-            self.send_header('Content-type', 'text/event-stream')
-            self.send_header('Cache-Control', 'no-cache')
-            self.send_header('Connection', 'keep-alive')
-            self.end_headers()
-            
-            # Send initial history
-            # (Optional: send only recent lines to avoid huge payload on reconnect)
-            for line in log_history[-50:]: 
-                self.wfile.write(f"data: {line}\n\n".encode('utf-8'))
-            self.wfile.flush()
-                
-            last_idx = len(msg_queue)
-            
+
+        source = stream_source(path)
+        if source is not None:
+            self._serve_sse(source)
+            return
+
+        if path.startswith('/api/'):
+            params = query_params(query)
             try:
-                while True:
-                    # Check for new messages
-                    current_len = len(msg_queue)
-                    if current_len > last_idx:
-                        for i in range(last_idx, current_len):
-                            msg = msg_queue[i]
-                            # Sanitize msg Newlines for SSE compatibility (data: ... \n\n)
-                            # Or just assume single line? iperf sometimes outputs multi lines?
-                            # Usually readline gives single line.
-                            self.wfile.write(f"data: {msg}\n\n".encode('utf-8'))
-                        self.wfile.flush()
-                        last_idx = current_len
-                    time.sleep(0.1)
-            except (ConnectionAbortedError, BrokenPipeError):
-                pass
+                download = download_source(path, params)
+            except ValueError as e:
+                self._send_json({"status": "error", "msg": str(e)})
+                return
+            if download is not None:
+                self._send_download(*download)
+                return
+            self._send_json(handle_api('GET', path, params))
             return
 
-        # Serve other static files if needed
-        return super().do_GET()
+        self._send_static(path)
 
-    def do_POST(self):
-        content_length = int(self.headers['Content-Length'])
-        post_data = self.rfile.read(content_length)
-        data = json.loads(post_data.decode('utf-8'))
-        
-        # Declare globals at the top of the function to avoid SyntaxError
-        global iperf_process, log_history, msg_queue, running
-        
-        response = {"status": "ok", "msg": ""}
+    def do_HEAD(self):
+        self._send_static(self.path.partition('?')[0], head=True)
+
+    def _send_download(self, content_type, filename, chunks):
+        # Chunked for HTTP/1.1 clients (length unknown up front); the
+        # connection closes afterwards either way, like every response here
+        chunked = self.request_version == 'HTTP/1.1'
+        if chunked:
+            self.protocol_version = 'HTTP/1.1'
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Disposition', f'attachment; filename="{filename}"')
+        if chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        try:
+            for chunk in chunks:
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk) if chunked else chunk)
+            if chunked:
+                self.wfile.write(b"0\r\n\r\n")
+        except (ConnectionAbortedError, BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _send_static(self, path, head=False):
+        # Only allow-listed assets; nothing else on disk is reachable
+        status, headers, body = static_files.respond(path, self.headers, head=head)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if 'Content-Length' not in headers and status != 304:
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def _serve_sse(self, source):
+        self.send_response(200)
+        self.send_header('Content-type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'keep-alive')
+        self.end_headers()
         
-        if self.path == '/api/start':
-            if running:
-                response = {"status": "error", "msg": "Already running"}
-            else:
-                cmd_str = data.get('command', 'iperf3 -v')
-                import shlex
-                cmd_parts = shlex.split(cmd_str)
-                
-                # --- Resolve iperf3 path ---
-                iperf_exe = "iperf3.exe" if sys.platform == 'win32' else "iperf3"
-                iperf_path = get_resource_path(iperf_exe)
-                
-                if cmd_parts and cmd_parts[0] == 'iperf3':
-                    if os.path.exists(iperf_path):
-                        cmd_parts[0] = iperf_path
-                    else:
-                        print(f"[Warning] Bundled {iperf_exe} not found at {iperf_path}, using system PATH.")
-
-                t = threading.Thread(target=run_iperf_thread, args=(cmd_parts,), daemon=True)
-                t.start()
-                response = {"status": "ok", "msg": "Started"}
-                
-        elif self.path == '/api/stop':
-            if iperf_process:
-                try:
-                    iperf_process.terminate()
-                    response = {"status": "ok", "msg": "Stopping..."}
-                except Exception as e:
-                    response = {"status": "warning", "msg": f"Process already stopped or error: {e}"}
+        # A reconnecting browser resumes exactly after its Last-Event-ID;
+        # a fresh client gets the recent log lines, then live messages.
+        last_seq = parse_last_event_id(self.headers.get('Last-Event-ID'))
+        sse_clients.inc()
+        try:
+            # (an id newer than anything we hold means the server restarted)
+            if last_seq is None or last_seq > source.last_seq:
+                last_seq = source.last_seq
+                history = source.tail(SSE_HISTORY_LINES)
             else:
-                 response = {"status": "error", "msg": "Not running"}
+                history = source.since(last_seq)
+            self.wfile.write(b"retry: 2000\n\n")
+            while True:
+                if history:
+                    self.wfile.write("".join(m.to_sse() for m in history).encode('utf-8'))
+                    last_seq = max(last_seq, history[-1].seq)
+                    self.wfile.flush()
+                # Sleep on the broadcaster condition until something is published
+                if not source.wait(last_seq, timeout=SSE_KEEPALIVE):
+                    self.wfile.write(b": keep-alive\n\n")
+                    self.wfile.flush()
+                history = source.since(last_seq)
+        except (ConnectionAbortedError, BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            sse_clients.dec()
 
-        elif self.path == '/api/clear':
-            log_history = []
-            msg_queue = []
-            response = {"status": "ok", "msg": "Cleared"}
-
-        elif self.path == '/api/shutdown':
-            if iperf_process:
-                try:
-                    iperf_process.terminate()
-                except Exception:
-                    pass
-            
-            def kill_server():
-                time.sleep(1)
-                os._exit(0)
-            
-            threading.Thread(target=kill_server, daemon=True).start()
-            response = {"status": "ok", "msg": "Shutting down"}
+    def do_POST(self):
+        content_length = int(self.headers.get('Content-Length') or 0)
+        post_data = self.rfile.read(content_length)
+        try:
+            data = json.loads(post_data.decode('utf-8')) if post_data else {}
+        except ValueError:
+            data = {}
+        
+        self._send_json(handle_api('POST', self.path.split('?', 1)[0], data))
 
+    def _send_json(self, response):
         self.send_response(200)
         self.send_header('Content-type', 'application/json')
         self.end_headers()
@@ -269,28 +782,86 @@ class RequestHandler(http.server.SimpleHTTPRequestHandler):
         # Silence default server logging to console to keep it clean
         pass
 
+def make_threaded_server(host, port):
+    """ThreadingTCPServer to handle SSE (long polling) and API requests concurrently"""
+    socketserver.ThreadingTCPServer.allow_reuse_address = True
+    socketserver.ThreadingTCPServer.daemon_threads = True
+    # The default backlog of 5 stalls a burst of connecting browsers for ~1 s
+    socketserver.ThreadingTCPServer.request_queue_size = 128
+    return socketserver.ThreadingTCPServer((host, port), RequestHandler)
+
 def open_browser():
+    import webbrowser   # not needed (and slow to import) on headless hosts
     time.sleep(1)
     webbrowser.open(f'http://localhost:{PORT}')
 
-if __name__ == '__main__':
+def main(argv=None):
+    """Parse arguments and serve until interrupted (also used by ``NetTest_cli daemon``)"""
+    global PORT
+    import argparse
+    ap = argparse.ArgumentParser(description="iPerf3 web dashboard backend")
+    ap.add_argument('--host', default='localhost',
+                    help="address to bind (default localhost; 0.0.0.0 to serve the network)")
+    ap.add_argument('--port', type=int, default=PORT)
+    ap.add_argument('--threaded', action='store_true',
+                    help="legacy ThreadingTCPServer (one thread per client) instead of asyncio")
+    ap.add_argument('--no-browser', action='store_true')
+    ap.add_argument('--max-runs', type=int, default=manager.max_concurrent,
+                    help="how many iperf3 runs may execute at the same time")
+    ap.add_argument('--history-db', default=None,
+                    help="SQLite results database (default ~/.nettest/history.sqlite3)")
+    ap.add_argument('--no-history', action='store_true', help="don't save finished runs")
+    ap.add_argument('--pool', type=int, default=0, metavar='N',
+                    help="start N local iperf3 servers for runs submitted with 'pool'")
+    ap.add_argument('--pool-base-port', type=int, default=5201)
+    ap.add_argument('--pool-backend', choices=('iperf3', 'builtin'), default='iperf3',
+                    help="iperf3 -s processes or the built-in Python server")
+    ap.add_argument('--no-anomaly', action='store_true', help="turn off throughput/loss/jitter anomaly detection")
+    ap.add_argument('--no-capture', action='store_true',
+                    help="detect anomalies but don't save the interval window around them to disk")
+    ap.add_argument('--journal-dir', default=None,
+                    help="main log journal directory (default ~/.nettest/journal/web, capped at 1 GB)")
+    ap.add_argument('--no-journal', action='store_true', help="keep the main log in memory only")
+    args = ap.parse_args(argv)
+    PORT = args.port
+    manager.set_max_concurrent(args.max_runs)
+    if args.no_anomaly:
+        manager.anomaly = None
+    elif args.no_capture:
+        manager.anomaly = {'capture': False}
+    if not args.no_history:
+        open_history(args.history_db)
+    if not args.no_journal:
+        open_journal(args.journal_dir)
+    if args.pool:
+        start_pool(size=args.pool, base_port=args.pool_base_port, backend=args.pool_backend)
+    # probe `iperf3 -v` now (cached) so the first /api/runs does not block on it
+    print(f"iperf3 output mode: {detect_output_mode(iperf_executable())}")
+
     # Ensure CWD is script directory - DISABLED for PyInstaller compatibility
     # os.chdir(os.path.dirname(os.path.abspath(__file__)))
     
-    print(f"Starting lightweight server on http://localhost:{PORT}")
+    print(f"Starting lightweight server on http://{args.host}:{PORT}")
     print("Press Ctrl+C to exit")
     
     # Launch browser in separate thread
-    threading.Thread(target=open_browser, daemon=True).start()
-    
-    # Use ThreadingTCPServer to handle SSE (long polling) and API requests concurrently
-    socketserver.ThreadingTCPServer.allow_reuse_address = True
+    if not args.no_browser:
+        threading.Thread(target=open_browser, daemon=True).start()
     
     try:
-        # Bind to localhost for security
-        with socketserver.ThreadingTCPServer(("localhost", PORT), RequestHandler) as httpd:
-            httpd.serve_forever()
+        if args.threaded:
+            # Binds to localhost unless --host says otherwise
+            with make_threaded_server(args.host, PORT) as httpd:
+                httpd.serve_forever()
+        else:
+            # Single event loop: HTTP, every SSE subscriber and the iperf3 pipe
+            from aio_server import serve
+            asyncio.run(serve(args.host, PORT, sys.modules[__name__]))
     except KeyboardInterrupt:
         print("\nShutting down...")
-        if iperf_process:
-            iperf_process.terminate()
+        manager.stop_all()
+        stop_pool()
+        close_journal()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""Cached, precompressed static assets for both dashboard servers.
+
+Only the allow-listed ``ASSETS`` are served; any other path is a 404, so the
+working directory is never exposed. Each file is read once and kept in
+memory with a gzip copy (and a brotli copy when the optional ``brotli``
+package is installed). The file is stat()ed at most once per
+``check_interval`` seconds and reloaded if its mtime or size changed.
+
+Responses carry a strong ETag (one per encoding) and ``Cache-Control:
+no-cache``: browsers revalidate on every load and get a bodiless 304 while
+the page is unchanged.
+"""
+import gzip
+import hashlib
+import os
+import threading
+import time
+
+try:
+    import brotli           # optional, not in the standard library
+except ImportError:
+    brotli = None
+
+# URL path -> (file name next to main.py, content type)
+ASSETS = {
+    '/': ('front-end.html', 'text/html; charset=utf-8'),
+    '/index.html': ('front-end.html', 'text/html; charset=utf-8'),
+}
+
+MIN_COMPRESS_BYTES = 512    # smaller bodies go out as-is
+
+
+class Asset:
+    """One file in memory: raw bytes plus precompressed copies."""
+
+    __slots__ = ('path', 'content_type', 'mtime', 'size', 'bodies', 'etags', 'checked')
+
+    def __init__(self, path, content_type):
+        self.path = path
+        self.content_type = content_type
+        self.mtime = None
+        self.size = None
+        self.bodies = {}            # encoding -> bytes ('identity', 'gzip', 'br')
+        self.etags = {}             # encoding -> quoted ETag
+        self.checked = 0.0
+
+    def load(self, st):
+        with open(self.path, 'rb') as f:
+            raw = f.read()
+        digest = hashlib.sha1(raw).hexdigest()[:16]
+        bodies = {'identity': raw}
+        if len(raw) >= MIN_COMPRESS_BYTES:
+            # mtime=0 keeps the gzip bytes (and so the ETag) stable across reloads
+            bodies['gzip'] = gzip.compress(raw, compresslevel=9, mtime=0)
+            if brotli is not None:
+                bodies['br'] = brotli.compress(raw)
+        self.bodies = {enc: body for enc, body in bodies.items()
+                       if enc == 'identity' or len(body) < len(raw)}
+        self.etags = {enc: f'"{digest}"' if enc == 'identity' else f'"{digest}-{enc}"'
+                      for enc in self.bodies}
+        self.mtime, self.size = st.st_mtime_ns, st.st_size
+
+
+def accepted_encodings(header):
+    """Codings a client accepts (q > 0), from an Accept-Encoding value."""
+    out = set()
+    for part in (header or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if coding and q > 0:
+            out.add(coding)
+    if '*' in out:
+        out.update(('gzip', 'br'))
+    return out
+
+
+def etag_matches(header, etags):
+    """True if an If-None-Match value names any of ``etags`` (or is ``*``)."""
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    # weak comparison, as RFC 9110 asks for If-None-Match
+    tags = {t.strip().removeprefix('W/') for t in header.split(',')}
+    return not tags.isdisjoint(etags)
+
+
+class StaticFiles:
+    """Answer GET/HEAD for the allow-listed assets from memory."""
+
+    def __init__(self, base_dir, assets=None, check_interval=1.0):
+        self.base_dir = base_dir
+        self.check_interval = check_interval
+        self._assets = {url: Asset(os.path.join(base_dir, name), ctype)
+                        for url, (name, ctype) in (assets or ASSETS).items()}
+        self._lock = threading.Lock()
+
+    def __contains__(self, url):
+        return url in self._assets
+
+    def _current(self, asset):
+        """The asset, reloaded if the file changed; None if it is missing."""
+        now = time.monotonic()
+        if asset.mtime is not None and now - asset.checked < self.check_interval:
+            return asset
+        with self._lock:
+            if asset.mtime is not None and now - asset.checked < self.check_interval:
+                return asset
+            try:
+                st = os.stat(asset.path)
+                if (st.st_mtime_ns, st.st_size) != (asset.mtime, asset.size):
+                    asset.load(st)
+            except OSError:
+                asset.mtime = None
+                return None
+            asset.checked = now
+            return asset
+
+    def respond(self, url, headers, head=False):
+        """``(status, headers, body)`` for ``url``; ``headers`` is a mapping
+        with ``get()`` (case-insensitive names, or lower-cased ones)."""
+        asset = self._assets.get(url)
+        if asset is None:
+            return 404, {'Content-Type': 'text/plain; charset=utf-8'}, b"Not found"
+        asset = self._current(asset)
+        if asset is None:
+            name = os.path.basename(self._assets[url].path)
+            return 404, {'Content-Type': 'text/plain; charset=utf-8'}, f"Error: {name} not found.".encode()
+        accepted = accepted_encodings(headers.get('accept-encoding'))
+        encoding = next((enc for enc in ('br', 'gzip') if enc in accepted and enc in asset.bodies),
+                        'identity')
+        out = {
+            'Content-Type': asset.content_type,
+            'ETag': asset.etags[encoding],
+            'Cache-Control': 'no-cache',
+            'Vary': 'Accept-Encoding',
+        }
+        if etag_matches(headers.get('if-none-match'), asset.etags.values()):
+            return 304, out, b""
+        if encoding != 'identity':
+            out['Content-Encoding'] = encoding
+        body = asset.bodies[encoding]
+        out['Content-Length'] = str(len(body))
+        return 200, out, b"" if head else body
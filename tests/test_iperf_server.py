@@ -0,0 +1,286 @@
+"""IperfServer over loopback, driven through iperf3's control-channel protocol.
+
+``Client`` below is the client half of the handshake as iperf_client_api.c
+runs it: cookie, PARAM_EXCHANGE, CREATE_STREAMS (TCP connections carrying
+the cookie, or the UDP connect datagram), TEST_START / TEST_RUNNING,
+TEST_END, EXCHANGE_RESULTS both ways, DISPLAY_RESULTS and IPERF_DONE.
+``RealClientTest`` runs a stock iperf3 client as well when one is installed.
+"""
+import json
+import shutil
+import socket
+import struct
+import subprocess
+import threading
+import time
+import unittest
+import uuid
+
+from NetTest_core import iperf_server as srv
+
+HOST = '127.0.0.1'
+TIMEOUT = 10
+
+
+def recv_exact(sock, n):
+    buf = b''
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("server closed the connection")
+        buf += chunk
+    return buf
+
+
+class Client:
+    """Just enough of an iperf3 client to run one test against ``port``."""
+
+    def __init__(self, port, **params):
+        self.port = port
+        self.params = dict(params, client_version='3.16')
+        self.cookie = uuid.uuid4().hex[:36].ljust(36, 'x').encode('ascii') + b'\0'
+        self.ctrl = socket.create_connection((HOST, port), TIMEOUT)
+        self.ctrl.sendall(self.cookie)
+        self.streams = []
+
+    def close(self):
+        for sock in self.streams:
+            sock.close()
+        self.ctrl.close()
+
+    def read_state(self):
+        return struct.unpack('b', recv_exact(self.ctrl, 1))[0]
+
+    def expect(self, state):
+        got = self.read_state()
+        if got != state:
+            raise AssertionError(f"expected state {state}, got {got}")
+
+    def send_state(self, state):
+        self.ctrl.sendall(struct.pack('b', state))
+
+    def write_json(self, obj):
+        data = json.dumps(obj).encode('utf-8')
+        self.ctrl.sendall(struct.pack('!I', len(data)) + data)
+
+    def read_json(self):
+        size, = struct.unpack('!I', recv_exact(self.ctrl, 4))
+        return json.loads(recv_exact(self.ctrl, size).decode('utf-8'))
+
+    def setup(self):
+        """Parameters and streams, up to TEST_RUNNING."""
+        self.expect(srv.PARAM_EXCHANGE)
+        self.write_json(self.params)
+        self.expect(srv.CREATE_STREAMS)
+        for _ in range(self.params.get('parallel', 1)):
+            if self.params.get('udp'):
+                sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                sock.settimeout(TIMEOUT)
+                sock.connect((HOST, self.port))
+                sock.send(struct.pack('!I', srv.UDP_CONNECT_MSG))
+                reply, = struct.unpack('!I', sock.recv(4))
+                assert reply == srv.UDP_CONNECT_REPLY, hex(reply)
+            else:
+                sock = socket.create_connection((HOST, self.port), TIMEOUT)
+                sock.sendall(self.cookie)
+            self.streams.append(sock)
+        self.expect(srv.TEST_START)
+        self.expect(srv.TEST_RUNNING)
+
+    def finish(self, streams):
+        """TEST_END and the results exchange; returns the server's results JSON."""
+        self.send_state(srv.TEST_END)
+        self.expect(srv.EXCHANGE_RESULTS)
+        self.write_json({'cpu_util_total': 0, 'cpu_util_user': 0, 'cpu_util_system': 0,
+                         'sender_has_retransmits': 0, 'streams': streams})
+        results = self.read_json()
+        self.expect(srv.DISPLAY_RESULTS)
+        self.send_state(srv.IPERF_DONE)
+        return results
+
+
+def client_stream(stream_id, nbytes, seconds, packets=0):
+    return {'id': stream_id, 'bytes': nbytes, 'retransmits': -1, 'jitter': 0, 'errors': 0,
+            'omitted_errors': 0, 'packets': packets, 'omitted_packets': 0,
+            'start_time': 0, 'end_time': seconds}
+
+
+class ServerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.events = []
+        self.sessions = []
+        self.done = threading.Event()
+
+        def listener(kind, payload):
+            self.events.append((kind, payload))
+            if kind == 'session':
+                self.sessions.append(payload)
+                self.done.set()
+
+        self.server = srv.IperfServer(host=HOST, port=0, interval=0.2, listener=listener).start()
+        self.addCleanup(self.server.stop)
+
+    def session(self):
+        self.assertTrue(self.done.wait(TIMEOUT), "the server never finished the test")
+        return self.sessions[-1]
+
+    def of_kind(self, kind):
+        return [payload for k, payload in self.events if k == kind]
+
+
+class TcpTest(ServerTestCase):
+
+    def test_upload(self):
+        client = Client(self.server.port, tcp=True, parallel=2, time=1, len=65536)
+        self.addCleanup(client.close)
+        client.setup()
+        block = b'\0' * 65536
+        sent = [0, 0]
+        deadline = time.monotonic() + 0.5
+        while time.monotonic() < deadline:
+            for i, sock in enumerate(client.streams):
+                sock.sendall(block)
+                sent[i] += len(block)
+        time.sleep(0.2)         # let the server drain its sockets
+        results = client.finish([client_stream(1, sent[0], 0.5), client_stream(3, sent[1], 0.5)])
+
+        self.assertEqual([s['id'] for s in results['streams']], [1, 3])
+        self.assertEqual([s['bytes'] for s in results['streams']], sent)
+        self.assertEqual(results['sender_has_retransmits'], -1)     # the server only received
+        session = self.session()
+        self.assertEqual(session['state'], 'finished', session['error'])
+        self.assertEqual((session['protocol'], session['parallel']), ('tcp', 2))
+        self.assertGreater(session['received_mbps'], 0)
+
+        summary = self.of_kind('summary')[-1]
+        received = [r for r in summary if r.stream is None and r.sender is False]
+        self.assertEqual(received[0].bytes, sum(sent))
+        self.assertTrue(self.of_kind('interval'))
+
+    def test_reverse(self):
+        client = Client(self.server.port, tcp=True, reverse=True, time=1, len=65536)
+        self.addCleanup(client.close)
+        client.setup()
+        sock = client.streams[0]
+        got = 0
+        deadline = time.monotonic() + 0.5
+        while time.monotonic() < deadline:
+            got += len(sock.recv(1 << 20))
+        results = client.finish([client_stream(1, got, 0.5)])
+
+        stream, = results['streams']
+        self.assertGreaterEqual(stream['bytes'], got)
+        self.assertIn(results['sender_has_retransmits'], (0, 1))
+        session = self.session()
+        self.assertEqual(session['state'], 'finished', session['error'])
+        self.assertTrue(session['reverse'])
+        self.assertGreater(session['sent_mbps'], 0)
+
+    def test_server_output(self):
+        client = Client(self.server.port, tcp=True, time=1, get_server_output=1)
+        self.addCleanup(client.close)
+        client.setup()
+        client.streams[0].sendall(b'\0' * 4096)
+        time.sleep(0.1)
+        results = client.finish([client_stream(1, 4096, 0.1)])
+        self.assertIn("Accepted connection from 127.0.0.1", results['server_output_text'])
+
+    def test_busy(self):
+        client = Client(self.server.port, tcp=True, time=1)
+        self.addCleanup(client.close)
+        client.setup()
+        other = socket.create_connection((HOST, self.server.port), TIMEOUT)
+        self.addCleanup(other.close)
+        other.sendall(b'y' * srv.COOKIE_SIZE)
+        self.assertEqual(struct.unpack('b', recv_exact(other, 1))[0], srv.ACCESS_DENIED)
+        client.finish([client_stream(1, 0, 0.1)])
+        self.assertEqual(self.session()['state'], 'finished')
+
+    def test_unsupported_protocol(self):
+        client = Client(self.server.port, sctp=True)
+        self.addCleanup(client.close)
+        client.expect(srv.PARAM_EXCHANGE)
+        client.write_json(client.params)
+        state, errno, _ = struct.unpack('!bii', recv_exact(client.ctrl, 9))
+        self.assertEqual((state, errno), (srv.SERVER_ERROR, srv.IEUNIMP))
+        session = self.session()
+        self.assertEqual(session['state'], 'failed')
+        self.assertEqual(self.server.status()['state'], srv.STATE_LISTENING)
+
+
+class UdpTest(ServerTestCase):
+
+    def test_upload_counts_loss(self):
+        client = Client(self.server.port, udp=True, time=1, len=1200, bandwidth=1000000)
+        self.addCleanup(client.close)
+        client.setup()
+        sock = client.streams[0]
+        payload = bytearray(1200)
+        sent = 0
+        for seq in range(1, 101):
+            if seq == 50:
+                continue        # one datagram "lost" on the way
+            now = time.time()
+            struct.pack_into('!III', payload, 0, int(now), int(now % 1 * 1e6), seq)
+            sock.send(payload)
+            sent += 1
+            time.sleep(0.001)
+        time.sleep(0.2)
+        results = client.finish([client_stream(1, sent * 1200, 0.3, packets=100)])
+
+        stream, = results['streams']
+        self.assertEqual((stream['packets'], stream['errors']), (100, 1))
+        self.assertEqual(stream['bytes'], sent * 1200)
+        self.assertGreaterEqual(stream['jitter'], 0)
+        session = self.session()
+        self.assertEqual((session['state'], session['protocol']), ('finished', 'udp'))
+        self.assertAlmostEqual(session['loss_percent'], 1.0)
+
+    def test_reverse(self):
+        client = Client(self.server.port, udp=True, reverse=True, time=1, len=1200,
+                        bandwidth=2000000)
+        self.addCleanup(client.close)
+        client.setup()
+        sock = client.streams[0]
+        sock.settimeout(0.05)
+        seqs = []
+        deadline = time.monotonic() + 0.5
+        while time.monotonic() < deadline:
+            try:
+                data = sock.recv(65536)
+            except socket.timeout:
+                continue
+            seqs.append(struct.unpack_from('!III', data)[2])
+        results = client.finish([client_stream(1, len(seqs) * 1200, 0.5, packets=len(seqs))])
+
+        self.assertTrue(seqs, "no datagrams from the server")
+        self.assertEqual(seqs, list(range(1, len(seqs) + 1)))
+        stream, = results['streams']
+        self.assertGreaterEqual(stream['packets'], len(seqs))
+        self.assertEqual(self.session()['state'], 'finished')
+
+
+@unittest.skipUnless(shutil.which('iperf3'), "no iperf3 client on PATH")
+class RealClientTest(ServerTestCase):
+
+    def run_client(self, *args):
+        out = subprocess.run(['iperf3', '-c', HOST, '-p', str(self.server.port), '-t', '1', '-J',
+                              *args], stdout=subprocess.PIPE, timeout=30, text=True).stdout
+        doc = json.loads(out)
+        self.assertNotIn('error', doc)
+        return doc['end']
+
+    def test_tcp(self):
+        end = self.run_client('-P', '2')
+        self.assertGreater(end['sum_received']['bytes'], 0)
+        self.assertEqual(self.session()['state'], 'finished')
+
+    def test_udp(self):
+        end = self.run_client('-u', '-b', '10M')
+        self.assertGreater(end['sum']['packets'], 0)
+        self.assertEqual(self.session()['state'], 'finished')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+"""IperfOutputParser against fake_iperf3.py output in every output mode."""
+import os
+import subprocess
+import sys
+import unittest
+
+from NetTest_core.iperf_stream import (MODE_JSON, MODE_JSON_STREAM, MODE_TEXT,
+                                       IperfOutputParser, parse_text_line)
+
+FAKE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                    'NetTest_bench', 'fake_iperf3.py')
+FORMATS = {MODE_TEXT: [], MODE_JSON_STREAM: ['--json-stream'], MODE_JSON: ['-J']}
+
+
+def parse(mode, *args, parallel=1):
+    """Events of one seeded fake run, parsed line by line."""
+    out = subprocess.run([sys.executable, FAKE, '-c', '127.0.0.1', '--fake-speed', '0',
+                          '--fake-seed', '1', *args, *FORMATS[mode]],
+                         stdout=subprocess.PIPE, check=True, text=True).stdout
+    parser = IperfOutputParser(parallel=parallel, render=False)
+    events = [e for line in out.splitlines(True) for e in parser.feed(line)] + parser.finish()
+    return parser, events
+
+
+def of_kind(events, kind):
+    return [payload for k, payload in events if k == kind]
+
+
+class TcpParallelTest(unittest.TestCase):
+    """-P 2 -t 2 -i 1: two intervals of two streams plus [SUM], then the totals."""
+
+    def check(self, mode, tolerance):
+        parser, events = parse(mode, '-t', '2', '-i', '1', '-P', '2', parallel=2)
+        self.assertEqual(parser.mode, mode)
+        self.assertEqual(len(of_kind(events, 'start')), 0 if mode == MODE_TEXT else 1)
+
+        intervals = of_kind(events, 'interval')
+        self.assertEqual(len(intervals), 2)
+        for (start, end), records in zip([(0.0, 1.0), (1.0, 2.0)], intervals):
+            self.assertEqual([r.stream for r in records], [5, 6, None])
+            for r in records:
+                self.assertEqual((r.start, r.end), (start, end))
+                self.assertFalse(r.final)
+        first = intervals[0]
+        self.assertAlmostEqual(first[0].mbps, 495.269616, delta=495.269616 * tolerance)
+        self.assertAlmostEqual(first[2].mbps, 959.703056, delta=959.703056 * tolerance)
+        self.assertEqual([r.retransmits for r in first], [0, 2, 2])
+
+        summary = [r for records in of_kind(events, 'summary') for r in records]
+        self.assertEqual([(r.stream, r.sender) for r in summary],
+                         [(5, True), (5, False), (6, True), (6, False), (None, True), (None, False)])
+        for r in summary:
+            self.assertTrue(r.final)
+            self.assertAlmostEqual(r.seconds, 2.0)
+        self.assertAlmostEqual(summary[4].mbps, 936.275676, delta=936.275676 * tolerance)
+        self.assertEqual(summary[4].retransmits, 3)
+        self.assertIsNone(summary[5].retransmits)
+
+    def test_text(self):
+        # the text tables round to three significant digits
+        self.check(MODE_TEXT, 0.01)
+
+    def test_json_stream(self):
+        self.check(MODE_JSON_STREAM, 1e-6)
+
+    def test_json(self):
+        self.check(MODE_JSON, 1e-6)
+
+
+class UdpTest(unittest.TestCase):
+    """-u -t 2 -i 1: datagram counts per interval and the loss total."""
+
+    def check(self, mode):
+        parser, events = parse(mode, '-u', '-t', '2', '-i', '1')
+        self.assertEqual(parser.mode, mode)
+        intervals = of_kind(events, 'interval')
+        self.assertEqual([[r.packets for r in records if r.stream is not None]
+                          for records in intervals], [[91], [83]])
+        summary = [r for records in of_kind(events, 'summary') for r in records]
+        sender = [r for r in summary if r.stream == 5]
+        self.assertEqual(len(sender), 1)
+        self.assertTrue(sender[0].sender)
+        self.assertEqual((sender[0].packets, sender[0].lost_packets), (174, 0))
+        self.assertAlmostEqual(sender[0].jitter_ms, 0.059, places=3)
+
+    def test_text(self):
+        self.check(MODE_TEXT)
+
+    def test_json_stream(self):
+        self.check(MODE_JSON_STREAM)
+
+    def test_json(self):
+        self.check(MODE_JSON)
+
+
+class TextFallbackTest(unittest.TestCase):
+
+    def test_single_stream_has_no_sum_line(self):
+        parser = IperfOutputParser(parallel=1, render=False)
+        events = parser.feed("[  5]   0.00-1.00   sec   112 MBytes   941 Mbits/sec    0   1.05 MBytes\n")
+        self.assertEqual(of_kind(events, 'interval')[0][0].stream, 5)
+
+    def test_error_line(self):
+        parser = IperfOutputParser(render=False)
+        events = parser.feed("iperf3: error - unable to connect to server: Connection refused\n")
+        self.assertEqual(of_kind(events, 'error'),
+                         ["iperf3: error - unable to connect to server: Connection refused"])
+
+    def test_units(self):
+        rec = parse_text_line("[SUM]   0.00-10.00  sec  1.10 GBytes   941 Mbits/sec   12   sender")
+        self.assertIsNone(rec.stream)
+        self.assertTrue(rec.final and rec.sender)
+        self.assertEqual(rec.bytes, int(1.10 * 1024 ** 3))
+        self.assertAlmostEqual(rec.bits_per_second, 941e6)
+        self.assertEqual(rec.retransmits, 12)
+
+    def test_broken_json_document_falls_back_to_text(self):
+        parser = IperfOutputParser(render=False)
+        events = []
+        for line in ("{\n", '\t"start": {\n', "}\n"):
+            events += parser.feed(line)
+        events += parser.finish()
+        self.assertEqual(parser.mode, MODE_TEXT)
+        self.assertEqual(of_kind(events, 'summary'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
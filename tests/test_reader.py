@@ -0,0 +1,63 @@
+"""ChunkReader / LineSplitter."""
+import os
+import sys
+import threading
+import unittest
+
+from NetTest_core.reader import ChunkReader, LineSplitter
+
+
+class LineSplitterTest(unittest.TestCase):
+
+    def test_partial_lines_and_crlf(self):
+        splitter = LineSplitter()
+        self.assertEqual(splitter.feed(b'one\r\ntw'), ['one\n'])
+        self.assertEqual(splitter.feed(b'o\nthree'), ['two\n'])
+        self.assertEqual(splitter.flush(), ['three\n'])
+        self.assertEqual(splitter.flush(), [])
+
+
+@unittest.skipIf(sys.platform == 'win32', "no wake-up pipe on Windows")
+class ChunkReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.r, self.w = os.pipe()
+        self.addCleanup(os.close, self.r)
+        self.addCleanup(os.close, self.w)
+
+    def test_cancel_wakes_a_silent_reader(self):
+        reader = ChunkReader(self.r)
+        batches = []
+        thread = threading.Thread(target=lambda: batches.extend(reader))
+        thread.start()
+        os.write(self.w, b'a\nb\n')
+        reader.cancel()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertIn(batches, ([], [['a\n', 'b\n']]))
+
+    def test_cancel_after_close_writes_nowhere(self):
+        reader = ChunkReader(self.r)
+        reader.close()
+        # the wake-up pipe's numbers are free again; cancel() must not touch them
+        r2, w2 = os.pipe()
+        self.addCleanup(os.close, r2)
+        self.addCleanup(os.close, w2)
+        os.set_blocking(r2, False)
+        reader.cancel()
+        reader.close()
+        with self.assertRaises(BlockingIOError):
+            os.read(r2, 1)
+
+    def test_cancel_racing_close(self):
+        for _ in range(200):
+            reader = ChunkReader(self.r)
+            thread = threading.Thread(target=lambda: [reader.cancel() for _ in range(10)])
+            thread.start()
+            reader.close()
+            thread.join(5)
+            self.assertFalse(thread.is_alive())
+
+
+if __name__ == '__main__':
+    unittest.main()